@@ -1,11 +1,16 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, send_file, url_for
 from sync_scripts.customer_sync import create_customer_to_qb, update_customer_in_qb
-import json
+from sync_scripts.customer_backfill import discard_upload, new_upload_path, upload_results_path
+from sync_scripts.entity_scheduler import entity_scheduler
+from api_routes.ingest import wants_async, accept_job, idempotent
+from sync_scripts.payload_archive import archive_payload
+import os
 
 # Create a Blueprint for customer routes
 customer_bp = Blueprint('customer_routes', __name__)
 
 @customer_bp.route('/', methods=['POST'])
+@idempotent("customer.create")
 def create_customer():
     """
     API endpoint to receive a Shopify customer JSON and sync it to QuickBooks.
@@ -16,10 +21,16 @@ def create_customer():
         return jsonify({"error": "Request must be JSON"}), 400
 
     shopify_customer_data = request.get_json()
-    shopify_customer_json_string = json.dumps(shopify_customer_data)
 
-    # Call the sync function
-    result = create_customer_to_qb(shopify_customer_json_string)
+    # Archive the received payload (encoded and written by a background thread, off the request path)
+    archive_payload("customer", shopify_customer_data, shopify_customer_data.get('id'), "create")
+
+    # In queue ingest mode, acknowledge now and let the background workers sync it
+    if wants_async():
+        return accept_job("customer.create", shopify_customer_data, entity_key=f"customer:{shopify_customer_data.get('id')}")
+
+    # Call the sync function (serialized with any other sync for the same customer)
+    result = entity_scheduler.run(f"customer:{shopify_customer_data.get('id')}", create_customer_to_qb, shopify_customer_data, coalesce=False)
 
     if result:
         # Check for an error key in the returned dictionary
@@ -30,6 +41,57 @@ def create_customer():
     else:
         return jsonify({"status": "error", "message": "Failed to sync customer to QuickBooks. Check sync service logs."}), 500
 
+# Content-Type of a bulk upload -> backfill input format.
+BULK_FORMATS = {
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json": "json",
+    "text/csv": "csv",
+}
+
+@customer_bp.route('/bulk', methods=['POST'])
+def bulk_create_customers():
+    """
+    API endpoint to backfill many Shopify customers into QuickBooks.
+    The body is JSONL (application/x-ndjson), a Shopify JSON export (application/json) or a Shopify
+    CSV export (text/csv). It is streamed to disk and processed by the job queue in batched envelopes,
+    so it answers 202; per-record outcomes are available at results_url. Bodies larger than
+    MAX_CONTENT_LENGTH (SYNC_BACKFILL_MAX_BYTES) get 413.
+    """
+    fmt = BULK_FORMATS.get(request.mimetype)
+    if fmt is None:
+        return jsonify({"error": f"Unsupported Content-Type. Use one of: {', '.join(BULK_FORMATS)}."}), 415
+
+    upload_id, path = new_upload_path(fmt)
+    try:
+        with open(path, "wb") as f:
+            while True:
+                chunk = request.stream.read(64 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+    except Exception:
+        # Including RequestEntityTooLarge once the body passes MAX_CONTENT_LENGTH
+        discard_upload(path)
+        raise
+
+    return accept_job("customer.backfill", {"path": path, "format": fmt},
+                      extra={"results_url": url_for("customer_routes.bulk_results", upload_id=upload_id)})
+
+@customer_bp.errorhandler(413)
+def upload_too_large(e):
+    return jsonify({"error": f"Upload larger than SYNC_BACKFILL_MAX_BYTES ({request.max_content_length} bytes)."}), 413
+
+@customer_bp.route('/bulk/<string:upload_id>/results', methods=['GET'])
+def bulk_results(upload_id):
+    """
+    API endpoint returning the per-record outcomes of a bulk upload so far, as JSONL.
+    """
+    path = upload_results_path(upload_id)
+    if path is None or not os.path.exists(path):
+        return jsonify({"error": f"No results for upload {upload_id}."}), 404
+    return send_file(path, mimetype="application/x-ndjson")
+
 @customer_bp.route('/<string:customer_id>', methods=['PUT'])
 def update_customer(customer_id):
     """
@@ -46,10 +108,13 @@ def update_customer(customer_id):
     if str(shopify_customer_data.get('id')) != customer_id:
         return jsonify({"error": f"ID in URL ({customer_id}) does not match ID in payload ({shopify_customer_data.get('id')})."}), 400
 
-    shopify_customer_json_string = json.dumps(shopify_customer_data)
+    archive_payload("customer", shopify_customer_data, customer_id, "update")
+
+    if wants_async():
+        return accept_job("customer.update", shopify_customer_data, entity_key=f"customer:{customer_id}", coalesce=True)
 
-    # Call the update function
-    result = update_customer_in_qb(shopify_customer_json_string)
+    # Call the update function, one at a time per customer and coalescing bursts of updates
+    result = entity_scheduler.run(f"customer:{customer_id}", update_customer_in_qb, shopify_customer_data)
 
     if result:
         if "error" in result:
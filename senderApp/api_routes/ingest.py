@@ -0,0 +1,93 @@
+import functools
+import json
+import os
+from flask import request, jsonify, url_for, make_response, Response
+from dotenv import load_dotenv
+from sync_scripts.job_queue import enqueue
+from sync_scripts import bridge_governor, idempotency
+
+# Load environment variables from .env file
+load_dotenv()
+
+# "sync" runs the QuickBooks sync inside the request; "queue" stores the payload and answers 202.
+INGEST_MODE = os.environ.get("SYNC_INGEST_MODE", "sync").lower()
+
+def wants_async(headers=None):
+    """
+    True if this request should be queued instead of synced inline: the service runs in queue
+    ingest mode, the caller sent `Prefer: respond-async`, or the bridge circuit breaker is open
+    (QB_BREAKER_DEFER), so the sync would fail anyway.
+    `headers` defaults to the current Flask request's headers.
+    """
+    if INGEST_MODE == "queue":
+        return True
+    if bridge_governor.BREAKER_DEFER and bridge_governor.is_open():
+        return True
+    if headers is None:
+        headers = request.headers
+    return "respond-async" in headers.get("Prefer", "")
+
+def accept_job(kind, payload, entity_key=None, coalesce=False, extra=None):
+    """
+    Persists the payload as a queued job and returns the 202 Accepted response with the job ID.
+    With coalesce=True a still-queued job for the same entity takes the new payload instead,
+    and its job ID is returned. `extra` adds fields to the response body.
+    """
+    job_id = enqueue(kind, payload, entity_key=entity_key, coalesce=coalesce)
+    status_url = url_for("job_routes.get_job_status", job_id=job_id)
+    response = jsonify({"status": "accepted", "job_id": job_id, "status_url": status_url, **(extra or {})})
+    response.headers["Location"] = status_url
+    return response, 202
+
+def replay_response(status_code, body):
+    """Builds the response of a redelivered webhook from the stored response of the first delivery."""
+    response = Response(body, status=status_code, mimetype="application/json")
+    response.headers["X-Idempotent-Replay"] = "true"
+    if status_code == 202:
+        status_url = json.loads(body).get("status_url")
+        if status_url:
+            response.headers["Location"] = status_url
+    return response
+
+def in_progress_response():
+    response = jsonify({"status": "in_progress",
+                        "message": "This webhook is still being processed by an earlier delivery. Retry later."})
+    response.headers["Retry-After"] = str(int(idempotency.WAIT_SECONDS) or 1)
+    return response, 409
+
+def idempotent(kind):
+    """
+    Decorator for webhook routes that Shopify and n8n may deliver more than once. The first delivery
+    of an idempotency key (the X-Shopify-Webhook-Id header, else the payload's Shopify ID and a
+    digest of the body) runs the view; a redelivery gets the first delivery's response, waiting for
+    it if it is still running, with an `X-Idempotent-Replay: true` header.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            data = request.get_json(silent=True) if request.is_json else None
+            if not idempotency.ENABLED or not isinstance(data, dict):
+                return view(*args, **kwargs)
+
+            key = idempotency.request_key(kind, request.headers.get(idempotency.WEBHOOK_ID_HEADER),
+                                          request.get_data(cache=True), data.get("id"))
+            claimed, stored = idempotency.claim(key)
+            if not claimed and stored is None:
+                # Another delivery of this webhook is running: wait for its response
+                stored = idempotency.wait_for(key)
+                if stored is None:
+                    claimed, stored = idempotency.claim(key)
+            if stored is not None:
+                return replay_response(*stored)
+            if not claimed:
+                return in_progress_response()
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                idempotency.release(key)
+                raise
+            idempotency.complete(key, response.status_code, response.get_data(as_text=True))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,22 @@
+from flask import Blueprint, request, jsonify, url_for
+from sync_scripts.inventory_sync import enqueue_inventory_sync
+
+# Create a Blueprint for inventory routes
+inventory_bp = Blueprint('inventory_routes', __name__)
+
+def _flag(name):
+    return request.args.get(name, "").lower() in ("1", "true", "yes")
+
+@inventory_bp.route('/sync', methods=['POST'])
+def sync_inventory():
+    """
+    API endpoint to push QuickBooks inventory quantities to Shopify (SYNC_SPEC 3.4).
+    The full endpoint is POST /inventory/sync; ?full=true ignores the last pushed quantities and
+    ?dry_run=true only counts changes. A sync covers the whole catalog, so it always runs as a job
+    and answers 202; a request made while another sync is waiting joins that one.
+    """
+    job_id = enqueue_inventory_sync(full=_flag("full"), dry_run=_flag("dry_run"))
+    status_url = url_for("job_routes.get_job_status", job_id=job_id)
+    response = jsonify({"status": "accepted", "job_id": job_id, "status_url": status_url})
+    response.headers["Location"] = status_url
+    return response, 202
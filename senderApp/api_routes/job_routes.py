@@ -0,0 +1,16 @@
+from flask import Blueprint, jsonify
+from sync_scripts.job_queue import get_job
+
+# Create a Blueprint for job status routes
+job_bp = Blueprint('job_routes', __name__)
+
+@job_bp.route('/<string:job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    API endpoint to check on a sync job accepted with 202.
+    The full endpoint is GET /jobs/<job_id>
+    """
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found."}), 404
+    return jsonify(job), 200
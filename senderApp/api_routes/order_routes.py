@@ -1,39 +1,14 @@
 from flask import Blueprint, request, jsonify
 from sync_scripts.order_sync import create_order_to_qb, update_order_in_qb
-import json
-import os
-from datetime import datetime
+from sync_scripts.entity_scheduler import entity_scheduler
+from api_routes.ingest import wants_async, accept_job, idempotent
+from sync_scripts.payload_archive import archive_payload
 
 # Create a Blueprint for order routes
 order_bp = Blueprint('order_routes', __name__)
 
-def save_order_json_to_logs(shopify_order_data):
-    """
-    Saves the received Shopify order JSON to a file in the logs directory.
-    
-    Args:
-        shopify_order_data: Dictionary containing Shopify order data
-    """
-    try:
-        # Ensure logs directory exists
-        logs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-        os.makedirs(logs_dir, exist_ok=True)
-        
-        # Get order ID for filename, or use timestamp if not available
-        order_id = shopify_order_data.get('id', 'unknown')
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-        filename = f"order_{order_id}_{timestamp}.json"
-        filepath = os.path.join(logs_dir, filename)
-        
-        # Write JSON to file with pretty formatting
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(shopify_order_data, f, indent=2, ensure_ascii=False)
-        
-        print(f"Order JSON saved to: {filepath}")
-    except Exception as e:
-        print(f"Error saving order JSON to logs: {e}")
-
 @order_bp.route('/', methods=['POST'])
+@idempotent("order.create")
 def create_order():
     """
     API endpoint to receive a Shopify order JSON and sync it to QuickBooks as a Sales Order.
@@ -44,13 +19,16 @@ def create_order():
         return jsonify({"error": "Request must be JSON"}), 400
 
     shopify_order_data = request.get_json()
-    shopify_order_json_string = json.dumps(shopify_order_data)
 
-    # Save the received JSON to logs directory
-    save_order_json_to_logs(shopify_order_data)
+    # Archive the received payload (encoded and written by a background thread, off the request path)
+    archive_payload("order", shopify_order_data, shopify_order_data.get('id'), "create")
+
+    # In queue ingest mode, acknowledge now and let the background workers sync it
+    if wants_async():
+        return accept_job("order.create", shopify_order_data, entity_key=f"order:{shopify_order_data.get('id')}")
 
-    # Call the sync function
-    result = create_order_to_qb(shopify_order_json_string)
+    # Call the sync function (serialized with any other sync for the same order)
+    result = entity_scheduler.run(f"order:{shopify_order_data.get('id')}", create_order_to_qb, shopify_order_data, coalesce=False)
 
     if result:
         # Check for an error key in the returned dictionary
@@ -77,10 +55,13 @@ def update_order(order_id):
     if str(shopify_order_data.get('id')) != order_id:
         return jsonify({"error": f"ID in URL ({order_id}) does not match ID in payload ({shopify_order_data.get('id')})."}), 400
 
-    shopify_order_json_string = json.dumps(shopify_order_data)
+    archive_payload("order", shopify_order_data, order_id, "update")
+
+    if wants_async():
+        return accept_job("order.update", shopify_order_data, entity_key=f"order:{order_id}", coalesce=True)
 
-    # Call the update function
-    result = update_order_in_qb(shopify_order_json_string)
+    # Call the update function, one at a time per order and coalescing bursts of updates
+    result = entity_scheduler.run(f"order:{order_id}", update_order_in_qb, shopify_order_data)
 
     if result:
         if "error" in result:
@@ -0,0 +1,57 @@
+from flask import Blueprint, request, jsonify
+from sync_scripts.product_sync import sync_product_to_qb
+from sync_scripts.entity_scheduler import entity_scheduler
+from api_routes.ingest import wants_async, accept_job
+
+# Create a Blueprint for product routes
+product_bp = Blueprint('product_routes', __name__)
+
+def _sync_response(result):
+    if result:
+        # Check for an error key in the returned dictionary
+        if "error" in result:
+            return jsonify({"status": "error", "response": result}), 400
+        else:
+            return jsonify({"status": "success", "response": result}), 200
+    else:
+        return jsonify({"status": "error", "message": "Failed to sync product to QuickBooks. Check sync service logs."}), 500
+
+@product_bp.route('/', methods=['POST'])
+def sync_product():
+    """
+    API endpoint to receive a Shopify product JSON and sync its variants to QuickBooks items (SYNC_SPEC §3.3).
+    This is called from the main app, with a /product prefix.
+    So the full endpoint is POST /product
+    Variants that already exist as items are updated, so products/create and products/update can both use it.
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    shopify_product_data = request.get_json()
+    entity_key = f"product:{shopify_product_data.get('id')}"
+
+    # In queue ingest mode, acknowledge now and let the background workers sync it
+    if wants_async():
+        return accept_job("product.sync", shopify_product_data, entity_key=entity_key, coalesce=True)
+
+    # Call the sync function (serialized with any other sync for the same product)
+    return _sync_response(entity_scheduler.run(entity_key, sync_product_to_qb, shopify_product_data))
+
+@product_bp.route('/<string:product_id>', methods=['PUT'])
+def update_product(product_id):
+    """
+    API endpoint to update the QuickBooks items of a Shopify product.
+    The full endpoint is PUT /product/<product_id>
+    """
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+
+    shopify_product_data = request.get_json()
+    if str(shopify_product_data.get('id')) != product_id:
+        return jsonify({"error": f"ID in URL ({product_id}) does not match ID in payload ({shopify_product_data.get('id')})."}), 400
+    entity_key = f"product:{product_id}"
+
+    if wants_async():
+        return accept_job("product.sync", shopify_product_data, entity_key=entity_key, coalesce=True)
+
+    return _sync_response(entity_scheduler.run(entity_key, sync_product_to_qb, shopify_product_data))
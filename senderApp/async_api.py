@@ -0,0 +1,336 @@
+import asyncio
+import functools
+import json
+import os
+from aiohttp import web
+from api_routes.customer_routes import BULK_FORMATS
+from api_routes.ingest import INGEST_MODE, wants_async
+from sync_scripts.customer_backfill import MAX_UPLOAD_BYTES, discard_upload, new_upload_path, upload_results_path
+from sync_scripts.async_engine import AsyncSyncEngine
+from sync_scripts.payload_archive import archive_payload
+from sync_scripts.job_queue import (
+    QUEUE_WORKERS_CONFIGURED,
+    enqueue,
+    get_job,
+    start_workers,
+    start_workers_on_demand,
+)
+from sync_scripts.item_catalog import PRELOAD as ITEM_CATALOG_PRELOAD, item_catalog
+from sync_scripts.inventory_sync import (
+    SYNC_INTERVAL as INVENTORY_SYNC_INTERVAL,
+    enqueue_inventory_sync,
+    start_scheduler as start_inventory_scheduler,
+)
+from sync_scripts import idempotency, json_backend, log_config, metrics
+
+# asyncio counterpart of sync_api.py with the same routes and responses. Each in-flight sync waits on
+# the event loop instead of holding a worker thread, so one process keeps many QuickBooks round trips
+# open at once. Run it with:
+#   python async_api.py
+#   gunicorn async_api:app --worker-class aiohttp.GunicornWebWorker --bind 0.0.0.0:5000
+
+ENGINE_KEY = web.AppKey("engine", AsyncSyncEngine)
+
+
+async def _read_json(request):
+    """Returns the parsed JSON body, or None if the body is not a JSON request. Parsed once per request."""
+    if "json" not in request:
+        data = None
+        if request.content_type == "application/json":
+            try:
+                data = json_backend.loads(await request.read())
+            except ValueError:
+                pass
+        request["json"] = data
+    return request["json"]
+
+
+def _json_response(data, status=200, headers=None):
+    return web.json_response(data, status=status, headers=headers, dumps=json_backend.dumps)
+
+
+async def _accept_job(kind, payload, entity_key=None, coalesce=False, extra=None):
+    job_id = await asyncio.to_thread(enqueue, kind, payload, entity_key, coalesce)
+    status_url = f"/jobs/{job_id}"
+    response = _json_response({"status": "accepted", "job_id": job_id, "status_url": status_url, **(extra or {})}, status=202)
+    response.headers["Location"] = status_url
+    return response
+
+
+def _sync_response(result, failure_message):
+    if result:
+        # Check for an error key in the returned dictionary
+        if "error" in result:
+            return _json_response({"status": "error", "response": result}, status=400)
+        return _json_response({"status": "success", "response": result}, status=200)
+    return _json_response({"status": "error", "message": failure_message}, status=500)
+
+
+def _idempotent(kind):
+    """aiohttp counterpart of api_routes.ingest.idempotent: redeliveries get the first delivery's response."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(request):
+            data = await _read_json(request)
+            if not idempotency.ENABLED or not isinstance(data, dict):
+                return await handler(request)
+
+            key = idempotency.request_key(kind, request.headers.get(idempotency.WEBHOOK_ID_HEADER),
+                                          await request.read(), data.get("id"))
+            claimed, stored = await asyncio.to_thread(idempotency.claim, key)
+            if not claimed and stored is None:
+                # Another delivery of this webhook is running: wait for its response
+                stored = await asyncio.to_thread(idempotency.wait_for, key)
+                if stored is None:
+                    claimed, stored = await asyncio.to_thread(idempotency.claim, key)
+            if stored is not None:
+                status_code, body = stored
+                headers = {"X-Idempotent-Replay": "true"}
+                status_url = json.loads(body).get("status_url") if status_code == 202 else None
+                if status_url:
+                    headers["Location"] = status_url
+                return web.Response(text=body, status=status_code, content_type="application/json", headers=headers)
+            if not claimed:
+                return _json_response(
+                    {"status": "in_progress",
+                     "message": "This webhook is still being processed by an earlier delivery. Retry later."},
+                    status=409, headers={"Retry-After": str(int(idempotency.WAIT_SECONDS) or 1)})
+
+            try:
+                response = await handler(request)
+            except BaseException:
+                await asyncio.to_thread(idempotency.release, key)
+                raise
+            await asyncio.to_thread(idempotency.complete, key, response.status, response.text)
+            return response
+        return wrapper
+    return decorator
+
+
+@_idempotent("customer.create")
+async def create_customer(request):
+    """POST /customer: syncs a Shopify customer JSON to QuickBooks."""
+    data = await _read_json(request)
+    if data is None:
+        return _json_response({"error": "Request must be JSON"}, status=400)
+    archive_payload("customer", data, data.get('id'), "create")
+    entity_key = f"customer:{data.get('id')}"
+
+    if await asyncio.to_thread(wants_async, request.headers):
+        return await _accept_job("customer.create", data, entity_key=entity_key)
+
+    result = await request.app[ENGINE_KEY].create_customer(data, entity_key)
+    return _sync_response(result, "Failed to sync customer to QuickBooks. Check sync service logs.")
+
+
+def _upload_too_large():
+    return _json_response({"error": f"Upload larger than SYNC_BACKFILL_MAX_BYTES ({MAX_UPLOAD_BYTES} bytes)."},
+                          status=413)
+
+
+async def bulk_create_customers(request):
+    """POST /customer/bulk: stores a JSONL/JSON/CSV customer export (up to SYNC_BACKFILL_MAX_BYTES) and queues its backfill."""
+    fmt = BULK_FORMATS.get(request.content_type)
+    if fmt is None:
+        return _json_response({"error": f"Unsupported Content-Type. Use one of: {', '.join(BULK_FORMATS)}."}, status=415)
+
+    if request.content_length is not None and request.content_length > MAX_UPLOAD_BYTES:
+        return _upload_too_large()
+
+    upload_id, path = new_upload_path(fmt)
+    received = 0
+    f = await asyncio.to_thread(open, path, "wb")
+    try:
+        async for chunk in request.content.iter_chunked(64 * 1024):
+            received += len(chunk)
+            if received > MAX_UPLOAD_BYTES:
+                break
+            await asyncio.to_thread(f.write, chunk)
+    finally:
+        await asyncio.to_thread(f.close)
+    if received > MAX_UPLOAD_BYTES:
+        await asyncio.to_thread(discard_upload, path)
+        return _upload_too_large()
+
+    return await _accept_job("customer.backfill", {"path": path, "format": fmt},
+                             extra={"results_url": f"/customer/bulk/{upload_id}/results"})
+
+
+async def bulk_results(request):
+    """GET /customer/bulk/{upload_id}/results: per-record outcomes of a bulk upload so far (JSONL)."""
+    upload_id = request.match_info["upload_id"]
+    path = upload_results_path(upload_id)
+    if path is None or not os.path.exists(path):
+        return _json_response({"error": f"No results for upload {upload_id}."}, status=404)
+    return web.FileResponse(path, headers={"Content-Type": "application/x-ndjson"})
+
+
+async def update_customer(request):
+    """PUT /customer/{customer_id}: updates the QuickBooks customer for a Shopify customer JSON."""
+    customer_id = request.match_info["customer_id"]
+    data = await _read_json(request)
+    if data is None:
+        return _json_response({"error": "Request must be JSON"}, status=400)
+    if str(data.get('id')) != customer_id:
+        return _json_response({"error": f"ID in URL ({customer_id}) does not match ID in payload ({data.get('id')})."}, status=400)
+    archive_payload("customer", data, customer_id, "update")
+    entity_key = f"customer:{customer_id}"
+
+    if await asyncio.to_thread(wants_async, request.headers):
+        return await _accept_job("customer.update", data, entity_key=entity_key, coalesce=True)
+
+    result = await request.app[ENGINE_KEY].update_customer(data, entity_key)
+    return _sync_response(result, "Failed to update customer in QuickBooks. Check sync service logs.")
+
+
+@_idempotent("order.create")
+async def create_order(request):
+    """POST /order: syncs a Shopify order JSON to QuickBooks as a Sales Order."""
+    data = await _read_json(request)
+    if data is None:
+        return _json_response({"error": "Request must be JSON"}, status=400)
+    archive_payload("order", data, data.get('id'), "create")
+    entity_key = f"order:{data.get('id')}"
+
+    if await asyncio.to_thread(wants_async, request.headers):
+        return await _accept_job("order.create", data, entity_key=entity_key)
+
+    result = await request.app[ENGINE_KEY].create_order(data, entity_key)
+    return _sync_response(result, "Failed to sync order to QuickBooks. Check sync service logs.")
+
+
+async def update_order(request):
+    """PUT /order/{order_id}: updates the QuickBooks Sales Order for a Shopify order JSON."""
+    order_id = request.match_info["order_id"]
+    data = await _read_json(request)
+    if data is None:
+        return _json_response({"error": "Request must be JSON"}, status=400)
+    if str(data.get('id')) != order_id:
+        return _json_response({"error": f"ID in URL ({order_id}) does not match ID in payload ({data.get('id')})."}, status=400)
+    archive_payload("order", data, order_id, "update")
+    entity_key = f"order:{order_id}"
+
+    if await asyncio.to_thread(wants_async, request.headers):
+        return await _accept_job("order.update", data, entity_key=entity_key, coalesce=True)
+
+    result = await request.app[ENGINE_KEY].update_order(data, entity_key)
+    return _sync_response(result, "Failed to update order in QuickBooks. Check sync service logs.")
+
+
+async def sync_product(request):
+    """POST /product and PUT /product/{product_id}: syncs a Shopify product's variants to QuickBooks items."""
+    data = await _read_json(request)
+    if data is None:
+        return _json_response({"error": "Request must be JSON"}, status=400)
+    product_id = request.match_info.get("product_id")
+    if product_id is not None and str(data.get('id')) != product_id:
+        return _json_response({"error": f"ID in URL ({product_id}) does not match ID in payload ({data.get('id')})."}, status=400)
+    entity_key = f"product:{data.get('id')}"
+
+    if await asyncio.to_thread(wants_async, request.headers):
+        return await _accept_job("product.sync", data, entity_key=entity_key, coalesce=True)
+
+    result = await request.app[ENGINE_KEY].sync_product(data, entity_key)
+    return _sync_response(result, "Failed to sync product to QuickBooks. Check sync service logs.")
+
+
+async def not_implemented(request):
+    """Placeholder for DELETE /customer/{id} and /order/{id}."""
+    entity = request.path.strip("/").split("/")[0]
+    entity_id = request.match_info.get("entity_id")
+    return _json_response({
+        "status": "placeholder",
+        "message": f"This endpoint will delete {entity} {entity_id}."
+    }, status=501)
+
+
+async def sync_inventory(request):
+    """POST /inventory/sync: queues a QuickBooks -> Shopify inventory sync (?full=true, ?dry_run=true)."""
+    def flag(name):
+        return request.query.get(name, "").lower() in ("1", "true", "yes")
+    job_id = await asyncio.to_thread(enqueue_inventory_sync, flag("full"), flag("dry_run"))
+    status_url = f"/jobs/{job_id}"
+    response = _json_response({"status": "accepted", "job_id": job_id, "status_url": status_url}, status=202)
+    response.headers["Location"] = status_url
+    return response
+
+
+async def get_job_status(request):
+    """GET /jobs/{job_id}: status of a sync job accepted with 202."""
+    job_id = request.match_info["job_id"]
+    job = await asyncio.to_thread(get_job, job_id)
+    if job is None:
+        return _json_response({"error": f"Job {job_id} not found."}, status=404)
+    return _json_response(job)
+
+
+async def get_metrics(request):
+    """GET /metrics: Prometheus scrape endpoint (see sync_scripts/metrics.py)."""
+    if not metrics.ENABLED:
+        return web.Response(text="Metrics are disabled (SYNC_METRICS=false).\n", status=404)
+    body = await asyncio.to_thread(metrics.render)
+    return web.Response(body=body.encode("utf-8"), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+
+async def index(request):
+    return web.Response(text="Sync API is running. Use the /customer endpoint to sync customers, /order endpoint to sync orders, or /product endpoint to sync products.")
+
+
+async def _on_startup(app):
+    # Same background services as sync_api.py, each started only when configured to run.
+    if INGEST_MODE == "queue" or QUEUE_WORKERS_CONFIGURED:
+        start_workers()
+    else:
+        start_workers_on_demand()
+    if ITEM_CATALOG_PRELOAD:
+        item_catalog.warm()
+    if INVENTORY_SYNC_INTERVAL > 0:
+        start_inventory_scheduler()
+
+
+async def _on_cleanup(app):
+    await app[ENGINE_KEY].close()
+
+
+@web.middleware
+async def _request_id_middleware(request, handler):
+    """Tags everything logged while handling a request with its correlation ID, echoed back on the response."""
+    token = log_config.set_request_id(request.headers.get(log_config.REQUEST_ID_HEADER))
+    try:
+        response = await handler(request)
+        response.headers[log_config.REQUEST_ID_HEADER] = log_config.current_request_id()
+        return response
+    finally:
+        log_config.reset_request_id(token)
+
+
+def create_app(engine=None):
+    log_config.configure()
+    app = web.Application(middlewares=[_request_id_middleware])
+    app[ENGINE_KEY] = engine or AsyncSyncEngine()
+    app.router.add_get("/", index)
+    for path in ("/customer", "/customer/"):
+        app.router.add_post(path, create_customer)
+    app.router.add_post("/customer/bulk", bulk_create_customers)
+    app.router.add_get("/customer/bulk/{upload_id}/results", bulk_results)
+    app.router.add_put("/customer/{customer_id}", update_customer)
+    app.router.add_delete("/customer/{entity_id}", not_implemented)
+    for path in ("/order", "/order/"):
+        app.router.add_post(path, create_order)
+    app.router.add_put("/order/{order_id}", update_order)
+    app.router.add_delete("/order/{entity_id}", not_implemented)
+    for path in ("/product", "/product/"):
+        app.router.add_post(path, sync_product)
+    app.router.add_put("/product/{product_id}", sync_product)
+    app.router.add_post("/inventory/sync", sync_inventory)
+    app.router.add_get("/jobs/{job_id}", get_job_status)
+    app.router.add_get("/metrics", get_metrics)
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+app = create_app()
+
+if __name__ == '__main__':
+    web.run_app(app, host='0.0.0.0', port=5000)
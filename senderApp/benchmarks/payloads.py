@@ -0,0 +1,97 @@
+import random
+
+# Deterministic, production-sized payloads for the benchmarks: Shopify customers and orders as the
+# webhooks send them, and qbXML list responses as the bridge returns them.
+
+_FIRST_NAMES = ["Ann", "Bob", "Chloé", "Dev", "Émile", "Fatima", "Gus", "Hana", "Ivan", "June"]
+_LAST_NAMES = ["Tremblay", "Gagnon", "Roy", "Côté", "Bouchard", "Smith", "Li", "Nguyen", "O'Neil", "Patel"]
+
+
+def address(rng, n):
+    return {
+        "first_name": rng.choice(_FIRST_NAMES),
+        "last_name": rng.choice(_LAST_NAMES),
+        # Company names must stay unique: QuickBooks names the customer after the company.
+        "company": rng.choice(["", f"Acme & Sons {n}", f"Northwind <Retail> {n}"]),
+        "address1": f"{rng.randint(1, 9999)} Rue Sainte-Catherine",
+        "address2": rng.choice(["", "Suite 200"]),
+        "city": "Montréal",
+        "province_code": "QC",
+        "country": "CA",
+        "zip": "H3B 1A7",
+        "phone": "+1 514-555-0100",
+    }
+
+
+def customer(rng, shopify_id):
+    """A Shopify customer as sent by customers/create (about 1.5 KB of JSON)."""
+    default_address = address(rng, shopify_id)
+    return {
+        "id": shopify_id,
+        "email": f"customer{shopify_id}@example.com",
+        "first_name": default_address["first_name"],
+        "last_name": f"{default_address['last_name']} {shopify_id}",
+        "phone": "+15145550100",
+        "currency": "CAD",
+        "note": "Prefers delivery after 5pm & before 9pm.",
+        "tags": "wholesale, vip",
+        "tax_exempt": False,
+        "verified_email": True,
+        "default_address": default_address,
+        "addresses": [default_address],
+    }
+
+
+def order(rng, shopify_id, lines=200):
+    """A Shopify order as sent by orders/create with `lines` line items."""
+    buyer = customer(rng, shopify_id + 10_000_000)
+    return {
+        "id": shopify_id,
+        "name": f"#{shopify_id}",
+        "created_at": "2026-10-01T10:15:00-04:00",
+        "currency": "CAD",
+        "customer": buyer,
+        "email": buyer["email"],
+        "billing_address": buyer["default_address"],
+        "shipping_address": address(rng, shopify_id),
+        "tax_lines": [{"title": "GST", "price": "12.34", "rate": 0.05}],
+        "line_items": [
+            {
+                "id": shopify_id * 1000 + i,
+                "sku": f"SKU-{rng.randrange(1000):06d}",
+                "name": f"Widget {i} - Large / Blue",
+                "title": f"Widget {i}",
+                "quantity": rng.randint(1, 5),
+                "price": f"{rng.uniform(1, 200):.2f}",
+                "taxable": rng.random() < 0.9,
+            }
+            for i in range(lines)
+        ],
+        "shipping_lines": [{"title": "Standard Shipping", "price": "15.00", "tax_lines": []}],
+    }
+
+
+def customer_ret_xml(i):
+    return (
+        f"<CustomerRet><ListID>80000{i:06d}-1700000000</ListID><TimeCreated>2026-01-01T10:00:00-05:00</TimeCreated>"
+        f"<TimeModified>2026-06-01T10:00:00-05:00</TimeModified><EditSequence>17000{i:05d}</EditSequence>"
+        f"<Name>Customer {i}</Name><FullName>Customer {i}</FullName><IsActive>true</IsActive>"
+        f"<CompanyName>Company {i}</CompanyName><FirstName>First</FirstName><LastName>Last {i}</LastName>"
+        f"<BillAddress><Addr1>{i} Main St</Addr1><City>Toronto</City><State>ON</State><PostalCode>M5V 1A1</PostalCode>"
+        f"<Country>CA</Country></BillAddress><Phone>416-555-0100</Phone><Email>c{i}@example.com</Email>"
+        f"<Balance>0.00</Balance><TotalBalance>0.00</TotalBalance></CustomerRet>"
+    )
+
+
+def list_response_xml(rows, rs_tag="CustomerQueryRs", ret_xml=customer_ret_xml):
+    """A qbXML response with one *Rs holding `rows` records."""
+    return (
+        '<?xml version="1.0" ?><QBXML><QBXMLMsgsRs>'
+        f'<{rs_tag} requestID="1" statusCode="0" statusSeverity="Info" statusMessage="Status OK">'
+        + "".join(ret_xml(i) for i in range(rows))
+        + f"</{rs_tag}></QBXMLMsgsRs></QBXML>"
+    )
+
+
+def rng(seed=42):
+    return random.Random(seed)
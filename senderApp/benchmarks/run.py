@@ -0,0 +1,371 @@
+"""
+Benchmarks for the sync hot paths: qbXML mapping (CustomerAdd/CustomerMod, a 200-line
+SalesOrderAdd), response parsing (_xml_to_dict, the findall-based parse_batch_response and the
+streaming parser on a 50k-row list response), webhook JSON handling (a 200-line order decoded
+and re-encoded with the configured backend), end-to-end create_customer_to_qb and
+create_order_to_qb against the in-process mock bridge (dev_tools/mock_qb_bridge.py), and the
+bridge governor's cost per round trip (take and free a slot) with four processes sharing its state.
+
+Every run is appended to benchmarks/history.json and compared with the last passing run on the
+same host and Python version. A case whose median time per call got slower than --threshold
+fails the run (exit status 1), so the suite can gate a change before it ships.
+
+    # from senderApp/
+    python -m benchmarks.run
+    python -m benchmarks.run --quick --filter e2e
+    python -m benchmarks.run --threshold 0.25 --accept    # record an intended slowdown as the new baseline
+"""
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.json")
+
+# Rows in the large list response (a full customer or item list of a big company file).
+LIST_ROWS = 50_000
+# Line items in the large order.
+ORDER_LINES = 200
+# Inventory items seeded in the mock bridge; the order SKUs are drawn from these.
+MOCK_ITEMS = 1000
+# Worker processes sharing the bridge governor state, counting the one that is timed.
+GOVERNOR_WORKERS = 4
+
+CASES = []
+
+
+def case(name):
+    """Registers a benchmark. The decorated function does the setup and returns the callable to time."""
+    def register(setup):
+        CASES.append((name, setup))
+        return setup
+    return register
+
+
+def _prepare_environment():
+    """
+    Points the sync modules at a throwaway state directory and an in-process mock bridge. Must run
+    before the first sync_scripts import: state_db and qb_client read their settings on import.
+    """
+    from dev_tools.mock_qb_bridge import start_mock_bridge
+
+    os.environ["SYNC_DATA_DIR"] = tempfile.mkdtemp(prefix="sync-bench-")
+    os.environ.pop("SYNC_STATE_DB", None)
+    os.environ["SYNC_PAYLOAD_ARCHIVE"] = "0"
+    _, base_url, _ = start_mock_bridge(items=MOCK_ITEMS, seed=1)
+    os.environ["QB_SERVER_URL"] = base_url
+
+
+# --- Cases ------------------------------------------------------------------------------------
+
+@case("map.customer_add_xml")
+def _customer_add_xml():
+    from benchmarks import payloads
+    from sync_scripts.customer_sync import create_customer_add_xml
+
+    customer = payloads.customer(payloads.rng(), 1001)
+    currency_map = {"Canadian Dollar": {"ListID": "80000001-1700000000", "FullName": "Canadian Dollar"}}
+    customer_type_map = {"Shopify customers": {"ListID": "80000002-1700000000", "FullName": "Shopify customers"}}
+    sales_rep_map = {"AS": {"ListID": "80000003-1700000000", "FullName": "AS"}}
+    return lambda: create_customer_add_xml(customer, currency_map, customer_type_map, sales_rep_map)
+
+
+@case("map.customer_mod_xml")
+def _customer_mod_xml():
+    from benchmarks import payloads
+    from sync_scripts.customer_sync import create_customer_mod_xml
+
+    customer = payloads.customer(payloads.rng(), 1002)
+    ids = {"ListID": "80000004-1700000000", "EditSequence": "1700000000"}
+    return lambda: create_customer_mod_xml(customer, ids)
+
+
+@case("map.sales_order_add_xml_200_lines")
+def _sales_order_add_xml():
+    from benchmarks import payloads
+    from sync_scripts.order_sync import create_sales_order_add_xml
+
+    order = payloads.order(payloads.rng(), 2001, lines=ORDER_LINES)
+    customer_ref_xml = "<CustomerRef><ListID>80000005-1700000000</ListID></CustomerRef>"
+    item_refs = {line["sku"]: f"8{i:07d}-1700000000" for i, line in enumerate(order["line_items"])}
+    return lambda: create_sales_order_add_xml(order, customer_ref_xml, item_refs)
+
+
+@case("parse.xml_to_dict_customer_ret")
+def _xml_to_dict():
+    import xml.etree.ElementTree as ET
+    from benchmarks import payloads
+    from sync_scripts.customer_sync import _xml_to_dict
+
+    element = ET.fromstring(payloads.customer_ret_xml(1))
+    return lambda: _xml_to_dict(element)
+
+
+@case("parse.order_payload_200_lines")
+def _order_payload():
+    import json
+    from benchmarks import payloads
+    from sync_scripts import json_backend
+
+    # A webhook body as it arrives: decoded once by the route, then encoded once for the archive.
+    body = json.dumps(payloads.order(payloads.rng(), 1, lines=ORDER_LINES)).encode("utf-8")
+    return lambda: json_backend.dumps(json_backend.loads(body))
+
+
+@case("parse.batch_response_50k_rows")
+def _parse_batch_response():
+    from benchmarks import payloads
+    from sync_scripts.qbxml_batch import parse_batch_response
+
+    raw = payloads.list_response_xml(LIST_ROWS)
+    return lambda: parse_batch_response(raw)
+
+
+@case("parse.reference_map_findall_50k_rows")
+def _reference_map_findall():
+    from benchmarks import payloads
+    from sync_scripts.customer_sync import _build_reference_map
+    from sync_scripts.qbxml_batch import parse_batch_response
+    from sync_scripts.qbxml_stream import element_to_record
+
+    raw = payloads.list_response_xml(LIST_ROWS)
+
+    def build():
+        result = parse_batch_response(raw)["1"]
+        return _build_reference_map((element_to_record(ret) for ret in result.rets("CustomerRet")), "FullName")
+    return build
+
+
+@case("parse.reference_map_stream_50k_rows")
+def _reference_map_stream():
+    from benchmarks import payloads
+    from sync_scripts.customer_sync import REFERENCE_FIELDS, _build_reference_map
+    from sync_scripts.qbxml_stream import QBXMLStream
+
+    raw = payloads.list_response_xml(LIST_ROWS).encode("utf-8")
+    return lambda: _build_reference_map(QBXMLStream(raw, REFERENCE_FIELDS).records("CustomerRet"), "FullName")
+
+
+def _governor_load(stop):
+    """Takes and frees bridge slots until `stop` is set, like a gunicorn worker sending envelopes."""
+    from sync_scripts import bridge_governor
+
+    while not stop.is_set():
+        bridge_governor.release(bridge_governor.acquire(), 0.0, True)
+
+
+@case("governor.acquire_release_4_workers")
+def _governor_round_trip():
+    from sync_scripts import bridge_governor
+
+    # The other workers contend for the same state database rows while this one is timed.
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    workers = [context.Process(target=_governor_load, args=(stop,), daemon=True) for _ in range(GOVERNOR_WORKERS - 1)]
+    for worker in workers:
+        worker.start()
+
+    def stop_workers():
+        stop.set()
+        for worker in workers:
+            worker.join(5)
+    atexit.register(stop_workers)
+    return lambda: bridge_governor.release(bridge_governor.acquire(), 0.0, True)
+
+
+def _unique_ids(start):
+    counter = iter(range(start, sys.maxsize))
+    return lambda: next(counter)
+
+
+@case("e2e.create_customer_to_qb")
+def _create_customer_e2e():
+    from benchmarks import payloads
+    from sync_scripts.customer_sync import create_customer_to_qb, get_reference_maps
+
+    rng = payloads.rng()
+    next_id = _unique_ids(int(time.time() * 1000))
+    get_reference_maps()  # load the reference cache so every timed call is one CustomerAdd round trip
+
+    def create():
+        result = create_customer_to_qb(json.dumps(payloads.customer(rng, next_id())))
+        if not result or "error" in result:
+            raise RuntimeError(f"create_customer_to_qb failed: {result}")
+    return create
+
+
+@case("e2e.create_order_to_qb_200_lines")
+def _create_order_e2e():
+    from benchmarks import payloads
+    from sync_scripts.customer_sync import get_reference_maps
+    from sync_scripts.item_catalog import item_catalog
+    from sync_scripts.order_sync import create_order_to_qb
+
+    rng = payloads.rng()
+    next_id = _unique_ids(int(time.time() * 1000))
+    get_reference_maps()
+    item_catalog.refresh()
+
+    def create():
+        result = create_order_to_qb(json.dumps(payloads.order(rng, next_id(), lines=ORDER_LINES)))
+        if not result or "error" in result:
+            raise RuntimeError(f"create_order_to_qb failed: {result}")
+    return create
+
+
+# --- Timing -----------------------------------------------------------------------------------
+
+def measure(fn, repeats, min_time):
+    """
+    Times fn like timeit: the loop count is raised until one repeat takes at least min_time seconds,
+    then `repeats` repeats are run. Returns the per-call median and minimum in seconds and the loops.
+    """
+    _time_loops(fn, 1)  # warm-up: first-call imports, connection setup, lazily compiled templates
+    loops = 1
+    while True:
+        elapsed = _time_loops(fn, loops)
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops = max(loops * 2, int(loops * min_time / max(elapsed, 1e-9) * 1.1))
+    samples = [elapsed / loops] + [_time_loops(fn, loops) / loops for _ in range(repeats - 1)]
+    return {"median": statistics.median(samples), "min": min(samples), "loops": loops, "repeats": repeats}
+
+
+def _time_loops(fn, loops):
+    # The sync functions print progress for every call; keep it out of the measurement output.
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        return time.perf_counter() - start
+
+
+# --- History ----------------------------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _environment():
+    return {"host": platform.node(), "python": platform.python_version(), "platform": platform.platform()}
+
+
+def load_history(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def save_history(path, history):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(history, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_baseline(history, name, environment):
+    """Returns the newest passing run on the same host and Python version that measured `name`."""
+    for run in reversed(history):
+        if (run.get("passed") and name in run.get("results", {})
+                and run.get("host") == environment["host"] and run.get("python") == environment["python"]):
+            return run
+    return None
+
+
+def compare(results, history, environment, threshold):
+    """Returns one row per case: (name, result, baseline result or None, change ratio or None, regressed)."""
+    rows = []
+    for name, result in results.items():
+        baseline_run = find_baseline(history, name, environment)
+        baseline = baseline_run["results"][name] if baseline_run else None
+        change = result["median"] / baseline["median"] - 1 if baseline else None
+        rows.append((name, result, baseline, change, change is not None and change > threshold))
+    return rows
+
+
+def _format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+
+def print_report(rows, threshold):
+    print(f"{'case':40} {'median':>10} {'min':>10} {'baseline':>10} {'change':>8}")
+    for name, result, baseline, change, regressed in rows:
+        print(f"{name:40} {_format_time(result['median']):>10} {_format_time(result['min']):>10} "
+              f"{_format_time(baseline['median']) if baseline else '-':>10} "
+              f"{f'{change:+.1%}' if change is not None else 'new':>8}{'  REGRESSION' if regressed else ''}")
+    regressions = [name for name, _, _, _, regressed in rows if regressed]
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline by more than {threshold:.0%}: {', '.join(regressions)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the mapping, serialization and parsing hot paths.")
+    parser.add_argument("--filter", action="append", default=[], help="only run cases whose name contains this (repeatable)")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="fail when a case's median is this much slower than the baseline (default 0.15 = 15%%)")
+    parser.add_argument("--quick", action="store_true", help="fewer and shorter repeats, for a smoke run")
+    parser.add_argument("--repeats", type=int, help="timed repeats per case (default 7, 3 with --quick)")
+    parser.add_argument("--history", default=HISTORY_PATH, help="history file (default benchmarks/history.json)")
+    parser.add_argument("--no-record", action="store_true", help="compare only; do not append this run to the history")
+    parser.add_argument("--accept", action="store_true", help="record this run as passing even if it regressed")
+    parser.add_argument("--list", action="store_true", help="list the cases and exit")
+    args = parser.parse_args(argv)
+
+    selected = [(name, setup) for name, setup in CASES if not args.filter or any(f in name for f in args.filter)]
+    if args.list or not selected:
+        for name, _ in selected or CASES:
+            print(name)
+        return 0 if selected else 2
+
+    repeats = args.repeats or (3 if args.quick else 7)
+    min_time = 0.05 if args.quick else 0.2
+
+    _prepare_environment()
+    results = {}
+    for name, setup in selected:
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn = setup()
+        results[name] = measure(fn, repeats, min_time)
+        print(f"  {name}: {_format_time(results[name]['median'])} per call ({results[name]['loops']} loops)", file=sys.stderr)
+
+    environment = _environment()
+    history = load_history(args.history)
+    rows = compare(results, history, environment, args.threshold)
+    print_report(rows, args.threshold)
+    passed = args.accept or not any(regressed for *_, regressed in rows)
+
+    if not args.no_record:
+        history.append(dict(
+            environment,
+            timestamp=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            commit=_git_commit(),
+            quick=args.quick,
+            threshold=args.threshold,
+            passed=passed,
+            results=results,
+        ))
+        save_history(args.history, history)
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Local stand-in for the Shopify Admin GraphQL API, for developing and load testing inventory sync
+without a store. It answers the two operations inventory sync uses (productVariants SKU search and
+inventorySetQuantities), applies Shopify's cost-based leaky bucket, and counts what it received.
+
+    python dev_tools/fake_shopify.py --skus 50000 --port 8780
+    SHOPIFY_STORE_URL=http://127.0.0.1:8780 SHOPIFY_LOCATION_ID=1 python -m sync_scripts.inventory_sync
+
+GET /stats returns the counters; POST /stats/reset clears them.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SKU_PATTERN = re.compile(r'sku:"((?:[^"\\]|\\.)*)"')
+
+
+class FakeShop:
+    def __init__(self, skus, bucket_size, restore_rate, unknown_every=0):
+        # Every `unknown_every`-th SKU does not exist in the shop, to exercise unmatched SKUs.
+        self.items = {
+            f"SKU-{i:06d}": f"gid://shopify/InventoryItem/{i}"
+            for i in range(skus) if not unknown_every or i % unknown_every
+        }
+        self.available = {}
+        self.bucket_size = bucket_size
+        self.restore_rate = restore_rate
+        self._bucket = float(bucket_size)
+        self._bucket_at = time.monotonic()
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"requests": 0, "lookups": 0, "set_calls": 0, "quantities_set": 0, "throttled": 0}
+
+    def _spend(self, cost):
+        """Leaky bucket: returns (allowed, currently_available)."""
+        now = time.monotonic()
+        self._bucket = min(self.bucket_size, self._bucket + (now - self._bucket_at) * self.restore_rate)
+        self._bucket_at = now
+        if self._bucket < cost:
+            return False, self._bucket
+        self._bucket -= cost
+        return True, self._bucket
+
+    def handle(self, query, variables):
+        with self.lock:
+            self.stats["requests"] += 1
+            if "inventorySetQuantities" in query:
+                quantities = variables["input"]["quantities"]
+                cost = 10 + len(quantities)
+            else:
+                skus = [s.replace('\\"', '"').replace("\\\\", "\\") for s in SKU_PATTERN.findall(variables.get("query", ""))]
+                cost = 2 + int(variables.get("first", 50))
+            allowed, available = self._spend(cost)
+            extensions = {"cost": {"requestedQueryCost": cost, "throttleStatus": {
+                "maximumAvailable": self.bucket_size, "currentlyAvailable": int(available),
+                "restoreRate": self.restore_rate}}}
+            if not allowed:
+                self.stats["throttled"] += 1
+                return {"errors": [{"message": "Throttled", "extensions": {"code": "THROTTLED"}}], "extensions": extensions}
+
+            if "inventorySetQuantities" in query:
+                known = set(self.items.values())
+                user_errors = [
+                    {"field": ["input", "quantities", str(i), "inventoryItemId"], "message": "The inventory item could not be found.", "code": "INVALID_INVENTORY_ITEM"}
+                    for i, q in enumerate(quantities) if q["inventoryItemId"] not in known
+                ]
+                if not user_errors:
+                    for q in quantities:
+                        self.available[q["inventoryItemId"]] = q["quantity"]
+                    self.stats["set_calls"] += 1
+                    self.stats["quantities_set"] += len(quantities)
+                data = {"inventorySetQuantities": {"userErrors": user_errors}}
+            else:
+                self.stats["lookups"] += 1
+                nodes = [{"sku": sku, "inventoryItem": {"id": self.items[sku]}} for sku in skus if sku in self.items]
+                data = {"productVariants": {"nodes": nodes}}
+            return {"data": data, "extensions": extensions}
+
+
+def make_handler(shop):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if self.path == "/stats":
+                with shop.lock:
+                    return self._reply(dict(shop.stats, levels=len(shop.available)))
+            self._reply({"errors": "Not Found"}, 404)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path == "/stats/reset":
+                with shop.lock:
+                    shop.reset_stats()
+                return self._reply({"ok": True})
+            if not self.path.endswith("/graphql.json"):
+                return self._reply({"errors": "Not Found"}, 404)
+            request = json.loads(body)
+            self._reply(shop.handle(request.get("query", ""), request.get("variables") or {}))
+
+        def _reply(self, payload, status=200):
+            out = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Shopify Admin GraphQL API for inventory sync.")
+    parser.add_argument("--port", type=int, default=8780)
+    parser.add_argument("--skus", type=int, default=1000, help="variants SKU-000000 ... in the shop")
+    parser.add_argument("--unknown-every", type=int, default=0, help="leave every Nth SKU out of the shop")
+    parser.add_argument("--bucket", type=int, default=1000, help="cost bucket size (Shopify standard: 1000)")
+    parser.add_argument("--restore-rate", type=float, default=50, help="cost points restored per second")
+    args = parser.parse_args()
+    shop = FakeShop(args.skus, args.bucket, args.restore_rate, args.unknown_every)
+    print(f"Fake Shopify with {len(shop.items)} SKUs on http://127.0.0.1:{args.port}")
+    ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(shop)).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
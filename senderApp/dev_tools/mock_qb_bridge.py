@@ -0,0 +1,481 @@
+"""
+In-repo stand-in for the Windows qbXML bridge (server.py in SYNC_SPEC), so the sync path can be
+developed, load tested and benchmarked on Linux without QuickBooks.
+
+It speaks the bridge protocol (POST /qbxml with {"xml": ...}, answered with {"response": ...}, gzip
+either way) and keeps an in-memory company file: customers, items, currencies, customer types, sales
+reps, sales tax codes, accounts and sales orders. Adds assign ListID/TxnID, EditSequence and
+TimeModified; mods require the current EditSequence (3200) and an existing object (3120); names
+must be unique (3100) and Customer/Item references must exist (3140). List queries support
+ListID/FullName/TxnID/RefNumber filters, ActiveStatus, FromModifiedDate, MaxReturned,
+IncludeRetElement and iterators. Latency, jitter, qbXML errors and HTTP failures can be injected.
+
+    # from senderApp/
+    python -m dev_tools.mock_qb_bridge --port 8765 --items 5000 --latency-ms 40 --jitter-ms 15
+    QB_SERVER_URL=http://127.0.0.1:8765 python sync_api.py
+
+GET /stats returns request counts and object counts. start_mock_bridge() runs it in-process for
+tools and benchmarks.
+"""
+import argparse
+import copy
+import gzip
+import itertools
+import json
+import random
+import socket
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Object type -> (table, ID field). All item types share one table because item names are unique across them.
+OBJECT_TYPES = {
+    "Customer": ("customer", "ListID"),
+    "Currency": ("currency", "ListID"),
+    "CustomerType": ("customer_type", "ListID"),
+    "SalesRep": ("sales_rep", "ListID"),
+    "SalesTaxCode": ("sales_tax_code", "ListID"),
+    "Account": ("account", "ListID"),
+    "Class": ("class", "ListID"),
+    "Employee": ("employee", "ListID"),
+    "Vendor": ("vendor", "ListID"),
+    "ItemInventory": ("item", "ListID"),
+    "ItemNonInventory": ("item", "ListID"),
+    "ItemService": ("item", "ListID"),
+    "ItemOtherCharge": ("item", "ListID"),
+    "ItemSalesTax": ("item", "ListID"),
+    "SalesOrder": ("sales_order", "TxnID"),
+}
+# ItemQueryRq returns every item type.
+QUERY_ALIASES = {"Item": None}
+
+STATUS_MESSAGES = {
+    "1": "A query request did not find a matching object in QuickBooks",
+    "3100": "The name \"{name}\" of the list element is already in use.",
+    "3120": "Object \"{name}\" specified in the request cannot be found.",
+    "3140": "There is an invalid reference to QuickBooks {name} in the request.",
+    "3170": "There was an error when modifying a {name}.",
+    "3175": "There was an error when saving a {name}. Another user is editing it.",
+    "3180": "There was an error when saving a {name}.",
+    "3200": "The provided edit sequence \"{name}\" is out-of-date.",
+}
+
+
+def _now():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S+00:00")
+
+
+def _parse_time(value):
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class QBError(Exception):
+    def __init__(self, code, name=""):
+        super().__init__(code)
+        self.code = code
+        self.message = STATUS_MESSAGES.get(code, "Error").format(name=name)
+
+
+class MockCompany:
+    """The in-memory company file and qbXML request processor."""
+
+    def __init__(self, items=0, customers=0, ref_checks=True, error_rate=0.0, error_codes=("3180",), seed=None):
+        self.ref_checks = ref_checks
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.tables = {table: {} for table, _ in OBJECT_TYPES.values()}
+        self.names = {table: {} for table in self.tables}
+        self.iterators = {}
+        self.counts = {}
+        self._ids = itertools.count(0x10000)
+        self._txn_numbers = itertools.count(1)
+        self._seed(items, customers)
+
+    # --- seeding -------------------------------------------------------------------------------
+
+    def _seed(self, items, customers):
+        def add(object_type, **fields):
+            element = ET.Element(f"{object_type}Add")
+            for tag, value in fields.items():
+                ET.SubElement(element, tag).text = str(value)
+            self._add(object_type, element)
+
+        for code in ("CAD", "USD", "EUR", "GBP"):
+            add("Currency", Name=code, CurrencyCode=code)
+        add("CustomerType", Name="Shopify customers")
+        add("SalesRep", Initial="AS")
+        for code in ("Tax", "Non"):
+            add("SalesTaxCode", Name=code, IsTaxable="true" if code == "Tax" else "false")
+        for name, account_type in (("Sales", "Income"), ("Inventory Asset", "OtherCurrentAsset"),
+                                   ("Cost of Goods Sold", "CostOfGoodsSold")):
+            add("Account", Name=name, AccountType=account_type)
+        add("ItemService", Name="Shipping")
+        add("ItemSalesTax", Name="GST", TaxRate="5.0")
+        add("Customer", Name="Shopify Guest")
+        for i in range(items):
+            add("ItemInventory", Name=f"SKU-{i:06d}", SalesPrice=f"{self.random.uniform(1, 200):.2f}",
+                QuantityOnHand=self.random.randint(0, 500))
+        for i in range(customers):
+            add("Customer", Name=f"Seed Customer {i:06d}", Email=f"seed{i}@example.com")
+
+    # --- requests ------------------------------------------------------------------------------
+
+    def handle(self, envelope):
+        """Processes a QBXML request envelope and returns the response envelope."""
+        root = ET.fromstring(envelope)
+        msgs = root.find("QBXMLMsgsRq")
+        stop_on_error = msgs.get("onError", "stopOnError") == "stopOnError"
+        out = ET.Element("QBXMLMsgsRs")
+        with self.lock:
+            for rq in msgs:
+                rs = self._handle_request(rq)
+                out.append(rs)
+                if stop_on_error and rs.get("statusSeverity") == "Error":
+                    break
+        return '<?xml version="1.0" ?><QBXML>' + ET.tostring(out, encoding="unicode") + "</QBXML>"
+
+    def _handle_request(self, rq):
+        tag = rq.tag[:-2] if rq.tag.endswith("Rq") else rq.tag
+        self.counts[rq.tag] = self.counts.get(rq.tag, 0) + 1
+        rs = ET.Element(f"{tag}Rs")
+        if rq.get("requestID") is not None:
+            rs.set("requestID", rq.get("requestID"))
+        try:
+            if tag.endswith("Query"):
+                self._query(tag[:-5], rq, rs)
+            elif tag.endswith("Add") or tag.endswith("Mod"):
+                object_type, action = tag[:-3], tag[-3:]
+                body = rq.find(tag)
+                if object_type not in OBJECT_TYPES or body is None:
+                    raise QBError("3180", object_type)
+                if self.error_rate and self.random.random() < self.error_rate:
+                    raise QBError(self.random.choice(self.error_codes), object_type)
+                ret = self._add(object_type, body) if action == "Add" else self._mod(object_type, body)
+                rs.append(copy.deepcopy(ret))
+            else:
+                raise QBError("3180", tag)
+            rs.set("statusCode", rs.get("statusCode", "0"))
+            rs.set("statusSeverity", rs.get("statusSeverity", "Info"))
+            rs.set("statusMessage", rs.get("statusMessage", "Status OK"))
+        except QBError as e:
+            rs.set("statusCode", e.code)
+            rs.set("statusSeverity", "Error")
+            rs.set("statusMessage", e.message)
+        return rs
+
+    def _new_id(self):
+        return f"{next(self._ids):X}-{int(time.time())}"
+
+    def _key(self, object_type, element):
+        return element.findtext("Initial") if object_type == "SalesRep" else element.findtext("Name")
+
+    def _check_refs(self, element):
+        if not self.ref_checks:
+            return
+        for ref in element.iter():
+            if ref.tag == "CustomerRef":
+                table = "customer"
+            elif ref.tag == "ItemRef":
+                table = "item"
+            else:
+                continue
+            list_id, full_name = ref.findtext("ListID"), ref.findtext("FullName")
+            if list_id is not None and list_id not in self.tables[table]:
+                raise QBError("3140", f"{table} \"{list_id}\"")
+            if list_id is None and full_name not in self.names[table]:
+                raise QBError("3140", f"{table} \"{full_name}\"")
+
+    def _convert(self, child, ret):
+        """Appends an Add/Mod child to a Ret element with the Ret tag names QuickBooks uses."""
+        tag = child.tag
+        if tag.endswith("LineAdd") or tag.endswith("LineMod"):
+            line = ET.SubElement(ret, tag[:-3] + "Ret")
+            ET.SubElement(line, "TxnLineID").text = self._new_id()
+            for grandchild in child:
+                if grandchild.tag != "TxnLineID":
+                    line.append(copy.deepcopy(grandchild))
+        elif tag in ("DataExtAdd", "DataExtMod"):
+            data_ext = copy.deepcopy(child)
+            data_ext.tag = "DataExtRet"
+            ret.append(data_ext)
+        else:
+            ret.append(copy.deepcopy(child))
+
+    def _add(self, object_type, body):
+        table, id_field = OBJECT_TYPES[object_type]
+        key = self._key(object_type, body)
+        if id_field == "ListID" and key is not None and key in self.names[table]:
+            raise QBError("3100", key)
+        self._check_refs(body)
+        now = _now()
+        ret = ET.Element(f"{object_type}Ret")
+        object_id = self._new_id()
+        ET.SubElement(ret, id_field).text = object_id
+        ET.SubElement(ret, "TimeCreated").text = now
+        ET.SubElement(ret, "TimeModified").text = now
+        ET.SubElement(ret, "EditSequence").text = str(int(time.time()))
+        if id_field == "TxnID":
+            ET.SubElement(ret, "TxnNumber").text = str(next(self._txn_numbers))
+        for child in body:
+            self._convert(child, ret)
+            if child.tag == "Name":
+                ET.SubElement(ret, "FullName").text = child.text
+        if id_field == "ListID":
+            if ret.find("IsActive") is None:
+                ET.SubElement(ret, "IsActive").text = "true"
+            if key is not None:
+                self.names[table][key] = object_id
+        self.tables[table][object_id] = ret
+        return ret
+
+    def _mod(self, object_type, body):
+        table, id_field = OBJECT_TYPES[object_type]
+        object_id = body.findtext(id_field)
+        ret = self.tables[table].get(object_id)
+        if ret is None or not ret.tag.startswith(object_type):
+            raise QBError("3120", object_id)
+        if body.findtext("EditSequence") != ret.findtext("EditSequence"):
+            raise QBError("3200", body.findtext("EditSequence"))
+        self._check_refs(body)
+
+        old_key = self._key(object_type, ret)
+        new_key = self._key(object_type, body)
+        if id_field == "ListID" and new_key is not None and new_key != old_key:
+            if new_key in self.names[table]:
+                raise QBError("3100", new_key)
+            self.names[table].pop(old_key, None)
+            self.names[table][new_key] = object_id
+
+        children = [child for child in body if child.tag not in (id_field, "EditSequence")]
+        if any(child.tag.endswith("LineMod") for child in children):
+            # Lines left out of a mod are deleted; the repo always sends the full set.
+            for line in [line for line in ret if line.tag.endswith("LineRet")]:
+                ret.remove(line)
+        for child in children:
+            if not child.tag.endswith("LineMod"):
+                for existing in ret.findall("DataExtRet" if child.tag == "DataExtMod" else child.tag):
+                    ret.remove(existing)
+            self._convert(child, ret)
+            if child.tag == "Name":
+                for existing in ret.findall("FullName"):
+                    existing.text = child.text
+        ret.find("TimeModified").text = _now()
+        edit_sequence = ret.find("EditSequence")
+        edit_sequence.text = str(max(int(edit_sequence.text) + 1, int(time.time())))
+        return ret
+
+    def _query(self, object_type, rq, rs):
+        iterator = rq.get("iterator")
+        if iterator == "Continue":
+            state = self.iterators.get(rq.get("iteratorID"))
+            if state is None:
+                raise QBError("3120", f"iterator {rq.get('iteratorID')}")
+            matches, include = state
+        else:
+            matches = self._matches(object_type, rq)
+            include = [element.text for element in rq.findall("IncludeRetElement")]
+
+        max_returned = rq.findtext("MaxReturned")
+        if iterator:
+            page_size = int(max_returned) if max_returned else len(matches)
+            page, rest = matches[:page_size], matches[page_size:]
+            iterator_id = rq.get("iteratorID") or f"{{{self._new_id()}}}"
+            if rest:
+                self.iterators[iterator_id] = (rest, include)
+            else:
+                self.iterators.pop(iterator_id, None)
+            rs.set("iteratorRemainingCount", str(len(rest)))
+            rs.set("iteratorID", iterator_id)
+        else:
+            page = matches[:int(max_returned)] if max_returned else matches
+
+        include_lines = (rq.findtext("IncludeLineItems") or "").lower() == "true"
+        for ret in page:
+            rs.append(self._project(ret, include, include_lines))
+        if not page:
+            rs.set("statusCode", "1")
+            rs.set("statusSeverity", "Info")
+            rs.set("statusMessage", STATUS_MESSAGES["1"])
+
+    def _matches(self, object_type, rq):
+        if object_type in QUERY_ALIASES:
+            candidates = list(self.tables["item"].values())
+        elif object_type in OBJECT_TYPES:
+            table, _ = OBJECT_TYPES[object_type]
+            candidates = [ret for ret in self.tables[table].values() if ret.tag == f"{object_type}Ret"]
+        else:
+            raise QBError("3180", object_type)
+
+        list_ids = {element.text for element in rq.findall("ListID")}
+        txn_ids = {element.text for element in rq.findall("TxnID")}
+        full_names = {element.text for element in rq.findall("FullName")}
+        ref_numbers = {element.text for element in rq.findall("RefNumber")}
+        active_status = rq.findtext("ActiveStatus") or "ActiveOnly"
+        from_modified = _parse_time(rq.findtext("FromModifiedDate") or rq.findtext("ModifiedDateRangeFilter/FromModifiedDate"))
+        data_ext = rq.find("DataExtRet")
+
+        def keep(ret):
+            if list_ids and ret.findtext("ListID") not in list_ids:
+                return False
+            if txn_ids and ret.findtext("TxnID") not in txn_ids:
+                return False
+            if full_names and (ret.findtext("FullName") or ret.findtext("Initial")) not in full_names:
+                return False
+            if ref_numbers and ret.findtext("RefNumber") not in ref_numbers:
+                return False
+            # Name filters return inactive objects too, as in QuickBooks.
+            if not (list_ids or full_names) and ret.find("IsActive") is not None:
+                is_active = ret.findtext("IsActive") != "false"
+                if (active_status == "ActiveOnly" and not is_active) or (active_status == "InactiveOnly" and is_active):
+                    return False
+            if from_modified is not None and _parse_time(ret.findtext("TimeModified")) < from_modified:
+                return False
+            if data_ext is not None:
+                wanted = (data_ext.findtext("DataExtName"), data_ext.findtext("DataExtValue"))
+                if not any((found.findtext("DataExtName"), found.findtext("DataExtValue")) == wanted
+                           for found in ret.findall("DataExtRet")):
+                    return False
+            return True
+
+        return [ret for ret in candidates if keep(ret)]
+
+    def _project(self, ret, include, include_lines):
+        projected = ET.Element(ret.tag)
+        for child in ret:
+            if include and child.tag not in include:
+                continue
+            if child.tag.endswith("LineRet") and not include_lines:
+                continue
+            projected.append(child)
+        return projected
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": dict(self.counts),
+                "objects": {table: len(objects) for table, objects in self.tables.items()},
+                "open_iterators": len(self.iterators),
+            }
+
+
+def make_handler(company, latency=0.0, per_request=0.0, jitter=0.0, http_error_rate=0.0, rng=None):
+    rng = rng or random.Random()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body are separate writes; without this, Nagle + delayed ACK add ~40 ms per call.
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                return self._reply(200, json.dumps(company.stats()).encode())
+            self._reply(200, b'{"status": "mock qbXML bridge"}')
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path.rstrip("/") != "/qbxml":
+                return self._reply(404, b'{"error": "Not Found"}')
+            if self.headers.get("Content-Encoding") == "gzip":
+                body = gzip.decompress(body)
+            xml = json.loads(body)["xml"]
+            requests = xml.count("Rq requestID=") or 1
+            delay = latency + per_request * requests + (rng.uniform(-jitter, jitter) if jitter else 0.0)
+            if delay > 0:
+                time.sleep(delay)
+            if http_error_rate and rng.random() < http_error_rate:
+                return self._reply(503, b'{"error": "QuickBooks is busy"}')
+            try:
+                response = company.handle(xml)
+            except ET.ParseError as e:
+                return self._reply(400, json.dumps({"error": f"Invalid qbXML: {e}"}).encode())
+            self._reply(200, json.dumps({"response": response}).encode())
+
+        def _reply(self, status, out):
+            headers = {"Content-Type": "application/json"}
+            if len(out) > 1024 and "gzip" in self.headers.get("Accept-Encoding", ""):
+                out = gzip.compress(out, compresslevel=5)
+                headers["Content-Encoding"] = "gzip"
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(out)))
+            self.end_headers()
+            self.wfile.write(out)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def start_mock_bridge(port=0, latency_ms=0.0, per_request_ms=0.0, jitter_ms=0.0, http_error_rate=0.0, **company_options):
+    """
+    Starts the mock bridge in a daemon thread and returns (server, base_url, company).
+    Set QB_SERVER_URL to base_url; call server.shutdown() to stop it.
+    """
+    company = MockCompany(**company_options)
+    handler = make_handler(company, latency_ms / 1000, per_request_ms / 1000, jitter_ms / 1000, http_error_rate,
+                           random.Random(company_options.get("seed")))
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-qb-bridge", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", company
+
+
+def add_arguments(parser):
+    """Adds the mock bridge options to an argparse parser (shared with tools that embed the mock)."""
+    parser.add_argument("--items", type=int, default=1000, help="inventory items SKU-000000 ... to seed (default 1000)")
+    parser.add_argument("--customers", type=int, default=0, help="customers to seed")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fixed delay per envelope")
+    parser.add_argument("--per-request-ms", type=float, default=0.0, help="extra delay per request in the envelope")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="uniform +/- jitter added to the delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Add/Mod requests that fail")
+    parser.add_argument("--error-codes", default="3180", help="comma-separated statusCodes for injected failures")
+    parser.add_argument("--http-error-rate", type=float, default=0.0, help="fraction of envelopes answered with HTTP 503")
+    parser.add_argument("--no-ref-checks", action="store_true", help="accept CustomerRef/ItemRef to unknown objects")
+    parser.add_argument("--seed", type=int, help="random seed for seeded data and injected failures")
+
+
+def options_from_args(args):
+    return {
+        "latency_ms": args.latency_ms,
+        "per_request_ms": args.per_request_ms,
+        "jitter_ms": args.jitter_ms,
+        "http_error_rate": args.http_error_rate,
+        "items": args.items,
+        "customers": args.customers,
+        "ref_checks": not args.no_ref_checks,
+        "error_rate": args.error_rate,
+        "error_codes": [code.strip() for code in args.error_codes.split(",") if code.strip()],
+        "seed": args.seed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock QuickBooks qbXML bridge with an in-memory company file.")
+    parser.add_argument("--port", type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server, base_url, company = start_mock_bridge(args.port, **options_from_args(args))
+    print(f"Mock qbXML bridge on {base_url}/qbxml with {company.stats()['objects']}")
+    print(f"Use QB_SERVER_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Replays archived Shopify webhook payloads against the sync service and reports throughput, latency
+percentiles and error rates, so performance changes can be measured with production-shaped traffic.
+
+Payloads are read from payload archive segments (logs/payloads/*.jsonl.gz, see
+sync_scripts/payload_archive.py), from the per-order JSON files older versions wrote to logs/, or
+from JSONL files of {"kind", "event", "payload"} records. Each one is sent either to a running API
+(POST /customer, PUT /customer/<id>, POST /order, ...) or straight into the sync functions
+(--direct), which then talk to the bridge in QB_SERVER_URL.
+
+    # from senderApp/, against a running sync_api.py or async_api.py
+    python -m dev_tools.replay logs/payloads --target http://127.0.0.1:5000 --concurrency 16
+    # no API server: call create_order_to_qb & co. in this process at a fixed arrival rate
+    python -m dev_tools.replay logs/payloads --direct --rate 50 --duration 60
+
+    # no QuickBooks at all: an in-process mock bridge with 40 ms +/- 15 ms per envelope
+    python -m dev_tools.replay logs/payloads --direct --mock-bridge --latency-ms 40 --jitter-ms 15
+
+Replayed creates are real writes, so hosts other than localhost are refused unless --allow-remote
+is given. Point QB_SERVER_URL (or the API's bridge) at a test company file or the mock bridge.
+
+Every request to an API carries a new X-Shopify-Webhook-Id, so each send (also the repeats of
+--loop and --duration) is a new delivery to the API's idempotency check instead of a redelivery
+answered from its stored response.
+"""
+import argparse
+import glob
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+from dev_tools.mock_qb_bridge import add_arguments as add_mock_arguments, options_from_args as mock_options_from_args, start_mock_bridge
+from sync_scripts.idempotency import WEBHOOK_ID_HEADER
+
+KINDS = ("customer", "order", "product")
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1", "")
+
+
+# --- Payload sources ---------------------------------------------------------------------------
+
+def _iter_jsonl(path, default_kind):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "payload" in record:
+                yield record
+            elif default_kind:
+                # A bare Shopify object per line.
+                yield {"kind": default_kind, "event": "create", "id": record.get("id"), "payload": record}
+
+
+def _iter_legacy_order_file(path):
+    with open(path, encoding="utf-8") as f:
+        payload = json.load(f)
+    yield {"kind": "order", "event": "create", "id": payload.get("id"), "payload": payload}
+
+
+def iter_records(sources, kinds=None, default_kind=None):
+    """
+    Yields {"kind", "event", "id", "payload"} records from archive segments, legacy
+    logs/order_*.json files and JSONL files. Directories are searched for all three.
+    """
+    from sync_scripts.payload_archive import iter_segment
+
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            found = []
+            for pattern in ("payloads-*.jsonl.*", "order_*.json", "*.jsonl"):
+                found.extend(glob.glob(os.path.join(source, pattern)))
+            paths.extend(sorted(found, key=lambda path: (os.path.getmtime(path), path)))
+        else:
+            paths.extend(sorted(glob.glob(source)) or [source])
+
+    for path in paths:
+        name = os.path.basename(path)
+        if name.startswith("payloads-") and (name.endswith(".gz") or name.endswith(".zst")):
+            records = iter_segment(path)
+        elif name.startswith("order_") and name.endswith(".json"):
+            records = _iter_legacy_order_file(path)
+        else:
+            records = _iter_jsonl(path, default_kind)
+        for record in records:
+            if kinds is None or record.get("kind") in kinds:
+                yield record
+
+
+# --- Targets -----------------------------------------------------------------------------------
+
+class HttpTarget:
+    """
+    Sends each record to the matching API route of a running sync service, as a new webhook
+    delivery (unique X-Shopify-Webhook-Id) so that repeated payloads are synced again.
+    """
+
+    def __init__(self, base_url, prefer_async=False, timeout=120):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.headers = {"Content-Type": "application/json"}
+        if prefer_async:
+            self.headers["Prefer"] = "respond-async"
+        self._local = threading.local()
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def __call__(self, record):
+        """Returns None on success or a short error label."""
+        kind, payload = record["kind"], record["payload"]
+        body = payload if isinstance(payload, str) else json.dumps(payload)
+        if record.get("event") == "update" and kind != "product":
+            method, url = "PUT", f"{self.base_url}/{kind}/{record.get('id') or _payload_id(payload)}"
+        else:
+            method, url = "POST", f"{self.base_url}/{kind}/"
+        headers = dict(self.headers)
+        headers[WEBHOOK_ID_HEADER] = uuid.uuid4().hex
+        response = self._session().request(method, url, data=body, headers=headers, timeout=self.timeout)
+        return None if response.status_code < 300 else f"HTTP {response.status_code}"
+
+
+class DirectTarget:
+    """Calls the sync functions in this process, as the routes and job queue workers do."""
+
+    def __init__(self):
+        from sync_scripts.customer_sync import create_customer_to_qb, update_customer_in_qb
+        from sync_scripts.order_sync import create_order_to_qb, update_order_in_qb
+        from sync_scripts.product_sync import sync_product_to_qb
+        self.functions = {
+            ("customer", "create"): create_customer_to_qb,
+            ("customer", "update"): update_customer_in_qb,
+            ("order", "create"): create_order_to_qb,
+            ("order", "update"): update_order_in_qb,
+            ("product", "create"): sync_product_to_qb,
+            ("product", "update"): sync_product_to_qb,
+        }
+
+    def __call__(self, record):
+        payload = record["payload"]
+        body = payload if isinstance(payload, str) else json.dumps(payload)
+        result = self.functions[(record["kind"], record.get("event") or "create")](body)
+        if result is None:
+            return "no result"
+        if "error" in result:
+            return f"statusCode {result['statusCode']}" if result.get("statusCode") else "sync error"
+        return None
+
+
+def _payload_id(payload):
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    return payload.get("id")
+
+
+# --- Load generation ---------------------------------------------------------------------------
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(Counter)
+
+    def record(self, key, seconds, error):
+        with self.lock:
+            self.latencies[key].append(seconds)
+            if error:
+                self.errors[key][error] += 1
+
+    def report(self, elapsed):
+        def summarize(latencies, errors):
+            values = sorted(latencies)
+            failed = sum(errors.values())
+            return {
+                "requests": len(values),
+                "errors": failed,
+                "error_rate": round(failed / len(values), 4) if values else 0.0,
+                "p50_ms": _ms(percentile(values, 0.50)),
+                "p95_ms": _ms(percentile(values, 0.95)),
+                "p99_ms": _ms(percentile(values, 0.99)),
+                "max_ms": _ms(values[-1] if values else None),
+                "error_types": dict(errors.most_common()),
+            }
+
+        with self.lock:
+            everything = [value for values in self.latencies.values() for value in values]
+            all_errors = sum(self.errors.values(), Counter())
+            report = summarize(everything, all_errors)
+            report["seconds"] = round(elapsed, 2)
+            report["throughput_rps"] = round(len(everything) / elapsed, 2) if elapsed > 0 else 0.0
+            report["by_type"] = {key: summarize(self.latencies[key], self.errors[key]) for key in sorted(self.latencies)}
+        return report
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def replay(records, target, concurrency=8, rate=None, duration=None, limit=None, loop=False):
+    """
+    Replays records through `target` and returns the report dictionary.
+
+    Without `rate` this is a closed loop: `concurrency` workers each send the next payload as soon
+    as their previous one finished. With `rate` (payloads per second) payloads are released on a
+    fixed schedule regardless of how fast they complete, and latency is measured from the scheduled
+    release, so a slow service shows up as queueing delay instead of a lower offered load.
+    """
+    records = list(records)
+    if not records:
+        raise ValueError("No payloads to replay.")
+    recorder = Recorder()
+    stop_at = time.monotonic() + duration if duration else None
+    total = limit or (None if loop or duration else len(records))
+
+    def schedule():
+        sent = 0
+        while total is None or sent < total:
+            if stop_at is not None and time.monotonic() >= stop_at:
+                return
+            if sent >= len(records) and not (loop or duration):
+                return
+            yield records[sent % len(records)]
+            sent += 1
+
+    def send(record, released_at):
+        error = None
+        try:
+            error = target(record)
+        except Exception as e:
+            error = type(e).__name__
+        recorder.record(f"{record['kind']}.{record.get('event') or 'create'}", time.monotonic() - released_at, error)
+
+    started = time.monotonic()
+    if rate:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for i, record in enumerate(schedule()):
+                release = started + i / rate
+                delay = release - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(send, record, release)
+    else:
+        source = schedule()
+        source_lock = threading.Lock()
+
+        def worker():
+            while True:
+                with source_lock:
+                    record = next(source, None)
+                if record is None:
+                    return
+                send(record, time.monotonic())
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return recorder.report(time.monotonic() - started)
+
+
+def print_report(report):
+    print(f"\n{report['requests']} request(s) in {report['seconds']}s: {report['throughput_rps']} req/s, "
+          f"{report['errors']} error(s) ({report['error_rate']:.2%})")
+    print(f"{'type':<18}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    rows = list(report["by_type"].items()) + [("all", report)]
+    for key, row in rows:
+        print(f"{key:<18}{row['requests']:>8}{row['errors']:>8}"
+              + "".join(f"{row[name] if row[name] is not None else '-':>10}" for name in ("p50_ms", "p95_ms", "p99_ms", "max_ms")))
+    for key, row in rows[:-1]:
+        for error, count in row["error_types"].items():
+            print(f"  {key}: {count} x {error}")
+
+
+def _check_local(url, what, allow_remote):
+    host = urlparse(url).hostname or ""
+    if host not in LOCAL_HOSTS and not allow_remote:
+        raise SystemExit(f"Refusing to replay writes to {what} {url}; pass --allow-remote if that is intended.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay archived webhook payloads and report latency percentiles.")
+    parser.add_argument("sources", nargs="+", help="archive directory, segment files, legacy logs/order_*.json or JSONL files")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--target", help="base URL of a running sync API, e.g. http://127.0.0.1:5000")
+    target.add_argument("--direct", action="store_true", help="call the sync functions in this process")
+    parser.add_argument("--kind", action="append", choices=KINDS, help="only replay these kinds (repeatable)")
+    parser.add_argument("--default-kind", choices=KINDS, help="kind of bare Shopify objects in JSONL input")
+    parser.add_argument("--concurrency", type=int, default=8, help="parallel requests (default 8)")
+    parser.add_argument("--rate", type=float, help="open loop: payloads released per second")
+    parser.add_argument("--duration", type=float, help="seconds to run, cycling through the payloads")
+    parser.add_argument("--limit", type=int, help="stop after this many payloads")
+    parser.add_argument("--loop", action="store_true", help="cycle through the payloads until --limit or --duration")
+    parser.add_argument("--prefer-async", action="store_true", help="send Prefer: respond-async (measures ingest only)")
+    parser.add_argument("--allow-remote", action="store_true", help="allow non-local API or bridge hosts")
+    parser.add_argument("--json", help="also write the report to this file")
+    mock = parser.add_argument_group("mock bridge", "with --direct --mock-bridge, replay against an in-process mock QuickBooks bridge")
+    mock.add_argument("--mock-bridge", action="store_true", help="start dev_tools/mock_qb_bridge.py and use it as QB_SERVER_URL")
+    add_mock_arguments(mock)
+    args = parser.parse_args(argv)
+
+    mock_company = None
+    if args.mock_bridge:
+        if not args.direct:
+            parser.error("--mock-bridge needs --direct; start the API with QB_SERVER_URL pointing at the mock instead.")
+        _, base_url, mock_company = start_mock_bridge(**mock_options_from_args(args))
+        # Before the first sync_scripts.qb_client import, which reads QB_SERVER_URL.
+        os.environ["QB_SERVER_URL"] = base_url
+        print(f"Replaying against mock bridge {base_url}")
+
+    if args.direct:
+        from sync_scripts.qb_client import SERVER_URL
+        _check_local(SERVER_URL, "the QuickBooks bridge", args.allow_remote)
+        replay_target = DirectTarget()
+    else:
+        _check_local(args.target, "the API", args.allow_remote)
+        replay_target = HttpTarget(args.target, prefer_async=args.prefer_async)
+
+    records = iter_records(args.sources, set(args.kind) if args.kind else None, args.default_kind)
+    report = replay(records, replay_target, args.concurrency, args.rate, args.duration, args.limit, args.loop)
+    print_report(report)
+    if mock_company is not None:
+        print(f"Mock bridge requests: {mock_company.stats()['requests']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0 if report["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+import argparse
+import logging
+import os
+import sys
+from xml.sax.saxutils import escape
+
+# Allow running this script directly from the getFields_src directory.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sync_scripts import log_config
+from sync_scripts.list_export import LIST_TYPES, export_list
+from sync_scripts.qbxml_paging import QBPagingError, build_list_filters
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    """
+    Exports one or more QuickBooks lists to JSONL files.
+
+    Examples (from senderApp/):
+        python -m getFields_src.export_list currency customer_type sales_rep
+        python -m getFields_src.export_list customer --page-size 200
+        python -m getFields_src.export_list customer --full
+        python -m getFields_src.export_list currency --full-name "US Dollar" --output json/us_dollar.jsonl
+    """
+    parser = argparse.ArgumentParser(description="Export QuickBooks lists to JSONL using iterator paging.")
+    parser.add_argument("list_types", nargs="+", metavar="LIST_TYPE",
+                        help=f"List to export: {', '.join(sorted(LIST_TYPES))}, or any name with --request.")
+    parser.add_argument("--output-dir", default="json", help="Directory for <list_type>.jsonl files (default: json).")
+    parser.add_argument("--output", help="Output file (only with a single list type).")
+    parser.add_argument("--page-size", type=int, help="Records per page for pageable lists (default: QB_PAGE_SIZE).")
+    parser.add_argument("--active-status", choices=("ActiveOnly", "InactiveOnly", "All"),
+                        help="ActiveStatus filter (QuickBooks defaults to ActiveOnly).")
+    parser.add_argument("--from-modified-date", help="Only export records modified since this date/time.")
+    parser.add_argument("--full-name", help="Export the single record with this FullName instead of the whole list.")
+    parser.add_argument("--request", help="Query request to use, e.g. PriceLevelQueryRq (for unlisted types).")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and start from the beginning.")
+    parser.add_argument("--full", action="store_true",
+                        help="Re-export the whole list instead of merging changes since the last export.")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.list_types) > 1:
+        parser.error("--output can only be used with a single list type.")
+    log_config.configure()
+
+    if args.full_name:
+        # A FullName lookup excludes the other list filters in qbXML.
+        filters_xml = f"<FullName>{escape(args.full_name)}</FullName>"
+    else:
+        filters_xml = build_list_filters(args.active_status, args.from_modified_date)
+
+    failed = False
+    for list_type in args.list_types:
+        output_path = args.output or os.path.join(args.output_dir, f"{list_type}.jsonl")
+        try:
+            export_list(
+                list_type,
+                output_path,
+                filters_xml=filters_xml,
+                page_size=args.page_size,
+                resume=not args.restart,
+                rq_tag=args.request,
+                paged=False if args.full_name else None,
+                incremental=not args.full,
+            )
+        except QBPagingError as e:
+            logger.error("QuickBooks Error while exporting %s: %s", list_type, e)
+            failed = True
+        except Exception as e:
+            logger.exception("An unexpected error occurred while exporting %s: %s", list_type, e)
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,58 @@
-from flask import Flask
+from flask import Flask, Response, g, request
+from flask.json.provider import DefaultJSONProvider
 from api_routes.customer_routes import customer_bp
 from api_routes.order_routes import order_bp
+from api_routes.job_routes import job_bp
+from api_routes.product_routes import product_bp
+from api_routes.inventory_routes import inventory_bp
+from api_routes.ingest import INGEST_MODE
+from sync_scripts.job_queue import QUEUE_WORKERS_CONFIGURED, start_workers, start_workers_on_demand
+from sync_scripts.customer_backfill import MAX_UPLOAD_BYTES
+from sync_scripts.item_catalog import PRELOAD as ITEM_CATALOG_PRELOAD, item_catalog
+from sync_scripts.inventory_sync import (
+    SYNC_INTERVAL as INVENTORY_SYNC_INTERVAL,
+    start_scheduler as start_inventory_scheduler,
+)
+from sync_scripts import json_backend, log_config, metrics
+
+class SyncJSONProvider(DefaultJSONProvider):
+    """
+    Decodes request bodies and encodes jsonify() responses with sync_scripts.json_backend (orjson
+    when installed). Indented output, used when the app runs in debug mode, goes through the
+    standard provider.
+    """
+
+    def dumps(self, obj, **kwargs):
+        if "indent" in kwargs:
+            return super().dumps(obj, **kwargs)
+        return json_backend.dumps(obj, default=self.default)
+
+    def loads(self, s, **kwargs):
+        return json_backend.loads(s)
+
+# Send all logging through the background log writer (console and sync_client.log)
+log_config.configure()
 
 app = Flask(__name__)
+app.json = SyncJSONProvider(app)
+# Bulk customer uploads are the largest request bodies; anything bigger is answered with 413
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+@app.before_request
+def _bind_request_id():
+    # Correlation ID for everything logged while handling this request
+    g.log_token = log_config.set_request_id(request.headers.get(log_config.REQUEST_ID_HEADER))
+
+@app.after_request
+def _echo_request_id(response):
+    response.headers[log_config.REQUEST_ID_HEADER] = log_config.current_request_id()
+    return response
+
+@app.teardown_request
+def _unbind_request_id(exc):
+    token = g.pop("log_token", None)
+    if token is not None:
+        log_config.reset_request_id(token)
 
 # Register the customer blueprint with a URL prefix
 app.register_blueprint(customer_bp, url_prefix='/customer')
@@ -10,9 +60,40 @@ app.register_blueprint(customer_bp, url_prefix='/customer')
 # Register the order blueprint with a URL prefix
 app.register_blueprint(order_bp, url_prefix='/order')
 
+# Register the job status blueprint with a URL prefix
+app.register_blueprint(job_bp, url_prefix='/jobs')
+
+# Register the product blueprint with a URL prefix
+app.register_blueprint(product_bp, url_prefix='/product')
+
+# Register the inventory blueprint with a URL prefix
+app.register_blueprint(inventory_bp, url_prefix='/inventory')
+
+# Start the background workers that drain the durable job queue (one set per gunicorn worker) in queue
+# ingest mode or when SYNC_QUEUE_WORKERS asks for them; otherwise only once a request is queued
+if INGEST_MODE == "queue" or QUEUE_WORKERS_CONFIGURED:
+    start_workers()
+else:
+    start_workers_on_demand()
+
+# Load the SKU -> item catalog in the background so the first orders can use ListIDs (opt-in)
+if ITEM_CATALOG_PRELOAD:
+    item_catalog.warm()
+
+# Queue an inventory sync every INVENTORY_SYNC_INTERVAL seconds (opt-in)
+if INVENTORY_SYNC_INTERVAL > 0:
+    start_inventory_scheduler()
+
 @app.route('/')
 def index():
-    return "Sync API is running. Use the /customer endpoint to sync customers, or /order endpoint to sync orders."
+    return "Sync API is running. Use the /customer endpoint to sync customers, /order endpoint to sync orders, or /product endpoint to sync products."
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms and outcome counters of all workers."""
+    if not metrics.ENABLED:
+        return Response("Metrics are disabled (SYNC_METRICS=false).\n", status=404, mimetype="text/plain")
+    return Response(metrics.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
 
 if __name__ == '__main__':
     # For development, the built-in server is fine.
@@ -0,0 +1,260 @@
+import asyncio
+import gzip
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+from sync_scripts.qb_client import (
+    CONNECT_TIMEOUT,
+    GZIP_MIN_BYTES,
+    GZIP_REQUESTS,
+    READ_TIMEOUT,
+    SERVER_URL,
+    QBResponseError,
+)
+from sync_scripts import bridge_governor, json_backend, metrics
+from sync_scripts.qbxml_batch import QBXMLBatch
+from sync_scripts.entity_scheduler import lock_entity_async, unlock_entity
+from sync_scripts.customer_sync import create_customer_flow, get_reference_maps, update_customer_flow
+from sync_scripts.order_sync import create_order_flow, update_order_flow
+from sync_scripts.product_sync import sync_product_flow
+
+try:
+    import aiohttp
+except ImportError:  # Only needed for the asyncio server (async_api.py)
+    aiohttp = None
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Connections to the bridge shared by every in-flight request of one async server process.
+# Requests beyond this wait for a free connection without holding a thread.
+ASYNC_POOL_SIZE = int(os.environ.get("QB_ASYNC_POOL_SIZE", "32"))
+
+
+class AsyncQBClient:
+    """
+    asyncio counterpart of QBClient: posts qbXML to the bridge over a pooled keep-alive
+    aiohttp session, with the same timeouts, gzip handling and errors.
+    """
+
+    def __init__(self, server_url=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 gzip_requests=None):
+        if aiohttp is None:
+            raise RuntimeError("The asyncio sync engine requires aiohttp (pip install aiohttp).")
+        self.server_url = server_url or SERVER_URL
+        self.pool_size = pool_size or ASYNC_POOL_SIZE
+        self.connect_timeout = connect_timeout if connect_timeout is not None else CONNECT_TIMEOUT
+        self.read_timeout = read_timeout if read_timeout is not None else READ_TIMEOUT
+        self.gzip_requests = GZIP_REQUESTS if gzip_requests is None else gzip_requests
+        self._session = None
+
+    def _get_session(self):
+        # Created on first use so it binds to the running event loop.
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+                headers={"Accept-Encoding": "gzip, deflate"},
+            )
+        return self._session
+
+    async def send(self, xml_request):
+        """
+        Posts a qbXML request to the bridge and returns the raw qbXML response string.
+        Raises aiohttp.ClientError or QBResponseError on transport or protocol errors, and
+        BridgeUnavailable when the bridge governor refuses the call.
+        """
+        body = json_backend.dumps_bytes({"xml": xml_request})
+        headers = {"Content-Type": "application/json"}
+        if self.gzip_requests and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+        lease = await bridge_governor.acquire_async()
+        start = time.perf_counter()
+        ok = False
+        try:
+            with metrics.stage("bridge_round_trip"):
+                async with self._get_session().post(self.server_url, data=body, headers=headers) as response:
+                    response.raise_for_status()
+                    response_json = await response.json(content_type=None, loads=json_backend.loads)
+
+            if "response" not in response_json:
+                raise QBResponseError(f"'response' key not found in server response: {response_json}")
+            ok = True
+            return response_json["response"]
+        finally:
+            await bridge_governor.release_async(lease, time.perf_counter() - start, ok)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def run_flow_async(flow, client):
+    """
+    Runs a sync flow (see qb_flow.py) on the event loop: batches are sent with the AsyncQBClient and
+    LocalCall steps run in a worker thread. Returns the flow's result.
+    """
+    outer_labels = metrics.current_operation()
+    start = time.perf_counter()
+    result_outcome = "exception"
+    try:
+        value, error = None, None
+        while True:
+            try:
+                step = flow.throw(error) if error is not None else flow.send(value)
+            except StopIteration as stop:
+                result_outcome = metrics.outcome(stop.value)
+                return stop.value
+            value, error = None, None
+            try:
+                if isinstance(step, QBXMLBatch):
+                    value = step.parse(await client.send(step.build())) if len(step) else {}
+                else:
+                    value = await asyncio.to_thread(step)
+            except Exception as e:
+                error = e
+    finally:
+        metrics.record_operation(metrics.current_operation(), time.perf_counter() - start, result_outcome)
+        metrics.restore_operation(outer_labels)
+
+
+class _AsyncWork:
+    __slots__ = ("fn", "payload", "coalesce", "future")
+
+    def __init__(self, fn, payload, coalesce, future):
+        self.fn = fn
+        self.payload = payload
+        self.coalesce = coalesce
+        self.future = future
+
+
+class _AsyncEntityState:
+    __slots__ = ("active", "queue")
+
+    def __init__(self):
+        self.active = None
+        self.queue = deque()
+
+
+class AsyncEntityScheduler:
+    """
+    asyncio counterpart of EntityScheduler: calls for the same entity run one at a time in arrival
+    order, and a still-queued coalescable call takes the payload of newer calls, whose callers all
+    receive its result. Queued calls are plain futures, so waiting costs no thread. The running call
+    holds the entity's lock in the state database, like EntityScheduler.
+    """
+
+    def __init__(self):
+        self._states = {}
+
+    async def run(self, entity_key, fn, payload, coalesce=True):
+        """Awaits fn(payload) once no earlier call for `entity_key` is in flight and returns its result."""
+        if entity_key is None:
+            return await fn(payload)
+
+        loop = asyncio.get_running_loop()
+        state = self._states.get(entity_key)
+        if state is None:
+            state = self._states[entity_key] = _AsyncEntityState()
+
+        if state.active is None:
+            work = state.active = _AsyncWork(fn, payload, coalesce, loop.create_future())
+            loop.create_task(self._execute(entity_key, state, work))
+        else:
+            last = state.queue[-1] if state.queue else None
+            if coalesce and last is not None and last.coalesce and last.fn == fn:
+                # Newer data supersedes the queued call; it will run with this payload.
+                last.payload = payload
+                work = last
+            else:
+                work = _AsyncWork(fn, payload, coalesce, loop.create_future())
+                state.queue.append(work)
+        # Shielded so a caller that goes away (e.g. client disconnect) does not cancel the sync.
+        return await asyncio.shield(work.future)
+
+    async def _execute(self, entity_key, state, work):
+        try:
+            holder = await lock_entity_async(entity_key)
+            if holder is None:
+                work.future.set_result(None)
+            else:
+                try:
+                    work.future.set_result(await work.fn(work.payload))
+                finally:
+                    await asyncio.to_thread(unlock_entity, entity_key, holder)
+        except asyncio.CancelledError:
+            # The task itself was cancelled (e.g. the server is shutting down): cancel this call and
+            # the ones queued behind it, so none of their callers waits forever.
+            work.future.cancel()
+            for queued in state.queue:
+                queued.future.cancel()
+            state.queue.clear()
+            raise
+        except Exception as e:
+            work.future.set_exception(e)
+        finally:
+            if state.queue:
+                state.active = state.queue.popleft()
+                asyncio.get_running_loop().create_task(self._execute(entity_key, state, state.active))
+            else:
+                state.active = None
+                del self._states[entity_key]
+
+    def pending(self):
+        """Returns the number of entities with a call in flight, for diagnostics."""
+        return len(self._states)
+
+
+class AsyncSyncEngine:
+    """
+    The customer/order/product sync pipeline on asyncio. Runs the same flows as the blocking sync functions,
+    so results and side effects (ID index, applied hashes) are identical; only the I/O differs.
+    Payloads are the JSON strings the sync functions take.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or AsyncQBClient()
+        self.scheduler = AsyncEntityScheduler()
+
+    async def run(self, flow):
+        return await run_flow_async(flow, self.client)
+
+    async def _create_customer(self, payload):
+        return await self.run(create_customer_flow(payload))
+
+    async def _update_customer(self, payload):
+        return await self.run(update_customer_flow(payload))
+
+    async def _create_order(self, payload):
+        return await self.run(create_order_flow(payload))
+
+    async def _update_order(self, payload):
+        return await self.run(update_order_flow(payload))
+
+    async def _sync_product(self, payload):
+        return await self.run(sync_product_flow(payload))
+
+    async def create_customer(self, payload, entity_key=None):
+        return await self.scheduler.run(entity_key, self._create_customer, payload, coalesce=False)
+
+    async def update_customer(self, payload, entity_key=None):
+        return await self.scheduler.run(entity_key, self._update_customer, payload)
+
+    async def create_order(self, payload, entity_key=None):
+        return await self.scheduler.run(entity_key, self._create_order, payload, coalesce=False)
+
+    async def update_order(self, payload, entity_key=None):
+        return await self.scheduler.run(entity_key, self._update_order, payload)
+
+    async def sync_product(self, payload, entity_key=None):
+        return await self.scheduler.run(entity_key, self._sync_product, payload)
+
+    async def reference_maps(self):
+        """Returns (currency_map, customer_type_map, sales_rep_map) from the shared reference cache."""
+        return await asyncio.to_thread(get_reference_maps)
+
+    async def close(self):
+        await self.client.close()
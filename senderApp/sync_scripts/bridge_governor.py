@@ -0,0 +1,467 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+import requests
+from dotenv import load_dotenv
+from sync_scripts.state_db import get_connection, register_schema, transaction
+from sync_scripts import metrics
+
+logger = logging.getLogger(__name__)
+
+# Concurrency governor and circuit breaker for the QuickBooks bridge, shared by every worker process.
+#
+# QuickBooks Desktop works through one qbXML session at a time, so piling more envelopes on a slow
+# bridge only makes every request slower. Each round trip takes a slot (a lease row in the state
+# database) before it is sent. The number of slots adapts AIMD-style: every fast success adds
+# 1/limit, and a failure or a round trip slower than its latency target halves it, at most once per
+# round trip. The target is QB_BRIDGE_LATENCY_TARGET, or the larger budget of bulk calls such as
+# list query pages (see latency_budget()). Requests that find no free slot wait for one, up to
+# QB_BRIDGE_ACQUIRE_TIMEOUT. Only one waiting request per process (per thread pool, and per event
+# loop) polls the shared state, with exponential backoff; the others wait in memory for a slot
+# released in this process or for their turn to poll. A backlog therefore costs a few
+# state-database transactions per second per process, however many requests are waiting.
+#
+# The circuit breaker opens when too many of the last ~QB_BREAKER_WINDOW_CALLS round trips failed
+# (an exponentially weighted failure rate, so a sudden outage trips it even after a long run of
+# successes). Slow but successful round trips only lower the concurrency limit. While the breaker
+# is open, calls fail at once with BridgeUnavailable, the routes queue new webhooks instead of
+# syncing them inline (QB_BREAKER_DEFER) and the queue workers pause. After
+# QB_BREAKER_OPEN_SECONDS a single probe is let through; it closes the breaker or opens it again.
+
+# Load environment variables from .env file
+load_dotenv()
+
+ENABLED = os.environ.get("QB_GOVERNOR", "true").lower() in ("1", "true", "yes")
+# Bounds for the number of envelopes in flight to the bridge, across all workers.
+MIN_CONCURRENCY = max(int(os.environ.get("QB_BRIDGE_MIN_CONCURRENCY", "1")), 1)
+MAX_CONCURRENCY = max(int(os.environ.get("QB_BRIDGE_MAX_CONCURRENCY", "4")), MIN_CONCURRENCY)
+# Round trips slower than this (seconds) count as congestion.
+LATENCY_TARGET = float(os.environ.get("QB_BRIDGE_LATENCY_TARGET", "10"))
+# Latency target of bulk calls: list query pages and customer backfill batches.
+BULK_LATENCY_TARGET = float(os.environ.get("QB_BRIDGE_BULK_LATENCY_TARGET", "60"))
+# How long a request waits for a free slot before failing with BridgeBusy.
+ACQUIRE_TIMEOUT = float(os.environ.get("QB_BRIDGE_ACQUIRE_TIMEOUT", "30"))
+# A lease not released within this time (a crashed worker) frees its slot.
+LEASE_SECONDS = float(os.environ.get("QB_BRIDGE_LEASE_SECONDS", "300"))
+
+# Number of recent round trips the failure rate is averaged over.
+BREAKER_WINDOW_CALLS = max(int(os.environ.get("QB_BREAKER_WINDOW_CALLS", "20")), 1)
+# The breaker only judges the failure rate after this many round trips since it last closed.
+BREAKER_MIN_REQUESTS = int(os.environ.get("QB_BREAKER_MIN_REQUESTS", "10"))
+# Failure rate (failed round trips) that opens the breaker.
+BREAKER_FAILURE_RATE = float(os.environ.get("QB_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("QB_BREAKER_OPEN_SECONDS", "30"))
+# Queue webhooks (202 Accepted) instead of failing them while the breaker is open.
+BREAKER_DEFER = os.environ.get("QB_BREAKER_DEFER", "true").lower() in ("1", "true", "yes")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Backoff of the waiting request that re-checks the shared state for a slot freed by another process.
+_POLL_INTERVAL = 0.05
+_MAX_POLL_INTERVAL = 1.0
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS bridge_governor (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    concurrency_limit REAL NOT NULL,
+    breaker_state TEXT NOT NULL,
+    opened_at REAL,
+    failure_rate REAL NOT NULL,
+    calls INTEGER NOT NULL,
+    last_decrease REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bridge_leases (
+    id TEXT PRIMARY KEY,
+    probe INTEGER NOT NULL,
+    acquired_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+""")
+
+
+class BridgeUnavailable(requests.RequestException):
+    """Raised instead of calling the bridge while the circuit breaker is open."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BridgeBusy(BridgeUnavailable):
+    """Raised when no bridge slot became free within QB_BRIDGE_ACQUIRE_TIMEOUT."""
+
+
+class Lease:
+    """A held bridge slot; pass it back to release() with the outcome of the round trip."""
+    __slots__ = ("id", "probe", "started", "latency_target")
+
+    def __init__(self, lease_id, probe):
+        self.id = lease_id
+        self.probe = probe
+        self.started = time.time()
+        self.latency_target = _latency_target.get()
+
+
+_latency_target = contextvars.ContextVar("bridge_latency_target", default=LATENCY_TARGET)
+
+# Guards _polling (a thread of this process is polling the shared state) and _releases (slots freed
+# by this process); notified on both changes.
+_released = threading.Condition()
+_polling = False
+_releases = 0
+_async_waiters = None
+_open_until = 0.0
+_open_checked = 0.0
+
+
+@contextmanager
+def latency_budget(seconds):
+    """
+    Round trips started in the enclosed block (in this thread or asyncio task) only count as slow
+    beyond `seconds` instead of QB_BRIDGE_LATENCY_TARGET, e.g. pages of a large list query:
+
+        with bridge_governor.latency_budget(bridge_governor.BULK_LATENCY_TARGET):
+            raw_xml = send_qbxml(xml)
+    """
+    token = _latency_target.set(seconds)
+    try:
+        yield
+    finally:
+        _latency_target.reset(token)
+
+
+def _reset_after_fork():
+    # A fork (e.g. gunicorn --preload) can happen while a thread of the parent waits or polls; the
+    # child starts with no waiters.
+    global _released, _polling, _async_waiters
+    _released = threading.Condition()
+    _polling = False
+    _async_waiters = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _state(conn, now):
+    row = conn.execute("SELECT * FROM bridge_governor WHERE id = 1").fetchone()
+    if row is not None:
+        return dict(row)
+    state = {
+        "concurrency_limit": float(MAX_CONCURRENCY), "breaker_state": CLOSED, "opened_at": None,
+        "failure_rate": 0.0, "calls": 0, "last_decrease": 0.0,
+    }
+    conn.execute(
+        "INSERT INTO bridge_governor (id, concurrency_limit, breaker_state, opened_at, failure_rate, calls, "
+        "last_decrease) VALUES (1, ?, ?, ?, ?, ?, ?)",
+        (state["concurrency_limit"], CLOSED, None, 0.0, 0, 0.0),
+    )
+    return state
+
+
+def _save(conn, state):
+    conn.execute(
+        "UPDATE bridge_governor SET concurrency_limit = ?, breaker_state = ?, opened_at = ?, failure_rate = ?, "
+        "calls = ?, last_decrease = ? WHERE id = 1",
+        (state["concurrency_limit"], state["breaker_state"], state["opened_at"], state["failure_rate"],
+         state["calls"], state["last_decrease"]),
+    )
+
+
+def _transition(state, breaker_state, now):
+    logger.warning("QuickBooks bridge circuit breaker: %s -> %s", state['breaker_state'], breaker_state)
+    metrics.count("sync_bridge_breaker_transitions_total", (breaker_state,))
+    state["breaker_state"] = breaker_state
+    state["opened_at"] = now if breaker_state == OPEN else None
+    if breaker_state == CLOSED:
+        state["failure_rate"], state["calls"] = 0.0, 0
+
+
+def _try_acquire():
+    """
+    One attempt at taking a slot. Returns a Lease, or None when every slot is taken.
+    Raises BridgeUnavailable while the breaker is open.
+    """
+    global _open_until
+    conn = get_connection()
+    now = time.time()
+    with transaction(conn):
+        state = _state(conn, now)
+        if state["breaker_state"] == OPEN:
+            retry_after = state["opened_at"] + BREAKER_OPEN_SECONDS - now
+            if retry_after > 0:
+                _open_until = now + retry_after
+                metrics.count("sync_bridge_rejections_total", ("open",))
+                raise BridgeUnavailable(
+                    f"QuickBooks bridge circuit breaker is open; retry in {retry_after:.0f}s.", retry_after)
+            _transition(state, HALF_OPEN, now)
+            _save(conn, state)
+
+        conn.execute("DELETE FROM bridge_leases WHERE expires_at < ?", (now,))
+        if state["breaker_state"] == HALF_OPEN:
+            # Only the probe goes through until it has shown whether the bridge recovered.
+            if conn.execute("SELECT 1 FROM bridge_leases LIMIT 1").fetchone() is not None:
+                return None
+            probe = True
+        else:
+            in_flight = conn.execute("SELECT COUNT(*) FROM bridge_leases").fetchone()[0]
+            if in_flight >= int(state["concurrency_limit"]):
+                return None
+            probe = False
+        lease = Lease(uuid.uuid4().hex, probe)
+        conn.execute("INSERT INTO bridge_leases (id, probe, acquired_at, expires_at) VALUES (?, ?, ?, ?)",
+                     (lease.id, int(probe), now, now + LEASE_SECONDS))
+    return lease
+
+
+def _busy():
+    metrics.count("sync_bridge_rejections_total", ("busy",))
+    return BridgeBusy("No QuickBooks bridge slot became free in time.", ACQUIRE_TIMEOUT)
+
+
+def _next_delay(delay, woken):
+    # A slot freed in this process is tried at once; otherwise the poll interval doubles.
+    return _POLL_INTERVAL if woken else min(delay * 2, _MAX_POLL_INTERVAL)
+
+
+def acquire(timeout=None):
+    """
+    Waits for a bridge slot and returns its Lease (None when the governor is disabled or its state
+    cannot be read, in which case the call goes ahead ungoverned).
+    Raises BridgeUnavailable while the breaker is open, or BridgeBusy after `timeout` seconds.
+    """
+    global _polling
+    if not ENABLED:
+        return None
+    deadline = time.monotonic() + (ACQUIRE_TIMEOUT if timeout is None else timeout)
+    with _released:
+        while _polling:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise _busy()
+            _released.wait(remaining)
+        _polling = True
+    try:
+        delay = _POLL_INTERVAL
+        while True:
+            with _released:
+                seen = _releases
+            try:
+                lease = _try_acquire()
+            except BridgeUnavailable:
+                raise
+            except (sqlite3.Error, OSError) as e:
+                logger.error("Error reading the bridge governor state, sending ungoverned: %s", e)
+                return None
+            if lease is not None:
+                return lease
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise _busy()
+            with _released:
+                if _releases == seen:
+                    _released.wait(min(remaining, delay * random.uniform(0.5, 1.5)))
+                delay = _next_delay(delay, _releases != seen)
+    finally:
+        with _released:
+            _polling = False
+            _released.notify_all()
+
+
+class _AsyncWaiters:
+    """_polling and _releases for the requests waiting on one event loop."""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.condition = asyncio.Condition()
+        self.polling = False
+        self.releases = 0
+
+
+def _get_async_waiters():
+    global _async_waiters
+    loop = asyncio.get_running_loop()
+    if _async_waiters is None or _async_waiters.loop is not loop:
+        _async_waiters = _AsyncWaiters(loop)
+    return _async_waiters
+
+
+async def _wait(condition, timeout):
+    try:
+        await asyncio.wait_for(condition.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def acquire_async(timeout=None):
+    """
+    asyncio counterpart of acquire(): waits on the event loop instead of blocking a thread. Only the
+    polling request uses a worker thread, for its state-database transaction.
+    """
+    if not ENABLED:
+        return None
+    deadline = time.monotonic() + (ACQUIRE_TIMEOUT if timeout is None else timeout)
+    waiters = _get_async_waiters()
+    async with waiters.condition:
+        while waiters.polling:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise _busy()
+            await _wait(waiters.condition, remaining)
+        waiters.polling = True
+    try:
+        delay = _POLL_INTERVAL
+        while True:
+            seen = waiters.releases
+            try:
+                lease = await asyncio.to_thread(_try_acquire)
+            except BridgeUnavailable:
+                raise
+            except (sqlite3.Error, OSError) as e:
+                logger.error("Error reading the bridge governor state, sending ungoverned: %s", e)
+                return None
+            if lease is not None:
+                return lease
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise _busy()
+            async with waiters.condition:
+                if waiters.releases == seen:
+                    await _wait(waiters.condition, min(remaining, delay * random.uniform(0.5, 1.5)))
+                delay = _next_delay(delay, waiters.releases != seen)
+    finally:
+        async with waiters.condition:
+            waiters.polling = False
+            waiters.condition.notify_all()
+
+
+def release(lease, latency, ok):
+    """
+    Frees the slot and feeds the round trip's outcome into the concurrency limit and the breaker.
+    `ok` is False for transport errors and unusable responses. A round trip slower than the lease's
+    latency target lowers the concurrency limit like a failure, but does not count towards the breaker.
+    """
+    global _releases
+    if lease is None:
+        return
+    failed = not ok
+    congested = failed or latency > lease.latency_target
+    now = time.time()
+    try:
+        conn = get_connection()
+        with transaction(conn):
+            conn.execute("DELETE FROM bridge_leases WHERE id = ?", (lease.id,))
+            state = _state(conn, now)
+
+            if congested:
+                # Halve once per round trip: calls already in flight at the last decrease do not halve again.
+                if lease.started >= state["last_decrease"]:
+                    state["concurrency_limit"] = max(float(MIN_CONCURRENCY), state["concurrency_limit"] / 2)
+                    state["last_decrease"] = now
+            else:
+                state["concurrency_limit"] = min(float(MAX_CONCURRENCY),
+                                                 state["concurrency_limit"] + 1 / state["concurrency_limit"])
+
+            state["failure_rate"] += (int(failed) - state["failure_rate"]) / BREAKER_WINDOW_CALLS
+            state["calls"] += 1
+
+            if lease.probe and state["breaker_state"] == HALF_OPEN:
+                _transition(state, OPEN if failed else CLOSED, now)
+            elif (state["breaker_state"] == CLOSED and state["calls"] >= BREAKER_MIN_REQUESTS
+                  and state["failure_rate"] >= BREAKER_FAILURE_RATE):
+                _transition(state, OPEN, now)
+            _save(conn, state)
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error updating the bridge governor state: %s", e)
+    with _released:
+        _releases += 1
+        _released.notify_all()
+
+
+async def release_async(lease, latency, ok):
+    if lease is None:
+        return
+    await asyncio.to_thread(release, lease, latency, ok)
+    waiters = _async_waiters
+    if waiters is not None and waiters.loop is asyncio.get_running_loop():
+        async with waiters.condition:
+            waiters.releases += 1
+            waiters.condition.notify_all()
+
+
+def is_open():
+    """
+    True while the breaker is open, i.e. bridge calls would fail at once. Read from the state
+    database at most once a second per process.
+    """
+    global _open_until, _open_checked
+    if not ENABLED:
+        return False
+    now = time.time()
+    if now - _open_checked >= 1.0:
+        _open_checked = now
+        try:
+            row = get_connection().execute(
+                "SELECT breaker_state, opened_at FROM bridge_governor WHERE id = 1").fetchone()
+        except (sqlite3.Error, OSError):
+            row = None
+        if row is not None and row["breaker_state"] == OPEN:
+            _open_until = row["opened_at"] + BREAKER_OPEN_SECONDS
+        else:
+            _open_until = 0.0
+    return now < _open_until
+
+
+def seconds_until_retry():
+    """Seconds until the open breaker lets a probe through (0 when it is not open)."""
+    return max(_open_until - time.time(), 0.0) if is_open() else 0.0
+
+
+def status():
+    """Returns the shared governor state: concurrency limit, slots in flight and breaker state."""
+    conn = get_connection()
+    now = time.time()
+    with transaction(conn):
+        state = _state(conn, now)
+        in_flight = conn.execute("SELECT COUNT(*) FROM bridge_leases WHERE expires_at >= ?", (now,)).fetchone()[0]
+    return {
+        "enabled": ENABLED,
+        "breaker_state": state["breaker_state"],
+        "concurrency_limit": int(state["concurrency_limit"]),
+        "in_flight": in_flight,
+        "failure_rate": round(state["failure_rate"], 3),
+        "retry_after": max(state["opened_at"] + BREAKER_OPEN_SECONDS - now, 0) if state["breaker_state"] == OPEN else 0,
+    }
+
+
+def reset():
+    """Closes the breaker and restores the full concurrency limit, e.g. after QuickBooks was restarted."""
+    conn = get_connection()
+    now = time.time()
+    with transaction(conn):
+        state = _state(conn, now)
+        if state["breaker_state"] != CLOSED:
+            _transition(state, CLOSED, now)
+        state["concurrency_limit"] = float(MAX_CONCURRENCY)
+        _save(conn, state)
+
+
+if __name__ == "__main__":
+    # python -m sync_scripts.bridge_governor [reset]
+    import json
+    import sys
+
+    from sync_scripts import log_config
+
+    log_config.configure()
+    if sys.argv[1:] == ["reset"]:
+        reset()
+    print(json.dumps(status(), indent=2))
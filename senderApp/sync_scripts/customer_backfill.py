@@ -0,0 +1,338 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from dotenv import load_dotenv
+from sync_scripts.customer_sync import _customer_content_hash, create_customer_add_xml, get_reference_maps
+from sync_scripts.qbxml_batch import QBXMLBatch
+from sync_scripts.state_db import DATA_DIR
+from sync_scripts import bridge_governor, id_index, job_queue, log_config
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# CustomerAddRq per envelope, and the envelope size budget in bytes; a batch is sent when either is reached.
+BATCH_SIZE = int(os.environ.get("QB_BACKFILL_BATCH_SIZE", "100"))
+BATCH_BYTES = int(os.environ.get("QB_BACKFILL_BATCH_BYTES", str(256 * 1024)))
+# Where uploads to POST /customer/bulk are stored along with their results.
+UPLOAD_DIR = os.environ.get("SYNC_BACKFILL_DIR", os.path.join(DATA_DIR, "backfill"))
+# Largest upload POST /customer/bulk accepts, in bytes; larger bodies are answered with 413.
+MAX_UPLOAD_BYTES = int(os.environ.get("SYNC_BACKFILL_MAX_BYTES", str(512 * 1024 * 1024)))
+
+FORMATS = ("jsonl", "json", "csv")
+# QuickBooks statusCode for "the name is already in use".
+NAME_IN_USE = "3100"
+
+# Per-record outcomes written to the results file.
+CREATED = "created"
+SKIPPED = "skipped"   # already in the ID index, i.e. synced before
+EXISTS = "exists"     # QuickBooks already has a customer with this name
+FAILED = "failed"
+INVALID = "invalid"
+
+# Shopify customer CSV export column -> customer field (current and older export headers).
+CSV_FIELDS = {
+    "Customer ID": "id",
+    "First Name": "first_name",
+    "Last Name": "last_name",
+    "Email": "email",
+    "Phone": "phone",
+    "Note": "note",
+}
+CSV_ADDRESS_FIELDS = {
+    "Default Address Company": "company",
+    "Default Address Address1": "address1",
+    "Default Address Address2": "address2",
+    "Default Address City": "city",
+    "Default Address Province Code": "province_code",
+    "Default Address Country Code": "country",
+    "Default Address Zip": "zip",
+    "Default Address Phone": "phone",
+    "Company": "company",
+    "Address1": "address1",
+    "Address2": "address2",
+    "City": "city",
+    "Province Code": "province_code",
+    "Country": "country",
+    "Zip": "zip",
+}
+
+
+class InvalidRecord:
+    """Stands in for an input record that could not be parsed, e.g. a JSONL line that is not JSON."""
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def detect_format(path):
+    """Returns the input format from the file extension: jsonl (also .ndjson), json or csv."""
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    if extension == "ndjson":
+        return "jsonl"
+    if extension in FORMATS:
+        return extension
+    raise ValueError(f"Cannot tell the format of {path}; use one of: {', '.join(FORMATS)}.")
+
+
+def results_path(input_path):
+    return os.path.splitext(input_path)[0] + ".results.jsonl"
+
+
+def _checkpoint_path(input_path):
+    return os.path.splitext(input_path)[0] + ".checkpoint"
+
+
+def _csv_value(value):
+    # Shopify prefixes IDs and phone numbers with ' so spreadsheets keep them as text.
+    value = (value or "").strip()
+    return value[1:] if value.startswith("'") else value
+
+
+def _customer_from_csv_row(row):
+    customer = {}
+    address = {}
+    for column, value in row.items():
+        if column in CSV_FIELDS:
+            customer[CSV_FIELDS[column]] = _csv_value(value)
+        elif column in CSV_ADDRESS_FIELDS and not address.get(CSV_ADDRESS_FIELDS[column]):
+            address[CSV_ADDRESS_FIELDS[column]] = _csv_value(value)
+    customer["default_address"] = address
+    return customer
+
+
+def iter_customers(path, fmt=None):
+    """
+    Yields Shopify customer dictionaries from a file, one at a time: JSONL (one customer per line),
+    a Shopify API JSON export ({"customers": [...]} or a list) or a Shopify admin CSV export.
+    JSONL and CSV are read line by line; a JSON document is loaded whole. A JSONL line that is not
+    valid JSON is yielded as an InvalidRecord, so one bad line does not stop the backfill.
+    """
+    fmt = fmt or detect_format(path)
+    with open(path, encoding="utf-8-sig", newline="" if fmt == "csv" else None) as f:
+        if fmt == "jsonl":
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    record = InvalidRecord(f"Line {line_number} is not valid JSON: {e}")
+                yield record
+        elif fmt == "json":
+            document = json.load(f)
+            yield from document.get("customers", []) if isinstance(document, dict) else document
+        elif fmt == "csv":
+            for row in csv.DictReader(f):
+                yield _customer_from_csv_row(row)
+        else:
+            raise ValueError(f"Unknown format '{fmt}'. Known formats: {', '.join(FORMATS)}")
+
+
+def _load_checkpoint(input_path):
+    try:
+        with open(_checkpoint_path(input_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(input_path, checkpoint):
+    # Write-then-rename so a crash never leaves a half-written checkpoint.
+    path = _checkpoint_path(input_path)
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def _iter_batches(records, reference_maps, batch_size, batch_bytes, counts, out):
+    """
+    Maps customers to CustomerAddRq and groups them into batches of at most `batch_size` requests
+    and about `batch_bytes` of qbXML. Yields (batch, pending, consumed): `pending` maps each requestID
+    to its customer, `consumed` is the number of input records covered so far. Records that need no
+    request (already synced, unreadable, not a customer object, no ID) are recorded in `out` straight away.
+    """
+    batch, pending, size, consumed = QBXMLBatch(), {}, 0, 0
+    for customer in records:
+        consumed += 1
+        if isinstance(customer, InvalidRecord):
+            _record(out, counts, None, INVALID, error=customer.error)
+            continue
+        if not isinstance(customer, dict):
+            _record(out, counts, None, INVALID, error=f"Expected a customer object, got {type(customer).__name__}.")
+            continue
+        shopify_id = customer.get("id")
+        if not shopify_id:
+            _record(out, counts, None, INVALID, error="Shopify customer ID missing.")
+        elif id_index.get("customer", shopify_id) is not None:
+            _record(out, counts, shopify_id, SKIPPED)
+        else:
+            try:
+                customer_add_xml = create_customer_add_xml(customer, *reference_maps)
+            except (AttributeError, TypeError, ValueError) as e:
+                # e.g. a default_address that is not an object
+                _record(out, counts, shopify_id, INVALID, error=f"Cannot map customer: {e}")
+                continue
+            if pending and (len(pending) >= batch_size or size + len(customer_add_xml) > batch_bytes):
+                yield batch, pending, consumed - 1
+                batch, pending, size = QBXMLBatch(), {}, 0
+            pending[batch.add("CustomerAddRq", customer_add_xml)] = customer
+            size += len(customer_add_xml)
+    yield batch, pending, consumed
+
+
+def _record(out, counts, shopify_id, outcome, list_id=None, error=None, status_code=None):
+    counts[outcome] = counts.get(outcome, 0) + 1
+    entry = {"id": shopify_id, "outcome": outcome}
+    if list_id:
+        entry["ListID"] = list_id
+    if error:
+        entry["error"] = error
+    if status_code:
+        entry["statusCode"] = status_code
+    out.write(json.dumps(entry, separators=(",", ":")))
+    out.write("\n")
+
+
+def backfill_customers(input_path, fmt=None, batch_size=None, batch_bytes=None, resume=True,
+                       sender=None, progress=None):
+    """
+    Creates every customer in `input_path` in QuickBooks with batched CustomerAddRq envelopes and
+    returns a summary dictionary with the outcome counts.
+
+    Each record's outcome is appended to "<input>.results.jsonl". After every batch a checkpoint
+    records how many input records are done, so an interrupted backfill resumes after the last
+    completed batch (resume=True). Customers already in the ID index are skipped, which also makes
+    re-running a finished backfill cheap. `progress`, if given, is called with the summary after each
+    batch. Transport errors propagate; the checkpoint then points at the failed batch.
+    """
+    fmt = fmt or detect_format(input_path)
+    batch_size = batch_size or BATCH_SIZE
+    batch_bytes = batch_bytes or BATCH_BYTES
+    output_path = results_path(input_path)
+    checkpoint = _load_checkpoint(input_path) if resume and os.path.exists(output_path) else None
+
+    if checkpoint:
+        done, counts = checkpoint["records"], checkpoint["counts"]
+        logger.info("Resuming customer backfill of %s after record %s...", input_path, done)
+        out = open(output_path, "r+")
+        # Drop outcomes written after the last checkpoint; those records are processed again.
+        out.truncate(checkpoint["offset"])
+        out.seek(checkpoint["offset"])
+    else:
+        done, counts = 0, {}
+        logger.info("Starting customer backfill of %s...", input_path)
+        out = open(output_path, "w")
+
+    reference_maps = get_reference_maps()
+    records = iter_customers(input_path, fmt)
+    for _ in range(done):
+        next(records, None)
+
+    started = time.monotonic()
+    sent = 0
+    with out:
+        for batch, pending, consumed in _iter_batches(records, reference_maps, batch_size, batch_bytes, counts, out):
+            if pending:
+                # A full envelope of adds legitimately takes longer than a single webhook's round trip.
+                with bridge_governor.latency_budget(bridge_governor.BULK_LATENCY_TARGET):
+                    results = batch.send(sender)
+                for request_id, customer in pending.items():
+                    result = results[request_id]
+                    shopify_id = customer["id"]
+                    if result.ok:
+                        customer_ret = result.ret("CustomerRet")
+                        id_index.remember("customer", shopify_id, customer_ret)
+                        id_index.set_applied_hash("customer", shopify_id, _customer_content_hash(customer))
+                        _record(out, counts, shopify_id, CREATED,
+                                list_id=customer_ret.findtext("ListID") if customer_ret is not None else None)
+                    else:
+                        outcome = EXISTS if result.status_code == NAME_IN_USE else FAILED
+                        _record(out, counts, shopify_id, outcome, error=result.status_message,
+                                status_code=result.status_code)
+                sent += len(pending)
+            out.flush()
+            _save_checkpoint(input_path, {"records": done + consumed, "offset": out.tell(), "counts": counts})
+            summary = {"records": done + consumed, "counts": counts, "results_path": output_path}
+            if progress is not None:
+                progress(summary)
+            if pending:
+                rate = sent / max(time.monotonic() - started, 1e-9) * 60
+                logger.info("%s record(s) processed (%s created, %.0f customers/min).", done + consumed, counts.get(CREATED, 0), rate)
+
+    try:
+        os.remove(_checkpoint_path(input_path))
+    except FileNotFoundError:
+        pass
+    logger.info("Customer backfill of %s finished: %s", input_path, counts)
+    return {"status": "completed", "records": done + consumed, "counts": counts, "results_path": output_path}
+
+
+def new_upload_path(fmt):
+    """Returns (upload_id, path) for storing a POST /customer/bulk upload in the given format."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    return upload_id, os.path.join(UPLOAD_DIR, f"{upload_id}.{fmt}")
+
+
+def discard_upload(path):
+    """Removes a partly received upload."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def upload_results_path(upload_id):
+    """Returns the results file of an upload, or None if the upload ID is not valid."""
+    try:
+        uuid.UUID(hex=upload_id)
+    except ValueError:
+        return None
+    return os.path.join(UPLOAD_DIR, f"{upload_id}.results.jsonl")
+
+
+def run_backfill_job(payload):
+    """Job queue handler for "customer.backfill": payload is {"path": ..., "format": ...}."""
+    job = json.loads(payload)
+    try:
+        return backfill_customers(job["path"], job.get("format"), progress=job_queue.set_progress)
+    except (OSError, ValueError) as e:
+        return {"error": f"Could not read backfill input: {e}"}
+    except Exception as e:
+        # Transport failure: retried by the queue, resuming from the checkpoint.
+        logger.error("Customer backfill of %s stopped: %s", job['path'], e)
+        return None
+
+
+job_queue.register_handler("customer.backfill", run_backfill_job)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create Shopify customers in QuickBooks in bulk.")
+    parser.add_argument("input", help="JSONL, Shopify JSON or Shopify CSV export of customers")
+    parser.add_argument("--format", choices=FORMATS, help="input format (default: from the file extension)")
+    parser.add_argument("--batch-size", type=int, help=f"CustomerAddRq per envelope (default {BATCH_SIZE})")
+    parser.add_argument("--batch-bytes", type=int, help=f"envelope size budget in bytes (default {BATCH_BYTES})")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args(argv)
+    log_config.configure()
+
+    try:
+        summary = backfill_customers(args.input, args.format, args.batch_size, args.batch_bytes, resume=not args.restart)
+    except Exception as e:
+        logger.error("Customer backfill stopped: %s. Re-run the same command to resume.", e)
+        return 1
+    logger.info("Outcomes written to %s.", summary['results_path'])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
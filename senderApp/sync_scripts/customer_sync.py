@@ -1,447 +1,439 @@
+import functools
 import json
+import logging
 import requests
-import os
-from dotenv import load_dotenv
-import xml.etree.ElementTree as ET
-from xml.sax.saxutils import escape
-
-# Load environment variables from .env file
-load_dotenv()
-
-base_url = os.environ.get("QB_SERVER_URL", "").rstrip('/')
-SERVER_URL = base_url + "/qbxml"
+from sync_scripts.qb_client import QBResponseError
+from sync_scripts.json_backend import parse_payload
+from sync_scripts.qb_flow import LocalCall, run_flow
+from sync_scripts.qbxml_batch import QBXMLBatch
+from sync_scripts.qbxml_paging import build_list_filters
+from sync_scripts.qbxml_stream import element_to_record
+from sync_scripts.qbxml_templates import ALWAYS, IF_SCOPE, TRUTHY, Field, Group, address_group, compile_template
+from sync_scripts.reference_cache import reference_cache
+from sync_scripts.watermarks import WatermarkTracker
+from sync_scripts import id_index, job_queue, metrics
+
+logger = logging.getLogger(__name__)
+
+# statusCodes meaning the indexed ListID/EditSequence no longer match QuickBooks:
+# 3200 = EditSequence out of date, 3120 = object not found.
+STALE_ID_STATUS_CODES = ("3200", "3120")
+
+def _build_reference_map(records, key_field, current=None, since=None):
+    """
+    Builds a reference map ({key: {"ListID", "FullName"}}) from streamed *Ret records. Given the
+    current map, the records are a delta: they are merged into a copy of it and inactive ones removed.
+    Returns (map, newest TimeModified seen).
+    """
+    reference_map = dict(current) if current else {}
+    watermark = WatermarkTracker(since)
+    for record in records:
+        watermark.observe(record)
+        key = record.get(key_field)
+        if not key:
+            continue
+        if record.get("IsActive") == "false":
+            reference_map.pop(key, None)
+            continue
+        reference_map[key] = {
+            "ListID": record.get("ListID"),
+            "FullName": key # FullName is not available for SalesRep, use Initial
+        }
+    return reference_map, watermark.value
+
+# Reference table name -> (query request, Ret tag, map key field, description)
+REFERENCE_TABLES = {
+    "currency": ("CurrencyQueryRq", "CurrencyRet", "FullName", "Currency"),
+    "customer_type": ("CustomerTypeQueryRq", "CustomerTypeRet", "FullName", "Customer Type"),
+    "sales_rep": ("SalesRepQueryRq", "SalesRepRet", "Initial", "Sales Rep"),
+}
+
+# Only these fields are kept from the streamed reference records.
+REFERENCE_FIELDS = ("ListID", "FullName", "Initial", "IsActive", "TimeModified")
+
+def _reference_query_filters(since):
+    # A delta also asks for inactive records so deactivated entries can be dropped from the map.
+    return build_list_filters(active_status="All", from_modified_date=since) if since else ""
+
+def _get_reference_map_from_qb(name, current=None, since=None):
+    """
+    Queries QuickBooks for a single reference table, or only its records modified since `since`
+    when the current map is given. Returns (map, watermark), or (None, None) on failure.
+    """
+    rq_tag, ret_tag, key_field, description = REFERENCE_TABLES[name]
+    try:
+        logger.info("Querying QuickBooks for %s table%s...", description, f" changes since {since}" if since else "")
+        batch = QBXMLBatch(on_error="stopOnError")
+        request_id = batch.add(rq_tag, _reference_query_filters(since))
+        stream = batch.stream(fields=REFERENCE_FIELDS)
+        reference_map, watermark = _build_reference_map(stream.records(ret_tag), key_field, current, since)
+        status = stream.statuses[request_id]
+        if not status.ok:
+            logger.error("QuickBooks Error while getting %s table: %s", description, status.status_message)
+            return None, None
+        logger.info("Successfully built %s map from QuickBooks data.", description)
+        return reference_map, watermark
+    except Exception as e:
+        _report_transport_error(e, f"get the {description} table")
+        return None, None
 
 def get_sales_rep_map_from_qb():
     """
     Queries QuickBooks for all Sales Reps and returns a map by initial.
     """
-    xml_request = """<?xml version="1.0" encoding="utf-8"?>
-                    <?qbxml version="16.0"?>
-                    <QBXML>
-                        <QBXMLMsgsRq onError="stopOnError">
-                            <SalesRepQueryRq>
-                            </SalesRepQueryRq>
-                        </QBXMLMsgsRq>
-                    </QBXML>"""
-    try:
-        print("Querying QuickBooks for Sales Rep table...")
-        response = requests.post(SERVER_URL, json={"xml": xml_request}, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
-        if "response" in response_json:
-            raw_xml = response_json["response"]
-            root = ET.fromstring(raw_xml)
-            sales_rep_list_xml = root.findall(".//SalesRepRet")
-            sales_rep_map = {
-                sr.find("Initial").text: {
-                    "ListID": sr.find("ListID").text,
-                    "FullName": sr.find("Initial").text # FullName is not available for SalesRep, use Initial
-                }
-                for sr in sales_rep_list_xml if sr.find("Initial") is not None
-            }
-            print("Successfully built Sales Rep map from QuickBooks data.")
-            return sales_rep_map
-        else:
-            print("Error: 'response' key not found in JSON while getting Sales Reps.")
-            return {}
-    except Exception as e:
-        print(f"An unexpected error occurred while getting Sales Reps: {e}")
-        return {}
+    return _get_reference_map_from_qb("sales_rep")[0] or {}
 
 def get_customer_type_map_from_qb():
     """
     Queries QuickBooks for all Customer Types and returns a map by name.
     """
-    xml_request = """<?xml version="1.0" encoding="utf-8"?>
-                    <?qbxml version="16.0"?>
-                    <QBXML>
-                        <QBXMLMsgsRq onError="stopOnError">
-                            <CustomerTypeQueryRq>
-                            </CustomerTypeQueryRq>
-                        </QBXMLMsgsRq>
-                    </QBXML>"""
-    try:
-        print("Querying QuickBooks for Customer Type table...")
-        response = requests.post(SERVER_URL, json={"xml": xml_request}, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
-        if "response" in response_json:
-            raw_xml = response_json["response"]
-            root = ET.fromstring(raw_xml)
-            customer_type_list_xml = root.findall(".//CustomerTypeRet")
-            customer_type_map = {
-                ct.find("FullName").text: {
-                    "ListID": ct.find("ListID").text,
-                    "FullName": ct.find("FullName").text
-                }
-                for ct in customer_type_list_xml if ct.find("FullName") is not None
-            }
-            print("Successfully built Customer Type map from QuickBooks data.")
-            return customer_type_map
-        else:
-            print("Error: 'response' key not found in JSON while getting Customer Types.")
-            return {}
-    except Exception as e:
-        print(f"An unexpected error occurred while getting Customer Types: {e}")
-        return {}
+    return _get_reference_map_from_qb("customer_type")[0] or {}
 
 def get_currency_map_from_qb():
     """
     Queries QuickBooks for all Currencies and returns a map by FullName.
     """
-    xml_request = """<?xml version="1.0" encoding="utf-8"?>
-                    <?qbxml version="16.0"?>
-                    <QBXML>
-                        <QBXMLMsgsRq onError="stopOnError">
-                            <CurrencyQueryRq>
-                            </CurrencyQueryRq>
-                        </QBXMLMsgsRq>
-                    </QBXML>"""
+    return _get_reference_map_from_qb("currency")[0] or {}
+
+def get_reference_maps_from_qb(names, deltas=None):
+    """
+    Queries QuickBooks for several reference tables in one batched round trip. Tables listed in
+    `deltas` (name -> (current map, since)) only fetch records modified since their watermark.
+    Returns a dictionary of table name -> (map, watermark); tables that failed are left out.
+    """
+    deltas = deltas or {}
+    batch = QBXMLBatch()
+    request_ids = {
+        name: batch.add(REFERENCE_TABLES[name][0], _reference_query_filters(deltas.get(name, (None, None))[1]))
+        for name in names
+    }
     try:
-        print("Querying QuickBooks for Currency table...")
-        response = requests.post(SERVER_URL, json={"xml": xml_request}, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
-        if "response" in response_json:
-            raw_xml = response_json["response"]
-            root = ET.fromstring(raw_xml)
-            currency_list_xml = root.findall(".//CurrencyRet")
-            currency_map = {
-                c.find("FullName").text: {
-                    "ListID": c.find("ListID").text,
-                    "FullName": c.find("FullName").text
-                }
-                for c in currency_list_xml if c.find("FullName") is not None
-            }
-            print("Successfully built Currency map from QuickBooks data.")
-            return currency_map
-        else:
-            print("Error: 'response' key not found in JSON while getting Currencies.")
-            return {}
+        logger.info("Querying QuickBooks for reference tables: %s...", ", ".join(names))
+        stream = batch.stream(fields=REFERENCE_FIELDS)
+        records = stream.group_by_request()
     except Exception as e:
-        print(f"An unexpected error occurred while getting Currencies: {e}")
+        _report_transport_error(e, "get the reference tables")
         return {}
 
-def create_customer_add_xml(customer_data, currency_map, customer_type_map, sales_rep_map):
+    reference_maps = {}
+    for name, request_id in request_ids.items():
+        _, ret_tag, key_field, description = REFERENCE_TABLES[name]
+        status = stream.statuses[request_id]
+        if status.ok:
+            current, since = deltas.get(name, (None, None))
+            reference_maps[name] = _build_reference_map(
+                (record for tag, record in records.get(request_id, ()) if tag == ret_tag),
+                key_field, current, since,
+            )
+        else:
+            logger.error("QuickBooks Error while getting %s table: %s", description, status.status_message)
+    return reference_maps
+
+# Reference tables are cached per worker so a customer sync only costs the CustomerAdd round trip.
+# After the first load they are refreshed with FromModifiedDate deltas.
+for _name in REFERENCE_TABLES:
+    reference_cache.register(_name, functools.partial(_get_reference_map_from_qb, _name), incremental=True)
+# Tables that need loading at the same time are fetched together in one envelope.
+reference_cache.set_batch_loader(get_reference_maps_from_qb, incremental=True)
+
+def get_reference_maps():
     """
-    Creates the CustomerAddRq qbXML string from Shopify customer data.
+    Returns the (currency_map, customer_type_map, sales_rep_map) tuple from the shared reference cache.
     """
-    # Use default address if available, otherwise use an empty dict
-    address = customer_data.get('default_address', {}) or {}
+    with metrics.stage("reference_lookup"):
+        maps = reference_cache.get_many(["currency", "customer_type", "sales_rep"])
+    return maps["currency"], maps["customer_type"], maps["sales_rep"]
 
-    # Determine QuickBooks Name/FullName based on the mapping document
+def get_qb_customer_name(customer_data):
+    """
+    Returns the QuickBooks Name/FullName for a Shopify customer: the default address company if set,
+    otherwise "first_name last_name" (see CUSTOMER_MAPPING.md).
+    """
+    address = customer_data.get('default_address', {}) or {}
     if address.get('company'):
-        qb_name = address.get('company')
-    else:
-        qb_name = f"{customer_data.get('first_name', '')} {customer_data.get('last_name', '')}".strip()
+        return address.get('company')
+    return f"{customer_data.get('first_name') or ''} {customer_data.get('last_name') or ''}".strip()
 
-    # Get currency info
+def _currency_ref(currency_map, customer_data):
+    """Returns the currency map entry for the customer's currency, falling back to CAD."""
     shopify_currency_code = customer_data.get('currency', 'CAD') # Default to CAD
     qb_currency = currency_map.get(shopify_currency_code)
     if not qb_currency:
-        print(f"Warning: Currency code '{shopify_currency_code}' not found in map. Using CAD as default.")
+        logger.warning("Currency code '%s' not found in map. Using CAD as default.", shopify_currency_code)
         qb_currency = currency_map.get("CAD")
-
-    # Helper to add a tag only if the value is not empty, and escape the value
-    def add_tag(tag, value):
-        if value:
-            # Ensure value is a string before escaping
-            return f"<{tag}>{escape(str(value))}</{tag}>"
-        return ""
-
-    # Construct the XML conditionally based on available data
-    xml_parts = [
-        "<CustomerAdd>",
-        add_tag("Name", qb_name),
-        add_tag("CompanyName", address.get('company')),
-        add_tag("FirstName", customer_data.get('first_name')),
-        add_tag("LastName", customer_data.get('last_name')),
-        "<BillAddress>",
-        add_tag("Addr1", address.get('address1')),
-        add_tag("Addr2", address.get('address2')),
-        add_tag("City", address.get('city')),
-        add_tag("State", address.get('province_code')),
-        add_tag("PostalCode", address.get('zip')),
-        add_tag("Country", address.get('country')),
-        "</BillAddress>",
-        "<ShipAddress>",
-        add_tag("Addr1", address.get('address1')),
-        add_tag("Addr2", address.get('address2')),
-        add_tag("City", address.get('city')),
-        add_tag("State", address.get('province_code')),
-        add_tag("PostalCode", address.get('zip')),
-        add_tag("Country", address.get('country')),
-        "</ShipAddress>",
-        add_tag("Phone", customer_data.get('phone') or address.get('phone')),
-        add_tag("Email", customer_data.get('email')),
-        add_tag("Notes", customer_data.get('note')),
-    ]
-    
-    # --- Add Refs from dynamic lookups ---
-    customer_type_ref = customer_type_map.get("Shopify customers")
-    if customer_type_ref:
-        xml_parts.append(f"<CustomerTypeRef><ListID>{customer_type_ref['ListID']}</ListID></CustomerTypeRef>")
-
-    sales_rep_ref = sales_rep_map.get("AS")
-    if sales_rep_ref:
-        xml_parts.append(f"<SalesRepRef><ListID>{sales_rep_ref['ListID']}</ListID></SalesRepRef>")
-
-    if qb_currency:
-        xml_parts.append("<CurrencyRef>")
-        xml_parts.append(f"<ListID>{qb_currency['ListID']}</ListID>")
-        xml_parts.append(f"<FullName>{qb_currency['FullName']}</FullName>")
-        xml_parts.append("</CurrencyRef>")
-        
+    return qb_currency
+
+# Shopify customer -> qbXML customer fields shared by CustomerAdd and CustomerMod (see CUSTOMER_MAPPING.md).
+CUSTOMER_FIELDS = [
+    Field("Name", lambda customer, ctx: get_qb_customer_name(customer), when=TRUTHY),
+    Field("CompanyName", "default_address.company", when=TRUTHY),
+    Field("FirstName", "first_name", when=TRUTHY),
+    Field("LastName", "last_name", when=TRUTHY),
+    address_group("BillAddress", "default_address"),
+    address_group("ShipAddress", "default_address"),
+    Field("Phone", ("phone", "default_address.phone"), when=TRUTHY),
+    Field("Email", "email", when=TRUTHY),
+    Field("Notes", "note", when=TRUTHY),
+]
+
+CUSTOMER_ADD = compile_template("CustomerAdd", [
+    *CUSTOMER_FIELDS,
+    Group("CustomerTypeRef", [Field("ListID", "ListID", when=ALWAYS)],
+          scope=lambda customer, ctx: ctx["customer_type"], when=IF_SCOPE),
+    Group("SalesRepRef", [Field("ListID", "ListID", when=ALWAYS)],
+          scope=lambda customer, ctx: ctx["sales_rep"], when=IF_SCOPE),
+    Group("CurrencyRef", [Field("ListID", "ListID", when=ALWAYS), Field("FullName", "FullName", when=ALWAYS)],
+          scope=lambda customer, ctx: ctx["currency"], when=IF_SCOPE),
     # Use a custom field for the Shopify ID.
-    xml_parts.append("<DataExtAdd>")
-    xml_parts.append("<OwnerID>0</OwnerID>")
-    xml_parts.append("<DataExtName>Shopify ID</DataExtName>")
-    xml_parts.append(f"<DataExtValue>{customer_data['id']}</DataExtValue>")
-    xml_parts.append("</DataExtAdd>")
+    "<DataExtAdd><OwnerID>0</OwnerID><DataExtName>Shopify ID</DataExtName>",
+    Field("DataExtValue", "id", when=ALWAYS),
+    "</DataExtAdd>",
+])
 
-    xml_parts.append("</CustomerAdd>")
-    
-    # Filter out empty strings from the list before joining
-    return "".join(filter(None, xml_parts))
+CUSTOMER_MOD = compile_template("CustomerMod", [
+    Field("ListID", lambda customer, ctx: ctx["ListID"], when=ALWAYS),
+    Field("EditSequence", lambda customer, ctx: ctx["EditSequence"], when=ALWAYS),
+    *CUSTOMER_FIELDS,
+])
+
+def create_customer_add_xml(customer_data, currency_map, customer_type_map, sales_rep_map):
+    """
+    Creates the CustomerAddRq qbXML string from Shopify customer data.
+    """
+    return CUSTOMER_ADD.render(customer_data, {
+        "currency": _currency_ref(currency_map, customer_data),
+        "customer_type": customer_type_map.get("Shopify customers"),
+        "sales_rep": sales_rep_map.get("AS"),
+    })
 
 def _xml_to_dict(element):
     """
     Recursively converts an XML element and its children into a dictionary.
     """
-    result = {}
-    for child in element:
-        child_data = _xml_to_dict(child)
-        if child.tag in result:
-            if not isinstance(result[child.tag], list):
-                result[child.tag] = [result[child.tag]]
-            result[child.tag].append(child_data if child_data else child.text)
+    return element_to_record(element)
+
+def _report_transport_error(e, action):
+    """
+    Logs a failed bridge call. The bridge's response body can be a whole qbXML document, so only
+    its start is logged, and all of it at DEBUG level.
+    """
+    if isinstance(e, requests.RequestException) and not isinstance(e, QBResponseError):
+        response = e.response
+        if response is None:
+            logger.error("HTTP Error while trying to %s: %s (no server response body)", action, e)
+        elif logger.isEnabledFor(logging.DEBUG):
+            logger.debug("HTTP Error while trying to %s: %s. Server response: %s", action, e, response.text)
         else:
-            result[child.tag] = child_data if child_data else child.text
-    return result
+            logger.error("HTTP Error while trying to %s: %s. Server response: %.500s", action, e, response.text)
+    else:
+        logger.exception("An unexpected error occurred while trying to %s: %s", action, e)
 
-def create_customer_to_qb(shopify_customer_json_string):
+def create_customer_flow(shopify_customer_json_string):
     """
-    Main function to sync a single Shopify customer to QuickBooks.
-    Receives Shopify customer data as a JSON string.
-    Returns a dictionary of the created customer from QuickBooks.
+    The customer create pipeline as a flow (see qb_flow.py); run by create_customer_to_qb and by
+    the asyncio engine. Returns a dictionary of the created customer from QuickBooks.
     """
+    metrics.operation("customer", "create")
     try:
-        shopify_customer_data = json.loads(shopify_customer_json_string)
-    except json.JSONDecodeError:
-        print("Error: Invalid JSON string provided for Shopify customer data.")
+        with metrics.stage("parse"):
+            shopify_customer_data = parse_payload(shopify_customer_json_string)
+    except (json.JSONDecodeError, TypeError):
+        logger.error("Invalid JSON string provided for Shopify customer data.")
         return None
 
-    # Get all necessary mappings from QuickBooks
-    currency_map = get_currency_map_from_qb()
-    customer_type_map = get_customer_type_map_from_qb()
-    sales_rep_map = get_sales_rep_map_from_qb()
+    # Get all necessary mappings (served from the reference cache when fresh)
+    currency_map, customer_type_map, sales_rep_map = yield LocalCall(get_reference_maps)
 
     if not currency_map:
-        print("Warning: Currency map is empty. Currency-related fields might be missing.")
+        logger.warning("Currency map is empty. Currency-related fields might be missing.")
     if not customer_type_map:
-        print("Warning: Customer Type map is empty. CustomerTypeRef will not be set.")
+        logger.warning("Customer Type map is empty. CustomerTypeRef will not be set.")
     if not sales_rep_map:
-        print("Warning: Sales Rep map is empty. SalesRepRef will not be set.")
-
-    customer_add_xml = create_customer_add_xml(shopify_customer_data, currency_map, customer_type_map, sales_rep_map)
-    
-    xml_request = f"""<?xml version="1.0" encoding="utf-8"?>
-                    <?qbxml version="16.0"?>
-                    <QBXML>
-                        <QBXMLMsgsRq onError="stopOnError">
-                            <CustomerAddRq>
-                                {customer_add_xml}
-                            </CustomerAddRq>
-                        </QBXMLMsgsRq>
-                    </QBXML>"""
+        logger.warning("Sales Rep map is empty. SalesRepRef will not be set.")
 
-    try:
-        print(f"Sending request to sync customer {shopify_customer_data.get('id')} to QuickBooks...")
-        response = requests.post(SERVER_URL, json={"xml": xml_request}, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
-        
-        if "response" in response_json:
-            raw_xml = response_json["response"]
-            root = ET.fromstring(raw_xml)
-            
-            # Check for errors in the response
-            status_code_node = root.find(".//*[@statusCode]")
-            if status_code_node is not None and status_code_node.get("statusCode") != "0":
-                status_message = status_code_node.get("statusMessage")
-                print(f"QuickBooks Error: {status_message}")
-                return {"error": status_message, "statusCode": status_code_node.get("statusCode")}
-
-            customer_ret_element = root.find(".//CustomerRet")
-            if customer_ret_element is not None:
-                customer_ret_dict = _xml_to_dict(customer_ret_element)
-                print("Successfully created customer in QuickBooks:")
-                print(json.dumps(customer_ret_dict, indent=2))
-                return customer_ret_dict
-            else:
-                print("CustomerRet not found in QuickBooks response.")
-                return {"error": "CustomerRet not found in response."}
-        else:
-            print("Error: 'response' key not found in server response.")
-            return {"error": "Invalid server response."}
+    with metrics.stage("xml_build"):
+        customer_add_xml = create_customer_add_xml(shopify_customer_data, currency_map, customer_type_map, sales_rep_map)
+    batch = QBXMLBatch(on_error="stopOnError")
+    request_id = batch.add("CustomerAddRq", customer_add_xml)
 
-    except requests.RequestException as e:
-        print(f"HTTP Error: {e}")
-        if e.response is not None:
-            print("Server response:", e.response.text)
-        else:
-            print("No server response body available.")
+    try:
+        logger.info("Sending request to sync customer %s to QuickBooks...", shopify_customer_data.get('id'))
+        result = (yield batch)[request_id]
+    except QBResponseError as e:
+        logger.error("Invalid response from the bridge: %s", e)
+        return {"error": "Invalid server response."}
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-    return None
+        _report_transport_error(e, "sync the customer")
+        return None
 
-def get_customer_by_shopify_id(shopify_id):
+    # Check for errors in the response
+    if not result.ok:
+        logger.error("QuickBooks Error: %s", result.status_message)
+        return result.to_error()
+
+    customer_ret_element = result.ret("CustomerRet")
+    if customer_ret_element is None:
+        logger.error("CustomerRet not found in QuickBooks response.")
+        return {"error": "CustomerRet not found in response."}
+
+    customer_ret_dict = _xml_to_dict(customer_ret_element)
+    yield LocalCall(id_index.remember, "customer", shopify_customer_data.get("id"), customer_ret_element)
+    # An identical customers/update webhook right after creation can then be skipped.
+    yield LocalCall(id_index.set_applied_hash, "customer", shopify_customer_data.get("id"),
+                    _customer_content_hash(shopify_customer_data))
+    logger.info("Successfully created customer in QuickBooks: %s (%s)", customer_ret_dict.get('FullName'), customer_ret_dict.get('ListID'))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("CustomerRet: %s", json.dumps(customer_ret_dict, indent=2))
+    return customer_ret_dict
+
+def create_customer_to_qb(shopify_customer_json_string):
     """
-    Finds a customer in QuickBooks by their Shopify ID custom field.
-    Returns a dictionary with ListID and EditSequence if found, otherwise None.
-    """
-    xml_request = f"""<?xml version="1.0" encoding="utf-8"?>
-<?qbxml version="16.0"?>
-<QBXML>
-    <QBXMLMsgsRq onError="stopOnError">
-        <CustomerQueryRq>
-            <DataExtRet>
-                <OwnerID>0</OwnerID>
-                <DataExtName>Shopify ID</DataExtName>
-                <DataExtValue>{shopify_id}</DataExtValue>
-            </DataExtRet>
-        </CustomerQueryRq>
-    </QBXMLMsgsRq>
-</QBXML>"""
+    Main function to sync a single Shopify customer to QuickBooks.
+    Receives Shopify customer data as a dictionary or a JSON string.
+    Returns a dictionary of the created customer from QuickBooks.
+    """
+    return run_flow(create_customer_flow(shopify_customer_json_string))
+
+def query_customer_flow(shopify_id):
+    """
+    Flow that finds a customer in QuickBooks by their Shopify ID custom field.
+    Returns a dictionary with ListID, EditSequence and FullName if found, otherwise None.
+    A found customer is also recorded in the local ID index.
+    """
+    batch = QBXMLBatch(on_error="stopOnError")
+    request_id = batch.add(
+        "CustomerQueryRq",
+        "<DataExtRet><OwnerID>0</OwnerID><DataExtName>Shopify ID</DataExtName>"
+        f"<DataExtValue>{shopify_id}</DataExtValue></DataExtRet>",
+    )
     try:
-        print(f"Querying QuickBooks for customer with Shopify ID: {shopify_id}...")
-        response = requests.post(SERVER_URL, json={"xml": xml_request}, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
-
-        if "response" in response_json:
-            raw_xml = response_json["response"]
-            root = ET.fromstring(raw_xml)
-            customer_ret = root.find(".//CustomerRet")
-            if customer_ret is not None:
-                list_id = customer_ret.find("ListID").text
-                edit_sequence = customer_ret.find("EditSequence").text
-                print(f"Found customer in QB. ListID: {list_id}, EditSequence: {edit_sequence}")
-                return {"ListID": list_id, "EditSequence": edit_sequence}
-            else:
-                print("Customer with that Shopify ID not found in QuickBooks.")
-                return None
+        logger.info("Querying QuickBooks for customer with Shopify ID: %s...", shopify_id)
+        result = (yield batch)[request_id]
     except Exception as e:
-        print(f"An error occurred while querying for customer by Shopify ID: {e}")
+        logger.error("An error occurred while querying for customer by Shopify ID: %s", e)
+        return None
+
+    customer_ret = result.ret("CustomerRet")
+    if customer_ret is None:
+        logger.info("Customer with Shopify ID %s not found in QuickBooks.", shopify_id)
         return None
+    list_id = customer_ret.findtext("ListID")
+    edit_sequence = customer_ret.findtext("EditSequence")
+    logger.info("Found customer in QB. ListID: %s, EditSequence: %s", list_id, edit_sequence)
+    yield LocalCall(id_index.remember, "customer", shopify_id, customer_ret)
+    return {
+        "ListID": list_id,
+        "EditSequence": edit_sequence,
+        "FullName": customer_ret.findtext("FullName"),
+    }
+
+def get_customer_by_shopify_id(shopify_id):
+    """
+    Finds a customer in QuickBooks by their Shopify ID custom field.
+    Returns a dictionary with ListID, EditSequence and FullName if found, otherwise None.
+    A found customer is also recorded in the local ID index.
+    """
+    return run_flow(query_customer_flow(shopify_id))
 
 def create_customer_mod_xml(customer_data, qb_customer_ids):
     """
     Creates the CustomerModRq qbXML string from Shopify customer data.
     """
-    address = customer_data.get('default_address', {}) or {}
-    if address.get('company'):
-        qb_name = address.get('company')
-    else:
-        qb_name = f"{customer_data.get('first_name', '')} {customer_data.get('last_name', '')}".strip()
-
-    def add_tag(tag, value):
-        if value:
-            return f"<{tag}>{escape(str(value))}</{tag}>"
-        return ""
-
-    xml_parts = [
-        "<CustomerMod>",
-        f"<ListID>{qb_customer_ids['ListID']}</ListID>",
-        f"<EditSequence>{qb_customer_ids['EditSequence']}</EditSequence>",
-        add_tag("Name", qb_name),
-        add_tag("CompanyName", address.get('company')),
-        add_tag("FirstName", customer_data.get('first_name')),
-        add_tag("LastName", customer_data.get('last_name')),
-        "<BillAddress>",
-        add_tag("Addr1", address.get('address1')),
-        add_tag("Addr2", address.get('address2')),
-        add_tag("City", address.get('city')),
-        add_tag("State", address.get('province_code')),
-        add_tag("PostalCode", address.get('zip')),
-        add_tag("Country", address.get('country')),
-        "</BillAddress>",
-        "<ShipAddress>",
-        add_tag("Addr1", address.get('address1')),
-        add_tag("Addr2", address.get('address2')),
-        add_tag("City", address.get('city')),
-        add_tag("State", address.get('province_code')),
-        add_tag("PostalCode", address.get('zip')),
-        add_tag("Country", address.get('country')),
-        "</ShipAddress>",
-        add_tag("Phone", customer_data.get('phone') or address.get('phone')),
-        add_tag("Email", customer_data.get('email')),
-        add_tag("Notes", customer_data.get('note')),
-        "</CustomerMod>",
-    ]
-    return "".join(filter(None, xml_parts))
+    return CUSTOMER_MOD.render(customer_data, qb_customer_ids)
 
-def update_customer_in_qb(shopify_customer_json_string):
+def update_customer_flow(shopify_customer_json_string):
     """
-    Main function to update a single Shopify customer in QuickBooks.
+    The customer update pipeline as a flow (see qb_flow.py); run by update_customer_in_qb and by
+    the asyncio engine.
     """
+    metrics.operation("customer", "update")
     try:
-        shopify_customer_data = json.loads(shopify_customer_json_string)
-    except json.JSONDecodeError:
+        with metrics.stage("parse"):
+            shopify_customer_data = parse_payload(shopify_customer_json_string)
+    except (json.JSONDecodeError, TypeError):
         return {"error": "Invalid JSON string provided for Shopify customer data."}
 
     shopify_id = shopify_customer_data.get("id")
     if not shopify_id:
         return {"error": "Shopify customer ID not found in payload."}
 
-    # Find the customer in QuickBooks to get ListID and EditSequence
-    qb_customer_ids = get_customer_by_shopify_id(shopify_id)
+    # Shopify often re-sends unchanged customers; skip the write if QuickBooks already has this exact data
+    content_hash = _customer_content_hash(shopify_customer_data)
+    if content_hash == (yield LocalCall(id_index.get_applied_hash, "customer", shopify_id)):
+        logger.info("Customer %s is unchanged since the last successful sync. Skipping update.", shopify_id)
+        return {"status": "unchanged", "message": f"Customer {shopify_id} already up to date in QuickBooks."}
+
+    # Use the locally indexed ListID/EditSequence, falling back to a QuickBooks query on a miss
+    qb_customer_ids = yield LocalCall(id_index.get, "customer", shopify_id)
+    from_index = qb_customer_ids is not None
+    if not from_index:
+        qb_customer_ids = yield from query_customer_flow(shopify_id)
     if not qb_customer_ids:
         return {"error": f"Customer with Shopify ID {shopify_id} not found in QuickBooks. Cannot update."}
 
-    # Create the CustomerMod XML
-    customer_mod_xml = create_customer_mod_xml(shopify_customer_data, qb_customer_ids)
-    
-    xml_request = f"""<?xml version="1.0" encoding="utf-8"?>
-<?qbxml version="16.0"?>
-<QBXML>
-    <QBXMLMsgsRq onError="stopOnError">
-        <CustomerModRq>
-            {customer_mod_xml}
-        </CustomerModRq>
-    </QBXMLMsgsRq>
-</QBXML>"""
+    result = yield from _customer_mod_flow(shopify_customer_data, qb_customer_ids)
 
-    try:
-        print(f"Sending request to update customer {shopify_id} in QuickBooks...")
-        response = requests.post(SERVER_URL, json={"xml": xml_request}, timeout=60)
-        response.raise_for_status()
-        response_json = response.json()
-        
-        if "response" in response_json:
-            raw_xml = response_json["response"]
-            root = ET.fromstring(raw_xml)
-            
-            status_code_node = root.find(".//*[@statusCode]")
-            if status_code_node is not None and status_code_node.get("statusCode") != "0":
-                status_message = status_code_node.get("statusMessage")
-                print(f"QuickBooks Error on update: {status_message}")
-                return {"error": status_message, "statusCode": status_code_node.get("statusCode")}
-
-            customer_ret_element = root.find(".//CustomerRet")
-            if customer_ret_element is not None:
-                customer_ret_dict = _xml_to_dict(customer_ret_element)
-                print("Successfully updated customer in QuickBooks.")
-                return customer_ret_dict
-            else:
-                return {"error": "CustomerRet not found in update response."}
-        else:
-            return {"error": "Invalid server response on update."}
+    if from_index and result.get("statusCode") in STALE_ID_STATUS_CODES:
+        # The customer was edited (or removed) in QuickBooks since we last saw it; refresh and retry once.
+        logger.info("Indexed IDs for customer %s are stale. Re-querying QuickBooks...", shopify_id)
+        yield LocalCall(id_index.forget, "customer", shopify_id)
+        qb_customer_ids = yield from query_customer_flow(shopify_id)
+        if not qb_customer_ids:
+            return {"error": f"Customer with Shopify ID {shopify_id} not found in QuickBooks. Cannot update."}
+        result = yield from _customer_mod_flow(shopify_customer_data, qb_customer_ids)
+
+    if "error" not in result:
+        yield LocalCall(id_index.set_applied_hash, "customer", shopify_id, content_hash)
+    return result
+
+def update_customer_in_qb(shopify_customer_json_string):
+    """
+    Main function to update a single Shopify customer in QuickBooks.
+    """
+    return run_flow(update_customer_flow(shopify_customer_json_string))
 
+def _customer_content_hash(shopify_customer_data):
+    """
+    Digest of the CustomerMod body for this payload, leaving out ListID/EditSequence,
+    so it only changes when the data sent to QuickBooks changes.
+    """
+    return id_index.payload_hash(create_customer_mod_xml(shopify_customer_data, {"ListID": "", "EditSequence": ""}))
+
+def _customer_mod_flow(shopify_customer_data, qb_customer_ids):
+    """
+    Flow that sends a CustomerModRq for the given customer IDs and returns the updated customer
+    dictionary, or an error dictionary.
+    """
+    shopify_id = shopify_customer_data.get("id")
+    with metrics.stage("xml_build"):
+        customer_mod_xml = create_customer_mod_xml(shopify_customer_data, qb_customer_ids)
+    batch = QBXMLBatch(on_error="stopOnError")
+    request_id = batch.add("CustomerModRq", customer_mod_xml)
+
+    try:
+        logger.info("Sending request to update customer %s in QuickBooks...", shopify_id)
+        result = (yield batch)[request_id]
+    except QBResponseError:
+        return {"error": "Invalid server response on update."}
     except Exception as e:
-        print(f"An unexpected error occurred during update: {e}")
+        _report_transport_error(e, f"update customer {shopify_id}")
         return {"error": str(e)}
 
+    if not result.ok:
+        logger.error("QuickBooks Error on update of customer %s: %s", shopify_id, result.status_message)
+        return result.to_error()
+
+    customer_ret_element = result.ret("CustomerRet")
+    if customer_ret_element is None:
+        return {"error": "CustomerRet not found in update response."}
+    yield LocalCall(id_index.remember, "customer", shopify_id, customer_ret_element)
+    logger.info("Successfully updated customer %s in QuickBooks.", shopify_id)
+    return _xml_to_dict(customer_ret_element)
+
+# Handlers for jobs accepted by the routes in queue ingest mode
+job_queue.register_handler("customer.create", create_customer_to_qb)
+job_queue.register_handler("customer.update", update_customer_in_qb)
+
 if __name__ == "__main__":
     pass
 
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from dotenv import load_dotenv
+from sync_scripts.state_db import get_connection, register_schema
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Seconds a call waits for another process (gunicorn worker, queue worker, async server) to finish
+# syncing the same entity. After that the call is not made and returns None, like a transport failure.
+LOCK_TIMEOUT = float(os.environ.get("SYNC_ENTITY_LOCK_TIMEOUT", "60"))
+# An entity lock not released within this time (a crashed worker) can be taken by another process.
+LOCK_SECONDS = float(os.environ.get("SYNC_ENTITY_LOCK_SECONDS", "300"))
+
+# Backoff of the call that re-checks the lock held by another process.
+_POLL_INTERVAL = 0.02
+_MAX_POLL_INTERVAL = 0.5
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS entity_locks (
+    entity_key TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+""")
+
+
+def _try_lock(entity_key, holder):
+    """
+    One attempt at taking the lock of `entity_key` for `holder`. False while another holder has it;
+    True when it was taken, or when the state database cannot be used (the call then goes ahead unlocked).
+    """
+    now = time.time()
+    try:
+        cursor = get_connection().execute(
+            "INSERT INTO entity_locks (entity_key, holder, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (entity_key) DO UPDATE SET holder = excluded.holder, expires_at = excluded.expires_at "
+            "WHERE entity_locks.expires_at < ?",
+            (entity_key, holder, now + LOCK_SECONDS, now),
+        )
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error taking the lock of %s, syncing it unlocked: %s", entity_key, e)
+        return True
+    return cursor.rowcount == 1
+
+
+def _lock_timed_out(entity_key):
+    logger.error("%s was still being synced by another process after %.0fs; not syncing it now.",
+                 entity_key, LOCK_TIMEOUT)
+    return None
+
+
+def lock_entity(entity_key):
+    """
+    Takes the lock that serializes syncs of `entity_key` across processes and returns the holder ID
+    to pass to unlock_entity(). Returns None if another process held it for SYNC_ENTITY_LOCK_TIMEOUT.
+    """
+    holder = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    delay = _POLL_INTERVAL
+    while not _try_lock(entity_key, holder):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return _lock_timed_out(entity_key)
+        time.sleep(min(remaining, delay * random.uniform(0.5, 1.5)))
+        delay = min(delay * 2, _MAX_POLL_INTERVAL)
+    return holder
+
+
+async def lock_entity_async(entity_key):
+    """asyncio counterpart of lock_entity(): sleeps on the event loop between attempts."""
+    holder = uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    delay = _POLL_INTERVAL
+    while not await asyncio.to_thread(_try_lock, entity_key, holder):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return _lock_timed_out(entity_key)
+        await asyncio.sleep(min(remaining, delay * random.uniform(0.5, 1.5)))
+        delay = min(delay * 2, _MAX_POLL_INTERVAL)
+    return holder
+
+
+def unlock_entity(entity_key, holder):
+    """Releases a lock taken by lock_entity(); a lock that expired and was taken over is left alone."""
+    try:
+        get_connection().execute("DELETE FROM entity_locks WHERE entity_key = ? AND holder = ?",
+                                 (entity_key, holder))
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error releasing the lock of %s: %s", entity_key, e)
+
+
+class _Work:
+    __slots__ = ("fn", "payload", "coalesce", "turn", "done", "result", "exception")
+
+    def __init__(self, fn, payload, coalesce):
+        self.fn = fn
+        self.payload = payload
+        self.coalesce = coalesce
+        self.turn = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.exception = None
+
+    def outcome(self):
+        if self.exception is not None:
+            raise self.exception
+        return self.result
+
+
+class _EntityState:
+    __slots__ = ("active", "queue")
+
+    def __init__(self):
+        self.active = None
+        self.queue = deque()
+
+
+class EntityScheduler:
+    """
+    Serializes sync calls per Shopify entity (e.g. "customer:123").
+
+    Calls for different entities run concurrently. Calls for the same entity run one at a time in
+    arrival order, so two updates never race on the same EditSequence. While a call is running,
+    further coalescable calls for that entity collapse into one queued call carrying the latest
+    payload; every caller that was folded into it receives its result.
+
+    Waiting happens in memory within this process. The call whose turn it is also takes the entity's
+    lock in the state database (lock_entity()), so it does not overlap a sync of the same entity in
+    another worker process either.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+
+    def run(self, entity_key, fn, payload, coalesce=True):
+        """
+        Runs fn(payload) once no earlier call for `entity_key` is in flight and returns its result.
+        With coalesce=True, a still-queued call with the same function is replaced by this payload.
+        Returns None without calling fn if another process kept the entity locked for
+        SYNC_ENTITY_LOCK_TIMEOUT.
+        """
+        if entity_key is None:
+            return fn(payload)
+
+        with self._lock:
+            state = self._states.get(entity_key)
+            if state is None:
+                state = self._states[entity_key] = _EntityState()
+
+            if state.active is None:
+                work = state.active = _Work(fn, payload, coalesce)
+                work.turn.set()
+                executor = True
+            else:
+                last = state.queue[-1] if state.queue else None
+                if coalesce and last is not None and last.coalesce and last.fn == fn:
+                    # Newer data supersedes the queued call; its caller will run it with this payload.
+                    last.payload = payload
+                    work = last
+                    executor = False
+                else:
+                    work = _Work(fn, payload, coalesce)
+                    state.queue.append(work)
+                    executor = True
+
+        if not executor:
+            work.done.wait()
+            return work.outcome()
+
+        work.turn.wait()
+        try:
+            holder = lock_entity(entity_key)
+            if holder is not None:
+                try:
+                    with self._lock:
+                        current_payload = work.payload
+                    work.result = work.fn(current_payload)
+                finally:
+                    unlock_entity(entity_key, holder)
+        except Exception as e:
+            work.exception = e
+        finally:
+            with self._lock:
+                if state.queue:
+                    state.active = state.queue.popleft()
+                    state.active.turn.set()
+                else:
+                    state.active = None
+                    del self._states[entity_key]
+            work.done.set()
+        return work.outcome()
+
+    def pending(self):
+        """Returns the number of entities with a call in flight, for diagnostics."""
+        with self._lock:
+            return len(self._states)
+
+
+# Shared instance used by the routes and queue workers in this process.
+entity_scheduler = EntityScheduler()
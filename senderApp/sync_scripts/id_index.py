@@ -0,0 +1,133 @@
+import hashlib
+import logging
+import sqlite3
+import time
+from sync_scripts.state_db import get_connection, register_schema
+
+logger = logging.getLogger(__name__)
+
+# Persistent map of Shopify object IDs to QuickBooks ListID/TxnID and the last EditSequence we saw,
+# so updates can go straight to a *ModRq without first querying QuickBooks. Failures here are
+# logged and treated as a cache miss; QuickBooks stays the source of truth.
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS qb_id_index (
+    entity TEXT NOT NULL,
+    shopify_id TEXT NOT NULL,
+    qb_id TEXT NOT NULL,
+    edit_sequence TEXT,
+    full_name TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (entity, shopify_id)
+);
+CREATE TABLE IF NOT EXISTS qb_applied_payloads (
+    entity TEXT NOT NULL,
+    shopify_id TEXT NOT NULL,
+    payload_hash TEXT NOT NULL,
+    applied_at REAL NOT NULL,
+    PRIMARY KEY (entity, shopify_id)
+);
+""")
+
+# The QuickBooks identifier field for each indexed entity type.
+ID_FIELDS = {
+    "customer": "ListID",
+    "sales_order": "TxnID",
+}
+# The field kept alongside the ID to reference the record by name.
+NAME_FIELDS = {
+    "customer": "FullName",
+    "sales_order": "RefNumber",
+}
+
+
+def _text(ret, field):
+    """Reads a field from a *Ret element or from a dictionary built by _xml_to_dict."""
+    if ret is None:
+        return None
+    if isinstance(ret, dict):
+        value = ret.get(field)
+        return value if isinstance(value, str) else None
+    node = ret.find(field)
+    return node.text if node is not None else None
+
+
+def get(entity, shopify_id):
+    """
+    Looks up the QuickBooks IDs recorded for a Shopify object.
+    Returns e.g. {"ListID": ..., "EditSequence": ..., "FullName": ...} for a customer, or None.
+    """
+    try:
+        row = get_connection().execute(
+            "SELECT qb_id, edit_sequence, full_name FROM qb_id_index WHERE entity = ? AND shopify_id = ?",
+            (entity, str(shopify_id)),
+        ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error reading ID index for %s %s: %s", entity, shopify_id, e)
+        return None
+    if row is None:
+        return None
+    return {
+        ID_FIELDS[entity]: row["qb_id"],
+        "EditSequence": row["edit_sequence"],
+        NAME_FIELDS[entity]: row["full_name"],
+    }
+
+
+def remember(entity, shopify_id, ret):
+    """
+    Records the IDs from a CustomerRet/SalesOrderRet (element or dict) returned by an Add, Mod or Query.
+    Does nothing if the record carries no QuickBooks ID.
+    """
+    qb_id = _text(ret, ID_FIELDS[entity])
+    if not qb_id or shopify_id is None:
+        return
+    try:
+        get_connection().execute(
+            "INSERT OR REPLACE INTO qb_id_index (entity, shopify_id, qb_id, edit_sequence, full_name, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (entity, str(shopify_id), qb_id, _text(ret, "EditSequence"), _text(ret, NAME_FIELDS[entity]), time.time()),
+        )
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error writing ID index for %s %s: %s", entity, shopify_id, e)
+
+
+def forget(entity, shopify_id):
+    """Removes a mapping, e.g. after QuickBooks reports the referenced object no longer exists."""
+    try:
+        get_connection().execute(
+            "DELETE FROM qb_id_index WHERE entity = ? AND shopify_id = ?",
+            (entity, str(shopify_id)),
+        )
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error removing %s %s from ID index: %s", entity, shopify_id, e)
+
+
+def payload_hash(xml):
+    """Returns the digest used to recognise a qbXML body that was already applied."""
+    return hashlib.sha256(xml.encode("utf-8")).hexdigest()
+
+
+def get_applied_hash(entity, shopify_id):
+    """Returns the digest of the last qbXML body successfully applied for a Shopify object, or None."""
+    try:
+        row = get_connection().execute(
+            "SELECT payload_hash FROM qb_applied_payloads WHERE entity = ? AND shopify_id = ?",
+            (entity, str(shopify_id)),
+        ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error reading applied payload hash for %s %s: %s", entity, shopify_id, e)
+        return None
+    return row["payload_hash"] if row is not None else None
+
+
+def set_applied_hash(entity, shopify_id, digest):
+    """Records the digest of a qbXML body QuickBooks accepted for a Shopify object."""
+    try:
+        get_connection().execute(
+            "INSERT OR REPLACE INTO qb_applied_payloads (entity, shopify_id, payload_hash, applied_at) "
+            "VALUES (?, ?, ?, ?)",
+            (entity, str(shopify_id), digest, time.time()),
+        )
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error writing applied payload hash for %s %s: %s", entity, shopify_id, e)
@@ -0,0 +1,195 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from sync_scripts.state_db import get_connection, register_schema, transaction
+
+logger = logging.getLogger(__name__)
+
+# Idempotency keys for webhook deliveries. Shopify and n8n redeliver a webhook when the first delivery
+# timed out, often while it is still being synced. The first delivery of a key claims it; a redelivery
+# then waits for the first one and gets its response, and later redeliveries get the stored response
+# at once, without touching QuickBooks.
+#
+# Responses live in a bounded in-process LRU in front of a table in the state database, which is
+# shared by all workers and kept for SYNC_IDEMPOTENCY_TTL_SECONDS. Only successful (2xx) responses
+# are stored: after an error the next delivery runs the sync again.
+
+# Load environment variables from .env file
+load_dotenv()
+
+ENABLED = os.environ.get("SYNC_IDEMPOTENCY", "true").lower() in ("1", "true", "yes")
+# Shopify retries a failed webhook for up to 48 hours.
+TTL_SECONDS = float(os.environ.get("SYNC_IDEMPOTENCY_TTL_SECONDS", "172800"))
+# Completed keys kept in memory per worker process.
+CACHE_SIZE = int(os.environ.get("SYNC_IDEMPOTENCY_CACHE_SIZE", "10000"))
+# How long a redelivery waits for the first delivery of the same key to finish.
+WAIT_SECONDS = float(os.environ.get("SYNC_IDEMPOTENCY_WAIT_SECONDS", "30"))
+# A claim not completed within this time (a crashed worker) can be taken over by a redelivery.
+PENDING_SECONDS = float(os.environ.get("SYNC_IDEMPOTENCY_PENDING_SECONDS", "300"))
+
+# Header carrying Shopify's unique ID of a webhook delivery (the same on every retry).
+WEBHOOK_ID_HEADER = "X-Shopify-Webhook-Id"
+
+PENDING = "pending"
+DONE = "done"
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    status_code INTEGER,
+    body TEXT,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at);
+""")
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+_last_purge = 0.0
+
+
+def request_key(kind, webhook_id, body, shopify_id):
+    """
+    Returns the idempotency key of a delivery: the webhook ID when the sender passed one, otherwise
+    the Shopify ID plus a digest of the raw body, so a redelivered payload maps to the same key.
+    """
+    if webhook_id:
+        return f"{kind}:webhook:{webhook_id}"
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    return f"{kind}:{shopify_id}:{hashlib.sha256(body or b'').hexdigest()[:32]}"
+
+
+def _cache_get(key, now):
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if entry[2] < now:
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry[0], entry[1]
+
+
+def _cache_put(key, status_code, body, expires_at):
+    with _lock:
+        _cache[key] = (status_code, body, expires_at)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def lookup(key):
+    """Returns the stored (status_code, body) for a completed key, or None."""
+    now = time.time()
+    cached = _cache_get(key, now)
+    if cached is not None:
+        return cached
+    try:
+        row = get_connection().execute(
+            "SELECT status_code, body, expires_at FROM idempotency_keys WHERE key = ? AND state = ? AND expires_at >= ?",
+            (key, DONE, now),
+        ).fetchone()
+    except sqlite3.Error as e:
+        logger.error("Error reading idempotency key %s: %s", key, e)
+        return None
+    if row is None:
+        return None
+    _cache_put(key, row["status_code"], row["body"], row["expires_at"])
+    return row["status_code"], row["body"]
+
+
+def claim(key):
+    """
+    Claims a key for the delivery about to be processed. Returns (claimed, response): response is
+    the stored (status_code, body) when the key already completed; claimed is False (and response
+    None) while another delivery of the key is still in progress. If the state database cannot be
+    used, the delivery is processed as if it were new.
+    """
+    response = lookup(key)
+    if response is not None:
+        return False, response
+    now = time.time()
+    try:
+        conn = get_connection()
+        with transaction(conn):
+            row = conn.execute("SELECT state, status_code, body, expires_at FROM idempotency_keys WHERE key = ?",
+                               (key,)).fetchone()
+            if row is not None and row["expires_at"] >= now:
+                if row["state"] == DONE:
+                    return False, (row["status_code"], row["body"])
+                return False, None
+            conn.execute(
+                "INSERT OR REPLACE INTO idempotency_keys (key, state, status_code, body, created_at, expires_at) "
+                "VALUES (?, ?, NULL, NULL, ?, ?)",
+                (key, PENDING, now, now + PENDING_SECONDS),
+            )
+    except sqlite3.Error as e:
+        logger.error("Error claiming idempotency key %s: %s", key, e)
+    return True, None
+
+
+def complete(key, status_code, body):
+    """Stores the response of a claimed key. Responses other than 2xx release the key instead."""
+    if not 200 <= status_code < 300:
+        release(key)
+        return
+    now = time.time()
+    expires_at = now + TTL_SECONDS
+    _cache_put(key, status_code, body, expires_at)
+    try:
+        get_connection().execute(
+            "INSERT OR REPLACE INTO idempotency_keys (key, state, status_code, body, created_at, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, DONE, status_code, body, now, expires_at),
+        )
+        _purge_expired(now)
+    except sqlite3.Error as e:
+        logger.error("Error storing idempotency key %s: %s", key, e)
+
+
+def release(key):
+    """Drops a claim without storing a response, so the next delivery of the key runs again."""
+    try:
+        get_connection().execute("DELETE FROM idempotency_keys WHERE key = ? AND state = ?", (key, PENDING))
+    except sqlite3.Error as e:
+        logger.error("Error releasing idempotency key %s: %s", key, e)
+
+
+def wait_for(key, timeout=None):
+    """
+    Waits for another delivery of the key to finish. Returns its stored (status_code, body), or None
+    when it failed (the key was released) or is still running after `timeout` seconds.
+    """
+    deadline = time.monotonic() + (WAIT_SECONDS if timeout is None else timeout)
+    delay = 0.05
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+        response = lookup(key)
+        if response is not None:
+            return response
+        try:
+            row = get_connection().execute("SELECT 1 FROM idempotency_keys WHERE key = ? AND state = ?",
+                                           (key, PENDING)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+    return None
+
+
+def _purge_expired(now):
+    global _last_purge
+    if now - _last_purge < 3600:
+        return
+    _last_purge = now
+    get_connection().execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (now,))
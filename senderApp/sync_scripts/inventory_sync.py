@@ -0,0 +1,319 @@
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+from dotenv import load_dotenv
+from sync_scripts.qbxml_paging import build_list_filters, iter_query_pages
+from sync_scripts.shopify_client import ShopifyError, get_shopify_client
+from sync_scripts.state_db import get_connection, register_schema, transaction
+from sync_scripts import job_queue, log_config
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Shopify location whose "available" quantities mirror QuickBooks QuantityOnHand.
+LOCATION_ID = os.environ.get("SHOPIFY_LOCATION_ID", "")
+# Quantities per inventorySetQuantities call (Shopify accepts up to 250).
+PUSH_BATCH_SIZE = int(os.environ.get("SHOPIFY_INVENTORY_BATCH_SIZE", "250"))
+# SKUs per productVariants search when resolving inventory item IDs.
+LOOKUP_BATCH_SIZE = int(os.environ.get("SHOPIFY_SKU_LOOKUP_BATCH_SIZE", "50"))
+# Seconds before a SKU that was not found in Shopify is looked up again.
+MISSING_SKU_RETRY = float(os.environ.get("SHOPIFY_MISSING_SKU_RETRY", "86400"))
+# Page size for the ItemInventoryQueryRq iterator.
+PAGE_SIZE = int(os.environ.get("QB_INVENTORY_PAGE_SIZE", "1000"))
+# Seconds between scheduled inventory syncs started by the API process (0 = only on request).
+SYNC_INTERVAL = float(os.environ.get("INVENTORY_SYNC_INTERVAL", "0"))
+
+INCLUDE_ELEMENTS = ("Name", "QuantityOnHand")
+# SQLite variable limit headroom for IN (...) lookups.
+_SQL_CHUNK = 500
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS inventory_snapshot (
+    sku TEXT PRIMARY KEY,
+    quantity INTEGER NOT NULL,
+    pushed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS shopify_inventory_items (
+    sku TEXT PRIMARY KEY,
+    inventory_item_id TEXT,
+    checked_at REAL NOT NULL
+);
+""")
+
+VARIANTS_BY_SKU_QUERY = """
+query($query: String!, $first: Int!) {
+  productVariants(first: $first, query: $query) { nodes { sku inventoryItem { id } } }
+}
+"""
+
+SET_QUANTITIES_MUTATION = """
+mutation($input: InventorySetQuantitiesInput!) {
+  inventorySetQuantities(input: $input) { userErrors { field message code } }
+}
+"""
+
+
+def _location_gid():
+    if LOCATION_ID.startswith("gid://"):
+        return LOCATION_ID
+    return f"gid://shopify/Location/{LOCATION_ID}"
+
+
+def _quantity(value):
+    """QuickBooks QuantityOnHand ("12", "12.00000") -> whole units for Shopify; missing counts as 0."""
+    try:
+        return int(Decimal(value)) if value else 0
+    except InvalidOperation:
+        return 0
+
+
+def _chunks(values, size):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _snapshot_quantities(skus):
+    """Returns SKU -> last quantity pushed to Shopify for the given SKUs."""
+    conn = get_connection()
+    quantities = {}
+    for chunk in _chunks(skus, _SQL_CHUNK):
+        rows = conn.execute(
+            f"SELECT sku, quantity FROM inventory_snapshot WHERE sku IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        quantities.update((row["sku"], row["quantity"]) for row in rows)
+    return quantities
+
+
+def _save_snapshot(quantities):
+    now = time.time()
+    conn = get_connection()
+    with transaction(conn):
+        conn.executemany(
+            "INSERT OR REPLACE INTO inventory_snapshot (sku, quantity, pushed_at) VALUES (?, ?, ?)",
+            [(sku, quantity, now) for sku, quantity in quantities.items()],
+        )
+
+
+def _search_query(skus):
+    return " OR ".join('sku:"{}"'.format(sku.replace("\\", "\\\\").replace('"', '\\"')) for sku in skus)
+
+
+def _inventory_item_ids(skus, shopify):
+    """
+    Returns SKU -> Shopify inventory item GID for the given SKUs. Known mappings come from the local
+    table; the rest are looked up in Shopify in batches of OR-ed SKU searches, and SKUs Shopify does
+    not have are remembered (and not searched again for MISSING_SKU_RETRY seconds).
+    """
+    conn = get_connection()
+    now = time.time()
+    ids = {}
+    known = set()
+    for chunk in _chunks(skus, _SQL_CHUNK):
+        rows = conn.execute(
+            f"SELECT sku, inventory_item_id, checked_at FROM shopify_inventory_items "
+            f"WHERE sku IN ({','.join('?' * len(chunk))})", chunk
+        ).fetchall()
+        for row in rows:
+            if row["inventory_item_id"]:
+                ids[row["sku"]] = row["inventory_item_id"]
+                known.add(row["sku"])
+            elif now - row["checked_at"] < MISSING_SKU_RETRY:
+                known.add(row["sku"])
+
+    unknown = [sku for sku in skus if sku not in known]
+    for chunk in _chunks(unknown, LOOKUP_BATCH_SIZE):
+        data = shopify.graphql(VARIANTS_BY_SKU_QUERY, {"query": _search_query(chunk), "first": len(chunk) * 2},
+                               expected_cost=len(chunk) * 2 + 2)
+        wanted = set(chunk)
+        found = {}
+        for node in (data.get("productVariants") or {}).get("nodes") or []:
+            # The search is tokenized, so keep exact SKU matches only.
+            if node.get("sku") in wanted and node.get("inventoryItem"):
+                found[node["sku"]] = node["inventoryItem"]["id"]
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO shopify_inventory_items (sku, inventory_item_id, checked_at) VALUES (?, ?, ?)",
+                [(sku, found.get(sku), now) for sku in chunk],
+            )
+        ids.update(found)
+    return ids
+
+
+def _error_index(user_error):
+    """Returns the position in `quantities` a userError points at (field ["input", "quantities", "3", ...]), or None."""
+    field = user_error.get("field") or []
+    if len(field) >= 3 and field[1] == "quantities" and str(field[2]).isdigit():
+        return int(field[2])
+    return None
+
+
+def _set_quantities(entries, shopify):
+    """
+    Sets "available" quantities for [(sku, inventory_item_id, quantity)] in one mutation.
+    Returns (applied_entries, errors). Shopify applies the whole call or nothing, so entries it
+    rejects are dropped and the rest is sent once more.
+    """
+    errors = []
+    for _ in range(2):
+        if not entries:
+            break
+        data = shopify.graphql(SET_QUANTITIES_MUTATION, {"input": {
+            "name": "available",
+            "reason": "correction",
+            "ignoreCompareQuantity": True,
+            "quantities": [
+                {"inventoryItemId": item_id, "locationId": _location_gid(), "quantity": quantity}
+                for _, item_id, quantity in entries
+            ],
+        }}, expected_cost=10 + len(entries))
+        user_errors = (data.get("inventorySetQuantities") or {}).get("userErrors") or []
+        if not user_errors:
+            return entries, errors
+        bad = set()
+        for user_error in user_errors:
+            index = _error_index(user_error)
+            if index is not None and index < len(entries):
+                bad.add(index)
+                errors.append({"sku": entries[index][0], "error": user_error.get("message")})
+        if not bad:
+            errors.extend({"sku": sku, "error": user_errors[0].get("message")} for sku, _, _ in entries)
+            return [], errors
+        entries = [entry for i, entry in enumerate(entries) if i not in bad]
+    return [], errors + [{"sku": sku, "error": "Rejected on retry."} for sku, _, _ in entries]
+
+
+def _push(changed, shopify, stats):
+    """Pushes SKU -> quantity changes to Shopify and records the applied ones in the snapshot."""
+    skus = list(changed)
+    item_ids = _inventory_item_ids(skus, shopify)
+    stats["unmatched"] += len(skus) - len(item_ids)
+    entries = [(sku, item_ids[sku], changed[sku]) for sku in skus if sku in item_ids]
+    for chunk in _chunks(entries, PUSH_BATCH_SIZE):
+        applied, errors = _set_quantities(chunk, shopify)
+        if applied:
+            _save_snapshot({sku: quantity for sku, _, quantity in applied})
+        stats["pushed"] += len(applied)
+        stats["failed"] += len(errors)
+        for error in errors[:10]:
+            logger.error("Shopify rejected inventory for %s: %s", error['sku'], error['error'])
+
+
+def sync_inventory(full=False, dry_run=False, sender=None, shopify=None, progress=None):
+    """
+    Pushes QuickBooks QuantityOnHand to Shopify "available" inventory and returns a summary.
+
+    ItemInventoryQueryRq is streamed page by page; each page is compared with the quantities last
+    pushed (the local inventory_snapshot table), and only SKUs whose quantity differs are sent, in
+    inventorySetQuantities calls of up to SHOPIFY_INVENTORY_BATCH_SIZE. A SKU is recorded in the
+    snapshot only once Shopify accepted it, so failures are retried on the next run. full=True pushes
+    every SKU regardless of the snapshot; dry_run=True only counts the changes.
+    """
+    shopify = shopify or get_shopify_client()
+    stats = {"items": 0, "changed": 0, "pushed": 0, "unmatched": 0, "failed": 0}
+    filters_xml = build_list_filters(include_elements=INCLUDE_ELEMENTS)
+    started = time.monotonic()
+    pending = {}
+    logger.info("Syncing QuickBooks inventory to Shopify...")
+    for records, _, remaining in iter_query_pages("ItemInventoryQueryRq", filters_xml, PAGE_SIZE, sender=sender):
+        page = {}
+        for _, record in records:
+            if record.get("Name"):
+                page[record["Name"]] = _quantity(record.get("QuantityOnHand"))
+        stats["items"] += len(page)
+        last = {} if full else _snapshot_quantities(list(page))
+        changed = {sku: quantity for sku, quantity in page.items() if last.get(sku) != quantity}
+        stats["changed"] += len(changed)
+        if not dry_run:
+            pending.update(changed)
+            if len(pending) >= PUSH_BATCH_SIZE:
+                _push(pending, shopify, stats)
+                pending = {}
+        if progress is not None:
+            progress(dict(stats, remaining=remaining))
+    if pending:
+        _push(pending, shopify, stats)
+
+    stats["seconds"] = round(time.monotonic() - started, 1)
+    logger.info("Inventory sync finished: %s", stats)
+    return stats
+
+
+def run_inventory_job(payload):
+    """Job queue handler for "inventory.sync": payload is {"full": bool, "dry_run": bool}."""
+    options = json.loads(payload or "{}")
+    try:
+        return sync_inventory(full=options.get("full", False), dry_run=options.get("dry_run", False),
+                              progress=job_queue.set_progress)
+    except ShopifyError as e:
+        if not e.retryable:
+            return {"error": str(e)}
+        # Throttled or failing on Shopify's side: retried by the queue like a transport failure.
+        logger.error("Inventory sync stopped: %s", e)
+        return None
+    except Exception as e:
+        # Transport failures are retried by the queue; the snapshot keeps what was already pushed.
+        logger.error("Inventory sync stopped: %s", e)
+        return None
+
+
+job_queue.register_handler("inventory.sync", run_inventory_job)
+
+# Jobs for this key run one at a time across all workers, and a waiting run absorbs newer requests.
+JOB_ENTITY_KEY = "inventory"
+
+
+def enqueue_inventory_sync(full=False, dry_run=False):
+    """Queues an inventory sync and returns its job ID."""
+    return job_queue.enqueue("inventory.sync", json.dumps({"full": full, "dry_run": dry_run}),
+                             entity_key=JOB_ENTITY_KEY, coalesce=True)
+
+
+_scheduler_pid = None
+
+
+def start_scheduler(interval=None):
+    """
+    Queues an inventory sync every `interval` seconds (INVENTORY_SYNC_INTERVAL) from a background
+    thread. Every worker process may run one; coalescing keeps at most one run waiting.
+    """
+    global _scheduler_pid
+    interval = SYNC_INTERVAL if interval is None else interval
+    if interval <= 0 or _scheduler_pid == os.getpid():
+        return
+    _scheduler_pid = os.getpid()
+
+    def schedule():
+        while True:
+            time.sleep(interval)
+            try:
+                enqueue_inventory_sync()
+            except (sqlite3.Error, OSError) as e:
+                logger.error("Error scheduling inventory sync: %s", e)
+
+    threading.Thread(target=schedule, name="inventory-scheduler", daemon=True).start()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Push QuickBooks inventory quantities to Shopify.")
+    parser.add_argument("--full", action="store_true", help="push every SKU, ignoring the last pushed quantities")
+    parser.add_argument("--dry-run", action="store_true", help="only count the quantities that changed")
+    args = parser.parse_args(argv)
+    log_config.configure()
+    try:
+        stats = sync_inventory(full=args.full, dry_run=args.dry_run)
+    except Exception as e:
+        logger.error("Inventory sync failed: %s", e)
+        return 1
+    return 0 if not stats["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
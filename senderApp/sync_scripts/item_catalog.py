@@ -0,0 +1,204 @@
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from sync_scripts.qbxml_paging import build_list_filters, iter_query_pages
+from sync_scripts.qbxml_stream import element_to_record
+from sync_scripts.watermarks import WatermarkTracker, is_newer
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Seconds between FromModifiedDate delta refreshes of the catalog.
+REFRESH_INTERVAL = float(os.environ.get("QB_ITEM_CATALOG_REFRESH", "300"))
+# Seconds between full reloads (these also drop items deleted in QuickBooks).
+FULL_RELOAD_INTERVAL = float(os.environ.get("QB_ITEM_CATALOG_FULL_RELOAD", "86400"))
+# Page size for ItemQueryRq iterators.
+PAGE_SIZE = int(os.environ.get("QB_ITEM_CATALOG_PAGE_SIZE", "1000"))
+# Start loading the catalog when the API starts instead of on the first order (opt-in: every
+# server worker process would otherwise page through the whole item list at startup).
+PRELOAD = os.environ.get("QB_ITEM_CATALOG_PRELOAD", "false").lower() in ("1", "true", "yes")
+
+# Only the fields the catalog keeps are returned by QuickBooks.
+INCLUDE_ELEMENTS = ("ListID", "Name", "FullName", "EditSequence", "IsActive", "QuantityOnHand", "TimeModified")
+
+
+class CatalogItem:
+    """
+    One QuickBooks item, keyed by SKU (the item Name). Slotted and with FullName only stored when
+    it differs from the SKU, so 100k+ items stay small in every worker process.
+    """
+    __slots__ = ("list_id", "_full_name", "edit_sequence", "quantity_on_hand", "sku")
+
+    def __init__(self, sku, list_id, full_name, edit_sequence, quantity_on_hand):
+        self.sku = sku
+        self.list_id = list_id
+        self._full_name = None if full_name == sku else full_name
+        self.edit_sequence = edit_sequence
+        self.quantity_on_hand = quantity_on_hand
+
+    @property
+    def full_name(self):
+        return self._full_name or self.sku
+
+    def __repr__(self):
+        return f"<CatalogItem {self.sku} {self.list_id} qty={self.quantity_on_hand}>"
+
+
+class ItemCatalog:
+    """
+    In-memory SKU -> QuickBooks item index shared by order, product and inventory sync.
+
+    The first load pages through ItemQueryRq with an iterator; later refreshes only ask for items
+    modified since the newest TimeModified seen (FromModifiedDate). Lookups never wait on QuickBooks:
+    a missing or stale catalog is (re)loaded in a background thread and callers fall back to
+    referencing items by SKU until it is ready.
+    """
+
+    def __init__(self, sender=None):
+        self._items = {}
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._sender = sender
+        self._loaded_at = None
+        self._attempted_at = None
+        self._full_loaded_at = None
+        self._watermark = None
+        # Records applied by update_from_ret while a full load runs; re-applied to the loaded items.
+        self._writes_during_load = None
+
+    def __len__(self):
+        return len(self._items)
+
+    @property
+    def loaded(self):
+        return self._loaded_at is not None
+
+    def get(self, sku):
+        """Returns the CatalogItem for a SKU, or None if it is unknown (or the catalog is not loaded yet)."""
+        self._refresh_if_stale()
+        return self._items.get(sku)
+
+    def resolve_many(self, skus):
+        """Returns a dictionary of SKU -> CatalogItem for the SKUs that are known."""
+        self._refresh_if_stale()
+        items = self._items
+        return {sku: items[sku] for sku in skus if sku in items}
+
+    def list_ids(self, skus):
+        """Returns a dictionary of SKU -> ListID for the SKUs that are known (for ItemRef resolution)."""
+        return {sku: item.list_id for sku, item in self.resolve_many(skus).items()}
+
+    def warm(self):
+        """Starts loading the catalog in the background if it is not loaded yet."""
+        self._refresh_if_stale()
+
+    def refresh(self, full=False):
+        """
+        Loads the catalog from QuickBooks in the calling thread: a full load the first time (or when
+        `full` is set), a FromModifiedDate delta afterwards. Returns the number of items received.
+        """
+        with self._refresh_lock:
+            full = full or self._full_loaded_at is None or (
+                time.monotonic() - self._full_loaded_at > FULL_RELOAD_INTERVAL)
+            if full:
+                filters = build_list_filters(include_elements=INCLUDE_ELEMENTS)
+            else:
+                # ActiveStatus All so items made inactive since the last refresh are dropped.
+                filters = build_list_filters(active_status="All", from_modified_date=self._watermark,
+                                             include_elements=INCLUDE_ELEMENTS)
+
+            logger.info("Loading item catalog from QuickBooks (%s)...", 'full' if full else 'delta since ' + str(self._watermark))
+            items = {} if full else None
+            # SKU -> TimeModified of the loaded records, to tell which concurrent writes are newer.
+            loaded_modified = {}
+            watermark = WatermarkTracker(None if full else self._watermark)
+            received = 0
+            if full:
+                with self._lock:
+                    self._writes_during_load = []
+            try:
+                for records, _, _ in iter_query_pages("ItemQueryRq", filters, PAGE_SIZE, sender=self._sender,
+                                                      fields=INCLUDE_ELEMENTS):
+                    page = []
+                    for _, record in records:
+                        received += 1
+                        watermark.observe(record)
+                        page.append(record)
+                        if full:
+                            loaded_modified[record.get("Name")] = record.get("TimeModified")
+                    with self._lock:
+                        self._apply_records(page, items if full else self._items)
+
+                with self._lock:
+                    if full:
+                        # Items added or modified while the pages were read: keep them unless the
+                        # loaded record is newer.
+                        for record in self._writes_during_load:
+                            if not is_newer(loaded_modified.get(record.get("Name")), record.get("TimeModified")):
+                                self._apply_records([record], items)
+                        self._items = items
+                        self._full_loaded_at = time.monotonic()
+                    self._watermark = watermark.value or self._watermark
+                    self._loaded_at = time.monotonic()
+            finally:
+                if full:
+                    with self._lock:
+                        self._writes_during_load = None
+            logger.info("Item catalog loaded: %s item(s) received, %s SKU(s) cached.", received, len(self._items))
+            return received
+
+    def update_from_ret(self, ret):
+        """
+        Applies an Item*Ret (element or record dictionary) returned by an Add/Mod/Query so the
+        catalog stays current between refreshes.
+        """
+        if not isinstance(ret, dict):
+            ret = element_to_record(ret, INCLUDE_ELEMENTS)
+        with self._lock:
+            self._apply_records([ret], self._items)
+            if self._writes_during_load is not None:
+                self._writes_during_load.append(ret)
+
+    def _apply_records(self, records, items):
+        # Callers hold self._lock.
+        for record in records:
+            sku = record.get("Name")
+            if not sku:
+                continue
+            if record.get("IsActive") == "false":
+                items.pop(sku, None)
+                continue
+            quantity = record.get("QuantityOnHand")
+            items[sku] = CatalogItem(
+                sku,
+                record.get("ListID"),
+                record.get("FullName"),
+                record.get("EditSequence"),
+                float(quantity) if quantity else None,
+            )
+
+    def _refresh_if_stale(self):
+        with self._lock:
+            now = time.monotonic()
+            # Failed attempts also count, so an unreachable bridge is retried once per interval, not per lookup.
+            if self._attempted_at is not None and now - self._attempted_at < REFRESH_INTERVAL:
+                return
+            if self._refresh_lock.locked():
+                return
+            self._attempted_at = now
+
+        def refresh():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Error refreshing item catalog: %s", e)
+
+        threading.Thread(target=refresh, name="item-catalog-refresh", daemon=True).start()
+
+
+# Shared instance used by all sync scripts in this process (one per gunicorn worker).
+item_catalog = ItemCatalog()
@@ -0,0 +1,304 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+from sync_scripts.entity_scheduler import entity_scheduler
+from sync_scripts import bridge_governor, json_backend, log_config
+from sync_scripts.state_db import get_connection, register_schema, transaction
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Background workers started per process by start_workers() (0 disables them). Unless it is set, the
+# API servers start them at startup only in queue ingest mode, and otherwise on the first queued job.
+QUEUE_WORKERS = int(os.environ.get("SYNC_QUEUE_WORKERS", "1"))
+QUEUE_WORKERS_CONFIGURED = "SYNC_QUEUE_WORKERS" in os.environ
+# Attempts before a job that keeps failing on transport errors is marked failed.
+MAX_ATTEMPTS = int(os.environ.get("SYNC_QUEUE_MAX_ATTEMPTS", "5"))
+# Seconds a running job may go without finishing before another worker picks it up again.
+LEASE_SECONDS = float(os.environ.get("SYNC_QUEUE_LEASE_SECONDS", "300"))
+POLL_INTERVAL = float(os.environ.get("SYNC_QUEUE_POLL_INTERVAL", "0.5"))
+# Seconds finished jobs are kept for GET /jobs/<id>.
+RETENTION_SECONDS = float(os.environ.get("SYNC_QUEUE_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    entity_key TEXT,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_available ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_entity_key ON jobs (entity_key, status);
+""")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+_handlers = {}
+_wakeup = threading.Event()
+_current = threading.local()
+
+
+def register_handler(kind, handler):
+    """
+    Registers the function that processes jobs of `kind`. The handler receives the payload string
+    and returns the sync result: a dictionary (containing "error" on a QuickBooks/validation failure)
+    or None on a transport failure, which is retried with backoff.
+    """
+    _handlers[kind] = handler
+
+
+def enqueue(kind, payload, entity_key=None, coalesce=False):
+    """
+    Durably stores a job and returns its ID. `payload` is stored as-is if it is a string,
+    otherwise JSON-encoded.
+
+    With coalesce=True, if a job of the same kind for the same entity is still waiting in the queue,
+    its payload is replaced by this (newer) one and its ID is returned instead of adding a job.
+    """
+    if _start_on_enqueue:
+        start_workers()
+    if not isinstance(payload, str):
+        payload = json_backend.dumps(payload)
+    conn = get_connection()
+    now = time.time()
+    with transaction(conn):
+        if coalesce and entity_key is not None:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE kind = ? AND entity_key = ? AND status = ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (kind, entity_key, QUEUED),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET payload = ?, updated_at = ? WHERE id = ?",
+                    (payload, now, row["id"]),
+                )
+                logger.info("Coalesced %s payload into queued job %s", kind, row["id"])
+                return row["id"]
+        job_id = uuid.uuid4().hex
+        conn.execute(
+            "INSERT INTO jobs (id, kind, entity_key, payload, status, created_at, updated_at, available_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, entity_key, payload, QUEUED, now, now, now),
+        )
+    logger.info("Queued job %s (%s)", job_id, kind)
+    _wakeup.set()
+    return job_id
+
+
+def get_job(job_id):
+    """Returns the public status of a job as a dictionary, or None if it does not exist."""
+    row = get_connection().execute(
+        "SELECT id, kind, entity_key, status, attempts, progress, result, error, created_at, updated_at "
+        "FROM jobs WHERE id = ?",
+        (job_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def set_progress(progress):
+    """
+    Records progress (any JSON-serializable value) for the job running on this thread. This also
+    renews the job's lease, so a long job that reports progress is not taken over by another worker.
+    """
+    job_id = getattr(_current, "job_id", None)
+    if job_id is None:
+        return
+    now = time.time()
+    get_connection().execute(
+        "UPDATE jobs SET progress = ?, updated_at = ?, lease_expires_at = ? WHERE id = ?",
+        (json.dumps(progress), now, now + LEASE_SECONDS, job_id),
+    )
+
+
+def claim_next():
+    """
+    Atomically takes the oldest available job (or one whose lease expired) and marks it running.
+    Jobs for the same entity are taken strictly one at a time and in order, across all workers.
+    Returns the job row, or None if there is nothing to do.
+    """
+    conn = get_connection()
+    now = time.time()
+    with transaction(conn):
+        row = conn.execute(
+            "SELECT id, kind, entity_key, payload, attempts FROM jobs AS j "
+            "WHERE ((j.status = ? AND j.available_at <= ?) OR (j.status = ? AND j.lease_expires_at < ?)) "
+            "AND (j.entity_key IS NULL OR NOT EXISTS ("
+            "    SELECT 1 FROM jobs AS o WHERE o.entity_key = j.entity_key AND o.id != j.id AND ("
+            "        (o.status = ? AND o.lease_expires_at >= ?)"
+            "        OR (o.status = ? AND o.created_at < j.created_at)))) "
+            "ORDER BY j.available_at LIMIT 1",
+            (QUEUED, now, RUNNING, now, RUNNING, now, QUEUED),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?, lease_expires_at = ? WHERE id = ?",
+            (RUNNING, now, now + LEASE_SECONDS, row["id"]),
+        )
+    return row
+
+
+def _finish(job_id, status, result=None, error=None):
+    get_connection().execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, lease_expires_at = NULL WHERE id = ?",
+        (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+    )
+
+
+def _retry_later(job_id, attempts, error):
+    # Exponential backoff: 2s, 4s, 8s, ... capped at 5 minutes.
+    delay = min(2 ** attempts, 300)
+    now = time.time()
+    get_connection().execute(
+        "UPDATE jobs SET status = ?, error = ?, updated_at = ?, available_at = ?, lease_expires_at = NULL WHERE id = ?",
+        (QUEUED, error, now, now + delay, job_id),
+    )
+
+
+def run_job(row):
+    """Runs one claimed job through its handler and records the outcome."""
+    job_id = row["id"]
+    attempts = row["attempts"] + 1
+    handler = _handlers.get(row["kind"])
+    if handler is None:
+        _finish(job_id, FAILED, error=f"No handler registered for job kind '{row['kind']}'.")
+        return
+
+    _current.job_id = job_id
+    # Everything logged while the job runs carries its ID, which is what the 202 response returned
+    log_token = log_config.set_request_id(job_id)
+    try:
+        # Also serialize against inline (non-queued) requests for the same entity in this process.
+        result = entity_scheduler.run(row["entity_key"], handler, row["payload"], coalesce=False)
+    except Exception as e:
+        logger.exception("Job %s (%s) raised an unexpected error: %s", job_id, row['kind'], e)
+        result = None
+        error = str(e)
+    else:
+        error = "Sync failed before QuickBooks returned a result."
+    finally:
+        _current.job_id = None
+        log_config.reset_request_id(log_token)
+
+    if result is None:
+        if attempts >= MAX_ATTEMPTS:
+            _finish(job_id, FAILED, error=error)
+        else:
+            _retry_later(job_id, attempts, error)
+    elif "error" in result:
+        _finish(job_id, FAILED, result=result, error=str(result["error"]))
+    else:
+        _finish(job_id, SUCCEEDED, result=result)
+
+
+def purge_finished(older_than=None):
+    """Deletes finished jobs older than the retention period."""
+    cutoff = time.time() - (RETENTION_SECONDS if older_than is None else older_than)
+    get_connection().execute(
+        "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+        (SUCCEEDED, FAILED, cutoff),
+    )
+
+
+def _worker_loop(stop_event):
+    last_purge = 0.0
+    while not stop_event.is_set():
+        try:
+            # Leave the jobs queued while the bridge breaker is open instead of spending their attempts.
+            retry_after = bridge_governor.seconds_until_retry()
+            if retry_after > 0:
+                stop_event.wait(min(retry_after, 5.0))
+                continue
+            row = claim_next()
+            if row is not None:
+                run_job(row)
+                continue
+            if time.time() - last_purge > 3600:
+                purge_finished()
+                last_purge = time.time()
+        except Exception as e:
+            logger.exception("Job queue worker error: %s", e)
+        # Jobs enqueued in this process wake us immediately; other processes' jobs are picked up by polling.
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+_workers = []
+_workers_pid = None
+_workers_lock = threading.Lock()
+_stop_event = threading.Event()
+_start_on_enqueue = False
+
+
+def start_workers(count=None):
+    """
+    Starts background threads that drain the queue in this process. Safe to call more than once;
+    workers are started once per (forked) process.
+    """
+    global _workers_pid
+    count = QUEUE_WORKERS if count is None else count
+    if count <= 0 or _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        _workers_pid = os.getpid()
+        _workers.clear()
+        for i in range(count):
+            worker = threading.Thread(target=_worker_loop, args=(_stop_event,), name=f"job-worker-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def start_workers_on_demand():
+    """
+    Defers start_workers() to the first enqueue() in each process, so a server in sync ingest mode
+    runs no queue threads until a request is actually queued (Prefer: respond-async, breaker deferral).
+    """
+    global _start_on_enqueue
+    _start_on_enqueue = True
+
+
+if __name__ == "__main__":
+    # Run a standalone queue drainer: python -m sync_scripts.job_queue
+    # Import through the package so handlers register on the same module instance the workers use.
+    import sync_scripts.customer_sync  # noqa: F401 (registers handlers)
+    import sync_scripts.customer_backfill  # noqa: F401 (registers handlers)
+    import sync_scripts.inventory_sync  # noqa: F401 (registers handlers)
+    import sync_scripts.order_sync  # noqa: F401 (registers handlers)
+    import sync_scripts.product_sync  # noqa: F401 (registers handlers)
+    from sync_scripts import job_queue, log_config
+
+    log_config.configure()
+    worker_count = max(job_queue.QUEUE_WORKERS, 1)
+    logger.info("Draining job queue with %s worker(s)...", worker_count)
+    job_queue.start_workers(worker_count)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        job_queue._stop_event.set()
@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# JSON encoding and decoding for the hot paths: webhook request bodies, API responses, payload
+# archive records and bridge request bodies. orjson, when installed, is several times faster than
+# the standard library on Shopify-sized documents. Objects orjson cannot encode (integers beyond 64
+# bits, non-string keys) are encoded by the standard library instead. Shopify IDs fit in 64 bits;
+# orjson decodes wider integers as floats.
+
+# Load environment variables from .env file
+load_dotenv()
+
+# "auto" uses orjson when it is installed; "json" forces the standard library.
+BACKEND = os.environ.get("SYNC_JSON_BACKEND", "auto").lower()
+
+USE_ORJSON = orjson is not None and BACKEND in ("auto", "orjson")
+
+if BACKEND == "orjson" and orjson is None:
+    logger.warning("SYNC_JSON_BACKEND=orjson but orjson is not installed; using the standard json module.")
+
+# Raised for malformed input by either backend (orjson.JSONDecodeError subclasses it).
+JSONDecodeError = json.JSONDecodeError
+
+
+def loads(data):
+    """Parses JSON text given as str or bytes."""
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj, default=None):
+    """
+    Serializes obj to compact UTF-8 JSON bytes. `default` converts objects neither backend
+    encodes natively, as in json.dumps.
+    """
+    if USE_ORJSON:
+        try:
+            return orjson.dumps(obj, default=default)
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=default).encode("utf-8")
+
+
+def dumps(obj, default=None):
+    """Serializes obj to a compact JSON string."""
+    if USE_ORJSON:
+        try:
+            return orjson.dumps(obj, default=default).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=default)
+
+
+def parse_payload(payload):
+    """
+    Returns a webhook payload as a dictionary. The sync functions take either the dictionary the
+    route already parsed or the JSON string stored by the job queue; only the latter is parsed.
+    Raises JSONDecodeError or TypeError for anything else.
+    """
+    if isinstance(payload, dict):
+        return payload
+    data = loads(payload)
+    if not isinstance(data, dict):
+        raise TypeError(f"Expected a JSON object, got {type(data).__name__}.")
+    return data
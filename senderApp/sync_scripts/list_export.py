@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+from sync_scripts import watermarks
+from sync_scripts.qbxml_batch import QBXMLBatch
+from sync_scripts.qbxml_paging import QBPagingError, build_list_filters, iter_query_pages
+from sync_scripts.watermarks import WatermarkTracker
+
+logger = logging.getLogger(__name__)
+
+# List type -> (query request, supports iterator paging).
+# Small setup lists do not take iterator/MaxReturned and are fetched in one streamed request.
+LIST_TYPES = {
+    "account": ("AccountQueryRq", False),
+    "class": ("ClassQueryRq", False),
+    "currency": ("CurrencyQueryRq", False),
+    "customer": ("CustomerQueryRq", True),
+    "customer_type": ("CustomerTypeQueryRq", False),
+    "employee": ("EmployeeQueryRq", True),
+    "item": ("ItemQueryRq", True),
+    "item_inventory": ("ItemInventoryQueryRq", True),
+    "item_non_inventory": ("ItemNonInventoryQueryRq", True),
+    "item_service": ("ItemServiceQueryRq", True),
+    "sales_rep": ("SalesRepQueryRq", False),
+    "sales_tax_code": ("SalesTaxCodeQueryRq", False),
+    "vendor": ("VendorQueryRq", True),
+}
+
+# Key added to each exported record holding its *Ret tag (e.g. ItemInventoryRet vs ItemServiceRet).
+RET_TYPE_KEY = "_ret"
+
+
+def default_output_path(list_type):
+    return os.path.join("json", f"{list_type}.jsonl")
+
+
+def _checkpoint_path(output_path):
+    return output_path + ".checkpoint"
+
+
+def _partial_path(output_path):
+    return output_path + ".partial"
+
+
+def _load_checkpoint(output_path):
+    try:
+        with open(_checkpoint_path(output_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_checkpoint(output_path, checkpoint):
+    # Write-then-rename so a crash never leaves a half-written checkpoint.
+    path = _checkpoint_path(output_path)
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+
+def _watermark_key(output_path):
+    return f"snapshot:{os.path.abspath(output_path)}"
+
+
+def _write_records(f, records):
+    for ret_tag, record in records:
+        record[RET_TYPE_KEY] = ret_tag
+        f.write(json.dumps(record, separators=(",", ":")))
+        f.write("\n")
+
+
+def _query_records(rq_tag, paged, filters_xml, page_size, sender):
+    """Yields (ret_tag, record) for every record matching the query, paged or in one request."""
+    if paged:
+        for records, _, _ in iter_query_pages(rq_tag, filters_xml, page_size, sender=sender):
+            yield from records
+        return
+    batch = QBXMLBatch(on_error="stopOnError")
+    request_id = batch.add(rq_tag, filters_xml)
+    stream = batch.stream(sender)
+    for _, ret_tag, record in stream:
+        yield ret_tag, record
+    status = stream.statuses[request_id]
+    if not status.ok:
+        raise QBPagingError(status)
+
+
+def refresh_snapshot(list_type, output_path, since, rq_tag, paged, page_size=None, sender=None):
+    """
+    Brings an exported snapshot up to date by fetching only the records modified since `since`
+    (FromModifiedDate) and merging them by ListID: changed records are replaced, new ones appended
+    and ones made inactive removed. Returns the number of changed records received.
+    """
+    logger.info("Refreshing %s with %s changes since %s...", output_path, list_type, since)
+    # Changes are few compared to the list, so they are held in memory while the snapshot streams past.
+    changes = {}
+    watermark = WatermarkTracker(since)
+    filters_xml = build_list_filters(active_status="All", from_modified_date=since)
+    for ret_tag, record in _query_records(rq_tag, paged, filters_xml, page_size, sender):
+        watermark.observe(record)
+        changes[record.get("ListID")] = (ret_tag, record)
+    received = len(changes)
+
+    if changes:
+        partial_path = _partial_path(output_path)
+        updated = removed = 0
+        with open(output_path) as src, open(partial_path, "w") as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                change = changes.pop(json.loads(line).get("ListID"), None)
+                if change is None:
+                    dst.write(line)
+                elif change[1].get("IsActive") == "false":
+                    removed += 1
+                else:
+                    _write_records(dst, [change])
+                    updated += 1
+            added = [change for change in changes.values() if change[1].get("IsActive") != "false"]
+            _write_records(dst, added)
+        os.replace(partial_path, output_path)
+        logger.info("Merged %s changes: %s updated, %s added, %s removed.", list_type, updated, len(added), removed)
+    else:
+        logger.info("No %s changes since %s.", list_type, since)
+    watermarks.advance(_watermark_key(output_path), watermark.value)
+    return received
+
+
+def export_list(list_type, output_path=None, filters_xml="", page_size=None, resume=True, rq_tag=None,
+                paged=None, incremental=True, sender=None):
+    """
+    Exports a QuickBooks list to a JSONL file, one record per line, and returns the number of records
+    written (for an incremental refresh, the number of changed records received).
+
+    Pageable lists are read with iterator="Start"/"Continue" pages of `page_size` records, each page
+    appended to "<output>.partial" as it arrives. After every page a checkpoint with the iterator ID
+    and the file offset is saved, so an interrupted export resumes where it stopped (resume=True).
+    If the iterator has expired in QuickBooks, the export starts over. The finished file replaces
+    `output_path` in one rename.
+
+    With incremental=True, a complete unfiltered export records the newest TimeModified it saw, and
+    later runs only merge the changes since then into the existing file (see refresh_snapshot).
+
+    `rq_tag` overrides the query request for list types not in LIST_TYPES. `paged` overrides whether
+    an iterator is used (required off for ListID/FullName lookups).
+    """
+    # Watermarks are only meaningful for whole-list snapshots of known list types.
+    track_watermark = rq_tag is None and not filters_xml
+    if rq_tag is None:
+        if list_type not in LIST_TYPES:
+            raise ValueError(f"Unknown list type '{list_type}'. Known types: {', '.join(sorted(LIST_TYPES))}")
+        rq_tag, list_paged = LIST_TYPES[list_type]
+    else:
+        list_paged = True
+    paged = list_paged if paged is None else paged
+    output_path = output_path or default_output_path(list_type)
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    partial_path = _partial_path(output_path)
+    checkpoint = _load_checkpoint(output_path) if resume and paged else None
+    if checkpoint and (checkpoint.get("rq_tag") != rq_tag or checkpoint.get("filters") != filters_xml
+                       or not os.path.exists(partial_path)):
+        logger.warning("Ignoring checkpoint for %s: it belongs to a different export.", output_path)
+        checkpoint = None
+
+    if track_watermark and incremental and checkpoint is None and os.path.exists(output_path):
+        since = watermarks.get(_watermark_key(output_path))
+        if since:
+            return refresh_snapshot(list_type, output_path, since, rq_tag, paged, page_size, sender)
+
+    if not paged:
+        logger.info("Exporting %s (%s) to %s...", list_type, rq_tag, output_path)
+        watermark = WatermarkTracker()
+        try:
+            with open(partial_path, "w") as f:
+                count = 0
+                for ret_tag, record in _query_records(rq_tag, False, filters_xml, None, sender):
+                    watermark.observe(record)
+                    _write_records(f, [(ret_tag, record)])
+                    count += 1
+        except QBPagingError:
+            os.remove(partial_path)
+            raise
+        os.replace(partial_path, output_path)
+        _record_full_export(output_path, watermark.value, track_watermark)
+        logger.info("Exported %s %s record(s) to %s.", count, list_type, output_path)
+        return count
+
+    while True:
+        if checkpoint:
+            iterator_id, count, offset = checkpoint["iterator_id"], checkpoint["records"], checkpoint["offset"]
+            watermark = WatermarkTracker(checkpoint.get("watermark"))
+            logger.info("Resuming %s export at record %s (iterator %s)...", list_type, count, iterator_id)
+            f = open(partial_path, "r+")
+            # Drop anything written after the last checkpoint so a page is never duplicated.
+            f.truncate(offset)
+            f.seek(offset)
+        else:
+            iterator_id, count = None, 0
+            watermark = WatermarkTracker()
+            logger.info("Exporting %s (%s) to %s...", list_type, rq_tag, output_path)
+            f = open(partial_path, "w")
+
+        try:
+            with f:
+                for records, iterator_id, remaining in iter_query_pages(rq_tag, filters_xml, page_size, iterator_id, sender):
+                    for _, record in records:
+                        watermark.observe(record)
+                    _write_records(f, records)
+                    f.flush()
+                    count += len(records)
+                    _save_checkpoint(output_path, {
+                        "list_type": list_type,
+                        "rq_tag": rq_tag,
+                        "filters": filters_xml,
+                        "iterator_id": iterator_id,
+                        "records": count,
+                        "offset": f.tell(),
+                        "remaining": remaining,
+                        "watermark": watermark.value,
+                    })
+                    logger.info("%s record(s) exported, %s remaining.", count, remaining)
+        except QBPagingError as e:
+            if checkpoint is None:
+                raise
+            # QuickBooks drops iterators after a while or when the company file is reopened.
+            logger.warning("Could not resume iterator (%s); restarting the export.", e)
+            checkpoint = None
+            continue
+        break
+
+    os.replace(partial_path, output_path)
+    try:
+        os.remove(_checkpoint_path(output_path))
+    except FileNotFoundError:
+        pass
+    _record_full_export(output_path, watermark.value, track_watermark)
+    logger.info("Exported %s %s record(s) to %s.", count, list_type, output_path)
+    return count
+
+
+def _record_full_export(output_path, watermark, track_watermark):
+    # A full export replaces the snapshot, so its watermark replaces the stored one.
+    key = _watermark_key(output_path)
+    watermarks.reset(key)
+    if track_watermark:
+        watermarks.advance(key, watermark)
+
+
+def read_export(path):
+    """Yields the records of an exported JSONL file one at a time."""
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,237 @@
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+from sync_scripts import json_backend
+
+try:
+    import fcntl
+except ImportError:  # Windows: rotation is not coordinated between processes
+    fcntl = None
+
+# Logging for the sync service (SYNC_SPEC §5). Modules log through logging.getLogger(__name__);
+# configure() installs one handler on the root logger that only puts records on an in-memory queue.
+# A listener thread formats them and does the console and file I/O, so a request thread never waits
+# on stdout or the disk. Records below SYNC_LOG_LEVEL are dropped before they are built, and
+# messages use %-style arguments, so a disabled debug line costs one level check.
+#
+# Every record carries the correlation ID of the request (or queued job) it was logged for: the
+# caller's X-Request-Id header, or a generated one, echoed back on the response.
+
+# Load environment variables from .env file
+load_dotenv()
+
+LEVEL = os.environ.get("SYNC_LOG_LEVEL", "INFO").upper()
+# Log file, rotated by size; set to an empty value to log to the console only.
+LOG_FILE = os.environ.get(
+    "SYNC_LOG_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "sync_client.log"),
+)
+MAX_BYTES = int(os.environ.get("SYNC_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+BACKUP_COUNT = int(os.environ.get("SYNC_LOG_BACKUP_COUNT", "5"))
+# "text" (one human-readable line per record) or "json" (one JSON object per line).
+FORMAT = os.environ.get("SYNC_LOG_FORMAT", "text").lower()
+CONSOLE = os.environ.get("SYNC_LOG_CONSOLE", "true").lower() in ("1", "true", "yes")
+# Records waiting for the listener thread; beyond this, new records are dropped and counted.
+QUEUE_SIZE = int(os.environ.get("SYNC_LOG_QUEUE_SIZE", "10000"))
+# Stop every logger in the process (including libraries and other handlers) from recording the
+# caller's file and line and the thread and process names. Neither format uses them, and skipping
+# them makes a logging call about a quarter cheaper, but it changes the global logging module state.
+LEAN_RECORDS = os.environ.get("SYNC_LOG_LEAN_RECORDS", "false").lower() in ("1", "true", "yes")
+
+REQUEST_ID_HEADER = "X-Request-Id"
+# Caller-supplied IDs end up in every log line, so only short, plain ones are accepted.
+_REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._:-]{1,64}")
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"
+
+_request_id = contextvars.ContextVar("sync_request_id", default="-")
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:16]
+
+
+def set_request_id(request_id=None):
+    """
+    Tags everything logged from here on in this thread/task with a correlation ID: `request_id` if
+    it is a plausible ID (e.g. from the caller's X-Request-Id header), otherwise a new one. Returns
+    a token for reset_request_id().
+    """
+    if not request_id or not _REQUEST_ID_PATTERN.fullmatch(request_id):
+        request_id = new_request_id()
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Puts records on the listener's queue. Only the message arguments are merged here (so later
+    changes to them do not show up in the log); formatting is left to the listener thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                sys.stderr.write(f"Log queue is full; {self.dropped} record(s) dropped.\n")
+
+
+class _SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler for a file that several processes (gunicorn workers, the queue drainer)
+    append to. Rotation takes a lock file, and a process whose file was rotated by another one
+    reopens the new file instead of rotating again.
+    """
+
+    def _rotated_elsewhere(self):
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except OSError:
+            return True
+
+    def shouldRollover(self, record):
+        if self.stream is not None and self._rotated_elsewhere():
+            self.stream.close()
+            self.stream = self._open()
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        if fcntl is None:
+            return super().doRollover()
+        with open(self.baseFilename + ".lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) < self.maxBytes \
+                        and self._rotated_elsewhere():
+                    # Another process rotated while we waited for the lock.
+                    self.stream.close()
+                    self.stream = self._open()
+                    return
+                super().doRollover()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; fields passed with extra={...} are included."""
+
+    _STANDARD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+    def format(self, record):
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._STANDARD and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json_backend.dumps(entry, default=str)
+
+
+def _handlers():
+    formatter = JsonFormatter() if FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    handlers = []
+    if CONSOLE:
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(formatter)
+        handlers.append(console)
+    if LOG_FILE:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(LOG_FILE)), exist_ok=True)
+            file_handler = _SharedRotatingFileHandler(LOG_FILE, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT,
+                                                      encoding="utf-8")
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+        except OSError as e:
+            sys.stderr.write(f"Cannot open log file {LOG_FILE}: {e}\n")
+    return handlers
+
+
+def configure():
+    """
+    Routes all logging of this process through the queue and its listener thread. Called by the
+    servers and the command-line tools at startup; calling it again does nothing.
+    """
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is not None:
+            return
+        log_queue = queue.Queue(QUEUE_SIZE)
+        _queue_handler = _QueueHandler(log_queue)
+        _queue_handler.addFilter(_RequestIdFilter())
+        if LEAN_RECORDS:
+            logging._srcfile = None
+            logging.logThreads = False
+            logging.logProcesses = False
+            logging.logMultiprocessing = False
+        root = logging.getLogger()
+        root.setLevel(LEVEL)
+        root.addHandler(_queue_handler)
+        _listener = logging.handlers.QueueListener(log_queue, *_handlers(), respect_handler_level=True)
+        _listener.start()
+
+
+def _restart_after_fork():
+    # The listener thread does not survive a fork (e.g. gunicorn --preload), and the parent's queue
+    # may have been locked by it at that moment: the child gets a new queue and listener.
+    global _lock, _listener
+    _lock = threading.Lock()
+    if _listener is not None:
+        log_queue = queue.Queue(QUEUE_SIZE)
+        _queue_handler.queue = log_queue
+        _listener = logging.handlers.QueueListener(log_queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def shutdown():
+    """Writes out the records still queued. Registered to run at exit."""
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+atexit.register(shutdown)
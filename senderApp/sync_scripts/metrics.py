@@ -0,0 +1,366 @@
+import atexit
+import bisect
+import contextvars
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+from sync_scripts.state_db import get_connection, register_schema, transaction
+
+logger = logging.getLogger(__name__)
+
+# Per-stage latency histograms and outcome counters for the sync pipeline, exposed in the Prometheus
+# text format on GET /metrics.
+#
+# Every process (gunicorn worker, queue drainer) keeps its metrics in memory, so recording one is a
+# dictionary update under a lock. A background thread adds what the process recorded since its last
+# flush to the process's row in the state database every SYNC_METRICS_FLUSH_SECONDS, and /metrics
+# merges the rows of all processes, so any worker answering the scrape reports the totals of the whole
+# server. Rows not updated for a while (e.g. of recycled workers) are folded into one "retired" row,
+# so counters never go back. A row holds increments rather than the process's running totals, so
+# folding the row of a process that is still alive (just slow to flush) does not count anything twice.
+
+# Load environment variables from .env file
+load_dotenv()
+
+ENABLED = os.environ.get("SYNC_METRICS", "true").lower() in ("1", "true", "yes")
+# Seconds between snapshot writes; /metrics may lag other workers by up to this much.
+FLUSH_SECONDS = float(os.environ.get("SYNC_METRICS_FLUSH_SECONDS", "5"))
+# A row not updated for this long (usually of a process that is gone) is folded into "retired".
+RETIRE_SECONDS = float(os.environ.get("SYNC_METRICS_RETIRE_SECONDS", "300"))
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS metrics_snapshots (
+    process TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL,
+    data TEXT NOT NULL
+);
+""")
+
+RETIRED = "retired"
+
+# Histogram buckets in seconds: from a template render (well under 1 ms) to a slow bridge round trip.
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Metric name -> (type, help, label names)
+METRICS = {
+    "sync_stage_duration_seconds": (
+        "histogram", "Time spent in one stage of a sync operation.", ("entity", "operation", "stage")),
+    "sync_operation_duration_seconds": (
+        "histogram", "Total time of a sync operation.", ("entity", "operation")),
+    "sync_operations_total": (
+        "counter", "Sync operations by outcome (ok, unchanged, error, retry, exception).",
+        ("entity", "operation", "outcome")),
+    "sync_qb_responses_total": (
+        "counter", "QuickBooks responses by request type and statusCode.",
+        ("entity", "operation", "request", "status_code")),
+    "sync_reference_cache_lookups_total": (
+        "counter", "Reference cache lookups by table and result (hit, stale_hit, miss).", ("table", "result")),
+    "sync_bridge_breaker_transitions_total": (
+        "counter", "Bridge circuit breaker transitions by new state (open, half_open, closed).", ("state",)),
+    "sync_bridge_rejections_total": (
+        "counter", "Bridge calls refused by the governor (open: breaker open, busy: no free slot).", ("reason",)),
+}
+
+# Pipeline stages, in order: Shopify payload parse, reference cache lookup, qbXML build,
+# HTTP round trip to the bridge, qbXML response parse.
+STAGES = ("parse", "reference_lookup", "xml_build", "bridge_round_trip", "response_parse")
+
+# (entity, operation) of the sync operation running in this thread or asyncio task. Flows set it
+# with operation(); the drivers in qb_flow.py and async_engine.py restore it when the flow is done.
+_operation = contextvars.ContextVar("sync_operation", default=("none", "none"))
+
+_lock = threading.Lock()
+_values = {}
+_process = None
+# Serializes flush() and collect() in this process. _flushed holds _values as of the last flush.
+_flush_lock = threading.Lock()
+_flushed = {}
+
+
+def operation(entity, name):
+    """Labels everything recorded from here on in this thread/task with the given entity and operation."""
+    _operation.set((entity, name))
+
+
+def current_operation():
+    return _operation.get()
+
+
+def restore_operation(labels):
+    _operation.set(labels)
+
+
+def _start():
+    """Names this process's snapshot and starts its flush thread, on the first recorded metric."""
+    global _process
+    with _lock:
+        if _process is None:
+            _process = f"{socket.gethostname()}:{os.getpid()}:{time.time():.0f}"
+            threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _reset_after_fork():
+    # A forked child (e.g. a gunicorn worker of a --preload app) must not report its parent's counts
+    # a second time, and needs its own flush thread.
+    global _lock, _values, _process, _flush_lock, _flushed
+    _lock = threading.Lock()
+    _values = {}
+    _process = None
+    _flush_lock = threading.Lock()
+    _flushed = {}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def observe(metric, labels, value):
+    """Adds one observation to a histogram."""
+    if not ENABLED:
+        return
+    if _process is None:
+        _start()
+    index = bisect.bisect_left(DURATION_BUCKETS, value)
+    key = (metric, labels)
+    with _lock:
+        series = _values.get(key)
+        if series is None:
+            # Per-bucket counts (not cumulative), then +Inf, sum and count.
+            series = _values[key] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0, 0]
+        series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+
+def count(metric, labels, amount=1):
+    """Increments a counter."""
+    if not ENABLED:
+        return
+    if _process is None:
+        _start()
+    key = (metric, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+
+class _StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe_stage(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def stage(name):
+    """
+    Times the enclosed block as one stage of the current sync operation:
+
+        with metrics.stage("xml_build"):
+            xml = create_customer_add_xml(...)
+    """
+    return _StageTimer(name)
+
+
+def observe_stage(name, seconds):
+    observe("sync_stage_duration_seconds", _operation.get() + (name,), seconds)
+
+
+def record_qb_response(rs_tag, status_code):
+    """Counts one QuickBooks response (e.g. "CustomerAddRs", "3100") for the current operation."""
+    count("sync_qb_responses_total", _operation.get() + (rs_tag[:-2], status_code or "none"))
+
+
+def record_reference_lookup(table, result):
+    count("sync_reference_cache_lookups_total", (table, result))
+
+
+def outcome(result):
+    """Classifies a sync function result the way the routes and the job queue do."""
+    if result is None:
+        return "retry"
+    if isinstance(result, dict):
+        if "error" in result:
+            return "error"
+        if result.get("status") == "unchanged":
+            return "unchanged"
+    return "ok"
+
+
+def record_operation(labels, seconds, result_outcome):
+    """Records a finished sync operation; operations that never called operation() are not counted."""
+    if labels == ("none", "none"):
+        return
+    observe("sync_operation_duration_seconds", labels, seconds)
+    count("sync_operations_total", labels + (result_outcome,))
+
+
+def _current():
+    with _lock:
+        return {key: list(value) if isinstance(value, list) else value for key, value in _values.items()}
+
+
+def _serialize(series):
+    """{(metric, labels): value} -> the stored snapshot shape {metric: [[labels, value], ...]}."""
+    snapshot = {}
+    for (metric, labels), value in series.items():
+        snapshot.setdefault(metric, []).append([list(labels), value])
+    return snapshot
+
+
+def _unflushed():
+    """Returns (increments since the last flush, current values) of this process."""
+    current = _current()
+    delta = {}
+    for key, value in current.items():
+        before = _flushed.get(key)
+        if before is None:
+            delta[key] = value
+        elif isinstance(value, list):
+            if value != before:
+                delta[key] = [a - b for a, b in zip(value, before)]
+        elif value != before:
+            delta[key] = value - before
+    return delta, current
+
+
+def _merge(target, snapshot):
+    """Adds a snapshot ({metric: [[labels, value], ...]}) into target ({(metric, labels): value})."""
+    for metric, series in snapshot.items():
+        if metric not in METRICS:
+            continue
+        for labels, value in series:
+            key = (metric, tuple(labels))
+            current = target.get(key)
+            if current is None:
+                target[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                # Snapshots written with a different bucket layout cannot be merged.
+                if len(value) == len(current):
+                    target[key] = [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = current + value
+
+
+def flush():
+    """
+    Adds what this process recorded since its last flush to its row, then folds rows that were not
+    updated for RETIRE_SECONDS into the retired row.
+    """
+    global _flushed
+    if not ENABLED or _process is None:
+        return
+    with _flush_lock:
+        delta, current = _unflushed()
+        now = time.time()
+        try:
+            conn = get_connection()
+            with transaction(conn):
+                # The row is gone if it was retired meanwhile; the increments then start a new one.
+                row = conn.execute("SELECT data FROM metrics_snapshots WHERE process = ?", (_process,)).fetchone()
+                totals = {}
+                if row is not None:
+                    _merge(totals, json.loads(row["data"]))
+                _merge(totals, _serialize(delta))
+                conn.execute(
+                    "INSERT INTO metrics_snapshots (process, updated_at, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(process) DO UPDATE SET updated_at = excluded.updated_at, data = excluded.data",
+                    (_process, now, json.dumps(_serialize(totals))),
+                )
+            _flushed = current
+            _retire(conn, now - RETIRE_SECONDS)
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Error writing metrics snapshot: %s", e)
+
+
+def _retire(conn, cutoff):
+    if conn.execute("SELECT 1 FROM metrics_snapshots WHERE updated_at < ? AND process != ? LIMIT 1",
+                    (cutoff, RETIRED)).fetchone() is None:
+        return
+    with transaction(conn):
+        rows = conn.execute("SELECT process, data FROM metrics_snapshots WHERE updated_at < ? OR process = ?",
+                            (cutoff, RETIRED)).fetchall()
+        merged = {}
+        for row in rows:
+            _merge(merged, json.loads(row["data"]))
+        conn.execute("DELETE FROM metrics_snapshots WHERE updated_at < ? OR process = ?", (cutoff, RETIRED))
+        conn.execute("INSERT INTO metrics_snapshots (process, updated_at, data) VALUES (?, ?, ?)",
+                     (RETIRED, time.time(), json.dumps(_serialize(merged))))
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        flush()
+
+
+atexit.register(flush)
+
+
+def collect():
+    """
+    Returns the merged series of all processes ({(metric, labels): value}): the rows in the state
+    database plus what this process recorded since its last flush. A scrape only reads the state
+    database. Falls back to this process alone when the state database cannot be read.
+    """
+    merged = {}
+    with _flush_lock:
+        try:
+            for row in get_connection().execute("SELECT data FROM metrics_snapshots"):
+                _merge(merged, json.loads(row["data"]))
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Error reading metrics snapshots: %s", e)
+            return _current()
+        delta, _ = _unflushed()
+    _merge(merged, _serialize(delta))
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names, values, le=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Returns the metrics of all processes in the Prometheus text exposition format (version 0.0.4)."""
+    merged = collect()
+    lines = []
+    for metric, (kind, help_text, label_names) in METRICS.items():
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {kind}")
+        for (name, labels), value in sorted(merged.items()):
+            if name != metric:
+                continue
+            if kind == "counter":
+                lines.append(f"{metric}{_label_text(label_names, labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(DURATION_BUCKETS + ("+Inf",), value):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_label_text(label_names, labels, bound)} {cumulative}")
+            lines.append(f"{metric}_sum{_label_text(label_names, labels)} {_number(value[-2])}")
+            lines.append(f"{metric}_count{_label_text(label_names, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
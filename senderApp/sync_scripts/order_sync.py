@@ -1,61 +1,445 @@
 import json
-import requests
+import logging
 import os
 from dotenv import load_dotenv
-import xml.etree.ElementTree as ET
-from xml.sax.saxutils import escape
+from sync_scripts.json_backend import parse_payload
+from sync_scripts.qb_flow import LocalCall, run_flow
+from sync_scripts.qbxml_batch import QBXMLBatch
+from sync_scripts.qbxml_templates import IF_SCOPE, PRESENT, Field, Fragment, Group, Ref, Repeat, address_group, compile_template, xml_text
+from sync_scripts.customer_sync import (
+    STALE_ID_STATUS_CODES,
+    _report_transport_error,
+    _xml_to_dict,
+    create_customer_add_xml,
+    get_qb_customer_name,
+    get_reference_maps,
+)
+from sync_scripts import id_index, job_queue, metrics
+from sync_scripts.item_catalog import item_catalog
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables from .env file
 load_dotenv()
 
-base_url = os.environ.get("QB_SERVER_URL", "").rstrip('/')
-SERVER_URL = base_url + "/qbxml"
+# QuickBooks item used for Shopify shipping lines.
+SHIPPING_ITEM = os.environ.get("QB_SHIPPING_ITEM", "Shipping")
+# Item used for line items without a SKU. If empty, such orders are rejected.
+NO_SKU_ITEM = os.environ.get("QB_NO_SKU_ITEM", "")
+# Customer used for orders placed without a Shopify customer.
+GUEST_CUSTOMER = os.environ.get("QB_GUEST_CUSTOMER", "Shopify Guest")
+# Sales tax codes for taxable / non-taxable lines.
+TAXABLE_CODE = os.environ.get("QB_TAXABLE_CODE", "Tax")
+NON_TAXABLE_CODE = os.environ.get("QB_NON_TAXABLE_CODE", "Non")
+# Shopify tax line title -> QuickBooks sales tax item, e.g. {"GST": "GST"} (the config.json tax_mapping).
+TAX_MAPPING = json.loads(os.environ.get("QB_TAX_MAPPING", "{}"))
+
+# QuickBooks statusCode for "the name is already in use".
+NAME_IN_USE = "3100"
+
+def _add_tag(tag, value):
+    """Returns <tag>value</tag> with the value escaped, or an empty string if there is no value."""
+    if value is None or value == "":
+        return ""
+    return f"<{tag}>{xml_text(value)}</{tag}>"
+
+def _ref(tag, list_id=None, full_name=None):
+    """Returns a *Ref element by ListID or FullName."""
+    if list_id:
+        return f"<{tag}><ListID>{xml_text(list_id)}</ListID></{tag}>"
+    return f"<{tag}><FullName>{xml_text(full_name)}</FullName></{tag}>"
+
+def _sales_tax_item(order_data, ctx):
+    """Maps the order's tax to the ItemSalesTaxRef FullName using the tax mapping, if configured."""
+    for tax_line in order_data.get('tax_lines') or []:
+        qb_tax_item = TAX_MAPPING.get(tax_line.get('title'))
+        if qb_tax_item:
+            return qb_tax_item
+    return None
+
+def _line_sku(line_item):
+    return line_item.get('sku') or NO_SKU_ITEM
+
+def _order_lines(line_tag, new_line_xml=""):
+    """
+    The SalesOrderLineAdd/SalesOrderLineMod elements for the order's line items and shipping lines.
+    ctx["item_refs"] may map a SKU to a resolved ItemRef ListID; otherwise ItemRef.FullName is the SKU.
+    Line items without a SKU (and no QB_NO_SKU_ITEM) are left out; see _lines_without_item.
+    """
+    return [
+        Repeat("line_items", [
+            f"<{line_tag}>{new_line_xml}",
+            Ref("ItemRef", lambda line, ctx: _line_sku(line), list_id=lambda line, ctx: ctx["item_refs"].get(_line_sku(line))),
+            Field("Desc", ("name", "title")),
+            Field("Quantity", "quantity"),
+            Field("Rate", "price"),
+            Ref("SalesTaxCodeRef", lambda line, ctx: TAXABLE_CODE if line.get('taxable', True) else NON_TAXABLE_CODE),
+            f"</{line_tag}>",
+        ], where=lambda line, ctx: _line_sku(line)),
+        Repeat("shipping_lines", [
+            f"<{line_tag}>{new_line_xml}",
+            Ref("ItemRef", lambda line, ctx: SHIPPING_ITEM),
+            Field("Desc", "title"),
+            Field("Amount", "price"),
+            Ref("SalesTaxCodeRef", lambda line, ctx: TAXABLE_CODE if line.get('tax_lines') else NON_TAXABLE_CODE),
+            f"</{line_tag}>",
+        ]),
+    ]
+
+# Header fields shared by SalesOrderAdd and SalesOrderMod, in qbXML element order.
+# ctx["customer_ref_xml"] is the CustomerRef resolved by _resolve_customer_ref.
+ORDER_HEADER = [
+    Fragment(lambda order, ctx: ctx["customer_ref_xml"]),
+    Field("TxnDate", "created_at", transform=lambda created_at: created_at[:10]),
+    Field("RefNumber", "name"),
+    address_group("BillAddress", "billing_address", when=IF_SCOPE, field_when=PRESENT),
+    address_group("ShipAddress", "shipping_address", when=IF_SCOPE, field_when=PRESENT),
+    Group("ItemSalesTaxRef", [Field("FullName", lambda qb_tax_item, ctx: qb_tax_item)],
+          scope=_sales_tax_item, when=IF_SCOPE),
+    Field("Memo", lambda order, ctx: f"Shopify order {order.get('id')}"),
+]
+
+SALES_ORDER_ADD = compile_template("SalesOrderAdd", [*ORDER_HEADER, *_order_lines("SalesOrderLineAdd")])
+
+# A new line in a SalesOrderMod is marked with TxnLineID -1; the lines we do not send are removed.
+SALES_ORDER_MOD = compile_template("SalesOrderMod", [
+    Field("TxnID", lambda order, ctx: ctx["TxnID"]),
+    Field("EditSequence", lambda order, ctx: ctx["EditSequence"]),
+    *ORDER_HEADER,
+    *_order_lines("SalesOrderLineMod", "<TxnLineID>-1</TxnLineID>"),
+])
+
+def _lines_without_item(order_data):
+    """Returns the titles of line items that cannot be mapped to a QuickBooks item."""
+    return [line_item.get('title') or str(line_item.get('id'))
+            for line_item in order_data.get('line_items') or [] if not _line_sku(line_item)]
+
+def _item_refs(order_data):
+    """
+    Resolves the order's SKUs to item ListIDs from the shared item catalog. SKUs the catalog does not
+    know (yet) are left out and referenced by FullName instead.
+    """
+    skus = [line_item.get('sku') for line_item in order_data.get('line_items') or [] if line_item.get('sku')]
+    with metrics.stage("reference_lookup"):
+        return item_catalog.list_ids(skus) if skus else {}
+
+def create_sales_order_add_xml(order_data, customer_ref_xml, item_refs=None):
+    """
+    Creates the SalesOrderAdd qbXML string from Shopify order data.
+    Returns (xml, skus_without_item).
+    """
+    xml = SALES_ORDER_ADD.render(order_data, {"customer_ref_xml": customer_ref_xml, "item_refs": item_refs or {}})
+    return xml, _lines_without_item(order_data)
+
+def create_sales_order_mod_xml(order_data, qb_order_ids, customer_ref_xml, item_refs=None):
+    """
+    Creates the SalesOrderMod qbXML string from Shopify order data. All existing lines are
+    replaced by the order's current lines. Returns (xml, skus_without_item).
+    """
+    xml = SALES_ORDER_MOD.render(order_data, {
+        "TxnID": qb_order_ids['TxnID'],
+        "EditSequence": qb_order_ids['EditSequence'],
+        "customer_ref_xml": customer_ref_xml,
+        "item_refs": item_refs or {},
+    })
+    return xml, _lines_without_item(order_data)
+
+def _order_customer_data(order_data):
+    """Returns the Shopify customer of an order, using the billing address if it has no default address."""
+    customer_data = dict(order_data.get('customer') or {})
+    if customer_data and not customer_data.get('default_address') and order_data.get('billing_address'):
+        customer_data['default_address'] = order_data['billing_address']
+    return customer_data
+
+def _order_customer_name(customer_data):
+    return get_qb_customer_name(customer_data) or f"Shopify {customer_data.get('id')}"
+
+def _resolve_customer_ref(order_data, allow_add=True):
+    """
+    Resolves the order's CustomerRef without querying QuickBooks.
+
+    Returns (customer_ref_xml, customer_add_xml). For a customer not in the local ID index,
+    customer_add_xml is the CustomerAdd body to send in the same envelope as the order, which then
+    points at the new customer by FullName; with allow_add unset, both are None instead.
+    """
+    customer_data = _order_customer_data(order_data)
+    shopify_customer_id = customer_data.get('id')
+    if not shopify_customer_id:
+        return _ref("CustomerRef", full_name=GUEST_CUSTOMER), None
+
+    indexed = id_index.get("customer", shopify_customer_id)
+    if indexed:
+        return _ref("CustomerRef", list_id=indexed['ListID']), None
+    if not allow_add:
+        return None, None
+
+    currency_map, customer_type_map, sales_rep_map = get_reference_maps()
+    with metrics.stage("xml_build"):
+        customer_add_xml = create_customer_add_xml(customer_data, currency_map, customer_type_map, sales_rep_map)
+    return _ref("CustomerRef", full_name=_order_customer_name(customer_data)), customer_add_xml
+
+def _shopify_id_of(customer_ret):
+    """Returns the "Shopify ID" custom field of a CustomerRet, or None."""
+    for data_ext in customer_ret.findall("DataExtRet"):
+        if data_ext.findtext("DataExtName") == "Shopify ID":
+            return data_ext.findtext("DataExtValue")
+    return None
+
+def _find_customer_flow(customer_data):
+    """
+    Flow that looks up by name a customer that is in QuickBooks but not in the ID index (e.g. created
+    before the index existed, or reported as existing by a backfill). The customer is only accepted
+    when its Shopify ID custom field matches, so an order is never linked to another customer of the
+    same name; it is then recorded in the index. Returns its ListID, or None.
+    """
+    shopify_customer_id = customer_data.get('id')
+    qb_name = _order_customer_name(customer_data)
+    batch = QBXMLBatch(on_error="stopOnError")
+    # OwnerID 0 returns the public custom fields (DataExtRet) along with the customer.
+    request_id = batch.add("CustomerQueryRq", _add_tag("FullName", qb_name) + "<OwnerID>0</OwnerID>")
+    logger.info("Querying QuickBooks for customer %s of Shopify customer %s...", qb_name, shopify_customer_id)
+    customer_ret = (yield batch)[request_id].ret("CustomerRet")
+    if customer_ret is None:
+        return None
+    if _shopify_id_of(customer_ret) != str(shopify_customer_id):
+        logger.warning("QuickBooks customer %s is not Shopify customer %s (Shopify ID %s).",
+                       qb_name, shopify_customer_id, _shopify_id_of(customer_ret))
+        return None
+    yield LocalCall(id_index.remember, "customer", shopify_customer_id, customer_ret)
+    return customer_ret.findtext("ListID")
+
+def _parse_order_payload(shopify_order_json_string):
+    try:
+        with metrics.stage("parse"):
+            return parse_payload(shopify_order_json_string), None
+    except (json.JSONDecodeError, TypeError):
+        return None, {"error": "Invalid JSON string provided for Shopify order data."}
+
+def create_order_flow(shopify_order_json_string):
+    """
+    The order create pipeline as a flow (see qb_flow.py); run by create_order_to_qb and by the
+    asyncio engine.
+
+    CustomerRef and ItemRefs are resolved locally (ID index, item catalog), and a customer
+    that is not yet known is added in the same batched envelope as the SalesOrderAdd, so an order of
+    any size costs a single QuickBooks round trip. If the customer turns out to exist already, the
+    order is only sent once _find_customer_flow has matched it to the Shopify customer.
+    """
+    metrics.operation("order", "create")
+    shopify_order_data, error = _parse_order_payload(shopify_order_json_string)
+    if error:
+        return error
+    shopify_id = shopify_order_data.get('id')
+    if not shopify_id:
+        return {"error": "Shopify order ID not found in payload."}
+
+    customer_ref_xml, customer_add_xml = yield LocalCall(_resolve_customer_ref, shopify_order_data)
+    item_refs = yield LocalCall(_item_refs, shopify_order_data)
+    with metrics.stage("xml_build"):
+        sales_order_add_xml, missing = create_sales_order_add_xml(shopify_order_data, customer_ref_xml, item_refs)
+    if missing:
+        return {"error": f"Line items without SKU cannot be mapped to QuickBooks items: {', '.join(missing)}"}
+
+    # stopOnError: the order is not added when its customer could not be.
+    batch = QBXMLBatch(on_error="stopOnError")
+    customer_request_id = batch.add("CustomerAddRq", customer_add_xml) if customer_add_xml else None
+    order_request_id = batch.add("SalesOrderAddRq", sales_order_add_xml)
+
+    try:
+        logger.info("Sending request to sync order %s to QuickBooks (%d request(s))...", shopify_id, len(batch))
+        results = yield batch
+
+        if customer_request_id:
+            customer_data = _order_customer_data(shopify_order_data)
+            customer_result = results[customer_request_id]
+            if customer_result.ok:
+                yield LocalCall(id_index.remember, "customer", customer_data['id'], customer_result.ret("CustomerRet"))
+            elif customer_result.status_code == NAME_IN_USE:
+                list_id = yield from _find_customer_flow(customer_data)
+                if list_id is None:
+                    return {"error": f"QuickBooks customer {_order_customer_name(customer_data)} already exists "
+                                     f"and is not Shopify customer {customer_data['id']}.",
+                            "statusCode": NAME_IN_USE}
+                customer_ref_xml = _ref("CustomerRef", list_id=list_id)
+                with metrics.stage("xml_build"):
+                    sales_order_add_xml, _ = create_sales_order_add_xml(shopify_order_data, customer_ref_xml, item_refs)
+                batch = QBXMLBatch(on_error="stopOnError")
+                order_request_id = batch.add("SalesOrderAddRq", sales_order_add_xml)
+                logger.info("Sending order %s for existing customer %s to QuickBooks...", shopify_id, list_id)
+                results = yield batch
+            else:
+                logger.error("QuickBooks Error adding the customer of order %s: %s", shopify_id, customer_result.status_message)
+                return customer_result.to_error()
+    except Exception as e:
+        _report_transport_error(e, f"sync order {shopify_id}")
+        return None
+
+    order_result = results[order_request_id]
+    if not order_result.ok:
+        logger.error("QuickBooks Error on order %s: %s", shopify_id, order_result.status_message)
+        return order_result.to_error()
+
+    sales_order_ret = order_result.ret("SalesOrderRet")
+    if sales_order_ret is None:
+        return {"error": "SalesOrderRet not found in response."}
+    yield LocalCall(id_index.remember, "sales_order", shopify_id, sales_order_ret)
+    yield LocalCall(id_index.set_applied_hash, "sales_order", shopify_id, _order_content_hash(shopify_order_data, customer_ref_xml))
+    logger.info("Successfully created sales order for Shopify order %s in QuickBooks.", shopify_id)
+    return _xml_to_dict(sales_order_ret)
 
 def create_order_to_qb(shopify_order_json_string):
     """
     Creates a Sales Order in QuickBooks from Shopify order data.
-    
+
     Args:
-        shopify_order_json_string: JSON string containing Shopify order data
-        
+        shopify_order_json_string: Shopify order data, as a dictionary or a JSON string
+
     Returns:
         Dictionary with success/error information, or None on failure
     """
-    # TODO: Implement order creation logic
-    # This should:
-    # 1. Parse the Shopify order JSON
-    # 2. Map Shopify fields to QuickBooks Sales Order fields (per SYNC_SPEC.md)
-    # 3. Build qbXML request for SalesOrderAdd
-    # 4. Send request to QuickBooks server
-    # 5. Parse and return response
-    
+    return run_flow(create_order_flow(shopify_order_json_string))
+
+def query_sales_order_flow(shopify_order_data):
+    """
+    Flow that finds the Sales Order for a Shopify order in QuickBooks by RefNumber (the Shopify order name).
+    Returns a dictionary with TxnID, EditSequence and RefNumber if found, otherwise None.
+    A found order is also recorded in the local ID index.
+    """
+    ref_number = shopify_order_data.get('name')
+    if not ref_number:
+        return None
+    batch = QBXMLBatch(on_error="stopOnError")
+    request_id = batch.add("SalesOrderQueryRq", _add_tag("RefNumber", ref_number))
+    try:
+        logger.info("Querying QuickBooks for sales order %s...", ref_number)
+        result = (yield batch)[request_id]
+    except Exception as e:
+        logger.error("An error occurred while querying for sales order %s: %s", ref_number, e)
+        return None
+
+    # RefNumbers are not unique in QuickBooks; prefer the order we tagged with this Shopify ID.
+    memo = f"Shopify order {shopify_order_data.get('id')}"
+    sales_order_rets = result.rets("SalesOrderRet")
+    matches = [ret for ret in sales_order_rets if ret.findtext("Memo") == memo] or sales_order_rets[:1]
+    if not matches:
+        logger.info("Sales order %s not found in QuickBooks.", ref_number)
+        return None
+    sales_order_ret = matches[0]
+    yield LocalCall(id_index.remember, "sales_order", shopify_order_data.get('id'), sales_order_ret)
     return {
-        "error": "Order sync functionality not yet implemented. Please implement create_order_to_qb in order_sync.py"
+        "TxnID": sales_order_ret.findtext("TxnID"),
+        "EditSequence": sales_order_ret.findtext("EditSequence"),
+        "RefNumber": ref_number,
     }
 
+def get_sales_order_by_ref_number(shopify_order_data):
+    """
+    Finds the Sales Order for a Shopify order in QuickBooks by RefNumber (the Shopify order name).
+    Returns a dictionary with TxnID, EditSequence and RefNumber if found, otherwise None.
+    """
+    return run_flow(query_sales_order_flow(shopify_order_data))
+
+def _order_content_hash(shopify_order_data, customer_ref_xml):
+    """
+    Digest of the SalesOrderMod body for this payload, leaving out TxnID/EditSequence. Items are
+    referenced by SKU here so the digest does not change when the item catalog refreshes.
+    """
+    xml, _ = create_sales_order_mod_xml(shopify_order_data, {"TxnID": "", "EditSequence": ""}, customer_ref_xml)
+    return id_index.payload_hash(xml)
+
+def _sales_order_mod_flow(shopify_order_data, qb_order_ids, customer_ref_xml):
+    """Flow that sends a SalesOrderModRq and returns the updated order dictionary, or an error dictionary."""
+    shopify_id = shopify_order_data.get('id')
+    item_refs = yield LocalCall(_item_refs, shopify_order_data)
+    with metrics.stage("xml_build"):
+        sales_order_mod_xml, missing = create_sales_order_mod_xml(shopify_order_data, qb_order_ids, customer_ref_xml, item_refs)
+    if missing:
+        return {"error": f"Line items without SKU cannot be mapped to QuickBooks items: {', '.join(missing)}"}
+
+    batch = QBXMLBatch(on_error="stopOnError")
+    request_id = batch.add("SalesOrderModRq", sales_order_mod_xml)
+    try:
+        logger.info("Sending request to update order %s in QuickBooks...", shopify_id)
+        result = (yield batch)[request_id]
+    except Exception as e:
+        _report_transport_error(e, f"update order {shopify_id}")
+        return None
+
+    if not result.ok:
+        logger.error("QuickBooks Error on update of order %s: %s", shopify_id, result.status_message)
+        return result.to_error()
+    sales_order_ret = result.ret("SalesOrderRet")
+    if sales_order_ret is None:
+        return {"error": "SalesOrderRet not found in update response."}
+    yield LocalCall(id_index.remember, "sales_order", shopify_id, sales_order_ret)
+    logger.info("Successfully updated sales order for Shopify order %s in QuickBooks.", shopify_id)
+    return _xml_to_dict(sales_order_ret)
+
+def update_order_flow(shopify_order_json_string):
+    """
+    The order update pipeline as a flow (see qb_flow.py); run by update_order_in_qb and by the
+    asyncio engine.
+
+    The TxnID/EditSequence come from the local ID index, falling back to a SalesOrderQueryRq by
+    RefNumber on a miss or when QuickBooks reports them stale.
+    """
+    metrics.operation("order", "update")
+    shopify_order_data, error = _parse_order_payload(shopify_order_json_string)
+    if error:
+        return error
+    shopify_id = shopify_order_data.get('id')
+    if not shopify_id:
+        return {"error": "Shopify order ID not found in payload."}
+
+    # Updates never create customers. A customer missing from the ID index is looked up by name;
+    # if it cannot be matched, CustomerRef is left out and the order keeps its customer.
+    customer_ref_xml, _ = yield LocalCall(_resolve_customer_ref, shopify_order_data, False)
+    if customer_ref_xml is None:
+        try:
+            list_id = yield from _find_customer_flow(_order_customer_data(shopify_order_data))
+        except Exception as e:
+            _report_transport_error(e, f"look up the customer of order {shopify_id}")
+            return None
+        customer_ref_xml = _ref("CustomerRef", list_id=list_id) if list_id else ""
+
+    content_hash = _order_content_hash(shopify_order_data, customer_ref_xml)
+    if content_hash == (yield LocalCall(id_index.get_applied_hash, "sales_order", shopify_id)):
+        logger.info("Order %s is unchanged since the last successful sync. Skipping update.", shopify_id)
+        return {"status": "unchanged", "message": f"Order {shopify_id} already up to date in QuickBooks."}
+
+    qb_order_ids = yield LocalCall(id_index.get, "sales_order", shopify_id)
+    from_index = qb_order_ids is not None
+    if not from_index:
+        qb_order_ids = yield from query_sales_order_flow(shopify_order_data)
+    if not qb_order_ids:
+        return {"error": f"Sales order for Shopify order {shopify_id} not found in QuickBooks. Cannot update."}
+
+    result = yield from _sales_order_mod_flow(shopify_order_data, qb_order_ids, customer_ref_xml)
+
+    if from_index and result and result.get("statusCode") in STALE_ID_STATUS_CODES:
+        logger.info("Indexed IDs for order %s are stale. Re-querying QuickBooks...", shopify_id)
+        yield LocalCall(id_index.forget, "sales_order", shopify_id)
+        qb_order_ids = yield from query_sales_order_flow(shopify_order_data)
+        if not qb_order_ids:
+            return {"error": f"Sales order for Shopify order {shopify_id} not found in QuickBooks. Cannot update."}
+        result = yield from _sales_order_mod_flow(shopify_order_data, qb_order_ids, customer_ref_xml)
+
+    if result and "error" not in result:
+        yield LocalCall(id_index.set_applied_hash, "sales_order", shopify_id, content_hash)
+    return result
+
 def update_order_in_qb(shopify_order_json_string):
     """
     Updates a Sales Order in QuickBooks from Shopify order data.
-    
+
     Args:
-        shopify_order_json_string: JSON string containing Shopify order data
-        
+        shopify_order_json_string: Shopify order data, as a dictionary or a JSON string
+
     Returns:
         Dictionary with success/error information, or None on failure
     """
-    # TODO: Implement order update logic
-    # This should:
-    # 1. Parse the Shopify order JSON
-    # 2. Find the existing Sales Order in QuickBooks (using ExternalGUID)
-    # 3. Map Shopify fields to QuickBooks Sales Order fields
-    # 4. Build qbXML request for SalesOrderMod
-    # 5. Send request to QuickBooks server
-    # 6. Parse and return response
-    
-
-
-    
-    return {
-        "error": "Order sync functionality not yet implemented. Please implement update_order_in_qb in order_sync.py"
-    }
+    return run_flow(update_order_flow(shopify_order_json_string))
 
+# Handlers for jobs accepted by the routes in queue ingest mode
+job_queue.register_handler("order.create", create_order_to_qb)
+job_queue.register_handler("order.update", update_order_in_qb)
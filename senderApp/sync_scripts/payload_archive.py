@@ -0,0 +1,341 @@
+import argparse
+import atexit
+import glob
+import gzip
+import io
+import json
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from sync_scripts import json_backend, log_config
+from sync_scripts.state_db import get_connection, register_schema, transaction
+
+try:
+    import zstandard
+except ImportError:  # Optional; segments are gzip-compressed without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Archive of every received webhook payload, kept for replay and support. Requests only put the raw
+# JSON on an in-memory queue; a background thread per process appends them as compact JSONL records
+# to compressed segment files and indexes each record by kind and Shopify ID in the state database.
+#
+# Each drained batch is written as one complete gzip member / zstd frame, so a segment that is still
+# being written is readable up to its last batch, and a lookup decompresses only the frame it needs.
+
+ARCHIVE_DIR = os.environ.get(
+    "SYNC_PAYLOAD_ARCHIVE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logs", "payloads"),
+)
+# Set to false to stop archiving payloads.
+ENABLED = os.environ.get("SYNC_PAYLOAD_ARCHIVE", "true").lower() in ("1", "true", "yes")
+# "zstd", "gzip" or "auto" (zstd when the zstandard package is installed, otherwise gzip).
+COMPRESSION = os.environ.get("SYNC_PAYLOAD_ARCHIVE_COMPRESSION", "auto").lower()
+# A segment is closed after this many uncompressed bytes or seconds, whichever comes first.
+SEGMENT_BYTES = int(os.environ.get("SYNC_PAYLOAD_ARCHIVE_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+SEGMENT_SECONDS = float(os.environ.get("SYNC_PAYLOAD_ARCHIVE_SEGMENT_SECONDS", "3600"))
+# Segments older than this many days are deleted (0 = keep forever).
+RETENTION_DAYS = float(os.environ.get("SYNC_PAYLOAD_ARCHIVE_RETENTION_DAYS", "30"))
+# The oldest segments are deleted while the archive is larger than this (0 = no size limit).
+MAX_BYTES = int(os.environ.get("SYNC_PAYLOAD_ARCHIVE_MAX_BYTES", "0"))
+# Payloads waiting to be written; beyond this, new payloads are dropped rather than slowing requests.
+QUEUE_SIZE = int(os.environ.get("SYNC_PAYLOAD_ARCHIVE_QUEUE_SIZE", "10000"))
+
+# Records per frame at most, and how long the writer waits for more before writing a frame.
+_FRAME_RECORDS = 500
+_FRAME_WAIT = 0.2
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS payload_archive_index (
+    kind TEXT NOT NULL,
+    entity_id TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    segment TEXT NOT NULL,
+    frame_offset INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS payload_archive_by_entity ON payload_archive_index (kind, entity_id, received_at);
+CREATE INDEX IF NOT EXISTS payload_archive_by_segment ON payload_archive_index (segment);
+""")
+
+
+def _codec():
+    if COMPRESSION == "zstd" or (COMPRESSION == "auto" and zstandard is not None):
+        if zstandard is None:
+            raise RuntimeError("SYNC_PAYLOAD_ARCHIVE_COMPRESSION=zstd needs the zstandard package.")
+        return "zst"
+    return "gz"
+
+
+def _compress(data, codec):
+    if codec == "zst":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _read_frame(path, offset):
+    """Returns the decompressed bytes of the gzip member / zstd frame starting at `offset`."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        if path.endswith(".zst"):
+            if zstandard is None:
+                raise RuntimeError(f"Reading {path} needs the zstandard package.")
+            return zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=False).read()
+        # wbits 16+: one gzip member; decompression stops at its end.
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = []
+        while not decompressor.eof:
+            data = f.read(64 * 1024)
+            if not data:
+                break
+            chunks.append(decompressor.decompress(data))
+        return b"".join(chunks)
+
+
+def _record_line(kind, entity_id, event, payload, received_at):
+    # The payload is already JSON text; it is embedded as is instead of being parsed and re-encoded.
+    if not isinstance(payload, str):
+        payload = json_backend.dumps(payload)
+    header = json.dumps({"ts": received_at, "kind": kind, "id": entity_id, "event": event},
+                        separators=(",", ":"), ensure_ascii=False)
+    return f'{header[:-1]},"payload":{payload}}}\n'
+
+
+class PayloadArchive:
+    """
+    Appends payloads to rotating compressed JSONL segments from a background thread.
+    One archive runs per process; segment names carry the process ID so workers never share a file.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or ARCHIVE_DIR
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+        self._codec = _codec()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._segment = None
+        self._segment_started = 0.0
+        self._segment_bytes = 0
+        self._sequence = 0
+
+    def submit(self, kind, payload, entity_id=None, event=None):
+        """Queues a payload for archiving without waiting for disk I/O. Never raises."""
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait((kind, None if entity_id is None else str(entity_id), event, payload, time.time()))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.info("Payload archive queue is full; %s payload(s) not archived.", self.dropped)
+
+    def flush(self, timeout=10):
+        """Waits until every queued payload is written. Returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _ensure_writer(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's queue, thread and open segment are not ours.
+            self._queue = queue.Queue(maxsize=QUEUE_SIZE)
+            self._segment = None
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="payload-archive", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush, 5)
+
+    def _run(self):
+        try:
+            prune(self.directory)
+        except (sqlite3.Error, OSError) as e:
+            logger.error("Error pruning payload archive: %s", e)
+        while True:
+            records = [self._queue.get()]
+            deadline = time.monotonic() + _FRAME_WAIT
+            while len(records) < _FRAME_RECORDS:
+                try:
+                    records.append(self._queue.get(timeout=max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                self._write_frame(records)
+            except Exception as e:
+                logger.error("Error writing %s payload(s) to the archive: %s", len(records), e)
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+
+    def _rotate_if_needed(self):
+        now = time.time()
+        if self._segment is not None and (self._segment_bytes < SEGMENT_BYTES and now - self._segment_started < SEGMENT_SECONDS):
+            return
+        if self._segment is not None:
+            try:
+                prune(self.directory)
+            except (sqlite3.Error, OSError) as e:
+                logger.error("Error pruning payload archive: %s", e)
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.fromtimestamp(now, timezone.utc).strftime("%Y%m%dT%H%M%S")
+        self._sequence += 1
+        self._segment = os.path.join(self.directory, f"payloads-{stamp}-{os.getpid()}-{self._sequence}.jsonl.{self._codec}")
+        self._segment_started = now
+        self._segment_bytes = 0
+
+    def _write_frame(self, records):
+        self._rotate_if_needed()
+        data = "".join(_record_line(kind, entity_id, event, payload, ts)
+                       for kind, entity_id, event, payload, ts in records).encode("utf-8")
+        with open(self._segment, "ab") as f:
+            offset = f.tell()
+            f.write(_compress(data, self._codec))
+        self._segment_bytes += len(data)
+
+        segment = os.path.basename(self._segment)
+        rows = [(kind, entity_id, ts, segment, offset) for kind, entity_id, _, _, ts in records if entity_id is not None]
+        if rows:
+            try:
+                conn = get_connection()
+                with transaction(conn):
+                    conn.executemany(
+                        "INSERT INTO payload_archive_index (kind, entity_id, received_at, segment, frame_offset) "
+                        "VALUES (?, ?, ?, ?, ?)", rows)
+            except (sqlite3.Error, OSError) as e:
+                # The payloads are archived either way; they are just not findable by ID.
+                logger.error("Error indexing archived payloads: %s", e)
+
+
+def _segments(directory=None):
+    """Returns the archive's segment paths, oldest first."""
+    paths = glob.glob(os.path.join(directory or ARCHIVE_DIR, "payloads-*.jsonl.*"))
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+def prune(directory=None, retention_days=None, max_bytes=None):
+    """
+    Applies the retention policy: deletes segments older than SYNC_PAYLOAD_ARCHIVE_RETENTION_DAYS,
+    then the oldest segments while the archive exceeds SYNC_PAYLOAD_ARCHIVE_MAX_BYTES, along with
+    their index entries. Returns the number of segments deleted.
+    """
+    retention_days = RETENTION_DAYS if retention_days is None else retention_days
+    max_bytes = MAX_BYTES if max_bytes is None else max_bytes
+    segments = [(path, os.path.getmtime(path), os.path.getsize(path)) for path in _segments(directory)]
+    cutoff = time.time() - retention_days * 86400 if retention_days > 0 else None
+    total = sum(size for _, _, size in segments)
+    expired = []
+    for path, mtime, size in segments:
+        if (cutoff is not None and mtime < cutoff) or (max_bytes > 0 and total > max_bytes):
+            expired.append(path)
+            total -= size
+    for path in expired:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    if expired:
+        conn = get_connection()
+        with transaction(conn):
+            conn.executemany("DELETE FROM payload_archive_index WHERE segment = ?",
+                             [(os.path.basename(path),) for path in expired])
+        logger.info("Payload archive: deleted %s expired segment(s).", len(expired))
+    return len(expired)
+
+
+def find_payloads(kind, entity_id, limit=20, directory=None):
+    """
+    Returns the archived records ({"ts", "kind", "id", "event", "payload"}) for one Shopify object,
+    newest first, reading only the frames that hold them.
+    """
+    directory = directory or ARCHIVE_DIR
+    rows = get_connection().execute(
+        "SELECT DISTINCT segment, frame_offset FROM payload_archive_index WHERE kind = ? AND entity_id = ? "
+        "ORDER BY received_at DESC LIMIT ?", (kind, str(entity_id), limit),
+    ).fetchall()
+    records = []
+    for row in rows:
+        path = os.path.join(directory, row["segment"])
+        if not os.path.exists(path):
+            continue
+        for line in _read_frame(path, row["frame_offset"]).splitlines():
+            record = json.loads(line)
+            if record.get("kind") == kind and record.get("id") == str(entity_id):
+                records.append(record)
+    records.sort(key=lambda record: record["ts"], reverse=True)
+    return records[:limit]
+
+
+def iter_segment(path):
+    """Yields every record of one segment file in order (a segment still being written is read up to its last batch)."""
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Reading {path} needs the zstandard package.")
+        f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True))
+    else:
+        f = gzip.open(path, "rb")
+    with f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_archive(directory=None, kinds=None):
+    """Yields the archived records of every segment, oldest segment first, optionally only some kinds."""
+    for path in _segments(directory):
+        for record in iter_segment(path):
+            if kinds is None or record.get("kind") in kinds:
+                yield record
+
+
+# Shared instance used by the API routes in this process.
+payload_archive = PayloadArchive()
+
+
+def archive_payload(kind, payload, entity_id=None, event=None):
+    """
+    Archives a received payload (JSON text or a dictionary) off the request thread.
+    `kind` is e.g. "order" or "customer", `entity_id` the Shopify ID it is indexed by.
+    """
+    if ENABLED:
+        payload_archive.submit(kind, payload, entity_id, event)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Look up or prune archived webhook payloads.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    show = subparsers.add_parser("show", help="print the archived payloads of one Shopify object as JSONL")
+    show.add_argument("kind", help="e.g. order or customer")
+    show.add_argument("entity_id", help="Shopify ID")
+    show.add_argument("--limit", type=int, default=20)
+    subparsers.add_parser("prune", help="apply the retention policy now")
+    args = parser.parse_args(argv)
+    log_config.configure()
+
+    if args.command == "prune":
+        prune()
+        return 0
+    records = find_payloads(args.kind, args.entity_id, args.limit)
+    for record in records:
+        print(json.dumps(record, ensure_ascii=False))
+    return 0 if records else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+import json
+import logging
+import os
+from dotenv import load_dotenv
+from sync_scripts.json_backend import parse_payload
+from sync_scripts.qb_flow import LocalCall, run_flow
+from sync_scripts.qbxml_batch import QBXMLBatch
+from sync_scripts.qbxml_templates import ALWAYS, IF_SCOPE, Field, Group, Ref, compile_template, xml_text
+from sync_scripts.customer_sync import STALE_ID_STATUS_CODES, _report_transport_error
+from sync_scripts.item_catalog import item_catalog
+from sync_scripts import id_index, job_queue, metrics
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Accounts for new inventory items (the config.json default_income_account / default_asset_account).
+INCOME_ACCOUNT = os.environ.get("QB_INCOME_ACCOUNT", "Sales")
+ASSET_ACCOUNT = os.environ.get("QB_ASSET_ACCOUNT", "Inventory Asset")
+COGS_ACCOUNT = os.environ.get("QB_COGS_ACCOUNT", "Cost of Goods Sold")
+
+# QuickBooks statusCode for "the name is already in use".
+NAME_IN_USE = "3100"
+
+# Shopify product variants -> QuickBooks inventory items. Each variant with a SKU is one
+# ItemInventory named after the SKU, which is how order lines and the item catalog find it.
+
+
+def _variant_description(variant, ctx):
+    """"Product title - variant title", leaving out Shopify's placeholder title for single-variant products."""
+    product_title = ctx["product"].get('title') or ""
+    variant_title = variant.get('title')
+    if variant_title and variant_title != "Default Title":
+        return f"{product_title} - {variant_title}" if product_title else variant_title
+    return product_title
+
+# ctx["product"] is the Shopify product; ctx["accounts"] holds the income/cogs/asset account FullNames.
+ITEM_INVENTORY_ADD = compile_template("ItemInventoryAdd", [
+    Field("Name", "sku"),
+    Group("BarCode", [Field("BarCodeValue", lambda barcode, ctx: barcode)], scope="barcode", when=IF_SCOPE),
+    Field("SalesDesc", _variant_description),
+    Field("SalesPrice", "price"),
+    Ref("IncomeAccountRef", lambda variant, ctx: ctx["accounts"]["income"]),
+    Field("PurchaseDesc", _variant_description),
+    Field("PurchaseCost", "cost"),
+    Ref("COGSAccountRef", lambda variant, ctx: ctx["accounts"]["cogs"]),
+    Ref("AssetAccountRef", lambda variant, ctx: ctx["accounts"]["asset"]),
+])
+
+# ctx["product"] is the Shopify product; ctx["ListID"]/ctx["EditSequence"] identify the item.
+# Accounts are left alone: changing them on an item with transactions needs an explicit decision in QuickBooks.
+ITEM_INVENTORY_MOD = compile_template("ItemInventoryMod", [
+    Field("ListID", lambda variant, ctx: ctx["ListID"], when=ALWAYS),
+    Field("EditSequence", lambda variant, ctx: ctx["EditSequence"], when=ALWAYS),
+    Field("Name", "sku"),
+    Group("BarCode", [Field("BarCodeValue", lambda barcode, ctx: barcode)], scope="barcode", when=IF_SCOPE),
+    Field("SalesDesc", _variant_description),
+    Field("SalesPrice", "price"),
+    Field("PurchaseDesc", _variant_description),
+    Field("PurchaseCost", "cost"),
+])
+
+
+def default_accounts():
+    """Returns the account FullNames used for new items, in the shape create_item_inventory_add_xml takes."""
+    return {"income": INCOME_ACCOUNT, "cogs": COGS_ACCOUNT, "asset": ASSET_ACCOUNT}
+
+
+def create_item_inventory_add_xml(variant, product, accounts):
+    """
+    Creates the ItemInventoryAddRq qbXML string for a Shopify variant.
+    `accounts` maps "income", "cogs" and "asset" to QuickBooks account FullNames.
+    """
+    return ITEM_INVENTORY_ADD.render(variant, {"product": product, "accounts": accounts})
+
+
+def create_item_inventory_mod_xml(variant, product, qb_item_ids):
+    """
+    Creates the ItemInventoryModRq qbXML string for a Shopify variant.
+    `qb_item_ids` holds the item's ListID and EditSequence.
+    """
+    return ITEM_INVENTORY_MOD.render(variant, {
+        "product": product,
+        "ListID": qb_item_ids["ListID"],
+        "EditSequence": qb_item_ids["EditSequence"],
+    })
+
+
+def product_variants(product):
+    """
+    Returns (variants, skipped): the product's variants keyed by SKU, and the IDs of variants that
+    cannot become items because they have no SKU. A SKU listed twice keeps its last variant.
+    """
+    variants = {}
+    skipped = []
+    for variant in product.get('variants') or []:
+        sku = (variant.get('sku') or "").strip()
+        if sku:
+            variants[sku] = dict(variant, sku=sku)
+        else:
+            skipped.append(variant.get('id'))
+    return variants, skipped
+
+
+def _product_content_hash(product, variants):
+    """
+    Digest of the ItemInventoryMod bodies for all variants, leaving out ListID/EditSequence,
+    so it only changes when the data sent to QuickBooks changes.
+    """
+    blank_ids = {"ListID": "", "EditSequence": ""}
+    return id_index.payload_hash("".join(
+        create_item_inventory_mod_xml(variants[sku], product, blank_ids) for sku in sorted(variants)
+    ))
+
+
+def _item_ids(item):
+    return {"ListID": item.list_id, "EditSequence": item.edit_sequence}
+
+
+def _catalog_item_ids(skus):
+    """Returns SKU -> {"ListID", "EditSequence"} for the SKUs the item catalog knows."""
+    with metrics.stage("reference_lookup"):
+        return {sku: _item_ids(item) for sku, item in item_catalog.resolve_many(skus).items()}
+
+
+def _update_catalog(item_rets):
+    for item_ret in item_rets:
+        item_catalog.update_from_ret(item_ret)
+
+
+def _item_query_flow(skus):
+    """Flow that looks items up by Name in one ItemInventoryQueryRq. Returns SKU -> {"ListID", "EditSequence"}."""
+    batch = QBXMLBatch(on_error="stopOnError")
+    names = "".join(f"<FullName>{xml_text(sku)}</FullName>" for sku in skus)
+    request_id = batch.add("ItemInventoryQueryRq", names + "<IncludeRetElement>ListID</IncludeRetElement>"
+                           "<IncludeRetElement>Name</IncludeRetElement><IncludeRetElement>EditSequence</IncludeRetElement>")
+    logger.info("Querying QuickBooks for %s item(s) by SKU...", len(skus))
+    result = (yield batch)[request_id]
+    found = {}
+    for item_ret in result.rets("ItemInventoryRet"):
+        found[item_ret.findtext("Name")] = {"ListID": item_ret.findtext("ListID"),
+                                           "EditSequence": item_ret.findtext("EditSequence")}
+    return found
+
+
+def _item_batch_flow(product, variants, qb_ids, accounts):
+    """
+    Flow that sends one envelope with an ItemInventoryModRq for every SKU in `qb_ids` and an
+    ItemInventoryAddRq for every other SKU in `variants`. Returns SKU -> (action, QBRequestResult).
+    """
+    batch = QBXMLBatch()
+    pending = {}
+    with metrics.stage("xml_build"):
+        for sku, variant in variants.items():
+            if sku in qb_ids:
+                request_id = batch.add("ItemInventoryModRq", create_item_inventory_mod_xml(variant, product, qb_ids[sku]))
+                pending[request_id] = (sku, "modified")
+            else:
+                request_id = batch.add("ItemInventoryAddRq", create_item_inventory_add_xml(variant, product, accounts))
+                pending[request_id] = (sku, "added")
+    adds = sum(1 for _, action in pending.values() if action == "added")
+    logger.info("Sending %d ItemInventoryAdd and %d ItemInventoryMod request(s) for product %s to QuickBooks...",
+                adds, len(pending) - adds, product.get('id'))
+    results = yield batch
+    return {sku: (action, results[request_id]) for request_id, (sku, action) in pending.items()}
+
+
+def sync_product_flow(shopify_product_json_string, accounts=None):
+    """
+    The product sync pipeline as a flow (see qb_flow.py); run by sync_product_to_qb and by the
+    asyncio engine.
+
+    Every variant with a SKU becomes (or updates) the QuickBooks inventory item named after the SKU.
+    The item catalog splits the variants into adds and mods, and all of them go to QuickBooks in one
+    envelope. Variants whose catalog entry was missing or stale (name in use, EditSequence out of
+    date, item not found) are looked up together and sent once more in a second envelope.
+    """
+    metrics.operation("product", "sync")
+    try:
+        with metrics.stage("parse"):
+            product = parse_payload(shopify_product_json_string)
+    except (json.JSONDecodeError, TypeError):
+        return {"error": "Invalid JSON string provided for Shopify product data."}
+
+    product_id = product.get('id')
+    if not product_id:
+        return {"error": "Shopify product ID not found in payload."}
+    variants, skipped = product_variants(product)
+    if not variants:
+        return {"error": f"Product {product_id} has no variants with a SKU; nothing to sync to QuickBooks."}
+
+    # Shopify sends products/update for every inventory or metafield change; skip when the items would not change
+    content_hash = _product_content_hash(product, variants)
+    if content_hash == (yield LocalCall(id_index.get_applied_hash, "product", product_id)):
+        logger.info("Product %s is unchanged since the last successful sync. Skipping update.", product_id)
+        return {"status": "unchanged", "message": f"Product {product_id} already up to date in QuickBooks."}
+
+    accounts = accounts or default_accounts()
+    qb_ids = yield LocalCall(_catalog_item_ids, variants)
+
+    try:
+        outcomes = yield from _item_batch_flow(product, variants, qb_ids, accounts)
+        retry = [sku for sku, (action, result) in outcomes.items()
+                 if result.status_code == NAME_IN_USE or (action == "modified" and result.status_code in STALE_ID_STATUS_CODES)]
+        if retry:
+            logger.info("%s item(s) of product %s were missing or stale in the item catalog. Re-querying QuickBooks...", len(retry), product_id)
+            qb_ids = yield from _item_query_flow(retry)
+            outcomes.update((yield from _item_batch_flow(product, {sku: variants[sku] for sku in retry}, qb_ids, accounts)))
+    except Exception as e:
+        _report_transport_error(e, "sync the product")
+        return None
+
+    items, errors, item_rets = [], [], []
+    for sku, (action, result) in outcomes.items():
+        if not result.ok:
+            logger.error("QuickBooks Error for SKU %s: %s", sku, result.status_message)
+            errors.append(dict(result.to_error(), sku=sku))
+            continue
+        item_ret = result.ret("ItemInventoryRet")
+        if item_ret is not None:
+            item_rets.append(item_ret)
+        items.append({"sku": sku, "action": action,
+                      "ListID": item_ret.findtext("ListID") if item_ret is not None else None})
+
+    if item_rets:
+        yield LocalCall(_update_catalog, item_rets)
+
+    response = {"product_id": product_id, "items": items}
+    if skipped:
+        response["skipped_variants"] = skipped
+    if errors:
+        response["error"] = f"{len(errors)} of {len(outcomes)} item(s) failed to sync."
+        response["errors"] = errors
+        return response
+    yield LocalCall(id_index.set_applied_hash, "product", product_id, content_hash)
+    logger.info("Successfully synced product %s to QuickBooks (%s item(s)).", product_id, len(items))
+    return response
+
+
+def sync_product_to_qb(shopify_product_json_string):
+    """
+    Main function to sync a Shopify product and its variants to QuickBooks inventory items.
+    Receives Shopify product data as a dictionary or a JSON string.
+    """
+    return run_flow(sync_product_flow(shopify_product_json_string))
+
+
+# Handler for jobs accepted by the routes in queue ingest mode
+job_queue.register_handler("product.sync", sync_product_to_qb)
@@ -0,0 +1,112 @@
+import gzip
+import os
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from sync_scripts import bridge_governor, json_backend, metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+base_url = os.environ.get("QB_SERVER_URL", "").rstrip('/')
+SERVER_URL = base_url + "/qbxml"
+
+# Connections kept alive to the bridge per worker process.
+POOL_SIZE = int(os.environ.get("QB_POOL_SIZE", "4"))
+CONNECT_TIMEOUT = float(os.environ.get("QB_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("QB_READ_TIMEOUT", "60"))
+# Gzip request bodies larger than QB_GZIP_MIN_BYTES. The bridge must accept Content-Encoding: gzip.
+GZIP_REQUESTS = os.environ.get("QB_GZIP_REQUESTS", "").lower() in ("1", "true", "yes")
+GZIP_MIN_BYTES = int(os.environ.get("QB_GZIP_MIN_BYTES", "1024"))
+
+
+class QBResponseError(requests.RequestException):
+    """Raised when the bridge answers but the body does not carry a qbXML 'response'."""
+
+
+class QBClient:
+    """
+    HTTP transport for the QuickBooks qbXML bridge.
+
+    Keeps a pooled keep-alive requests.Session so consecutive qbXML calls reuse the same
+    TCP/TLS connection instead of paying a new handshake each time. Responses are requested
+    with gzip transfer encoding; request bodies are gzipped when GZIP_REQUESTS is enabled.
+    """
+
+    def __init__(self, server_url=None, pool_size=None, connect_timeout=None, read_timeout=None,
+                 gzip_requests=None):
+        self.server_url = server_url or SERVER_URL
+        self.timeout = (
+            connect_timeout if connect_timeout is not None else CONNECT_TIMEOUT,
+            read_timeout if read_timeout is not None else READ_TIMEOUT,
+        )
+        self.gzip_requests = GZIP_REQUESTS if gzip_requests is None else gzip_requests
+
+        pool_size = pool_size or POOL_SIZE
+        self.session = requests.Session()
+        # No automatic retries: qbXML Add/Mod requests are not idempotent.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+
+    def send(self, xml_request):
+        """
+        Posts a qbXML request to the bridge and returns the raw qbXML response string.
+        Raises requests.RequestException (including QBResponseError) on transport or protocol errors,
+        and BridgeUnavailable when the bridge governor refuses the call (see bridge_governor.py).
+        """
+        body = json_backend.dumps_bytes({"xml": xml_request})
+        headers = {"Content-Type": "application/json"}
+        if self.gzip_requests and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body, compresslevel=5)
+            headers["Content-Encoding"] = "gzip"
+
+        lease = bridge_governor.acquire()
+        start = time.perf_counter()
+        ok = False
+        try:
+            with metrics.stage("bridge_round_trip"):
+                response = self.session.post(self.server_url, data=body, headers=headers, timeout=self.timeout)
+                response.raise_for_status()
+                try:
+                    response_json = json_backend.loads(response.content)
+                except json_backend.JSONDecodeError as e:
+                    raise QBResponseError(f"Invalid JSON in server response: {e}", response=response)
+
+            if "response" not in response_json:
+                raise QBResponseError(f"'response' key not found in server response: {response_json}", response=response)
+            ok = True
+            return response_json["response"]
+        finally:
+            bridge_governor.release(lease, time.perf_counter() - start, ok)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_qb_client():
+    """
+    Returns the QBClient shared by this worker process.
+    The client is created lazily, and re-created after a fork, so gunicorn workers never share sockets.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = QBClient()
+                _client_pid = pid
+    return _client
+
+
+def send_qbxml(xml_request):
+    """Shortcut for get_qb_client().send(xml_request)."""
+    return get_qb_client().send(xml_request)
@@ -0,0 +1,53 @@
+import time
+from sync_scripts import metrics
+from sync_scripts.qbxml_batch import QBXMLBatch
+
+# A sync "flow" is a generator holding the logic of one sync operation without doing any network I/O
+# itself. It yields a QBXMLBatch whenever it needs QuickBooks and receives the batch results
+# (requestID -> QBRequestResult) back at the yield; transport errors are raised at the yield instead.
+# It may also yield a LocalCall for blocking local work. The flow's return value is the sync result.
+# Everything that can block - state database reads and writes (ID index, applied hashes), the reference
+# cache and the item catalog - must go through a LocalCall, never be called from the flow directly:
+# under the asyncio driver the flow itself runs on the event loop.
+#
+# run_flow drives a flow with the blocking QBClient (Flask routes, job queue, CLIs);
+# async_engine.run_flow_async drives the same flow on asyncio, so both front ends share one pipeline.
+
+
+class LocalCall:
+    """
+    A blocking local step of a flow, such as a reference cache lookup that may have to query
+    QuickBooks. The blocking driver calls it directly; the asyncio driver runs it in a worker thread.
+    """
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn, *args):
+        self.fn = fn
+        self.args = args
+
+    def __call__(self):
+        return self.fn(*self.args)
+
+
+def run_flow(flow, sender=None):
+    """Runs a flow to completion with blocking I/O and returns its result."""
+    outer_labels = metrics.current_operation()
+    start = time.perf_counter()
+    result_outcome = "exception"
+    try:
+        value, error = None, None
+        while True:
+            try:
+                step = flow.throw(error) if error is not None else flow.send(value)
+            except StopIteration as stop:
+                result_outcome = metrics.outcome(stop.value)
+                return stop.value
+            value, error = None, None
+            try:
+                value = step.send(sender) if isinstance(step, QBXMLBatch) else step()
+            except Exception as e:
+                error = e
+    finally:
+        # The flow labelled its stages with metrics.operation(); record it and drop the labels.
+        metrics.record_operation(metrics.current_operation(), time.perf_counter() - start, result_outcome)
+        metrics.restore_operation(outer_labels)
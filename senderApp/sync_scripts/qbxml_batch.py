@@ -0,0 +1,161 @@
+import xml.etree.ElementTree as ET
+from sync_scripts import bridge_governor, metrics
+from sync_scripts.qb_client import send_qbxml
+from sync_scripts.qbxml_stream import QBXMLStream
+
+QBXML_VERSION = "16.0"
+
+
+def wrap_qbxml(msgs_xml, on_error="stopOnError"):
+    """
+    Wraps one or more *Rq elements in the qbXML envelope.
+    """
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>'
+        f'<?qbxml version="{QBXML_VERSION}"?>'
+        f'<QBXML><QBXMLMsgsRq onError="{on_error}">{msgs_xml}</QBXMLMsgsRq></QBXML>'
+    )
+
+
+def _record_status(status):
+    metrics.record_qb_response(status.rs_tag, status.status_code)
+
+
+class QBRequestResult:
+    """
+    The outcome of one request inside a batch: the *Rs status attributes and the *Rs element itself.
+    """
+    __slots__ = ("request_id", "rs_tag", "status_code", "status_severity", "status_message", "element")
+
+    def __init__(self, request_id, rs_tag, status_code, status_severity, status_message, element=None):
+        self.request_id = request_id
+        self.rs_tag = rs_tag
+        self.status_code = status_code
+        self.status_severity = status_severity
+        self.status_message = status_message
+        self.element = element
+
+    @property
+    def ok(self):
+        # statusCode 1 ("no matching object") is an Info-level result for queries, not a failure.
+        return self.status_severity != "Error"
+
+    def rets(self, tag=None):
+        """Returns the *Ret child elements of this response, optionally limited to one tag."""
+        if self.element is None:
+            return []
+        if tag is not None:
+            return self.element.findall(tag)
+        return [child for child in self.element if child.tag.endswith("Ret")]
+
+    def ret(self, tag=None):
+        """Returns the first *Ret child element, or None."""
+        rets = self.rets(tag)
+        return rets[0] if rets else None
+
+    def to_error(self):
+        """Returns the error dictionary shape used by the sync functions."""
+        return {"error": self.status_message, "statusCode": self.status_code}
+
+    def __repr__(self):
+        return f"<QBRequestResult {self.request_id} {self.rs_tag} statusCode={self.status_code}>"
+
+
+def parse_batch_response(raw_xml):
+    """
+    Splits a QBXMLMsgsRs response into a dictionary of requestID -> QBRequestResult.
+    Responses without a requestID are keyed by their position ("0", "1", ...).
+    """
+    root = ET.fromstring(raw_xml)
+    msgs = root.find("QBXMLMsgsRs")
+    if msgs is None:
+        msgs = root
+    results = {}
+    for position, rs in enumerate(child for child in msgs if child.tag.endswith("Rs")):
+        request_id = rs.get("requestID", str(position))
+        results[request_id] = QBRequestResult(
+            request_id,
+            rs.tag,
+            rs.get("statusCode"),
+            rs.get("statusSeverity"),
+            rs.get("statusMessage"),
+            rs,
+        )
+    return results
+
+
+class QBXMLBatch:
+    """
+    Packs several independent qbXML requests into one envelope and one HTTP round trip.
+
+    Usage:
+        batch = QBXMLBatch()
+        currency_id = batch.add("CurrencyQueryRq")
+        customer_id = batch.add("CustomerAddRq", customer_add_xml)
+        results = batch.send()
+        results[customer_id].ok
+
+    With onError="continueOnError" (the default) a failing request does not stop the ones after it.
+    """
+
+    def __init__(self, on_error="continueOnError"):
+        self.on_error = on_error
+        self._requests = []
+
+    def add(self, rq_tag, body="", request_id=None, attrs=None):
+        """
+        Adds a request element (e.g. "CustomerAddRq" with its inner XML) and returns its requestID.
+        """
+        if request_id is None:
+            request_id = str(len(self._requests) + 1)
+        request_id = str(request_id)
+        attr_xml = "".join(f' {name}="{value}"' for name, value in (attrs or {}).items())
+        self._requests.append((request_id, rq_tag, f'<{rq_tag} requestID="{request_id}"{attr_xml}>{body}</{rq_tag}>'))
+        return request_id
+
+    def __len__(self):
+        return len(self._requests)
+
+    def build(self):
+        """Returns the complete qbXML envelope for all queued requests."""
+        return wrap_qbxml("".join(xml for _, _, xml in self._requests), self.on_error)
+
+    def send(self, sender=None):
+        """
+        Sends the batch in one POST and returns a dictionary of requestID -> QBRequestResult.
+        Requests that QuickBooks did not answer (e.g. skipped after a stopOnError failure)
+        are reported with an Error result. Transport errors propagate to the caller.
+        """
+        if not self._requests:
+            return {}
+        return self.parse((sender or send_qbxml)(self.build()))
+
+    def parse(self, raw_xml):
+        """
+        Parses the response to this batch into a dictionary of requestID -> QBRequestResult,
+        for callers that send the envelope from build() themselves (e.g. the asyncio engine).
+        """
+        with metrics.stage("response_parse"):
+            results = parse_batch_response(raw_xml)
+        for request_id, rq_tag, _ in self._requests:
+            if request_id not in results:
+                results[request_id] = QBRequestResult(
+                    request_id, rq_tag[:-2] + "Rs", None, "Error", "No response returned for this request."
+                )
+        for result in results.values():
+            metrics.record_qb_response(result.rs_tag, result.status_code)
+        return results
+
+    def stream(self, sender=None, fields=None):
+        """
+        Sends the batch in one POST and returns a QBXMLStream over the response, for queries whose
+        results are large lists. Records are parsed one at a time as the stream is iterated, without
+        building the element tree of the whole response (the response text is still received whole);
+        the per-request statuses (including unanswered requests) are complete once it is exhausted.
+        The round trip is judged against the bridge governor's bulk latency target, and each status
+        is counted in the metrics as it is read, like the results of send().
+        """
+        with bridge_governor.latency_budget(bridge_governor.BULK_LATENCY_TARGET):
+            raw_xml = (sender or send_qbxml)(self.build())
+        expected = {request_id: rq_tag[:-2] + "Rs" for request_id, rq_tag, _ in self._requests}
+        return QBXMLStream(raw_xml, fields, expected, on_status=_record_status)
@@ -0,0 +1,65 @@
+import os
+from dotenv import load_dotenv
+from sync_scripts.qbxml_batch import QBXMLBatch
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Records requested per page of an iterator query.
+PAGE_SIZE = int(os.environ.get("QB_PAGE_SIZE", "500"))
+
+
+class QBPagingError(Exception):
+    """Raised when QuickBooks rejects a page of an iterator query."""
+
+    def __init__(self, status):
+        super().__init__(f"{status.rs_tag} failed with statusCode {status.status_code}: {status.status_message}")
+        self.status = status
+
+
+def build_list_filters(active_status=None, from_modified_date=None, include_elements=None, extra_xml=""):
+    """
+    Builds list query filter elements in the order qbXML requires
+    (ActiveStatus, FromModifiedDate, ..., IncludeRetElement).
+    """
+    parts = []
+    if active_status:
+        parts.append(f"<ActiveStatus>{active_status}</ActiveStatus>")
+    if from_modified_date:
+        parts.append(f"<FromModifiedDate>{from_modified_date}</FromModifiedDate>")
+    parts.append(extra_xml)
+    for element in include_elements or ():
+        parts.append(f"<IncludeRetElement>{element}</IncludeRetElement>")
+    return "".join(parts)
+
+
+def iter_query_pages(rq_tag, filters_xml="", page_size=None, iterator_id=None, sender=None, fields=None):
+    """
+    Runs a qbXML list query with iterator="Start"/"Continue" and yields one page at a time.
+
+    Each page is yielded as (records, iterator_id, remaining_count), where records is a list of
+    (ret_tag, record dictionary) tuples parsed with QBXMLStream, so at most one page is held in
+    memory. Pass `iterator_id` to continue an iterator from an earlier run. Raises QBPagingError if
+    QuickBooks rejects a page; statusCode 1 (no matching records) ends the iteration normally.
+    """
+    page_size = page_size or PAGE_SIZE
+    while True:
+        batch = QBXMLBatch(on_error="stopOnError")
+        if iterator_id is None:
+            # Filters only apply when the iterator is created; later pages just continue it.
+            request_id = batch.add(rq_tag, f"<MaxReturned>{page_size}</MaxReturned>{filters_xml}",
+                                   attrs={"iterator": "Start"})
+        else:
+            request_id = batch.add(rq_tag, f"<MaxReturned>{page_size}</MaxReturned>",
+                                   attrs={"iterator": "Continue", "iteratorID": iterator_id})
+        stream = batch.stream(sender, fields)
+        records = [(ret_tag, record) for _, ret_tag, record in stream]
+        status = stream.statuses[request_id]
+        if not status.ok:
+            raise QBPagingError(status)
+
+        iterator_id = status.iterator_id
+        remaining = status.iterator_remaining_count
+        yield records, iterator_id, remaining
+        if remaining <= 0 or not iterator_id:
+            break
@@ -0,0 +1,150 @@
+import io
+import xml.etree.ElementTree as ET
+
+
+class QBResponseStatus:
+    """
+    The status attributes of one *Rs element in a streamed response, including the iterator
+    attributes of paged queries. Has the same ok/to_error interface as QBRequestResult.
+    """
+    __slots__ = ("request_id", "rs_tag", "status_code", "status_severity", "status_message",
+                 "iterator_id", "iterator_remaining_count")
+
+    def __init__(self, request_id, rs_tag, status_code, status_severity, status_message,
+                 iterator_id=None, iterator_remaining_count=0):
+        self.request_id = request_id
+        self.rs_tag = rs_tag
+        self.status_code = status_code
+        self.status_severity = status_severity
+        self.status_message = status_message
+        self.iterator_id = iterator_id
+        self.iterator_remaining_count = iterator_remaining_count
+
+    @classmethod
+    def from_attrib(cls, request_id, rs_tag, attrib):
+        remaining = attrib.get("iteratorRemainingCount")
+        return cls(
+            request_id,
+            rs_tag,
+            attrib.get("statusCode"),
+            attrib.get("statusSeverity"),
+            attrib.get("statusMessage"),
+            attrib.get("iteratorID"),
+            int(remaining) if remaining else 0,
+        )
+
+    @property
+    def ok(self):
+        # statusCode 1 ("no matching object") is an Info-level result for queries, not a failure.
+        return self.status_severity != "Error"
+
+    def to_error(self):
+        """Returns the error dictionary shape used by the sync functions."""
+        return {"error": self.status_message, "statusCode": self.status_code}
+
+    def __repr__(self):
+        return f"<QBResponseStatus {self.request_id} {self.rs_tag} statusCode={self.status_code}>"
+
+
+def element_to_record(element, fields=None):
+    """
+    Converts a *Ret element into a plain dictionary: leaf elements become their text, aggregates
+    become nested dictionaries and repeated elements become lists. With `fields`, only those
+    top-level elements are kept.
+    """
+    record = {}
+    for child in element:
+        tag = child.tag
+        if fields is not None and tag not in fields:
+            continue
+        value = element_to_record(child) if len(child) else child.text
+        if tag in record:
+            if not isinstance(record[tag], list):
+                record[tag] = [record[tag]]
+            record[tag].append(value)
+        else:
+            record[tag] = value
+    return record
+
+
+class QBXMLStream:
+    """
+    Incrementally parses a qbXML response and yields one (request_id, ret_tag, record) tuple per
+    *Ret element, where record is a dictionary (see element_to_record). Each element is discarded
+    as soon as it has been converted, so no element tree (or list of records) is built for the whole
+    response. The source itself is not streamed from the network: QBClient returns the bridge's
+    response as one string, so the raw XML is still held in memory while it is parsed.
+
+    The status of every *Rs is available in `statuses` (requestID -> QBResponseStatus) from the
+    moment its start tag has been read; a request that has no records still gets a status. Requests
+    listed in `expected` (requestID -> Rs tag) that QuickBooks did not answer get an Error status
+    once the stream is exhausted.
+
+    `source` may be the raw XML (str or bytes) or a binary file object. `on_status`, if given, is
+    called with each status as it becomes known, e.g. to count QuickBooks status codes.
+    """
+
+    def __init__(self, source, fields=None, expected=None, on_status=None):
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        self._source = source
+        self._fields = set(fields) if fields else None
+        self._expected = expected or {}
+        self._on_status = on_status
+        self.statuses = {}
+
+    def __iter__(self):
+        fields = self._fields
+        rs = None
+        rs_depth = None
+        status = None
+        depth = 0
+        for event, element in ET.iterparse(self._source, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                tag = element.tag
+                if rs is None and tag.endswith("Rs") and tag != "QBXMLMsgsRs":
+                    rs = element
+                    rs_depth = depth
+                    request_id = element.get("requestID", str(len(self.statuses)))
+                    status = self.statuses[request_id] = QBResponseStatus.from_attrib(request_id, tag, element.attrib)
+                    if self._on_status is not None:
+                        self._on_status(status)
+                continue
+
+            depth -= 1
+            if rs is None:
+                continue
+            if element is rs:
+                element.clear()
+                rs = None
+            elif depth == rs_depth:
+                # A direct child of the *Rs has ended: convert it, then drop it from the tree.
+                record = element_to_record(element, fields) if element.tag.endswith("Ret") else None
+                element.clear()
+                rs.remove(element)
+                if record is not None:
+                    yield status.request_id, element.tag, record
+
+        for request_id, rs_tag in self._expected.items():
+            if request_id not in self.statuses:
+                status = self.statuses[request_id] = QBResponseStatus(
+                    request_id, rs_tag, None, "Error", "No response returned for this request."
+                )
+                if self._on_status is not None:
+                    self._on_status(status)
+
+    def records(self, ret_tag=None):
+        """Yields only the records, optionally limited to one *Ret tag."""
+        for _, tag, record in self:
+            if ret_tag is None or tag == ret_tag:
+                yield record
+
+    def group_by_request(self):
+        """Consumes the stream and returns a dictionary of requestID -> list of (ret_tag, record)."""
+        grouped = {}
+        for request_id, tag, record in self:
+            grouped.setdefault(request_id, []).append((tag, record))
+        return grouped
@@ -0,0 +1,251 @@
+from xml.sax.saxutils import escape
+
+# Declarative qbXML request bodies. A template is a tree of the nodes below describing which source
+# field goes to which qbXML element and when it is emitted. compile_template turns it into a
+# serializer once, at import time, by generating a single straight-line Python function: constant
+# markup is pre-rendered and merged, paths become direct dict lookups, and there is no per-field
+# dispatch, so rendering a record only looks up values, escapes them and joins the pieces.
+#
+# Values are given as:
+#   "a.b"          a dotted path into the current source dict (None if any step is missing),
+#   ("a", "b.c")   the first truthy of several paths (like `a or b`),
+#   callable       fn(source, ctx) for values computed from the record or the render context.
+# Inside a scoped Group or a Repeat, the source is the scope value or list item.
+
+# Emit rules for Field values.
+ALWAYS = "always"      # always emitted, even when empty
+PRESENT = "present"    # emitted unless the value is None or ""
+TRUTHY = "truthy"      # emitted only if the value is truthy
+
+# Emit rules for Group scopes.
+IF_SCOPE = "if_scope"  # emitted only if the group's scope value is truthy
+
+
+class Field:
+    """<tag>value</tag>, escaped, with an optional transform applied to the value first."""
+    __slots__ = ("tag", "value", "transform", "when")
+
+    def __init__(self, tag, value, transform=None, when=PRESENT):
+        self.tag = tag
+        self.value = value
+        self.transform = transform
+        self.when = when
+
+
+class Group:
+    """
+    <tag>children</tag>. With `scope`, children read from that value instead of the current source
+    (a missing scope reads as an empty dict); with when=IF_SCOPE the group is left out if it is empty.
+    """
+    __slots__ = ("tag", "children", "scope", "when")
+
+    def __init__(self, tag, children, scope=None, when=ALWAYS):
+        self.tag = tag
+        self.children = children
+        self.scope = scope
+        self.when = when
+
+
+class Ref:
+    """A *Ref element: <ListID> if `list_id` has a value, otherwise <FullName>."""
+    __slots__ = ("tag", "list_id", "full_name")
+
+    def __init__(self, tag, full_name, list_id=None):
+        self.tag = tag
+        self.full_name = full_name
+        self.list_id = list_id
+
+
+class Repeat:
+    """Renders `children` once per item of the list at `value`, skipping items for which `where` is false."""
+    __slots__ = ("value", "children", "where")
+
+    def __init__(self, value, children, where=None):
+        self.value = value
+        self.children = children
+        self.where = where
+
+
+class Fragment:
+    """Inserts already rendered XML (e.g. a CustomerRef resolved elsewhere) as-is."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+def xml_text(value):
+    """Escapes a value for element text; most values need no escaping and are returned unchanged."""
+    text = value if value.__class__ is str else str(value)
+    if "&" in text or "<" in text or ">" in text:
+        return escape(text)
+    return text
+
+
+class _CodeGen:
+    """Writes the Python source of one template serializer."""
+
+    def __init__(self):
+        self.lines = []
+        self.namespace = {"escape": escape, "str": str}
+        self._names = 0
+        self._literal = []
+        self._literal_depth = 0
+
+    def bind(self, obj):
+        """Makes `obj` (a callable from the template) available to the generated code by name."""
+        self._names += 1
+        name = f"_f{self._names}"
+        self.namespace[name] = obj
+        return name
+
+    def scope_var(self):
+        self._names += 1
+        return f"_s{self._names}"
+
+    def literal(self, text, depth):
+        if self._literal and depth != self._literal_depth:
+            self.flush()
+        self._literal.append(text)
+        self._literal_depth = depth
+
+    def flush(self):
+        # Adjacent constant markup becomes a single append.
+        if self._literal:
+            self.lines.append("    " * self._literal_depth + f"a({''.join(self._literal)!r})")
+            self._literal = []
+
+    def line(self, code, depth):
+        self.flush()
+        self.lines.append("    " * depth + code)
+
+    def value(self, spec, src, depth):
+        """Emits code assigning the value of `spec` for source `src` to `v`."""
+        if callable(spec):
+            self.line(f"v = {self.bind(spec)}({src}, ctx)", depth)
+        elif isinstance(spec, tuple):
+            # Same result as `a or b or c`.
+            self.value(spec[0], src, depth)
+            for position, path in enumerate(spec[1:]):
+                self.line("if not v:", depth + position)
+                self.value(path, src, depth + position + 1)
+        else:
+            keys = spec.split(".")
+            self.line(f"v = {src}.get({keys[0]!r})", depth)
+            for key in keys[1:]:
+                self.line(f"v = v.get({key!r}) if v else None", depth)
+
+    def text(self, open_tag, close_tag, depth):
+        """Emits code escaping `v` and appending it between the given tags."""
+        self.line("if v.__class__ is not str: v = str(v)", depth)
+        self.line('if "&" in v or "<" in v or ">" in v: v = escape(v)', depth)
+        self.line(f"a({open_tag!r} + v + {close_tag!r})", depth)
+
+    def nodes(self, nodes, src, depth):
+        for node in nodes:
+            if isinstance(node, str):
+                self.literal(node, depth)
+            elif isinstance(node, Field):
+                self.field(node, src, depth)
+            elif isinstance(node, Ref):
+                self.ref(node, src, depth)
+            elif isinstance(node, Group):
+                self.group(node, src, depth)
+            elif isinstance(node, Repeat):
+                self.repeat(node, src, depth)
+            elif isinstance(node, Fragment):
+                self.value(node.value, src, depth)
+                self.line("if v:", depth)
+                self.line("a(v)", depth + 1)
+            else:
+                raise TypeError(f"Unsupported template node: {node!r}")
+        self.flush()
+
+    def field(self, node, src, depth):
+        self.value(node.value, src, depth)
+        if node.transform is not None:
+            self.line(f"if v is not None: v = {self.bind(node.transform)}(v)", depth)
+        if node.when == PRESENT:
+            self.line('if v is not None and v != "":', depth)
+            depth += 1
+        elif node.when == TRUTHY:
+            self.line("if v:", depth)
+            depth += 1
+        else:
+            self.line('if v is None: v = ""', depth)
+        self.text(f"<{node.tag}>", f"</{node.tag}>", depth)
+
+    def ref(self, node, src, depth):
+        if node.list_id is not None:
+            self.value(node.list_id, src, depth)
+            self.line("if v:", depth)
+            self.text(f"<{node.tag}><ListID>", f"</ListID></{node.tag}>", depth + 1)
+            self.line("else:", depth)
+            depth += 1
+        self.value(node.full_name, src, depth)
+        self.text(f"<{node.tag}><FullName>", f"</FullName></{node.tag}>", depth)
+
+    def group(self, node, src, depth):
+        if node.scope is None:
+            self.literal(f"<{node.tag}>", depth)
+            self.nodes(node.children, src, depth)
+            self.literal(f"</{node.tag}>", depth)
+            return
+        scope = self.scope_var()
+        self.value(node.scope, src, depth)
+        self.line(f"{scope} = v", depth)
+        if node.when == IF_SCOPE:
+            self.line(f"if {scope}:", depth)
+            depth += 1
+        else:
+            self.line(f"if not {scope}: {scope} = {{}}", depth)
+        self.literal(f"<{node.tag}>", depth)
+        self.nodes(node.children, scope, depth)
+        self.literal(f"</{node.tag}>", depth)
+        self.flush()
+
+    def repeat(self, node, src, depth):
+        item = self.scope_var()
+        self.value(node.value, src, depth)
+        self.line(f"for {item} in v or ():", depth)
+        depth += 1
+        if node.where is not None:
+            self.line(f"if not {self.bind(node.where)}({item}, ctx): continue", depth)
+        self.nodes(node.children, item, depth)
+
+
+class CompiledTemplate:
+    """
+    A template compiled into a serializer. render(source, ctx) returns the request body XML;
+    `code` holds the generated Python source for inspection.
+    """
+    __slots__ = ("tag", "code", "render")
+
+    def __init__(self, tag, children):
+        gen = _CodeGen()
+        gen.line("def render(source, ctx=None):", 0)
+        gen.line("out = []", 1)
+        gen.line("a = out.append", 1)
+        gen.nodes([Group(tag, children)], "source", 1)
+        gen.line('return "".join(out)', 1)
+        self.tag = tag
+        self.code = "\n".join(gen.lines)
+        exec(compile(self.code, f"<qbxml template {tag}>", "exec"), gen.namespace)
+        self.render = gen.namespace["render"]
+
+
+def compile_template(tag, children):
+    """Compiles the body of a qbXML element (e.g. "CustomerAdd") into a CompiledTemplate."""
+    return CompiledTemplate(tag, children)
+
+
+def address_group(tag, scope, when=ALWAYS, field_when=TRUTHY):
+    """The Shopify address -> qbXML BillAddress/ShipAddress mapping shared by customers and orders."""
+    return Group(tag, [
+        Field("Addr1", "address1", when=field_when),
+        Field("Addr2", "address2", when=field_when),
+        Field("City", "city", when=field_when),
+        Field("State", "province_code", when=field_when),
+        Field("PostalCode", "zip", when=field_when),
+        Field("Country", "country", when=field_when),
+    ], scope=scope, when=when)
@@ -0,0 +1,263 @@
+import logging
+import os
+import threading
+import time
+from dotenv import load_dotenv
+from sync_scripts import metrics
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Lookup counters that are also exported on /metrics, with their "result" label.
+_LOOKUP_RESULTS = {"hits": "hit", "stale_hits": "stale_hit", "misses": "miss"}
+
+# Default freshness window for a reference table, in seconds.
+DEFAULT_TTL = float(os.environ.get("QB_REF_CACHE_TTL", "900"))
+# How long past its TTL a table may still be served while it is refreshed in the background.
+DEFAULT_STALE_TTL = float(os.environ.get("QB_REF_CACHE_STALE_TTL", "3600"))
+# Incremental tables are reloaded in full this often (deltas cannot see records deleted in QuickBooks).
+FULL_RELOAD_INTERVAL = float(os.environ.get("QB_REF_CACHE_FULL_RELOAD", "86400"))
+
+
+class _CacheEntry:
+    __slots__ = ("value", "loaded_at", "refreshing", "watermark", "full_loaded_at")
+
+    def __init__(self, value, loaded_at, watermark=None, full_loaded_at=None):
+        self.value = value
+        self.loaded_at = loaded_at
+        self.refreshing = False
+        self.watermark = watermark
+        self.full_loaded_at = loaded_at if full_loaded_at is None else full_loaded_at
+
+
+class ReferenceCache:
+    """
+    Process-wide cache for QuickBooks reference tables (currencies, customer types, sales reps, ...).
+
+    Each table is registered with a loader and its own TTL. A fresh entry is served from memory,
+    an entry past its TTL but still inside the stale window is served immediately while a single
+    background thread reloads it, and anything older (or never loaded) is loaded in the calling
+    thread. Concurrent misses for the same table wait for one load instead of each hitting QuickBooks.
+
+    Tables registered as incremental keep the newest TimeModified they have seen; once loaded, they
+    are refreshed by asking only for records modified since then and merging them into the cached map.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._entries = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._batch_loader = None
+        self._batch_incremental = False
+
+    def register(self, name, loader, ttl=None, stale_ttl=None, incremental=False):
+        """
+        Registers a reference table. `loader` is called with no arguments and must return the map,
+        or None when QuickBooks could not be reached (which is never cached). An empty map is a
+        table with no records and is cached like any other.
+        TTLs default to QB_REF_CACHE_TTL_<NAME> / QB_REF_CACHE_STALE_TTL_<NAME>, then the global defaults.
+
+        With incremental=True the loader is called as loader(current, since) and returns
+        (map, watermark): `current`/`since` are the cached map and its TimeModified watermark for a
+        delta refresh, or None for a full load. The returned map must be a new dictionary.
+        """
+        env_name = name.upper()
+        if ttl is None:
+            ttl = float(os.environ.get(f"QB_REF_CACHE_TTL_{env_name}", DEFAULT_TTL))
+        if stale_ttl is None:
+            stale_ttl = float(os.environ.get(f"QB_REF_CACHE_STALE_TTL_{env_name}", DEFAULT_STALE_TTL))
+        with self._lock:
+            self._tables[name] = {"loader": loader, "ttl": ttl, "stale_ttl": stale_ttl, "incremental": incremental}
+            self._locks.setdefault(name, threading.Lock())
+            self._stats.setdefault(name, {"hits": 0, "stale_hits": 0, "misses": 0, "loads": 0, "load_errors": 0})
+
+    def set_batch_loader(self, batch_loader, incremental=False):
+        """
+        Registers a loader that fetches several tables at once. It is called with a list of table
+        names and must return a dictionary of name -> map, leaving out tables it could not load.
+
+        With incremental=True it is called as batch_loader(names, deltas), where deltas maps the
+        names due for a delta refresh to (current, since), and returns name -> (map, watermark).
+        """
+        self._batch_loader = batch_loader
+        self._batch_incremental = incremental
+
+    def get(self, name):
+        """
+        Returns the cached map for `name`, loading or refreshing it as needed.
+        Returns an empty dict if the table has never been loaded successfully.
+        """
+        return self.get_many([name])[name]
+
+    def get_many(self, names):
+        """
+        Returns a dictionary of name -> map for several tables. Tables that need loading are
+        fetched together through the batch loader (one QuickBooks round trip) when one is set.
+        """
+        result = {}
+        to_load = []
+        to_refresh = []
+        now = time.monotonic()
+
+        for name in names:
+            table = self._tables[name]
+            entry = self._entries.get(name)
+            if entry is not None:
+                age = now - entry.loaded_at
+                if age < table["ttl"]:
+                    self._count(name, "hits")
+                    result[name] = entry.value
+                    continue
+                if age < table["ttl"] + table["stale_ttl"]:
+                    self._count(name, "stale_hits")
+                    result[name] = entry.value
+                    if self._claim_refresh(entry):
+                        to_refresh.append((name, entry))
+                    continue
+            self._count(name, "misses")
+            to_load.append(name)
+
+        if to_refresh:
+            self._refresh_in_background(to_refresh)
+
+        if to_load:
+            # Lock in a fixed order so concurrent callers cannot deadlock on overlapping tables.
+            locks = [self._locks[name] for name in sorted(to_load)]
+            for lock in locks:
+                lock.acquire()
+            try:
+                # Another thread may have finished loading while we waited for the locks.
+                missing = []
+                for name in to_load:
+                    entry = self._entries.get(name)
+                    if entry is not None and time.monotonic() - entry.loaded_at < self._tables[name]["ttl"]:
+                        result[name] = entry.value
+                    else:
+                        missing.append(name)
+                loaded = self._load(missing) if missing else {}
+                for name in missing:
+                    if name in loaded:
+                        result[name] = loaded[name]
+                    else:
+                        # Keep serving the last good copy rather than nothing if QuickBooks is unreachable.
+                        entry = self._entries.get(name)
+                        result[name] = entry.value if entry is not None else {}
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+        return result
+
+    def set(self, name, value, watermark=None, full=True):
+        """Stores a freshly loaded map for `name`, e.g. one fetched as part of a larger request."""
+        now = time.monotonic()
+        with self._lock:
+            previous = self._entries.get(name)
+            full_loaded_at = now if full or previous is None else previous.full_loaded_at
+            self._entries[name] = _CacheEntry(value, now, watermark, full_loaded_at)
+
+    def invalidate(self, name=None):
+        """Drops one table (or every table when `name` is None) so the next `get` reloads it."""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def stats(self):
+        """Returns a snapshot of the hit/miss counters and entry ages per table."""
+        now = time.monotonic()
+        snapshot = {}
+        with self._lock:
+            for name, counters in self._stats.items():
+                entry = self._entries.get(name)
+                snapshot[name] = dict(counters)
+                snapshot[name]["age_seconds"] = round(now - entry.loaded_at, 1) if entry is not None else None
+        return snapshot
+
+    def _deltas(self, names):
+        """Returns name -> (current, since) for the incremental tables that can be refreshed by delta."""
+        now = time.monotonic()
+        deltas = {}
+        for name in names:
+            entry = self._entries.get(name)
+            if (self._tables[name]["incremental"] and entry is not None and entry.watermark
+                    and now - entry.full_loaded_at < FULL_RELOAD_INTERVAL):
+                deltas[name] = (entry.value, entry.watermark)
+        return deltas
+
+    def _load(self, names):
+        """Loads the given tables, batched when possible, and stores the ones that succeeded."""
+        for name in names:
+            self._count(name, "loads")
+        deltas = self._deltas(names)
+        # name -> (map, watermark or None)
+        loaded = {}
+        if self._batch_loader is not None and len(names) > 1:
+            try:
+                if self._batch_incremental:
+                    loaded = self._batch_loader(list(names), deltas) or {}
+                else:
+                    loaded = {name: (value, None) for name, value in (self._batch_loader(list(names)) or {}).items()}
+            except Exception as e:
+                logger.error("Error loading reference tables %s: %s", names, e)
+        else:
+            for name in names:
+                table = self._tables[name]
+                try:
+                    if table["incremental"]:
+                        current, since = deltas.get(name, (None, None))
+                        loaded[name] = table["loader"](current, since)
+                    else:
+                        loaded[name] = (table["loader"](), None)
+                except Exception as e:
+                    logger.error("Error loading reference table '%s': %s", name, e)
+
+        maps = {}
+        for name in names:
+            value, watermark = loaded.get(name) or (None, None)
+            # None means the load failed; an empty map is a table without records.
+            if value is not None:
+                self.set(name, value, watermark, full=name not in deltas)
+                maps[name] = value
+            else:
+                self._count(name, "load_errors")
+        return maps
+
+    def _claim_refresh(self, entry):
+        with self._lock:
+            if entry.refreshing:
+                return False
+            entry.refreshing = True
+            return True
+
+    def _refresh_in_background(self, stale):
+        names = [name for name, _ in stale]
+
+        def refresh():
+            locks = [self._locks[name] for name in sorted(names)]
+            for lock in locks:
+                lock.acquire()
+            try:
+                self._load(names)
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+                for _, entry in stale:
+                    entry.refreshing = False
+
+        threading.Thread(target=refresh, name=f"refcache-{'-'.join(names)}", daemon=True).start()
+
+    def _count(self, name, counter):
+        with self._lock:
+            self._stats[name][counter] += 1
+        if counter in _LOOKUP_RESULTS:
+            metrics.record_reference_lookup(name, _LOOKUP_RESULTS[counter])
+
+
+# Shared instance used by all sync scripts in this process (one per gunicorn worker).
+reference_cache = ReferenceCache()
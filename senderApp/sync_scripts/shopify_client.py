@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Shop admin URL, e.g. https://your-store.myshopify.com (or a local fake, see dev_tools/fake_shopify.py).
+STORE_URL = os.environ.get("SHOPIFY_STORE_URL", "").rstrip('/')
+ACCESS_TOKEN = os.environ.get("SHOPIFY_ACCESS_TOKEN", "")
+API_VERSION = os.environ.get("SHOPIFY_API_VERSION", "2024-07")
+TIMEOUT = float(os.environ.get("SHOPIFY_TIMEOUT", "30"))
+# Attempts for a request Shopify throttled (HTTP 429 or a THROTTLED GraphQL error) before giving up.
+MAX_THROTTLE_RETRIES = int(os.environ.get("SHOPIFY_MAX_THROTTLE_RETRIES", "5"))
+
+
+# Top-level GraphQL error codes for a request that may succeed if it is sent again later.
+RETRYABLE_ERROR_CODES = frozenset({"THROTTLED", "INTERNAL_SERVER_ERROR", "SERVICE_UNAVAILABLE", "TIMEOUT"})
+
+
+class ShopifyError(requests.RequestException):
+    """
+    Raised when Shopify answers a GraphQL request with top-level errors. `retryable` is True when
+    Shopify was throttling or failing (the request itself may be fine), False when it rejected the
+    request, e.g. for a bad query or missing access scope.
+    """
+
+    def __init__(self, message, errors=None, retryable=None):
+        super().__init__(message)
+        self.errors = errors or []
+        if retryable is None:
+            retryable = any((error.get("extensions") or {}).get("code") in RETRYABLE_ERROR_CODES
+                            for error in self.errors)
+        self.retryable = retryable
+
+
+class ShopifyClient:
+    """
+    Shopify Admin GraphQL transport with a pooled keep-alive session.
+
+    GraphQL calls are rate limited by query cost with a leaky bucket. The client keeps the bucket
+    state Shopify reports with each response (extensions.cost.throttleStatus), waits before a call
+    when the bucket cannot cover the call's expected cost, and retries throttled calls after the
+    time the bucket needs to refill.
+    """
+
+    def __init__(self, store_url=None, access_token=None, api_version=None, timeout=None):
+        self.url = f"{(store_url or STORE_URL).rstrip('/')}/admin/api/{api_version or API_VERSION}/graphql.json"
+        self.timeout = timeout if timeout is not None else TIMEOUT
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=4, max_retries=0))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=4, max_retries=0))
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "X-Shopify-Access-Token": access_token or ACCESS_TOKEN,
+        })
+        self._lock = threading.Lock()
+        # Last reported bucket state: points available, when it was reported, refill rate per second.
+        self._available = None
+        self._available_at = 0.0
+        self._restore_rate = 50.0
+
+    def _wait_for_budget(self, cost):
+        with self._lock:
+            if self._available is None:
+                return
+            available = self._available + (time.monotonic() - self._available_at) * self._restore_rate
+        if available < cost:
+            time.sleep((cost - available) / self._restore_rate)
+
+    def _update_budget(self, extensions):
+        throttle = ((extensions or {}).get("cost") or {}).get("throttleStatus")
+        if throttle:
+            with self._lock:
+                self._available = throttle.get("currentlyAvailable", 0)
+                self._restore_rate = throttle.get("restoreRate") or self._restore_rate
+                self._available_at = time.monotonic()
+
+    def graphql(self, query, variables=None, expected_cost=100):
+        """
+        Runs a GraphQL query or mutation and returns its "data". Raises ShopifyError on GraphQL
+        errors and requests.RequestException on transport errors.
+        """
+        for attempt in range(MAX_THROTTLE_RETRIES + 1):
+            self._wait_for_budget(expected_cost)
+            response = self.session.post(self.url, json={"query": query, "variables": variables or {}}, timeout=self.timeout)
+            if response.status_code == 429:
+                time.sleep(float(response.headers.get("Retry-After", "1")))
+                continue
+            response.raise_for_status()
+            body = response.json()
+            self._update_budget(body.get("extensions"))
+            errors = body.get("errors") or []
+            if any((error.get("extensions") or {}).get("code") == "THROTTLED" for error in errors):
+                # The bucket state was just updated, so the next wait covers the refill time.
+                self._wait_for_budget(expected_cost)
+                continue
+            if errors:
+                raise ShopifyError(f"Shopify GraphQL error: {errors[0].get('message')}", errors)
+            return body.get("data") or {}
+        raise ShopifyError(f"Shopify kept throttling the request after {MAX_THROTTLE_RETRIES} retries.", retryable=True)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_shopify_client():
+    """Returns the ShopifyClient shared by this worker process (re-created after a fork)."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = ShopifyClient()
+                _client_pid = pid
+    return _client
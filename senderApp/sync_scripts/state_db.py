@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+DATA_DIR = os.environ.get(
+    "SYNC_DATA_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"),
+)
+STATE_DB_PATH = os.environ.get("SYNC_STATE_DB", os.path.join(DATA_DIR, "sync_state.db"))
+
+_schemas = []
+_schema_lock = threading.Lock()
+_local = threading.local()
+
+
+def register_schema(ddl):
+    """
+    Registers CREATE TABLE/INDEX IF NOT EXISTS statements that must exist in the state database.
+    Modules call this at import time; the DDL is applied to every connection before first use.
+    """
+    with _schema_lock:
+        if ddl not in _schemas:
+            _schemas.append(ddl)
+
+
+def get_connection():
+    """
+    Returns this thread's connection to the local state database (sync_state.db).
+
+    The database runs in WAL mode so every gunicorn worker and background thread can read while
+    one of them writes. Connections are in autocommit mode; use `with transaction(conn):` for
+    multi-statement writes.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        db_dir = os.path.dirname(STATE_DB_PATH)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = sqlite3.connect(STATE_DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+        _local.pid = os.getpid()
+        _local.schema_count = 0
+
+    if _local.schema_count < len(_schemas):
+        with _schema_lock:
+            pending = _schemas[_local.schema_count:]
+        for ddl in pending:
+            conn.executescript(ddl)
+        _local.schema_count += len(pending)
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    """
+    Runs the enclosed statements in an IMMEDIATE transaction, so read-then-write sequences
+    are not raced by other workers.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
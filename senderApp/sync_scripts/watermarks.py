@@ -0,0 +1,90 @@
+import logging
+import sqlite3
+import time
+from datetime import datetime
+from sync_scripts.state_db import get_connection, register_schema, transaction
+
+logger = logging.getLogger(__name__)
+
+# Last successful TimeModified per QuickBooks list, so refreshes can ask for FromModifiedDate onwards
+# instead of the whole table. Persisted watermarks belong to data that is persisted too (e.g. JSONL
+# snapshots); in-memory caches keep theirs next to the cached data with WatermarkTracker.
+
+register_schema("""
+CREATE TABLE IF NOT EXISTS qb_watermarks (
+    list_key TEXT PRIMARY KEY,
+    time_modified TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+""")
+
+
+def _parse_time(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_newer(candidate, current):
+    """Returns True if TimeModified `candidate` is later than `current` (None counts as oldest)."""
+    if not candidate:
+        return False
+    if not current:
+        return True
+    parsed_candidate, parsed_current = _parse_time(candidate), _parse_time(current)
+    if parsed_candidate is None or parsed_current is None:
+        return candidate > current
+    return parsed_candidate > parsed_current
+
+
+class WatermarkTracker:
+    """Keeps the newest TimeModified seen while records are processed."""
+    __slots__ = ("value",)
+
+    def __init__(self, start=None):
+        self.value = start
+
+    def observe(self, record):
+        time_modified = record.get("TimeModified")
+        if is_newer(time_modified, self.value):
+            self.value = time_modified
+
+
+def get(list_key):
+    """Returns the stored TimeModified watermark for `list_key`, or None."""
+    try:
+        row = get_connection().execute(
+            "SELECT time_modified FROM qb_watermarks WHERE list_key = ?", (list_key,)
+        ).fetchone()
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error reading watermark for %s: %s", list_key, e)
+        return None
+    return row["time_modified"] if row is not None else None
+
+
+def advance(list_key, time_modified):
+    """Stores `time_modified` for `list_key` unless an equal or newer watermark is already recorded."""
+    if not time_modified:
+        return
+    try:
+        conn = get_connection()
+        with transaction(conn):
+            row = conn.execute(
+                "SELECT time_modified FROM qb_watermarks WHERE list_key = ?", (list_key,)
+            ).fetchone()
+            if row is None or is_newer(time_modified, row["time_modified"]):
+                conn.execute(
+                    "INSERT OR REPLACE INTO qb_watermarks (list_key, time_modified, updated_at) VALUES (?, ?, ?)",
+                    (list_key, time_modified, time.time()),
+                )
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error writing watermark for %s: %s", list_key, e)
+
+
+def reset(list_key):
+    """Forgets the watermark so the next refresh of `list_key` is a full load."""
+    try:
+        get_connection().execute("DELETE FROM qb_watermarks WHERE list_key = ?", (list_key,))
+    except (sqlite3.Error, OSError) as e:
+        logger.error("Error removing watermark for %s: %s", list_key, e)
@@ -0,0 +1,78 @@
+import os
+import sys
+import tempfile
+
+# The sync modules read their settings when they are imported: point the state database at a
+# throwaway directory and switch off the background services before any of them is imported.
+_DATA_DIR = tempfile.mkdtemp(prefix="sync-tests-")
+os.environ["SYNC_DATA_DIR"] = _DATA_DIR
+os.environ["SYNC_STATE_DB"] = os.path.join(_DATA_DIR, "sync_state.db")
+os.environ["SYNC_LOG_FILE"] = ""
+os.environ["SYNC_PAYLOAD_ARCHIVE"] = "false"
+os.environ["QB_ITEM_CATALOG_PRELOAD"] = "false"
+os.environ["SYNC_QUEUE_WORKERS"] = "0"
+os.environ.setdefault("QB_SERVER_URL", "http://127.0.0.1:9")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from dev_tools.mock_qb_bridge import MockCompany, start_mock_bridge  # noqa: E402
+from sync_scripts import qb_client  # noqa: E402
+from sync_scripts.item_catalog import item_catalog  # noqa: E402
+from sync_scripts.reference_cache import reference_cache  # noqa: E402
+from sync_scripts.state_db import get_connection  # noqa: E402
+
+
+@pytest.fixture
+def state_db():
+    """The state database connection of the test thread, emptied of rows left by earlier tests."""
+    conn = get_connection()
+    tables = [row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    for table in tables:
+        conn.execute(f"DELETE FROM {table}")
+    return conn
+
+
+@pytest.fixture
+def mock_bridge(state_db, monkeypatch):
+    """
+    Runs the mock qbXML bridge (dev_tools/mock_qb_bridge.py) and points the shared QBClient at it.
+    Returns its MockCompany.
+    """
+    server, base_url, company = start_mock_bridge(items=20, seed=1)
+    client = qb_client.QBClient(server_url=base_url + "/qbxml")
+    monkeypatch.setattr(qb_client, "_client", client)
+    monkeypatch.setattr(qb_client, "_client_pid", os.getpid())
+    # IDs cached from another test's company are unknown to this one.
+    monkeypatch.setattr(item_catalog, "_items", {})
+    reference_cache.invalidate()
+    # Lookups must not start a catalog load against the real bridge address.
+    monkeypatch.setattr(item_catalog, "_refresh_if_stale", lambda: None)
+    yield company
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+
+class InProcessAsyncClient:
+    """AsyncQBClient stand-in that answers from a MockCompany without HTTP."""
+
+    def __init__(self, company):
+        self.company = company
+        self.envelopes = []
+
+    async def send(self, xml_request):
+        self.envelopes.append(xml_request)
+        return self.company.handle(xml_request)
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def async_client(state_db, monkeypatch):
+    """An in-process AsyncQBClient stand-in backed by a fresh MockCompany (reference checks off)."""
+    monkeypatch.setattr(item_catalog, "_items", {})
+    monkeypatch.setattr(item_catalog, "_refresh_if_stale", lambda: None)
+    return InProcessAsyncClient(MockCompany(items=20, ref_checks=False, seed=1))
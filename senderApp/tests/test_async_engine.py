@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+from benchmarks import payloads
+from sync_scripts import customer_sync, entity_scheduler, id_index, order_sync
+from sync_scripts.async_engine import AsyncEntityScheduler, AsyncSyncEngine
+from sync_scripts.item_catalog import item_catalog
+
+REFERENCE_MAPS = (
+    {"CAD": {"ListID": "CUR-CAD", "FullName": "CAD"}},
+    {"Shopify customers": {"ListID": "CT-1", "FullName": "Shopify customers"}},
+    {"AS": {"ListID": "SR-1", "FullName": "AS"}},
+)
+
+
+def _record_calls_on_loop(monkeypatch):
+    """
+    Wraps every blocking call the flows make (state database, item catalog, reference cache) so
+    that calling one on the event loop thread is recorded. Returns the list of such calls.
+    """
+    on_loop = []
+
+    def guard(name, fn):
+        def guarded(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                on_loop.append(name)
+            return fn(*args, **kwargs)
+        return guarded
+
+    for name in ("get", "remember", "forget", "get_applied_hash", "set_applied_hash"):
+        monkeypatch.setattr(id_index, name, guard(f"id_index.{name}", getattr(id_index, name)))
+    for name in ("resolve_many", "update_from_ret"):
+        monkeypatch.setattr(item_catalog, name, guard(f"item_catalog.{name}", getattr(item_catalog, name)))
+    for module in (customer_sync, order_sync):
+        monkeypatch.setattr(module, "get_reference_maps", guard("get_reference_maps", lambda: REFERENCE_MAPS))
+    return on_loop
+
+
+def test_flows_keep_blocking_calls_off_the_event_loop(async_client, monkeypatch):
+    on_loop = _record_calls_on_loop(monkeypatch)
+    rng = payloads.rng()
+    customer = payloads.customer(rng, 501)
+    order = payloads.order(rng, 601, lines=3)
+    product = {"id": 701, "title": "Widget", "variants": [
+        {"id": 1, "sku": "SKU-000001", "price": "9.99"},
+        {"id": 2, "sku": "NEW-0001", "price": "5.00"},
+    ]}
+
+    async def scenario():
+        engine = AsyncSyncEngine(client=async_client)
+        results = [await engine.create_customer(customer)]
+        customer["note"] = "Updated note"
+        results.append(await engine.update_customer(customer))
+        results.append(await engine.update_customer(customer))
+        results.append(await engine.create_order(order))
+        order["line_items"][0]["quantity"] += 1
+        results.append(await engine.update_order(order))
+        # SKU-000001 exists but is not in the catalog: exercises the name-in-use re-query.
+        results.append(await engine.sync_product(product))
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert all(result and "error" not in result for result in results), results
+    assert results[2]["status"] == "unchanged"
+    assert on_loop == []
+
+
+def test_cancelled_entity_call_cancels_its_waiters():
+    async def scenario():
+        scheduler = AsyncEntityScheduler()
+        started = asyncio.Event()
+
+        async def hang(payload):
+            started.set()
+            await asyncio.Event().wait()
+
+        first = asyncio.ensure_future(scheduler.run("customer:1", hang, "a", coalesce=False))
+        second = asyncio.ensure_future(scheduler.run("customer:1", hang, "b", coalesce=False))
+        await started.wait()
+        [execute] = [task for task in asyncio.all_tasks() if task.get_coro().__name__ == "_execute"]
+        execute.cancel()
+        done, pending = await asyncio.wait([first, second], timeout=2)
+        return done, pending, scheduler.pending()
+
+    done, pending, active = asyncio.run(scenario())
+
+    assert not pending
+    assert all(task.cancelled() for task in done)
+    assert active == 0
+
+
+def test_entity_call_waits_for_the_lock_of_another_process(state_db, monkeypatch):
+    monkeypatch.setattr(entity_scheduler, "LOCK_TIMEOUT", 0.1)
+    state_db.execute("INSERT INTO entity_locks (entity_key, holder, expires_at) VALUES (?, ?, ?)",
+                     ("customer:1", "other-process", time.time() + 60))
+    ran = []
+
+    async def sync(payload):
+        ran.append(payload)
+        return payload
+
+    async def scenario():
+        scheduler = AsyncEntityScheduler()
+        timed_out = await scheduler.run("customer:1", sync, "a")
+        state_db.execute("DELETE FROM entity_locks")
+        return timed_out, await scheduler.run("customer:1", sync, "b")
+
+    assert asyncio.run(scenario()) == (None, "b")
+    assert ran == ["b"]
@@ -0,0 +1,55 @@
+import json
+import time
+
+from benchmarks import run
+
+ENVIRONMENT = {"host": "build-1", "python": "3.11.9", "platform": "Linux"}
+
+
+def _run(median, passed=True, **environment):
+    return dict(ENVIRONMENT, **environment, passed=passed, results={"case": {"median": median, "min": median}})
+
+
+def test_cases_are_compared_with_the_last_passing_run_on_the_same_host_and_python():
+    history = [
+        _run(1.0),
+        _run(2.0),
+        _run(0.1, host="laptop"),
+        _run(0.1, python="3.12.1"),
+        _run(5.0, passed=False),
+    ]
+    results = {"case": {"median": 2.4, "min": 2.3}, "new_case": {"median": 1.0, "min": 1.0}}
+
+    rows = {name: row for name, *row in run.compare(results, history, ENVIRONMENT, threshold=0.15)}
+
+    _, baseline, change, regressed = rows["case"]
+    assert baseline["median"] == 2.0
+    assert round(change, 6) == 0.2 and regressed
+    assert rows["new_case"][1:] == [None, None, False]
+    assert not run.compare(results, history, ENVIRONMENT, threshold=0.25)[0][4]
+
+
+def test_a_regression_fails_the_run_and_does_not_become_the_baseline(tmp_path, monkeypatch, capsys):
+    delay = {"seconds": 0.0}
+    monkeypatch.setattr(run, "CASES", [("sleep", lambda: lambda: time.sleep(delay["seconds"]))])
+    monkeypatch.setattr(run, "_prepare_environment", lambda: None)
+    monkeypatch.setattr(run, "_environment", lambda: dict(ENVIRONMENT))
+    history_path = str(tmp_path / "history.json")
+
+    def main(*args):
+        return run.main(["--quick", "--repeats", "1", "--history", history_path, *args])
+
+    assert main() == 0
+    delay["seconds"] = 0.002
+    assert main() == 1
+    assert "REGRESSION" in capsys.readouterr().out
+    # Still compared with the first run, since the failed one is not a baseline.
+    assert main() == 1
+    # An intended slowdown is accepted and becomes the new baseline.
+    assert main("--accept") == 0
+
+    with open(history_path) as f:
+        history = json.load(f)
+    assert [entry["passed"] for entry in history] == [True, False, False, True]
+    assert all(entry["host"] == "build-1" and "sleep" in entry["results"] for entry in history)
+    assert run.find_baseline(history, "sleep", ENVIRONMENT) == history[3]
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from sync_scripts import bridge_governor
+
+
+@pytest.fixture
+def governor(state_db, monkeypatch):
+    """The governor with a single slot and a fresh shared state. Counts the state transactions."""
+    monkeypatch.setattr(bridge_governor, "ENABLED", True)
+    monkeypatch.setattr(bridge_governor, "MIN_CONCURRENCY", 1)
+    monkeypatch.setattr(bridge_governor, "MAX_CONCURRENCY", 1)
+    attempts = []
+    try_acquire = bridge_governor._try_acquire
+
+    def counted():
+        attempts.append(threading.current_thread().name)
+        return try_acquire()
+
+    monkeypatch.setattr(bridge_governor, "_try_acquire", counted)
+    return attempts
+
+
+def test_waiting_threads_poll_the_shared_state_one_at_a_time(governor):
+    held = bridge_governor.acquire()
+    errors = []
+
+    def wait():
+        try:
+            bridge_governor.acquire(timeout=1.0)
+        except bridge_governor.BridgeBusy as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wait) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    bridge_governor.release(held, 0.01, True)
+
+    assert len(errors) == 20
+    # One poller backing off from 50 ms, plus one last attempt per waiter; polling every 50 ms
+    # per waiter would be about 400 transactions.
+    assert len(governor) <= 45
+
+
+def test_release_wakes_a_waiting_thread_at_once(governor):
+    held = bridge_governor.acquire()
+    acquired = []
+
+    def wait():
+        acquired.append((bridge_governor.acquire(timeout=5), time.monotonic()))
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    time.sleep(1.2)  # the poller has backed off to its longest interval
+    released_at = time.monotonic()
+    bridge_governor.release(held, 0.01, True)
+    thread.join()
+
+    lease, acquired_at = acquired[0]
+    assert lease is not None
+    assert acquired_at - released_at < 0.2
+    bridge_governor.release(lease, 0.01, True)
+
+
+def test_async_waiters_share_one_poller_and_are_woken_by_release(governor):
+    async def scenario():
+        held = await bridge_governor.acquire_async()
+        waiters = [asyncio.ensure_future(bridge_governor.acquire_async(timeout=5)) for _ in range(50)]
+        await asyncio.sleep(1.2)
+        polls = len(governor)
+        released_at = time.monotonic()
+        await bridge_governor.release_async(held, 0.01, True)
+        done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        woken_after = time.monotonic() - released_at
+        lease = done.pop().result()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await bridge_governor.release_async(lease, 0.01, True)
+        return polls, woken_after
+
+    polls, woken_after = asyncio.run(scenario())
+
+    assert polls <= 10
+    assert woken_after < 0.2
+
+
+def _round_trips(count, latency, ok):
+    for _ in range(count):
+        lease = bridge_governor.acquire(timeout=0)
+        bridge_governor.release(lease, latency, ok)
+
+
+def test_slow_successes_lower_the_limit_but_do_not_open_the_breaker(governor, monkeypatch):
+    monkeypatch.setattr(bridge_governor, "MAX_CONCURRENCY", 4)
+    monkeypatch.setattr(bridge_governor, "BREAKER_MIN_REQUESTS", 5)
+    monkeypatch.setattr(bridge_governor, "BREAKER_WINDOW_CALLS", 4)
+
+    _round_trips(20, bridge_governor.LATENCY_TARGET + 1, True)
+
+    status = bridge_governor.status()
+    assert status["breaker_state"] == bridge_governor.CLOSED
+    assert status["failure_rate"] == 0
+    assert status["concurrency_limit"] == 1
+
+
+def test_failures_open_the_breaker(governor, monkeypatch):
+    monkeypatch.setattr(bridge_governor, "BREAKER_MIN_REQUESTS", 5)
+    monkeypatch.setattr(bridge_governor, "BREAKER_WINDOW_CALLS", 4)
+
+    _round_trips(5, 0.01, False)
+
+    assert bridge_governor.status()["breaker_state"] == bridge_governor.OPEN
+    with pytest.raises(bridge_governor.BridgeUnavailable):
+        bridge_governor.acquire(timeout=0)
+
+
+def test_latency_budget_applies_to_round_trips_started_inside_it(governor, monkeypatch):
+    monkeypatch.setattr(bridge_governor, "MAX_CONCURRENCY", 4)
+
+    with bridge_governor.latency_budget(bridge_governor.LATENCY_TARGET * 3):
+        _round_trips(5, bridge_governor.LATENCY_TARGET * 2, True)
+    assert bridge_governor.status()["concurrency_limit"] == 4
+
+    _round_trips(1, bridge_governor.LATENCY_TARGET * 2, True)
+    assert bridge_governor.status()["concurrency_limit"] == 2
+
+
+def test_list_queries_use_the_bulk_latency_budget():
+    from sync_scripts.qbxml_batch import QBXMLBatch
+
+    targets = []
+
+    def sender(xml):
+        targets.append(bridge_governor._latency_target.get())
+        return '<QBXML><QBXMLMsgsRs><ItemQueryRs requestID="1" statusCode="0" statusSeverity="Info" ' \
+               'statusMessage="Status OK"/></QBXMLMsgsRs></QBXML>'
+
+    batch = QBXMLBatch()
+    batch.add("ItemQueryRq")
+    list(batch.stream(sender))
+
+    assert targets == [bridge_governor.BULK_LATENCY_TARGET]
+
+
+def test_unusable_state_database_sends_ungoverned(governor, monkeypatch):
+    def unavailable():
+        raise OSError("read-only file system")
+
+    monkeypatch.setattr(bridge_governor, "get_connection", unavailable)
+    assert bridge_governor.acquire(timeout=0) is None
+    bridge_governor.release(bridge_governor.Lease("gone", False), 0.01, True)
+    assert bridge_governor._releases > 0
+
+
+def test_async_routes_check_the_breaker_off_the_event_loop(state_db, monkeypatch):
+    from aiohttp.test_utils import TestClient, TestServer
+
+    import async_api
+    from sync_scripts import job_queue
+
+    checked_on_loop = []
+
+    def breaker_open():
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            checked_on_loop.append(False)
+        else:
+            checked_on_loop.append(True)
+        return True
+
+    monkeypatch.setattr(bridge_governor, "BREAKER_DEFER", True)
+    monkeypatch.setattr(bridge_governor, "is_open", breaker_open)
+    monkeypatch.setattr(async_api, "start_workers_on_demand", lambda: None)
+    monkeypatch.setattr(job_queue, "_start_on_enqueue", False)
+
+    async def update_order():
+        async with TestClient(TestServer(async_api.create_app())) as client:
+            response = await client.put("/order/7", json={"id": 7})
+            return response.status
+
+    assert asyncio.run(update_order()) == 202
+    assert checked_on_loop == [False]
@@ -0,0 +1,127 @@
+import asyncio
+import json
+import os
+
+import pytest
+import requests
+
+from benchmarks import payloads
+from sync_scripts import customer_backfill, job_queue
+
+
+def _write_jsonl(path, lines):
+    path.write_text("".join(line + "\n" for line in lines), encoding="utf-8")
+    return str(path)
+
+
+def _outcomes(input_path):
+    with open(customer_backfill.results_path(input_path)) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_unreadable_and_non_object_lines_are_recorded_as_invalid(mock_bridge, tmp_path):
+    rng = payloads.rng(14)
+    first, last = payloads.customer(rng, 1401), payloads.customer(rng, 1402)
+    broken_address = dict(payloads.customer(rng, 1403), default_address=["not", "an", "object"])
+    path = _write_jsonl(tmp_path / "customers.jsonl", [
+        json.dumps(first), '{"id": 99, "first_name": ', "[]", json.dumps({"first_name": "No ID"}),
+        json.dumps(broken_address), json.dumps(last),
+    ])
+
+    summary = customer_backfill.backfill_customers(path)
+
+    assert summary["counts"] == {"created": 2, "invalid": 4}
+    outcomes = _outcomes(path)
+    assert [entry["outcome"] for entry in outcomes] == ["invalid"] * 4 + ["created"] * 2
+    assert outcomes[0]["error"].startswith("Line 2 is not valid JSON")
+    assert outcomes[1]["error"] == "Expected a customer object, got list."
+    assert mock_bridge.counts["CustomerAddRq"] == 2
+
+
+def test_interrupted_backfill_resumes_after_the_last_completed_batch(mock_bridge, tmp_path):
+    rng = payloads.rng(16)
+    customers = [payloads.customer(rng, 1600 + i) for i in range(5)]
+    path = _write_jsonl(tmp_path / "customers.jsonl", [json.dumps(customer) for customer in customers])
+    envelopes = []
+
+    def sender(xml):
+        envelopes.append(xml)
+        if len(envelopes) == 2:
+            raise requests.ConnectionError("bridge went away")
+        return mock_bridge.handle(xml)
+
+    with pytest.raises(requests.ConnectionError):
+        customer_backfill.backfill_customers(path, batch_size=2, sender=sender)
+    assert len(_outcomes(path)) == 2
+
+    summary = customer_backfill.backfill_customers(path, batch_size=2, sender=sender)
+
+    # Only the failed batch and the ones after it are sent again, and each outcome is written once.
+    assert [envelope.count("<CustomerAddRq") for envelope in envelopes] == [2, 2, 2, 1]
+    assert summary["counts"] == {"created": 5}
+    assert [entry["id"] for entry in _outcomes(path)] == [customer["id"] for customer in customers]
+    assert mock_bridge.counts["CustomerAddRq"] == 5
+    assert not os.path.exists(os.path.splitext(path)[0] + ".checkpoint")
+
+    # Running it again finds every customer in the ID index.
+    assert customer_backfill.backfill_customers(path, sender=sender)["counts"] == {"skipped": 5}
+    assert len(envelopes) == 4
+
+
+def _upload_files():
+    return sorted(os.listdir(customer_backfill.UPLOAD_DIR)) if os.path.isdir(customer_backfill.UPLOAD_DIR) else []
+
+
+def test_bulk_upload_is_queued_with_an_object_payload_and_backfilled(mock_bridge, monkeypatch):
+    from sync_api import app
+
+    monkeypatch.setattr(job_queue, "_start_on_enqueue", False)
+    body = json.dumps(payloads.customer(payloads.rng(15), 1501)) + "\n"
+    response = app.test_client().post("/customer/bulk", data=body, content_type="application/x-ndjson")
+
+    assert response.status_code == 202
+    row = job_queue.claim_next()
+    payload = json.loads(row["payload"])
+    assert set(payload) == {"path", "format"} and payload["format"] == "jsonl"
+
+    job_queue.run_job(row)
+    assert job_queue.get_job(row["id"])["result"]["counts"] == {"created": 1}
+
+
+def test_flask_bulk_upload_over_the_limit_is_refused(state_db, monkeypatch):
+    from sync_api import app
+
+    monkeypatch.setitem(app.config, "MAX_CONTENT_LENGTH", 1024)
+    before = _upload_files()
+    response = app.test_client().post("/customer/bulk", data=b"{}\n" * 1000, content_type="application/x-ndjson")
+
+    assert response.status_code == 413
+    assert "SYNC_BACKFILL_MAX_BYTES" in response.get_json()["error"]
+    assert _upload_files() == before
+    assert job_queue.claim_next() is None
+
+
+def test_async_bulk_upload_over_the_limit_is_refused(state_db, monkeypatch):
+    from aiohttp.test_utils import TestClient, TestServer
+
+    import async_api
+
+    monkeypatch.setattr(async_api, "MAX_UPLOAD_BYTES", 1024)
+    monkeypatch.setattr(async_api, "start_workers_on_demand", lambda: None)
+    before = _upload_files()
+
+    async def chunks():
+        for _ in range(10):
+            yield b"{}\n" * 100
+
+    async def upload():
+        async with TestClient(TestServer(async_api.create_app())) as client:
+            headers = {"Content-Type": "application/x-ndjson"}
+            declared = await client.post("/customer/bulk", data=b"{}\n" * 1000, headers=headers)
+            # Without a Content-Length the cap applies while the body is written to disk.
+            chunked = await client.post("/customer/bulk", data=chunks(), headers=headers)
+            return declared.status, chunked.status
+
+    assert asyncio.run(upload()) == (413, 413)
+    assert _upload_files() == before
+    assert job_queue.claim_next() is None
@@ -0,0 +1,44 @@
+from sync_scripts.customer_sync import REFERENCE_TABLES, get_reference_maps
+from sync_scripts.reference_cache import reference_cache
+
+WATERMARK = "2024-01-01T00:00:00+00:00"
+
+
+def _envelope(request):
+    return f'<?xml version="1.0" ?><QBXML><QBXMLMsgsRq onError="stopOnError">{request}</QBXMLMsgsRq></QBXML>'
+
+
+def test_reference_tables_are_refreshed_with_changes_since_their_watermark(mock_bridge, monkeypatch):
+    for table in REFERENCE_TABLES:
+        for ret in mock_bridge.tables[table].values():
+            ret.find("TimeModified").text = WATERMARK
+    envelopes = []
+    handle = mock_bridge.handle
+    monkeypatch.setattr(mock_bridge, "handle", lambda xml: envelopes.append(xml) or handle(xml))
+
+    currency_map, customer_type_map, sales_rep_map = get_reference_maps()
+    assert set(currency_map) == {"CAD", "USD", "EUR", "GBP"}
+    assert list(customer_type_map) == ["Shopify customers"] and list(sales_rep_map) == ["AS"]
+    # All three tables in one envelope, the whole table each.
+    assert len(envelopes) == 1 and "FromModifiedDate" not in envelopes[0]
+
+    # In QuickBooks, EUR is made inactive and a customer type is added.
+    eur = mock_bridge.tables["currency"][mock_bridge.names["currency"]["EUR"]]
+    handle(_envelope(
+        f'<CurrencyModRq requestID="1"><CurrencyMod><ListID>{eur.findtext("ListID")}</ListID>'
+        f'<EditSequence>{eur.findtext("EditSequence")}</EditSequence><IsActive>false</IsActive></CurrencyMod>'
+        '</CurrencyModRq>'))
+    handle(_envelope('<CustomerTypeAddRq requestID="1"><CustomerTypeAdd><Name>Wholesale</Name>'
+                     '</CustomerTypeAdd></CustomerTypeAddRq>'))
+    # Past the stale window, so the refresh runs in this thread.
+    for table in REFERENCE_TABLES:
+        reference_cache._entries[table].loaded_at -= 10 ** 6
+    del envelopes[:]
+
+    currency_map, customer_type_map, sales_rep_map = get_reference_maps()
+
+    assert len(envelopes) == 1
+    assert envelopes[0].count(f"<FromModifiedDate>{WATERMARK}</FromModifiedDate>") == 3
+    assert set(currency_map) == {"CAD", "USD", "GBP"}
+    assert set(customer_type_map) == {"Shopify customers", "Wholesale"}
+    assert list(sales_rep_map) == ["AS"]
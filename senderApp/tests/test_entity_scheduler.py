@@ -0,0 +1,118 @@
+import multiprocessing
+import threading
+import time
+
+from sync_scripts import entity_scheduler
+from sync_scripts.entity_scheduler import EntityScheduler
+
+
+def _start(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_calls_for_one_entity_run_in_order_and_coalesce():
+    scheduler = EntityScheduler()
+    release = threading.Event()
+    ran = []
+    results = {}
+
+    def sync(payload):
+        ran.append(payload)
+        if payload == "first":
+            release.wait(5)
+        return f"synced {payload}"
+
+    def call(name, payload, coalesce=True):
+        results[name] = scheduler.run("customer:1", sync, payload, coalesce=coalesce)
+
+    threads = [_start(call, "a", "first", False)]
+    while not ran:
+        time.sleep(0.001)
+    # Queued behind the running call: b and c collapse into one call that runs with c's payload.
+    for name, payload in (("b", "second"), ("c", "third")):
+        threads.append(_start(call, name, payload))
+        while len(scheduler._states["customer:1"].queue) != 1:
+            time.sleep(0.001)
+    time.sleep(0.05)
+    assert ran == ["first"]
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert ran == ["first", "third"]
+    assert results == {"a": "synced first", "b": "synced third", "c": "synced third"}
+    assert scheduler.pending() == 0
+
+
+def test_different_entities_run_concurrently_and_errors_reach_the_caller():
+    scheduler = EntityScheduler()
+    barrier = threading.Barrier(2, timeout=5)
+    errors = []
+
+    def sync(payload):
+        barrier.wait()  # Both calls must be running at once to get past this.
+        raise ValueError(payload)
+
+    def call(key):
+        try:
+            scheduler.run(key, sync, key)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [_start(call, "order:1"), _start(call, "order:2")]
+    for thread in threads:
+        thread.join(5)
+
+    assert sorted(errors) == ["order:1", "order:2"]
+    assert scheduler.pending() == 0
+
+
+def _sync_in_own_process(name, log_path, barrier):
+    def sync(payload):
+        with open(log_path, "a") as log:
+            log.write(f"start {payload}\n")
+        time.sleep(0.3)
+        with open(log_path, "a") as log:
+            log.write(f"end {payload}\n")
+        return payload
+
+    barrier.wait()
+    EntityScheduler().run("customer:1", sync, name)
+
+
+def test_calls_for_one_entity_do_not_overlap_across_processes(state_db, tmp_path):
+    # Like two gunicorn workers receiving webhooks for the same customer at the same time.
+    context = multiprocessing.get_context("spawn")
+    log_path = tmp_path / "calls.log"
+    barrier = context.Barrier(2)
+    processes = [context.Process(target=_sync_in_own_process, args=(name, str(log_path), barrier))
+                 for name in ("a", "b")]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    lines = log_path.read_text().split("\n")[:-1]
+    assert sorted(lines) == ["end a", "end b", "start a", "start b"]
+    assert lines[0].split()[1] == lines[1].split()[1]
+    assert state_db.execute("SELECT COUNT(*) FROM entity_locks").fetchone()[0] == 0
+
+
+def test_lock_held_by_another_process_times_out_until_it_expires(state_db, monkeypatch):
+    monkeypatch.setattr(entity_scheduler, "LOCK_TIMEOUT", 0.1)
+    state_db.execute("INSERT INTO entity_locks (entity_key, holder, expires_at) VALUES (?, ?, ?)",
+                     ("order:1", "other-process", time.time() + 60))
+    ran = []
+
+    assert EntityScheduler().run("order:1", ran.append, "first") is None
+    assert ran == []
+
+    # The other process crashed: its lock expires and the next call takes it over.
+    state_db.execute("UPDATE entity_locks SET expires_at = ?", (time.time() - 1,))
+    EntityScheduler().run("order:1", ran.append, "second")
+    assert ran == ["second"]
+    assert state_db.execute("SELECT COUNT(*) FROM entity_locks").fetchone()[0] == 0
@@ -0,0 +1,52 @@
+import xml.etree.ElementTree as ET
+
+from benchmarks import payloads
+from sync_scripts import id_index
+from sync_scripts.customer_sync import create_customer_to_qb, update_customer_in_qb
+
+
+def test_ids_are_recorded_from_ret_elements_and_dicts(state_db):
+    ret = ET.fromstring("<CustomerRet><ListID>80-1</ListID><EditSequence>7</EditSequence>"
+                        "<FullName>Jane Doe</FullName></CustomerRet>")
+    id_index.remember("customer", 42, ret)
+    id_index.remember("sales_order", "1001", {"TxnID": "TX-9", "EditSequence": "3", "RefNumber": "1001"})
+    # Nothing to record without a QuickBooks ID.
+    id_index.remember("customer", 43, {"EditSequence": "1"})
+
+    assert id_index.get("customer", "42") == {"ListID": "80-1", "EditSequence": "7", "FullName": "Jane Doe"}
+    assert id_index.get("sales_order", 1001) == {"TxnID": "TX-9", "EditSequence": "3", "RefNumber": "1001"}
+    assert id_index.get("customer", 43) is None
+
+    id_index.forget("customer", 42)
+    assert id_index.get("customer", 42) is None
+
+
+def _customer_mod_count(company):
+    return company.counts.get("CustomerModRq", 0)
+
+
+def test_updates_use_the_indexed_ids_and_requery_when_they_are_stale(mock_bridge):
+    customer = payloads.customer(payloads.rng(4), 4)
+    list_id = create_customer_to_qb(customer)["ListID"]
+    assert id_index.get("customer", customer["id"])["ListID"] == list_id
+
+    customer["note"] = "First update"
+    assert "error" not in update_customer_in_qb(customer)
+    # Straight to CustomerMod with the indexed ListID/EditSequence: no query first.
+    assert (mock_bridge.counts.get("CustomerQueryRq", 0), _customer_mod_count(mock_bridge)) == (0, 1)
+    indexed = id_index.get("customer", customer["id"])
+    assert indexed["EditSequence"] == mock_bridge.tables["customer"][list_id].findtext("EditSequence")
+
+    # Someone edits the customer in QuickBooks, so the indexed EditSequence is out of date.
+    mock_bridge.handle(
+        '<?xml version="1.0" ?><QBXML><QBXMLMsgsRq onError="stopOnError"><CustomerModRq requestID="0">'
+        f'<CustomerMod><ListID>{list_id}</ListID><EditSequence>{indexed["EditSequence"]}</EditSequence>'
+        '<Phone>555-0100</Phone></CustomerMod></CustomerModRq></QBXMLMsgsRq></QBXML>')
+    customer["note"] = "Second update"
+    result = update_customer_in_qb(customer)
+
+    assert "error" not in result and result["Notes"] == "Second update"
+    # The stale Mod failed, the customer was queried once and the Mod sent again.
+    assert mock_bridge.counts["CustomerQueryRq"] == 1
+    assert _customer_mod_count(mock_bridge) == 1 + 1 + 2
+    assert id_index.get("customer", customer["id"])["EditSequence"] == result["EditSequence"]
@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+
+import pytest
+
+from benchmarks import payloads
+from sync_scripts import idempotency, json_backend
+
+
+@pytest.fixture
+def keys(state_db, monkeypatch):
+    """Idempotency keys with an empty in-process cache."""
+    monkeypatch.setattr(idempotency, "_cache", type(idempotency._cache)())
+    return idempotency
+
+
+def test_request_key_prefers_the_webhook_id(keys):
+    assert keys.request_key("order.create", "abc", b"{}", 1) == "order.create:webhook:abc"
+    by_body = keys.request_key("order.create", None, b'{"id": 1}', 1)
+    assert by_body == keys.request_key("order.create", None, '{"id": 1}', 1)
+    assert by_body != keys.request_key("order.create", None, b'{"id": 1, "note": "x"}', 1)
+
+
+def test_first_delivery_claims_and_redeliveries_get_its_response(keys):
+    assert keys.claim("k") == (True, None)
+    assert keys.claim("k") == (False, None)
+    keys.complete("k", 200, '{"ok": true}')
+
+    assert keys.claim("k") == (False, (200, '{"ok": true}'))
+    # Also from the shared table when this process has not cached it.
+    keys._cache.clear()
+    assert keys.lookup("k") == (200, '{"ok": true}')
+
+
+def test_error_responses_release_the_key(keys):
+    assert keys.claim("k") == (True, None)
+    keys.complete("k", 500, '{"error": "down"}')
+
+    assert keys.lookup("k") is None
+    assert keys.claim("k") == (True, None)
+
+
+def test_expired_claim_can_be_taken_over(keys, monkeypatch):
+    monkeypatch.setattr(keys, "PENDING_SECONDS", -1)
+    assert keys.claim("k") == (True, None)
+    assert keys.claim("k") == (True, None)
+
+
+def test_unusable_state_database_processes_the_delivery(keys, monkeypatch):
+    def unavailable():
+        raise sqlite3.OperationalError("unable to open database file")
+
+    monkeypatch.setattr(keys, "get_connection", unavailable)
+    assert keys.claim("k") == (True, None)
+
+
+def test_redelivery_waits_for_the_first_delivery(keys):
+    keys.claim("k")
+    timer = threading.Timer(0.1, keys.complete, args=("k", 201, '{"ok": true}'))
+    timer.start()
+    try:
+        assert keys.wait_for("k", timeout=5) == (201, '{"ok": true}')
+    finally:
+        timer.cancel()
+
+    keys.claim("released")
+    threading.Timer(0.1, keys.release, args=("released",)).start()
+    assert keys.wait_for("released", timeout=5) is None
+
+
+def test_redelivered_webhook_is_not_synced_twice(mock_bridge, keys):
+    from sync_api import app
+
+    customer = payloads.customer(payloads.rng(3), 3)
+    body = json_backend.dumps(customer)
+    headers = {"Content-Type": "application/json", idempotency.WEBHOOK_ID_HEADER: "delivery-1"}
+    client = app.test_client()
+
+    first = client.post("/customer/", data=body, headers=headers)
+    second = client.post("/customer/", data=body, headers=headers)
+
+    assert first.status_code == second.status_code == 200
+    assert second.headers["X-Idempotent-Replay"] == "true"
+    assert second.get_json() == first.get_json()
+    assert mock_bridge.counts["CustomerAddRq"] == 1
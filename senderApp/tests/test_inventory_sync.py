@@ -0,0 +1,66 @@
+import json
+
+import pytest
+import requests
+
+from sync_scripts import inventory_sync, shopify_client
+from sync_scripts.shopify_client import ShopifyClient, ShopifyError
+
+
+class _Response:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": "0"}
+        self._body = body or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+    def json(self):
+        return self._body
+
+
+def _client(monkeypatch, *responses):
+    client = ShopifyClient(store_url="http://shopify.test", access_token="token")
+    replies = iter(responses)
+    monkeypatch.setattr(client.session, "post", lambda *args, **kwargs: next(replies))
+    monkeypatch.setattr(shopify_client, "MAX_THROTTLE_RETRIES", 1)
+    return client
+
+
+def _errors(code, message="failed"):
+    return {"errors": [{"message": message, "extensions": {"code": code}}]}
+
+
+@pytest.mark.parametrize("responses, retryable", [
+    ([_Response(body=_errors("INTERNAL_SERVER_ERROR"))], True),
+    ([_Response(429), _Response(429)], True),
+    ([_Response(body=_errors("THROTTLED"))] * 2, True),
+    ([_Response(body=_errors("ACCESS_DENIED"))], False),
+    ([_Response(body={"errors": [{"message": "Field 'x' doesn't exist on type 'Query'"}]})], False),
+])
+def test_shopify_errors_say_whether_a_retry_can_help(monkeypatch, responses, retryable):
+    client = _client(monkeypatch, *responses)
+
+    with pytest.raises(ShopifyError) as raised:
+        client.graphql("{ shop { name } }", expected_cost=1)
+
+    assert raised.value.retryable is retryable
+
+
+@pytest.mark.parametrize("error, expected", [
+    (ShopifyError("Shopify kept throttling the request after 5 retries.", retryable=True), None),
+    (ShopifyError("Shopify GraphQL error: Internal error", [{"extensions": {"code": "INTERNAL_SERVER_ERROR"}}]), None),
+    (requests.HTTPError("503 Server Error"), None),
+    (requests.ConnectionError("connection reset"), None),
+    (ShopifyError("Shopify GraphQL error: Access denied", [{"extensions": {"code": "ACCESS_DENIED"}}]),
+     {"error": "Shopify GraphQL error: Access denied"}),
+])
+def test_inventory_job_retries_only_transient_failures(monkeypatch, error, expected):
+    def sync_inventory(**options):
+        raise error
+
+    monkeypatch.setattr(inventory_sync, "sync_inventory", sync_inventory)
+
+    assert inventory_sync.run_inventory_job(json.dumps({"full": False})) == expected
@@ -0,0 +1,83 @@
+import xml.etree.ElementTree as ET
+
+from dev_tools.mock_qb_bridge import MockCompany
+from sync_scripts import item_catalog as item_catalog_module
+from sync_scripts.item_catalog import ItemCatalog
+from sync_scripts.watermarks import is_newer
+
+
+def _envelope(request):
+    return f'<?xml version="1.0" ?><QBXML><QBXMLMsgsRq onError="stopOnError">{request}</QBXMLMsgsRq></QBXML>'
+
+
+def test_items_written_during_a_full_reload_survive_the_swap(monkeypatch):
+    monkeypatch.setattr(item_catalog_module, "PAGE_SIZE", 2)
+    company = MockCompany(items=5, seed=1)
+    pages = []
+
+    def sender(xml):
+        response = company.handle(xml)
+        pages.append(xml)
+        if len(pages) == 1:
+            # A product sync adds an item while the catalog is paging through the item list.
+            added = company.handle(_envelope(
+                '<ItemInventoryAddRq requestID="1"><ItemInventoryAdd><Name>NEW-SKU</Name></ItemInventoryAdd>'
+                '</ItemInventoryAddRq>'))
+            catalog.update_from_ret(ET.fromstring(added).find(".//ItemInventoryRet"))
+            # An out-of-date record (e.g. a late reply) must not overwrite the newer loaded one.
+            catalog.update_from_ret({"Name": "SKU-000003", "ListID": "OLD", "EditSequence": "1",
+                                     "TimeModified": "2000-01-01T00:00:00+00:00"})
+        return response
+
+    catalog = ItemCatalog(sender=sender)
+    # Lookups would otherwise start a delta refresh that also finds the new item.
+    monkeypatch.setattr(catalog, "_refresh_if_stale", lambda: None)
+    catalog.refresh(full=True)
+
+    assert len(pages) > 2
+    assert catalog.get("NEW-SKU") is not None
+    assert catalog.get("SKU-000003").list_id == company.names["item"]["SKU-000003"]
+
+
+def test_full_load_pages_through_the_items_and_deltas_start_at_the_watermark(monkeypatch):
+    monkeypatch.setattr(item_catalog_module, "PAGE_SIZE", 2)
+    company = MockCompany(items=5, seed=1)
+    for i, ret in enumerate(company.tables["item"].values()):
+        ret.find("TimeModified").text = f"2024-01-{i + 1:02d}T00:00:00+00:00"
+    watermark = max(ret.findtext("TimeModified") for ret in company.tables["item"].values())
+    envelopes = []
+
+    def sender(xml):
+        envelopes.append(xml)
+        return company.handle(xml)
+
+    catalog = ItemCatalog(sender=sender)
+    monkeypatch.setattr(catalog, "_refresh_if_stale", lambda: None)
+
+    received = catalog.refresh()
+    assert received == len(company.tables["item"]) == len(catalog)
+    assert len(envelopes) == (received + 1) // 2
+    assert catalog._watermark == watermark
+    assert catalog.get("SKU-000002").quantity_on_hand is not None
+
+    # In QuickBooks, SKU-000001 is made inactive and a new item is added.
+    sku_1 = company.tables["item"][company.names["item"]["SKU-000001"]]
+    company.handle(_envelope(
+        '<ItemInventoryModRq requestID="1"><ItemInventoryMod>'
+        f'<ListID>{sku_1.findtext("ListID")}</ListID><EditSequence>{sku_1.findtext("EditSequence")}</EditSequence>'
+        '<IsActive>false</IsActive></ItemInventoryMod></ItemInventoryModRq>'))
+    company.handle(_envelope(
+        '<ItemInventoryAddRq requestID="1"><ItemInventoryAdd><Name>NEW-SKU</Name></ItemInventoryAdd>'
+        '</ItemInventoryAddRq>'))
+    del envelopes[:]
+
+    received = catalog.refresh()
+
+    assert f"<FromModifiedDate>{watermark}</FromModifiedDate>" in envelopes[0]
+    assert "<ActiveStatus>All</ActiveStatus>" in envelopes[0]
+    # The item at the watermark itself (FromModifiedDate is inclusive) and the two changed ones.
+    assert received == 3
+    assert catalog.get("SKU-000001") is None
+    assert catalog.get("NEW-SKU") is not None
+    assert catalog.get("SKU-000000") is not None
+    assert is_newer(catalog._watermark, watermark)
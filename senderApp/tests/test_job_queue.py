@@ -0,0 +1,123 @@
+import json
+import os
+import time
+
+import pytest
+
+from benchmarks import payloads
+from sync_scripts import job_queue, qb_client
+import sync_scripts.customer_sync  # noqa: F401 (registers handlers)
+
+
+def _claim_ids():
+    """Claims jobs until none is available and returns their IDs in claim order."""
+    claimed = []
+    while True:
+        row = job_queue.claim_next()
+        if row is None:
+            return claimed
+        claimed.append(row["id"])
+
+
+def _row(conn, job_id):
+    return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def _finish(job_id):
+    job_queue._finish(job_id, job_queue.SUCCEEDED, result={"ok": True})
+
+
+def test_jobs_for_one_entity_are_claimed_one_at_a_time_in_order(state_db):
+    first = job_queue.enqueue("test.kind", "1", entity_key="customer:1")
+    second = job_queue.enqueue("test.kind", "2", entity_key="customer:1")
+    other = job_queue.enqueue("test.kind", "3", entity_key="customer:2")
+    unkeyed = job_queue.enqueue("test.kind", "4")
+
+    # The second job for customer:1 waits while the first one runs; other entities do not.
+    assert _claim_ids() == [first, other, unkeyed]
+    _finish(first)
+    assert _claim_ids() == [second]
+
+
+def test_retried_job_keeps_later_jobs_of_its_entity_waiting(state_db):
+    first = job_queue.enqueue("test.kind", "1", entity_key="order:1")
+    second = job_queue.enqueue("test.kind", "2", entity_key="order:1")
+    row = job_queue.claim_next()
+    job_queue._retry_later(row["id"], 1, "timeout")
+
+    assert row["id"] == first
+    assert job_queue.claim_next() is None
+    assert job_queue.get_job(second)["status"] == job_queue.QUEUED
+
+
+def test_coalescing_replaces_the_payload_of_a_queued_job_only(state_db):
+    first = job_queue.enqueue("customer.update", {"v": 1}, entity_key="customer:1", coalesce=True)
+    assert job_queue.enqueue("customer.update", {"v": 2}, entity_key="customer:1", coalesce=True) == first
+    # Not coalesced: another kind, another entity, or a caller that asked for its own job.
+    assert job_queue.enqueue("customer.create", {"v": 3}, entity_key="customer:1", coalesce=True) != first
+    assert job_queue.enqueue("customer.update", {"v": 4}, entity_key="customer:2", coalesce=True) != first
+    assert job_queue.enqueue("customer.update", {"v": 5}, entity_key="customer:1") != first
+
+    row = job_queue.claim_next()
+    assert row["id"] == first and json.loads(row["payload"]) == {"v": 2}
+
+    # Once the job runs, a newer payload gets a job of its own.
+    later = job_queue.enqueue("customer.update", {"v": 6}, entity_key="customer:1", coalesce=True)
+    assert later != first
+
+
+def test_transport_failures_are_retried_with_backoff_then_failed(state_db, monkeypatch):
+    monkeypatch.setattr(job_queue, "MAX_ATTEMPTS", 3)
+    monkeypatch.setitem(job_queue._handlers, "test.flaky", lambda payload: None)
+    job_id = job_queue.enqueue("test.flaky", "{}")
+
+    for attempt in (1, 2):
+        before = time.time()
+        job_queue.run_job(job_queue.claim_next())
+        job = _row(state_db, job_id)
+        assert (job["status"], job["attempts"]) == (job_queue.QUEUED, attempt)
+        assert job["available_at"] == pytest.approx(before + 2 ** attempt, abs=1)
+        # Not available again until the backoff has passed.
+        assert job_queue.claim_next() is None
+        state_db.execute("UPDATE jobs SET available_at = 0 WHERE id = ?", (job_id,))
+
+    job_queue.run_job(job_queue.claim_next())
+    job = job_queue.get_job(job_id)
+    assert (job["status"], job["attempts"]) == (job_queue.FAILED, 3)
+
+
+def test_expired_lease_is_claimed_again(state_db):
+    job_id = job_queue.enqueue("test.kind", "{}", entity_key="customer:1")
+    waiting = job_queue.enqueue("test.kind", "{}", entity_key="customer:1")
+    assert job_queue.claim_next()["id"] == job_id
+    assert job_queue.claim_next() is None
+
+    state_db.execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ?", (time.time() - 1, job_id))
+    row = job_queue.claim_next()
+    assert (row["id"], row["attempts"]) == (job_id, 1)
+    assert _row(state_db, waiting)["status"] == job_queue.QUEUED
+
+
+def test_customer_job_syncs_against_the_bridge(mock_bridge):
+    customer = payloads.customer(payloads.rng(1), 1)
+    job_id = job_queue.enqueue("customer.create", customer, entity_key="customer:1")
+
+    job_queue.run_job(job_queue.claim_next())
+
+    job = job_queue.get_job(job_id)
+    assert job["status"] == job_queue.SUCCEEDED
+    assert job["result"]["ListID"] in mock_bridge.tables["customer"]
+    assert mock_bridge.counts["CustomerAddRq"] == 1
+
+
+def test_customer_job_is_retried_when_the_bridge_is_down(state_db, monkeypatch):
+    client = qb_client.QBClient(server_url="http://127.0.0.1:9/qbxml")
+    monkeypatch.setattr(qb_client, "_client", client)
+    monkeypatch.setattr(qb_client, "_client_pid", os.getpid())
+    job_id = job_queue.enqueue("customer.create", payloads.customer(payloads.rng(2), 2), entity_key="customer:2")
+
+    job_queue.run_job(job_queue.claim_next())
+
+    job = job_queue.get_job(job_id)
+    assert (job["status"], job["attempts"]) == (job_queue.QUEUED, 1)
+    assert job["result"] is None
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from sync_scripts import json_backend
+from sync_scripts.json_backend import JSONDecodeError, parse_payload
+
+ORDER = {"id": 820982911946154508, "email": "jöns@example.com", "total_price": "199.00", "taxes_included": False,
+         "line_items": [{"sku": "SKU-1", "quantity": 2, "price": 12.5, "properties": []}], "note": None}
+
+
+@pytest.fixture(params=[
+    False,
+    pytest.param(True, marks=pytest.mark.skipif(json_backend.orjson is None, reason="orjson is not installed")),
+], ids=["json", "orjson"])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(json_backend, "USE_ORJSON", request.param)
+    return json_backend
+
+
+def test_backends_round_trip_to_the_same_compact_json(backend):
+    text = backend.dumps(ORDER)
+
+    assert text == json.dumps(ORDER, separators=(",", ":"), ensure_ascii=False)
+    assert backend.dumps_bytes(ORDER) == text.encode("utf-8")
+    assert backend.loads(text) == backend.loads(text.encode("utf-8")) == ORDER
+
+
+def test_objects_orjson_cannot_encode_fall_back_to_the_standard_library(backend):
+    assert backend.dumps({"id": 2 ** 70, 1: "non-string key"}) == '{"id":1180591620717411303424,"1":"non-string key"}'
+    assert backend.dumps_bytes({"when": object()}, default=lambda value: "converted") == b'{"when":"converted"}'
+
+
+def test_malformed_json_raises_json_decode_error(backend):
+    with pytest.raises(JSONDecodeError):
+        backend.loads('{"id": ')
+
+
+def test_parse_payload_only_parses_strings(backend):
+    assert parse_payload(ORDER) is ORDER
+    assert parse_payload(json.dumps(ORDER)) == ORDER
+    with pytest.raises(TypeError):
+        parse_payload("[1, 2]")
+    # The sync functions catch both; which one depends on the backend.
+    with pytest.raises((TypeError, JSONDecodeError)):
+        parse_payload(None)
+    with pytest.raises(JSONDecodeError):
+        parse_payload("not json")
+
+
+def test_routes_pass_the_parsed_payload_to_the_sync_function(state_db, monkeypatch):
+    from api_routes import customer_routes
+    from sync_api import app
+
+    received = []
+    monkeypatch.setattr(customer_routes, "wants_async", lambda: False)
+    monkeypatch.setattr(customer_routes, "create_customer_to_qb",
+                        lambda payload: received.append(payload) or {"ListID": "80-1"})
+
+    response = app.test_client().post("/customer/", json={"id": 24, "first_name": "Jo"})
+
+    assert response.status_code == 200
+    assert received == [{"id": 24, "first_name": "Jo"}]
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+import requests
+
+from dev_tools.mock_qb_bridge import MockCompany
+from sync_scripts.list_export import export_list, read_export
+
+SKUS = [f"SKU-{i:06d}" for i in range(7)]
+
+
+def _interrupted_sender(company, fail_at):
+    """Answers from `company` but fails envelope number `fail_at` once, like a dropped connection."""
+    envelopes = []
+    sent = []
+
+    def sender(xml):
+        envelopes.append(xml)
+        sent.append(xml)
+        if len(sent) == fail_at:
+            raise requests.ConnectionError("bridge went away")
+        return company.handle(xml)
+    return sender, envelopes
+
+
+def _names(path):
+    return [record["Name"] for record in read_export(path)]
+
+
+def test_interrupted_export_resumes_from_its_checkpoint(state_db, tmp_path):
+    company = MockCompany(items=7, seed=1)
+    path = str(tmp_path / "items.jsonl")
+    sender, envelopes = _interrupted_sender(company, fail_at=3)
+
+    with pytest.raises(requests.ConnectionError):
+        export_list("item_inventory", path, page_size=2, sender=sender)
+    assert not os.path.exists(path)
+    assert _names(path + ".partial") == SKUS[:4]
+
+    del envelopes[:]
+    assert export_list("item_inventory", path, page_size=2, sender=sender) == 7
+
+    # The iterator is continued, not started again, and no page is written twice.
+    assert all('iterator="Continue"' in xml for xml in envelopes)
+    assert _names(path) == SKUS
+    assert not os.path.exists(path + ".partial") and not os.path.exists(path + ".checkpoint")
+
+
+def test_export_starts_over_when_quickbooks_dropped_the_iterator(state_db, tmp_path):
+    company = MockCompany(items=7, seed=1)
+    path = str(tmp_path / "items.jsonl")
+    sender, envelopes = _interrupted_sender(company, fail_at=2)
+    with pytest.raises(requests.ConnectionError):
+        export_list("item_inventory", path, page_size=2, sender=sender)
+
+    # E.g. the company file was closed and reopened in the meantime.
+    company.iterators.clear()
+    del envelopes[:]
+    assert export_list("item_inventory", path, page_size=2, sender=sender) == 7
+
+    assert 'iterator="Continue"' in envelopes[0] and 'iterator="Start"' in envelopes[1]
+    assert _names(path) == SKUS
+
+
+def test_setup_lists_are_exported_in_one_request(state_db, tmp_path):
+    company = MockCompany(seed=1)
+    path = str(tmp_path / "currency.jsonl")
+    envelopes = []
+
+    def sender(xml):
+        envelopes.append(xml)
+        return company.handle(xml)
+
+    count = export_list("currency", path, sender=sender)
+
+    assert count == len(company.tables["currency"]) > 0
+    assert len(envelopes) == 1 and "iterator" not in envelopes[0]
+    assert {record["_ret"] for record in read_export(path)} == {"CurrencyRet"}
+
+
+def test_second_export_merges_the_changes_since_the_first(state_db, tmp_path):
+    company = MockCompany(items=3, seed=1)
+    for ret in company.tables["item"].values():
+        ret.find("TimeModified").text = "2024-01-01T00:00:00+00:00"
+    path = str(tmp_path / "items.jsonl")
+    envelopes = []
+
+    def sender(xml):
+        envelopes.append(xml)
+        return company.handle(xml)
+
+    assert export_list("item_inventory", path, page_size=2, sender=sender) == 3
+
+    def mod(sku, body):
+        ret = company.tables["item"][company.names["item"][sku]]
+        company.handle(
+            '<?xml version="1.0" ?><QBXML><QBXMLMsgsRq onError="stopOnError"><ItemInventoryModRq requestID="1">'
+            f'<ItemInventoryMod><ListID>{ret.findtext("ListID")}</ListID>'
+            f'<EditSequence>{ret.findtext("EditSequence")}</EditSequence>{body}</ItemInventoryMod>'
+            '</ItemInventoryModRq></QBXMLMsgsRq></QBXML>')
+
+    mod("SKU-000000", "<SalesPrice>9.99</SalesPrice>")
+    mod("SKU-000001", "<IsActive>false</IsActive>")
+    company.handle(
+        '<?xml version="1.0" ?><QBXML><QBXMLMsgsRq onError="stopOnError"><ItemInventoryAddRq requestID="1">'
+        '<ItemInventoryAdd><Name>NEW-SKU</Name></ItemInventoryAdd></ItemInventoryAddRq></QBXMLMsgsRq></QBXML>')
+    del envelopes[:]
+
+    # The three changes plus SKU-000002, modified at the watermark itself (FromModifiedDate is inclusive).
+    assert export_list("item_inventory", path, page_size=2, sender=sender) == 4
+
+    assert "<FromModifiedDate>2024-01-01T00:00:00+00:00</FromModifiedDate>" in envelopes[0]
+    records = list(read_export(path))
+    assert [record["Name"] for record in records] == ["SKU-000000", "SKU-000002", "NEW-SKU"]
+    assert records[0]["SalesPrice"] == "9.99"
@@ -0,0 +1,18 @@
+import logging
+
+from sync_scripts import log_config
+
+
+def test_configure_leaves_global_record_attributes_alone_by_default(monkeypatch):
+    monkeypatch.setattr(log_config, "_queue_handler", None)
+    monkeypatch.setattr(log_config, "_listener", None)
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    srcfile = logging._srcfile
+    try:
+        log_config.configure()
+        assert logging._srcfile == srcfile is not None
+        assert logging.logThreads and logging.logProcesses and logging.logMultiprocessing
+    finally:
+        log_config._listener.stop()
+        root.handlers[:] = handlers
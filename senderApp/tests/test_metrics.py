@@ -0,0 +1,69 @@
+import json
+import time
+
+import pytest
+
+from sync_scripts import metrics
+
+OK = ("customer", "create", "ok")
+
+
+@pytest.fixture
+def fresh_metrics(state_db, monkeypatch):
+    """Empty in-memory metrics for a process named "test" (no flush thread)."""
+    monkeypatch.setattr(metrics, "_values", {})
+    monkeypatch.setattr(metrics, "_flushed", {})
+    monkeypatch.setattr(metrics, "_process", "test")
+    return state_db
+
+
+def _write_snapshot(conn, process, value, updated_at=None):
+    data = {"sync_operations_total": [[list(OK), value]]}
+    conn.execute("INSERT OR REPLACE INTO metrics_snapshots (process, updated_at, data) VALUES (?, ?, ?)",
+                 (process, time.time() if updated_at is None else updated_at, json.dumps(data)))
+
+
+def _ok_total(merged):
+    return merged.get(("sync_operations_total", OK), 0)
+
+
+def _rows(conn):
+    """The ok count stored in each process's row."""
+    rows = {}
+    for row in conn.execute("SELECT process, data FROM metrics_snapshots"):
+        merged = {}
+        metrics._merge(merged, json.loads(row["data"]))
+        rows[row["process"]] = _ok_total(merged)
+    return rows
+
+
+def test_scrape_merges_all_processes_with_unflushed_counts_without_writing(fresh_metrics, monkeypatch):
+    _write_snapshot(fresh_metrics, "other", 5)
+    metrics.count("sync_operations_total", OK, 2)
+    metrics.flush()
+    metrics.count("sync_operations_total", OK, 1)
+
+    def no_writes(*args, **kwargs):
+        raise AssertionError("a scrape must not write metrics")
+
+    monkeypatch.setattr(metrics, "flush", no_writes)
+    monkeypatch.setattr(metrics, "_retire", no_writes)
+    rows_before = fresh_metrics.execute("SELECT process, updated_at, data FROM metrics_snapshots").fetchall()
+
+    assert _ok_total(metrics.collect()) == 8
+    assert 'sync_operations_total{entity="customer",operation="create",outcome="ok"} 8' in metrics.render()
+    assert fresh_metrics.execute("SELECT process, updated_at, data FROM metrics_snapshots").fetchall() == rows_before
+
+
+def test_retiring_a_live_process_does_not_count_it_twice(fresh_metrics):
+    metrics.count("sync_operations_total", OK, 2)
+    metrics.flush()
+    # The process stalls past RETIRE_SECONDS and another process folds its row into "retired".
+    metrics._retire(fresh_metrics, time.time() + 1)
+    assert _rows(fresh_metrics) == {metrics.RETIRED: 2}
+
+    metrics.count("sync_operations_total", OK, 3)
+    metrics.flush()
+
+    assert _rows(fresh_metrics) == {metrics.RETIRED: 2, "test": 3}
+    assert _ok_total(metrics.collect()) == 5
@@ -0,0 +1,86 @@
+import xml.etree.ElementTree as ET
+
+from dev_tools.mock_qb_bridge import MockCompany, start_mock_bridge
+from sync_scripts.qb_client import QBClient
+
+
+def _envelope(*requests, on_error="stopOnError"):
+    """Wraps (tag, body) or (tag, body, attributes) requests in a QBXML envelope."""
+    parts = []
+    for i, (tag, inner, *attributes) in enumerate(requests):
+        parts.append(f'<{tag} requestID="{i}"{"".join(attributes)}>{inner}</{tag}>')
+    body = "".join(parts)
+    return f'<?xml version="1.0" ?><QBXML><QBXMLMsgsRq onError="{on_error}">{body}</QBXMLMsgsRq></QBXML>'
+
+
+def _statuses(response):
+    return [rs.get("statusCode") for rs in ET.fromstring(response).find("QBXMLMsgsRs")]
+
+
+def _add_customer(name):
+    return ("CustomerAddRq", f"<CustomerAdd><Name>{name}</Name></CustomerAdd>")
+
+
+def test_adds_assign_ids_and_names_must_be_unique():
+    company = MockCompany()
+    response = company.handle(_envelope(_add_customer("Jane Doe"), _add_customer("Jane Doe"), on_error="continueOnError"))
+
+    assert _statuses(response) == ["0", "3100"]
+    ret = ET.fromstring(response).find(".//CustomerRet")
+    assert ret.findtext("ListID") in company.tables["customer"]
+    assert ret.findtext("FullName") == "Jane Doe"
+
+
+def test_mods_need_an_existing_object_and_the_current_edit_sequence():
+    company = MockCompany()
+    ret = ET.fromstring(company.handle(_envelope(_add_customer("Jane Doe")))).find(".//CustomerRet")
+    list_id, edit_sequence = ret.findtext("ListID"), ret.findtext("EditSequence")
+
+    def mod(object_id, sequence):
+        return ("CustomerModRq", f"<CustomerMod><ListID>{object_id}</ListID><EditSequence>{sequence}</EditSequence>"
+                                 "<Email>jane@example.com</Email></CustomerMod>")
+
+    response = company.handle(_envelope(mod("NOPE", edit_sequence), mod(list_id, "1"), mod(list_id, edit_sequence),
+                                        on_error="continueOnError"))
+
+    assert _statuses(response) == ["3120", "3200", "0"]
+    assert company.tables["customer"][list_id].findtext("Email") == "jane@example.com"
+    assert int(company.tables["customer"][list_id].findtext("EditSequence")) > int(edit_sequence)
+
+
+def test_stop_on_error_skips_the_rest_of_the_envelope():
+    company = MockCompany()
+    response = company.handle(_envelope(_add_customer("A"), _add_customer("A"), _add_customer("B")))
+
+    assert _statuses(response) == ["0", "3100"]
+    assert "B" not in company.names["customer"]
+
+
+def test_iterator_queries_page_through_the_items():
+    company = MockCompany(items=5, seed=1)
+    first = ET.fromstring(company.handle(_envelope(
+        ("ItemInventoryQueryRq", "<MaxReturned>3</MaxReturned>", ' iterator="Start"')))).find(".//ItemInventoryQueryRs")
+    assert first.get("iteratorRemainingCount") == "2"
+
+    rest = ET.fromstring(company.handle(_envelope(
+        ("ItemInventoryQueryRq", "<MaxReturned>3</MaxReturned>",
+         f' iterator="Continue" iteratorID="{first.get("iteratorID")}"')))).find(".//ItemInventoryQueryRs")
+    names = [ret.findtext("Name") for ret in [*first, *rest]]
+
+    assert rest.get("iteratorRemainingCount") == "0"
+    assert names == [f"SKU-{i:06d}" for i in range(5)]
+
+
+def test_http_bridge_answers_the_qb_client():
+    server, base_url, company = start_mock_bridge(items=50, seed=1)
+    client = QBClient(server_url=base_url + "/qbxml")
+    try:
+        # Large enough that the bridge gzips its reply.
+        response = client.send(_envelope(("ItemInventoryQueryRq", "")))
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+    assert len(ET.fromstring(response).findall(".//ItemInventoryRet")) == 50
+    assert company.counts == {"ItemInventoryQueryRq": 1}
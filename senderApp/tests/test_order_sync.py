@@ -0,0 +1,64 @@
+from benchmarks import payloads
+from sync_scripts import id_index
+from sync_scripts.customer_sync import create_customer_to_qb
+from sync_scripts.order_sync import create_order_to_qb, update_order_in_qb
+
+
+def _customer(shopify_id, company):
+    customer = payloads.customer(payloads.rng(shopify_id), shopify_id)
+    customer["default_address"]["company"] = company
+    return customer
+
+
+def _order(order_id, customer):
+    order = payloads.order(payloads.rng(order_id), order_id, lines=2)
+    order["customer"] = customer
+    for line in order["line_items"]:
+        line["sku"] = "SKU-000001"
+    return order
+
+
+def _customer_ref(company, txn_id):
+    return company.tables["sales_order"][txn_id].findtext("CustomerRef/ListID")
+
+
+def test_order_for_existing_unindexed_customer_links_and_indexes_it(mock_bridge):
+    customer = _customer(9001, "Existing Co 9001")
+    list_id = create_customer_to_qb(customer)["ListID"]
+    id_index.forget("customer", 9001)
+
+    first = create_order_to_qb(_order(9101, customer))
+    assert "error" not in first
+    assert _customer_ref(mock_bridge, first["TxnID"]) == list_id
+    assert id_index.get("customer", 9001)["ListID"] == list_id
+
+    adds = mock_bridge.counts["CustomerAddRq"]
+    second = create_order_to_qb(_order(9102, customer))
+    assert _customer_ref(mock_bridge, second["TxnID"]) == list_id
+    assert mock_bridge.counts["CustomerAddRq"] == adds
+
+
+def test_order_is_not_linked_to_another_customer_with_the_same_name(mock_bridge):
+    create_customer_to_qb(_customer(9002, "Same Name Ltd"))
+
+    result = create_order_to_qb(_order(9103, _customer(9003, "Same Name Ltd")))
+
+    assert result["statusCode"] == "3100"
+    assert "not Shopify customer 9003" in result["error"]
+    assert mock_bridge.tables["sales_order"] == {}
+    assert id_index.get("customer", 9003) is None
+
+
+def test_order_update_resolves_an_unindexed_customer_by_name(mock_bridge):
+    customer = _customer(9004, "Update Co 9004")
+    order = _order(9104, customer)
+    created = create_order_to_qb(order)
+    list_id = id_index.get("customer", 9004)["ListID"]
+    id_index.forget("customer", 9004)
+
+    order["line_items"][0]["quantity"] += 1
+    updated = update_order_in_qb(order)
+
+    assert "error" not in updated
+    assert _customer_ref(mock_bridge, created["TxnID"]) == list_id
+    assert id_index.get("customer", 9004)["ListID"] == list_id
@@ -0,0 +1,43 @@
+import json
+import os
+
+from sync_scripts import payload_archive
+from sync_scripts.payload_archive import PayloadArchive, find_payloads, iter_archive, prune
+
+
+def test_payloads_are_written_off_the_caller_and_found_by_shopify_id(state_db, tmp_path):
+    archive = PayloadArchive(directory=str(tmp_path))
+    archive.submit("order", '{"id": 1, "total_price": "10.00"}', 1, "create")
+    archive.submit("customer", {"id": 7, "email": "a@example.com"}, 7, "update")
+    archive.submit("order", '{"id": 1, "total_price": "12.50"}', 1, "update")
+    assert archive.flush()
+
+    records = find_payloads("order", 1, directory=str(tmp_path))
+    # Newest first, with the JSON text stored as sent.
+    assert [(record["event"], record["payload"]["total_price"]) for record in records] == [
+        ("update", "12.50"), ("create", "10.00")]
+    assert find_payloads("customer", 7, directory=str(tmp_path))[0]["payload"] == {"id": 7, "email": "a@example.com"}
+    assert [record["kind"] for record in iter_archive(str(tmp_path))] == ["order", "customer", "order"]
+    assert [record["kind"] for record in iter_archive(str(tmp_path), kinds={"customer"})] == ["customer"]
+
+
+def test_segments_rotate_and_the_oldest_are_pruned_with_their_index(state_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(payload_archive, "SEGMENT_BYTES", 1)
+    monkeypatch.setattr(payload_archive, "RETENTION_DAYS", 0)
+    archive = PayloadArchive(directory=str(tmp_path))
+    for i in range(3):
+        archive.submit("order", json.dumps({"id": i, "note": "x" * 200}), i)
+        # One frame per payload, so each lands in a segment of its own.
+        assert archive.flush()
+    segments = payload_archive._segments(str(tmp_path))
+    assert len(segments) == 3
+    for age, path in enumerate(reversed(segments)):
+        os.utime(path, (1_700_000_000 - age, 1_700_000_000 - age))
+
+    newest_size = os.path.getsize(segments[-1])
+    assert prune(str(tmp_path), retention_days=0, max_bytes=newest_size) == 2
+
+    assert payload_archive._segments(str(tmp_path)) == segments[-1:]
+    assert find_payloads("order", 0, directory=str(tmp_path)) == []
+    assert [record["id"] for record in iter_archive(str(tmp_path))] == ["2"]
+    assert state_db.execute("SELECT COUNT(*) FROM payload_archive_index").fetchone()[0] == 1
@@ -0,0 +1,46 @@
+from sync_scripts.item_catalog import item_catalog
+from sync_scripts.product_sync import sync_product_to_qb
+
+
+def _product(*variants):
+    return {"id": 16, "title": "Shirt", "variants": [
+        {"id": 160 + i, "title": title, "sku": sku, "price": price} for i, (title, sku, price) in enumerate(variants)
+    ]}
+
+
+def test_variants_are_added_then_modified_in_one_envelope_each(mock_bridge):
+    product = _product(("Small", "SHIRT-S", "19.99"), ("Medium", "SHIRT-M", "21.99"), ("Large", "", "23.99"))
+
+    result = sync_product_to_qb(product)
+
+    assert [(item["sku"], item["action"]) for item in result["items"]] == [("SHIRT-S", "added"), ("SHIRT-M", "added")]
+    assert result["skipped_variants"] == [162]
+    assert mock_bridge.counts == {"ItemInventoryAddRq": 2}
+    item = mock_bridge.tables["item"][mock_bridge.names["item"]["SHIRT-S"]]
+    assert (item.findtext("SalesDesc"), item.findtext("SalesPrice")) == ("Shirt - Small", "19.99")
+    assert item_catalog.get("SHIRT-M").list_id == result["items"][1]["ListID"]
+
+    # The catalog now knows both items: a price change goes straight to ItemInventoryMod.
+    product["variants"][0]["price"] = "17.99"
+    result = sync_product_to_qb(product)
+
+    assert [item["action"] for item in result["items"]] == ["modified", "modified"]
+    assert mock_bridge.counts == {"ItemInventoryAddRq": 2, "ItemInventoryModRq": 2}
+    assert item.findtext("SalesPrice") == "17.99"
+
+    # Shopify re-sends the same product: nothing to send.
+    assert sync_product_to_qb(product)["status"] == "unchanged"
+    assert sum(mock_bridge.counts.values()) == 4
+
+
+def test_items_missing_from_the_catalog_are_looked_up_and_modified(mock_bridge):
+    # SKU-000001 exists in QuickBooks, but the item catalog has not been loaded.
+    result = sync_product_to_qb(_product(("Blue", "SKU-000001", "5.00"), ("Red", "SHIRT-RED", "6.00")))
+
+    assert "error" not in result
+    assert {item["sku"]: item["action"] for item in result["items"]} == {"SKU-000001": "modified",
+                                                                        "SHIRT-RED": "added"}
+    # The add of SKU-000001 failed with 3100, so it was queried and sent again as a mod.
+    assert mock_bridge.counts == {"ItemInventoryAddRq": 2, "ItemInventoryQueryRq": 1, "ItemInventoryModRq": 1}
+    item = mock_bridge.tables["item"][mock_bridge.names["item"]["SKU-000001"]]
+    assert item.findtext("SalesPrice") == "5.00"
@@ -0,0 +1,82 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from sync_scripts import qb_client
+from sync_scripts.qb_client import QBClient, QBResponseError
+
+ENVELOPE = ('<?xml version="1.0" ?><QBXML><QBXMLMsgsRq onError="stopOnError">'
+            '<CurrencyQueryRq requestID="0">{}</CurrencyQueryRq></QBXMLMsgsRq></QBXML>')
+
+
+def _requests_sent(client):
+    """Records the prepared request of every response the client receives."""
+    sent = []
+    client.session.hooks["response"].append(lambda response, *args, **kwargs: sent.append(response.request))
+    return sent
+
+
+def test_consecutive_calls_reuse_one_kept_alive_connection(mock_bridge):
+    client = qb_client.get_qb_client()
+
+    for _ in range(5):
+        assert "<CurrencyQueryRs" in qb_client.send_qbxml(ENVELOPE.format(""))
+
+    pools = client.session.get_adapter(client.server_url).poolmanager.pools
+    [key] = pools.keys()
+    assert pools[key].num_connections == 1
+    assert mock_bridge.counts["CurrencyQueryRq"] == 5
+
+
+def test_large_request_bodies_are_gzipped_when_enabled(mock_bridge):
+    client = QBClient(server_url=qb_client.get_qb_client().server_url, gzip_requests=True)
+    sent = _requests_sent(client)
+    try:
+        client.send(ENVELOPE.format(""))
+        client.send(ENVELOPE.format("<MaxReturned>1</MaxReturned>" + " " * 2000))
+    finally:
+        client.close()
+
+    assert [request.headers.get("Content-Encoding") for request in sent] == [None, "gzip"]
+    assert mock_bridge.counts["CurrencyQueryRq"] == 2
+
+
+@pytest.mark.parametrize("body", [b'{"status": "ok"}', b"<html>Bad gateway</html>"])
+def test_answer_without_a_qbxml_response_raises(state_db, body):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = QBClient(server_url=f"http://127.0.0.1:{server.server_address[1]}/qbxml")
+    try:
+        with pytest.raises(QBResponseError):
+            client.send(ENVELOPE.format(""))
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_shared_client_is_created_again_in_a_forked_process(monkeypatch):
+    monkeypatch.setattr(qb_client, "_client", None)
+    first = qb_client.get_qb_client()
+    assert qb_client.get_qb_client() is first
+
+    # As seen by a gunicorn worker forked after the parent created its client.
+    monkeypatch.setattr(qb_client, "_client_pid", -1)
+    second = qb_client.get_qb_client()
+
+    assert second is not first
+    assert qb_client.get_qb_client() is second
+    first.close()
+    second.close()
@@ -0,0 +1,67 @@
+from dev_tools.mock_qb_bridge import MockCompany
+from sync_scripts.qbxml_batch import QBXMLBatch, parse_batch_response
+
+
+def _customer_add(name):
+    return f"<CustomerAdd><Name>{name}</Name></CustomerAdd>"
+
+
+def test_requests_share_one_envelope_and_get_their_own_results():
+    company = MockCompany()
+    envelopes = []
+
+    def sender(xml):
+        envelopes.append(xml)
+        return company.handle(xml)
+
+    batch = QBXMLBatch()
+    currencies = batch.add("CurrencyQueryRq")
+    first = batch.add("CustomerAddRq", _customer_add("Jane Doe"))
+    duplicate = batch.add("CustomerAddRq", _customer_add("Jane Doe"))
+    second = batch.add("CustomerAddRq", _customer_add("John Roe"), request_id="john")
+
+    results = batch.send(sender)
+
+    assert len(envelopes) == 1 and len(batch) == 4
+    assert (currencies, first, duplicate, second) == ("1", "2", "3", "john")
+    assert results[currencies].ok and results[currencies].rets("CurrencyRet")
+    assert results[first].ret("CustomerRet").findtext("Name") == "Jane Doe"
+    # continueOnError: the duplicate fails on its own and the request after it still runs.
+    assert (results[duplicate].ok, results[duplicate].status_code) == (False, "3100")
+    assert results[duplicate].to_error() == {"error": results[duplicate].status_message, "statusCode": "3100"}
+    assert results[second].ok and results[second].rs_tag == "CustomerAddRs"
+
+
+def test_requests_skipped_after_a_stop_on_error_failure_are_reported_as_errors():
+    company = MockCompany()
+    existing = QBXMLBatch()
+    existing.add("CustomerAddRq", _customer_add("Jane Doe"))
+    existing.send(company.handle)
+
+    batch = QBXMLBatch(on_error="stopOnError")
+    duplicate = batch.add("CustomerAddRq", _customer_add("Jane Doe"))
+    skipped = batch.add("CustomerAddRq", _customer_add("John Roe"))
+    results = batch.send(company.handle)
+
+    assert results[duplicate].status_code == "3100"
+    assert not results[skipped].ok
+    assert (results[skipped].rs_tag, results[skipped].status_message) == (
+        "CustomerAddRs", "No response returned for this request.")
+    assert "John Roe" not in company.names["customer"]
+
+
+def test_an_empty_batch_sends_nothing():
+    def sender(xml):
+        raise AssertionError("sent an empty batch")
+
+    assert QBXMLBatch().send(sender) == {}
+
+
+def test_responses_without_a_request_id_are_keyed_by_position():
+    results = parse_batch_response(
+        '<QBXML><QBXMLMsgsRs><CurrencyQueryRs statusCode="0" statusSeverity="Info" statusMessage="OK"/>'
+        '<CustomerQueryRs statusCode="1" statusSeverity="Info" statusMessage="No match"/></QBXMLMsgsRs></QBXML>')
+
+    assert list(results) == ["0", "1"]
+    # statusCode 1 (no matching object) is not a failure.
+    assert results["1"].ok and results["1"].rets() == []
@@ -0,0 +1,81 @@
+import io
+import xml.etree.ElementTree as ET
+
+from sync_scripts import metrics
+from sync_scripts.qbxml_batch import QBXMLBatch
+from sync_scripts.qbxml_stream import QBXMLStream, element_to_record
+
+RESPONSE = """<?xml version="1.0" ?>
+<QBXML><QBXMLMsgsRs>
+<ItemInventoryQueryRs requestID="items" statusCode="0" statusSeverity="Info" statusMessage="Status OK"
+    iteratorRemainingCount="40" iteratorID="{it-1}">
+  <ItemInventoryRet><ListID>1</ListID><Name>SKU-1</Name><QuantityOnHand>5</QuantityOnHand>
+    <DataExtRet><DataExtName>A</DataExtName></DataExtRet><DataExtRet><DataExtName>B</DataExtName></DataExtRet>
+  </ItemInventoryRet>
+  <ItemInventoryRet><ListID>2</ListID><Name>SKU-2</Name><QuantityOnHand>0</QuantityOnHand></ItemInventoryRet>
+</ItemInventoryQueryRs>
+<CustomerQueryRs requestID="none" statusCode="1" statusSeverity="Info" statusMessage="No match" />
+<CustomerAddRs requestID="add" statusCode="3100" statusSeverity="Error" statusMessage="Name &quot;A &amp; B&quot; in use" />
+</QBXMLMsgsRs></QBXML>"""
+
+
+def test_records_and_statuses_of_every_response():
+    stream = QBXMLStream(RESPONSE, expected={"items": "ItemInventoryQueryRs", "lost": "SalesOrderAddRs"})
+    grouped = stream.group_by_request()
+
+    assert list(grouped) == ["items"]
+    assert [tag for tag, _ in grouped["items"]] == ["ItemInventoryRet", "ItemInventoryRet"]
+    first = grouped["items"][0][1]
+    assert first["Name"] == "SKU-1"
+    assert first["DataExtRet"] == [{"DataExtName": "A"}, {"DataExtName": "B"}]
+
+    items = stream.statuses["items"]
+    assert items.ok and (items.iterator_id, items.iterator_remaining_count) == ("{it-1}", 40)
+    # "No match" is informational; QuickBooks errors and unanswered requests are not ok.
+    assert stream.statuses["none"].ok
+    assert stream.statuses["add"].to_error() == {"error": 'Name "A & B" in use', "statusCode": "3100"}
+    assert not stream.statuses["lost"].ok and stream.statuses["lost"].rs_tag == "SalesOrderAddRs"
+
+
+def test_fields_and_tag_filter_from_a_file_object():
+    stream = QBXMLStream(io.BytesIO(RESPONSE.encode()), fields=("ListID", "QuantityOnHand"))
+
+    assert list(stream.records("ItemInventoryRet")) == [
+        {"ListID": "1", "QuantityOnHand": "5"},
+        {"ListID": "2", "QuantityOnHand": "0"},
+    ]
+    assert list(QBXMLStream(RESPONSE).records("CustomerRet")) == []
+
+
+def test_status_is_known_before_the_first_record_is_consumed():
+    stream = QBXMLStream(RESPONSE)
+    records = iter(stream)
+    request_id, _, _ = next(records)
+
+    assert request_id == "items"
+    assert stream.statuses["items"].iterator_remaining_count == 40
+    assert "add" not in stream.statuses
+
+
+def test_element_to_record_keeps_nested_aggregates():
+    element = ET.fromstring("<CustomerRet><BillAddress><Addr1>1 Main</Addr1></BillAddress><Name /></CustomerRet>")
+    assert element_to_record(element) == {"BillAddress": {"Addr1": "1 Main"}, "Name": None}
+
+
+def test_streamed_batch_counts_every_status():
+    batch = QBXMLBatch()
+    for request_id, rq_tag in (("items", "ItemInventoryQueryRq"), ("none", "CustomerQueryRq"),
+                               ("add", "CustomerAddRq"), ("lost", "SalesOrderAddRq")):
+        batch.add(rq_tag, request_id=request_id)
+    metrics.operation("item", "stream_test")
+
+    try:
+        stream = batch.stream(sender=lambda envelope: RESPONSE)
+        assert len(list(stream.records())) == 2
+    finally:
+        metrics.restore_operation(("none", "none"))
+
+    counts = {labels[2:]: value for (metric, labels), value in metrics._values.items()
+              if metric == "sync_qb_responses_total" and labels[:2] == ("item", "stream_test")}
+    assert counts == {("ItemInventoryQuery", "0"): 1, ("CustomerQuery", "1"): 1,
+                      ("CustomerAdd", "3100"): 1, ("SalesOrderAdd", "none"): 1}
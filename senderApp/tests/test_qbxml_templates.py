@@ -0,0 +1,244 @@
+import pytest
+
+from sync_scripts import order_sync
+from sync_scripts.customer_sync import create_customer_add_xml, create_customer_mod_xml
+from sync_scripts.order_sync import create_sales_order_add_xml, create_sales_order_mod_xml
+from sync_scripts.product_sync import create_item_inventory_add_xml, create_item_inventory_mod_xml
+from sync_scripts.qbxml_templates import (
+    ALWAYS,
+    IF_SCOPE,
+    PRESENT,
+    TRUTHY,
+    Field,
+    Fragment,
+    Group,
+    Ref,
+    Repeat,
+    compile_template,
+)
+
+# Golden request bodies: any change to what the sync sends QuickBooks shows up here.
+
+ADDRESS = {
+    "company": "A&B <Co>", "address1": "1 Main St", "address2": "", "city": "Toronto",
+    "province_code": "ON", "zip": "M5V 1A1", "country": "CA", "phone": "555-0100",
+}
+ADDRESS_XML = ("<Addr1>1 Main St</Addr1><City>Toronto</City><State>ON</State>"
+               "<PostalCode>M5V 1A1</PostalCode><Country>CA</Country>")
+
+CURRENCY_MAP = {"CAD": {"ListID": "CUR-CAD", "FullName": "Canadian Dollar"},
+                "USD": {"ListID": "CUR-USD", "FullName": "US Dollar"}}
+CUSTOMER_TYPE_MAP = {"Shopify customers": {"ListID": "CT-1", "FullName": "Shopify customers"}}
+SALES_REP_MAP = {"AS": {"ListID": "SR-1", "FullName": "AS"}}
+
+
+@pytest.fixture
+def order_settings(monkeypatch):
+    """The order_sync item and tax code settings, independent of the environment."""
+    monkeypatch.setattr(order_sync, "SHIPPING_ITEM", "Shipping")
+    monkeypatch.setattr(order_sync, "NO_SKU_ITEM", "")
+    monkeypatch.setattr(order_sync, "TAXABLE_CODE", "Tax")
+    monkeypatch.setattr(order_sync, "NON_TAXABLE_CODE", "Non")
+    monkeypatch.setattr(order_sync, "TAX_MAPPING", {"GST": "GST"})
+
+
+def _customer():
+    return {"id": 42, "first_name": "Ann", "last_name": "O'Neil & Sons", "email": "ann@example.com",
+            "phone": None, "note": "<VIP>", "currency": "USD", "default_address": dict(ADDRESS)}
+
+
+def test_customer_add():
+    xml = create_customer_add_xml(_customer(), CURRENCY_MAP, CUSTOMER_TYPE_MAP, SALES_REP_MAP)
+
+    assert xml == (
+        "<CustomerAdd><Name>A&amp;B &lt;Co&gt;</Name><CompanyName>A&amp;B &lt;Co&gt;</CompanyName>"
+        "<FirstName>Ann</FirstName><LastName>O'Neil &amp; Sons</LastName>"
+        f"<BillAddress>{ADDRESS_XML}</BillAddress><ShipAddress>{ADDRESS_XML}</ShipAddress>"
+        "<Phone>555-0100</Phone><Email>ann@example.com</Email><Notes>&lt;VIP&gt;</Notes>"
+        "<CustomerTypeRef><ListID>CT-1</ListID></CustomerTypeRef><SalesRepRef><ListID>SR-1</ListID></SalesRepRef>"
+        "<CurrencyRef><ListID>CUR-USD</ListID><FullName>US Dollar</FullName></CurrencyRef>"
+        "<DataExtAdd><OwnerID>0</OwnerID><DataExtName>Shopify ID</DataExtName><DataExtValue>42</DataExtValue></DataExtAdd>"
+        "</CustomerAdd>"
+    )
+
+
+def test_customer_add_with_missing_fields():
+    # No address, no reference lists set up in QuickBooks, and a currency QuickBooks does not know.
+    customer = {"id": 7, "first_name": "Bo", "last_name": None, "currency": "JPY"}
+
+    xml = create_customer_add_xml(customer, {}, {}, {})
+
+    assert xml == (
+        "<CustomerAdd><Name>Bo</Name><FirstName>Bo</FirstName><BillAddress></BillAddress><ShipAddress></ShipAddress>"
+        "<DataExtAdd><OwnerID>0</OwnerID><DataExtName>Shopify ID</DataExtName><DataExtValue>7</DataExtValue></DataExtAdd>"
+        "</CustomerAdd>"
+    )
+
+
+@pytest.mark.parametrize("names, expected", [
+    ({"first_name": "Bo", "last_name": "Li"}, "Bo Li"),
+    ({"first_name": None, "last_name": "Li"}, "Li"),
+    ({"last_name": "Li"}, "Li"),
+    ({"first_name": "Bo", "last_name": ""}, "Bo"),
+])
+def test_customer_name_skips_missing_and_null_name_parts(names, expected):
+    # Shopify sends null for names it does not have; they must not become "None Li".
+    customer = {"id": 7, "default_address": {"company": ""}, **names}
+
+    add_xml = create_customer_add_xml(customer, {}, {}, {})
+    mod_xml = create_customer_mod_xml(customer, {"ListID": "80000001-1", "EditSequence": "1"})
+
+    assert f"<Name>{expected}</Name>" in add_xml
+    assert f"<Name>{expected}</Name>" in mod_xml
+
+
+def test_customer_mod():
+    customer = _customer()
+    customer["default_address"]["company"] = ""
+    customer["phone"] = "555-0199"
+
+    xml = create_customer_mod_xml(customer, {"ListID": "80000001-1", "EditSequence": "1700000000"})
+
+    assert xml == (
+        "<CustomerMod><ListID>80000001-1</ListID><EditSequence>1700000000</EditSequence>"
+        "<Name>Ann O'Neil &amp; Sons</Name><FirstName>Ann</FirstName><LastName>O'Neil &amp; Sons</LastName>"
+        f"<BillAddress>{ADDRESS_XML}</BillAddress><ShipAddress>{ADDRESS_XML}</ShipAddress>"
+        "<Phone>555-0199</Phone><Email>ann@example.com</Email><Notes>&lt;VIP&gt;</Notes></CustomerMod>"
+    )
+
+
+def _order():
+    return {
+        "id": 1001, "name": "#1001", "created_at": "2024-05-01T10:00:00-04:00",
+        "billing_address": dict(ADDRESS), "shipping_address": None, "tax_lines": [{"title": "GST"}],
+        "line_items": [
+            {"sku": "SKU-1", "name": "Widget & Co", "title": "Widget", "quantity": 2, "price": "9.99", "taxable": True},
+            {"sku": "", "title": "Gift wrap", "quantity": 1, "price": "0.00"},
+            {"sku": "SKU-2", "title": "Gadget <XL>", "quantity": 1, "price": "5.00", "taxable": False},
+        ],
+        "shipping_lines": [{"title": "Standard", "price": "4.00", "tax_lines": []}],
+    }
+
+
+CUSTOMER_REF = "<CustomerRef><ListID>80000001-1</ListID></CustomerRef>"
+
+
+def _order_lines(tag, new_line=""):
+    return (
+        f"<{tag}>{new_line}<ItemRef><ListID>8000000A-1</ListID></ItemRef><Desc>Widget &amp; Co</Desc>"
+        f"<Quantity>2</Quantity><Rate>9.99</Rate><SalesTaxCodeRef><FullName>Tax</FullName></SalesTaxCodeRef></{tag}>"
+        f"<{tag}>{new_line}<ItemRef><FullName>SKU-2</FullName></ItemRef><Desc>Gadget &lt;XL&gt;</Desc>"
+        f"<Quantity>1</Quantity><Rate>5.00</Rate><SalesTaxCodeRef><FullName>Non</FullName></SalesTaxCodeRef></{tag}>"
+        f"<{tag}>{new_line}<ItemRef><FullName>Shipping</FullName></ItemRef><Desc>Standard</Desc>"
+        f"<Amount>4.00</Amount><SalesTaxCodeRef><FullName>Non</FullName></SalesTaxCodeRef></{tag}>"
+    )
+
+
+ORDER_HEADER_XML = (
+    f"{CUSTOMER_REF}<TxnDate>2024-05-01</TxnDate><RefNumber>#1001</RefNumber>"
+    f"<BillAddress>{ADDRESS_XML}</BillAddress>"
+    "<ItemSalesTaxRef><FullName>GST</FullName></ItemSalesTaxRef><Memo>Shopify order 1001</Memo>"
+)
+
+
+def test_sales_order_add(order_settings):
+    xml, without_item = create_sales_order_add_xml(_order(), CUSTOMER_REF, {"SKU-1": "8000000A-1"})
+
+    assert xml == f"<SalesOrderAdd>{ORDER_HEADER_XML}{_order_lines('SalesOrderLineAdd')}</SalesOrderAdd>"
+    assert without_item == ["Gift wrap"]
+
+
+def test_sales_order_add_with_missing_fields(order_settings):
+    xml, without_item = create_sales_order_add_xml({"id": 5, "line_items": None}, "")
+
+    assert xml == "<SalesOrderAdd><Memo>Shopify order 5</Memo></SalesOrderAdd>"
+    assert without_item == []
+
+
+def test_sales_order_mod(order_settings):
+    xml, without_item = create_sales_order_mod_xml(
+        _order(), {"TxnID": "1A-1700000000", "EditSequence": "3"}, CUSTOMER_REF, {"SKU-1": "8000000A-1"})
+
+    assert xml == (
+        "<SalesOrderMod><TxnID>1A-1700000000</TxnID><EditSequence>3</EditSequence>"
+        f"{ORDER_HEADER_XML}{_order_lines('SalesOrderLineMod', '<TxnLineID>-1</TxnLineID>')}</SalesOrderMod>"
+    )
+    assert without_item == ["Gift wrap"]
+
+
+ACCOUNTS = {"income": "Sales & Revenue", "cogs": "Cost of Goods Sold", "asset": "Inventory Asset"}
+ACCOUNT_REFS_XML = "<COGSAccountRef><FullName>Cost of Goods Sold</FullName></COGSAccountRef>" \
+                   "<AssetAccountRef><FullName>Inventory Asset</FullName></AssetAccountRef>"
+
+
+def _variant():
+    return {"sku": "SKU-9", "title": "Large", "barcode": "0123", "price": "19.99", "cost": "7.50"}
+
+
+def test_item_inventory_add():
+    xml = create_item_inventory_add_xml(_variant(), {"title": "Tee & Co"}, ACCOUNTS)
+
+    assert xml == (
+        "<ItemInventoryAdd><Name>SKU-9</Name><BarCode><BarCodeValue>0123</BarCodeValue></BarCode>"
+        "<SalesDesc>Tee &amp; Co - Large</SalesDesc><SalesPrice>19.99</SalesPrice>"
+        "<IncomeAccountRef><FullName>Sales &amp; Revenue</FullName></IncomeAccountRef>"
+        f"<PurchaseDesc>Tee &amp; Co - Large</PurchaseDesc><PurchaseCost>7.50</PurchaseCost>{ACCOUNT_REFS_XML}"
+        "</ItemInventoryAdd>"
+    )
+
+
+def test_item_inventory_add_with_missing_fields():
+    variant = {"sku": "SKU-8", "title": "Default Title", "barcode": None, "price": "0", "cost": None}
+
+    xml = create_item_inventory_add_xml(variant, {"title": ""}, ACCOUNTS)
+
+    assert xml == (
+        "<ItemInventoryAdd><Name>SKU-8</Name><SalesPrice>0</SalesPrice>"
+        f"<IncomeAccountRef><FullName>Sales &amp; Revenue</FullName></IncomeAccountRef>{ACCOUNT_REFS_XML}"
+        "</ItemInventoryAdd>"
+    )
+
+
+def test_item_inventory_mod():
+    xml = create_item_inventory_mod_xml(_variant(), {"title": "Tee & Co"}, {"ListID": "80000009-1", "EditSequence": "17"})
+
+    assert xml == (
+        "<ItemInventoryMod><ListID>80000009-1</ListID><EditSequence>17</EditSequence><Name>SKU-9</Name>"
+        "<BarCode><BarCodeValue>0123</BarCodeValue></BarCode><SalesDesc>Tee &amp; Co - Large</SalesDesc>"
+        "<SalesPrice>19.99</SalesPrice><PurchaseDesc>Tee &amp; Co - Large</PurchaseDesc><PurchaseCost>7.50</PurchaseCost>"
+        "</ItemInventoryMod>"
+    )
+
+
+def test_emit_rules_and_value_specs():
+    template = compile_template("T", [
+        Field("Always", "missing", when=ALWAYS),
+        Field("Present", "zero", when=PRESENT),
+        Field("Truthy", "zero", when=TRUTHY),
+        Field("Empty", "empty"),
+        Field("Fallback", ("empty", "nested.value")),
+        Field("Upper", "name", transform=str.upper),
+        Field("Context", lambda source, ctx: ctx["value"]),
+        Group("Scoped", [Field("Value", "value")], scope="nested", when=IF_SCOPE),
+        Group("Skipped", [Field("Value", "value")], scope="missing", when=IF_SCOPE),
+        Group("Kept", [Field("Value", "value")], scope="missing"),
+        Ref("ByName", "name", list_id="missing"),
+        Ref("ById", "name", list_id="nested.value"),
+        Repeat("items", ["<Item>", Field("N", "n"), "</Item>"], where=lambda item, ctx: item["n"] != 2),
+        Fragment(lambda source, ctx: "<Raw>&amp;</Raw>"),
+    ])
+
+    xml = template.render({"zero": 0, "empty": "", "name": "a&b", "nested": {"value": "v<1>"},
+                           "items": [{"n": 1}, {"n": 2}, {"n": 3}]}, {"value": 5})
+
+    assert xml == (
+        "<T><Always></Always><Present>0</Present><Fallback>v&lt;1&gt;</Fallback><Upper>A&amp;B</Upper>"
+        "<Context>5</Context><Scoped><Value>v&lt;1&gt;</Value></Scoped><Kept></Kept>"
+        "<ByName><FullName>a&amp;b</FullName></ByName><ById><ListID>v&lt;1&gt;</ListID></ById>"
+        "<Item><N>1</N></Item><Item><N>3</N></Item><Raw>&amp;</Raw></T>"
+    )
+
+
+def test_unsupported_node_is_rejected():
+    with pytest.raises(TypeError):
+        compile_template("T", [object()])
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from sync_scripts.reference_cache import ReferenceCache
+
+
+def _counted(value):
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return value
+    return loader, calls
+
+
+def test_an_empty_table_is_cached_but_a_failed_load_is_not():
+    cache = ReferenceCache()
+    empty, empty_calls = _counted({})
+    failed, failed_calls = _counted(None)
+    cache.register("empty", empty, ttl=60, stale_ttl=60)
+    cache.register("failed", failed, ttl=60, stale_ttl=60)
+
+    for _ in range(3):
+        assert cache.get_many(["empty", "failed"]) == {"empty": {}, "failed": {}}
+
+    assert len(empty_calls) == 1
+    assert len(failed_calls) == 3
+    assert cache.stats()["failed"]["load_errors"] == 3
+
+
+def _age(cache, name, seconds):
+    entry = cache._entries[name]
+    entry.loaded_at -= seconds
+    entry.full_loaded_at -= seconds
+
+
+def test_stale_table_is_served_while_one_thread_refreshes_it():
+    cache = ReferenceCache()
+    versions = iter([{"CAD": 1}, {"CAD": 2}])
+    release = threading.Event()
+    calls = []
+
+    def loader():
+        calls.append(threading.current_thread().name)
+        if len(calls) == 2:
+            release.wait(5)
+        return next(versions)
+
+    cache.register("currency", loader, ttl=60, stale_ttl=60)
+    assert cache.get("currency") == {"CAD": 1}
+    assert cache.get("currency") == {"CAD": 1}
+    assert len(calls) == 1
+
+    # Past its TTL but inside the stale window: the old map comes back at once, however many
+    # callers ask, and one background thread reloads it.
+    _age(cache, "currency", 90)
+    assert [cache.get("currency") for _ in range(3)] == [{"CAD": 1}] * 3
+    release.set()
+    deadline = time.monotonic() + 5
+    while cache.get("currency") != {"CAD": 2} and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert cache.get("currency") == {"CAD": 2}
+    assert len(calls) == 2 and calls[1] == "refcache-currency"
+    assert cache.stats()["currency"]["stale_hits"] >= 3
+
+
+def test_expired_table_is_loaded_once_by_the_first_caller():
+    cache = ReferenceCache()
+    versions = iter([{"AS": 1}, {"AS": 2}])
+    loads = []
+    barrier = threading.Barrier(4, timeout=5)
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return next(versions)
+
+    cache.register("sales_rep", loader, ttl=60, stale_ttl=60)
+    cache.get("sales_rep")
+    _age(cache, "sales_rep", 200)
+    results = []
+
+    def get():
+        barrier.wait()
+        results.append(cache.get("sales_rep"))
+
+    threads = [threading.Thread(target=get) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # Past the stale window nothing is served from memory, but concurrent misses share one load.
+    assert results == [{"AS": 2}] * 4
+    assert len(loads) == 2
+
+
+def test_tables_missing_together_are_fetched_by_the_batch_loader():
+    cache = ReferenceCache()
+    single, single_calls = _counted({"single": True})
+    cache.register("currency", single)
+    cache.register("customer_type", single)
+    batches = []
+
+    def batch_loader(names):
+        batches.append(sorted(names))
+        return {"currency": {"CAD": 1}}
+
+    cache.set_batch_loader(batch_loader)
+
+    # customer_type was left out of the batch (not loaded), so it is not cached.
+    assert cache.get_many(["currency", "customer_type"]) == {"currency": {"CAD": 1}, "customer_type": {}}
+    assert cache.get_many(["currency", "customer_type"]) == {"currency": {"CAD": 1}, "customer_type": {"single": True}}
+    assert batches == [["currency", "customer_type"]]
+    assert len(single_calls) == 1
@@ -0,0 +1,27 @@
+import threading
+
+from werkzeug.serving import make_server
+
+from benchmarks import payloads
+from dev_tools.replay import HttpTarget, replay
+
+
+def test_looped_http_replay_syncs_every_send(mock_bridge):
+    from sync_api import app
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        customer = payloads.customer(payloads.rng(4), 4)
+        records = [{"kind": "customer", "event": "create", "id": 4, "payload": customer}]
+        target = HttpTarget(f"http://127.0.0.1:{server.server_port}")
+
+        report = replay(records, target, concurrency=1, limit=3, loop=True)
+    finally:
+        server.shutdown()
+
+    # Each send is a new delivery: the repeats reach QuickBooks (and find the name taken) instead of
+    # getting the first response back from the idempotency store.
+    assert report["requests"] == 3
+    assert report["error_types"] == {"HTTP 400": 2}
+    assert mock_bridge.counts["CustomerAddRq"] == 3
@@ -0,0 +1,26 @@
+import sys
+import threading
+
+from sync_scripts import job_queue
+
+
+def _threads(prefix):
+    return [thread for thread in threading.enumerate() if thread.name.startswith(prefix)]
+
+
+def test_sync_mode_server_starts_no_background_threads(state_db, monkeypatch):
+    # Import the app as it starts with the default settings (SYNC_QUEUE_WORKERS not set).
+    started = []
+    monkeypatch.setattr(job_queue, "QUEUE_WORKERS_CONFIGURED", False)
+    monkeypatch.setattr(job_queue, "_start_on_enqueue", False)
+    monkeypatch.setattr(job_queue, "start_workers", lambda count=None: started.append(count))
+    monkeypatch.delitem(sys.modules, "sync_api", raising=False)
+    import sync_api  # noqa: F401
+
+    assert started == []
+    assert _threads("inventory-scheduler") == []
+    assert _threads("item-catalog") == []
+
+    # Queuing a request (e.g. Prefer: respond-async) starts this process's workers.
+    job_queue.enqueue("customer.update", "{}", entity_key="customer:1")
+    assert started == [None]